@@ -0,0 +1,408 @@
+## This program runs the benchmark suite on a corpus of cacm documents and
+#  writes a JSON report of the measurements, so that the reports of different
+#  commits can be compared (refer to compare.py)
+#
+# The corpus is a folder of cacm documents, or a synthetic corpus of a given
+# size generated in the workdir (refer to synthetic.py). The suite builds the
+# corpusstore and indexstore of the documents in the workdir and measures,
+#   synthetic     - time to generate the synthetic corpus, if any
+#   corpus, index - build time and peak RSS of corpus.py and indexer.py
+#   load          - time to read the index and global statistics
+#   search.<model>- per query latency (p50, p95, p99) of every retrieval model of
+#                   searcher.py
+#   snippets      - snippet generation time
+#   evaluation    - time to evaluate the runs of all models
+# Every stage runs in a fresh process (refer to stages.py)
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from   argparse import RawTextHelpFormatter
+
+## Globals #####################################################################
+
+# The repository is one directory up; the stages are next to this program
+ROOT   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stages.py")
+
+# Retrieval models of searcher.py
+MODELS = ["bm25", "tfidf", "qlm", "prf", "proximity"]
+
+# Version of the report format
+REPORTVERSION = 1
+
+## Help strings ################################################################
+
+program_help = '''
+
+    bench.py benchmarks the indexing, search, snippet generation and evaluation
+    of the repository on a folder of cacm documents, or a synthetic corpus, and
+    writes a JSON report
+
+    Argument 1: docstore         - Path to the folder of cacm documents, e.g.
+                                 ./cacm/cacm_docs. Not used with synthetic
+
+    Argument 2: cacmqueryfile    - Path to the cacm query file, e.g.
+                                 ./cacm/cacm.query.txt. Not used with synthetic
+
+    Argument 3: relevancefile    - Path to the cacm relevance file. Not used with
+                                 synthetic
+
+    Argument 4: synthetic        - Number of documents of a synthetic corpus to
+                                 benchmark instead (refer to gen_synthetic.py).
+                                 The corpus, queries and relevance judgements
+                                 are generated with the given seed
+
+    Argument 5: seed             - Seed of the synthetic corpus. Defaults to 0
+
+    Argument 6: stopfile         - Path to the stopfile used for snippets. This
+                                 argument is optional
+
+    Argument 7: models           - Comma separated list of retrieval models to
+                                 benchmark. Defaults to all models
+
+    Argument 8: repeat           - Number of times every query is searched; the
+                                 fastest search counts. Defaults to 1
+
+    Argument 9: snippetqueries   - Number of queries to generate the snippets of
+                                 the bm25 run for. Defaults to 10
+
+    Argument 10: name            - Name of the corpus in the report. Defaults to
+                                 the name of the docstore
+
+    Argument 11: workdir         - Folder to build the corpusstore and indexstore
+                                 in. Defaults to a temporary folder, deleted
+                                 when the benchmark ends
+
+    Argument 12: outputfile      - Path to the JSON report
+
+    EXAMPLES:
+
+        python bench/bench.py --docstore=./cacm/cacm_docs --cacmqueryfile=./cacm/cacm.query.txt --relevancefile=./cacm/cacm.rel.txt --stopfile=./cacm/common_words --outputfile=bench.json
+        python bench/bench.py --docstore=./cacm/cacm_docs --cacmqueryfile=./cacm/cacm.query.txt --relevancefile=./cacm/cacm.rel.txt --models=bm25,qlm --repeat=5 --outputfile=bench.json
+        python bench/bench.py --synthetic=50000 --seed=1 --models=bm25,tfidf --outputfile=bench.50k.json
+  '''
+
+docstore_help = '''
+    Path to the folder of cacm documents
+    '''
+
+cacmqueryfile_help = '''
+    Path to the cacm query file
+    '''
+
+relevancefile_help = '''
+    Path to the cacm relevance file
+    '''
+
+synthetic_help = '''
+    Number of documents of a synthetic corpus to benchmark instead of the
+    docstore. This argument is optional
+    '''
+
+seed_help = '''
+    Seed of the synthetic corpus. Defaults to 0
+    '''
+
+stopfile_help = '''
+    Path to the stopfile used for snippets. This argument is optional
+    '''
+
+models_help = '''
+    Comma separated list of retrieval models to benchmark. One or more of
+    ''' + ", ".join(MODELS) + '''. Defaults to all models
+    '''
+
+repeat_help = '''
+    Number of times every query is searched; the fastest search counts.
+    Defaults to 1
+    '''
+
+snippetqueries_help = '''
+    Number of queries to generate the snippets of the bm25 run for. 0 skips
+    snippet generation. Defaults to 10
+    '''
+
+name_help = '''
+    Name of the corpus in the report. Defaults to the name of the docstore,
+    or "synthetic-<documents>"
+    '''
+
+workdir_help = '''
+    Folder to build the corpusstore and indexstore in. It is kept. Defaults to
+    a temporary folder, deleted when the benchmark ends
+    '''
+
+outputfile_help = '''
+    Path to the JSON report. If the outputfile already exists, it is deleted
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--docstore",
+                       metavar  = "d",
+                       type     = str,
+                       default  = "",
+                       help     = docstore_help)
+
+argparser.add_argument("--cacmqueryfile",
+                       metavar  = "q",
+                       type     = str,
+                       default  = "",
+                       help     = cacmqueryfile_help)
+
+argparser.add_argument("--relevancefile",
+                       metavar  = "rl",
+                       type     = str,
+                       default  = "",
+                       help     = relevancefile_help)
+
+argparser.add_argument("--synthetic",
+                       metavar  = "sy",
+                       type     = int,
+                       default  = 0,
+                       help     = synthetic_help)
+
+argparser.add_argument("--seed",
+                       metavar  = "sd",
+                       type     = int,
+                       default  = 0,
+                       help     = seed_help)
+
+argparser.add_argument("--stopfile",
+                       metavar  = "s",
+                       type     = str,
+                       default  = "",
+                       help     = stopfile_help)
+
+argparser.add_argument("--models",
+                       metavar  = "m",
+                       type     = str,
+                       default  = ",".join(MODELS),
+                       help     = models_help)
+
+argparser.add_argument("--repeat",
+                       metavar  = "r",
+                       type     = int,
+                       default  = 1,
+                       help     = repeat_help)
+
+argparser.add_argument("--snippetqueries",
+                       metavar  = "sq",
+                       type     = int,
+                       default  = 10,
+                       help     = snippetqueries_help)
+
+argparser.add_argument("--name",
+                       metavar  = "n",
+                       type     = str,
+                       default  = "",
+                       help     = name_help)
+
+argparser.add_argument("--workdir",
+                       metavar  = "w",
+                       type     = str,
+                       default  = "",
+                       help     = workdir_help)
+
+argparser.add_argument("--outputfile",
+                       metavar  = "o",
+                       required = True,
+                       type     = str,
+                       help     = outputfile_help)
+
+## Utilities ###################################################################
+
+# Returns the commit of the repository, or "" if it is not a git repository
+def repository_commit():
+
+    try:
+        with open(os.devnull, "w") as devnull:
+            commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                             cwd = ROOT, stderr = devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+    return commit.strip()
+
+# Returns a dictionary describing the machine and interpreter
+def environment():
+    return {"python"   : platform.python_version(),
+            "platform" : platform.platform(),
+            "machine"  : platform.machine(),
+            "cpus"     : multiprocessing.cpu_count()}
+
+# Given a stage (refer to stages.py) and the path to the config of the benchmark
+# Run the stage in a fresh process
+# Returns the measurements of the stage
+def run_stage(stage, configfile):
+
+    resultfile = configfile + "." + stage
+
+    print "Running stage ", stage
+
+    status = subprocess.call([sys.executable, STAGES, stage, configfile,
+                              resultfile])
+    if (status != 0):
+        print "FATAL: Stage ", stage, " failed with status ", status
+        exit(-1)
+
+    with open(resultfile, "r") as f:
+        measurements = json.load(f)
+    os.remove(resultfile)
+
+    return measurements
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+docstore       = args['docstore']
+cacmqueryfile  = args['cacmqueryfile']
+relevancefile  = args['relevancefile']
+synthetic      = args['synthetic']
+seed           = args['seed']
+stopfile       = args['stopfile']
+models         = args['models'].split(",")
+repeat         = args['repeat']
+snippetqueries = args['snippetqueries']
+name           = args['name']
+workdir        = args['workdir']
+outputfile     = args['outputfile']
+
+## Input check
+if (synthetic < 0):
+    print "FATAL: synthetic should be >= 0"
+    exit(-1)
+if (synthetic == 0 and not os.path.isdir(docstore)):
+    print "FATAL: Cannot find docstore, ", docstore
+    exit(-1)
+if (synthetic == 0 and not os.path.exists(cacmqueryfile)):
+    print "FATAL: Cannot find cacm query file, ", cacmqueryfile
+    exit(-1)
+if (synthetic == 0 and not os.path.exists(relevancefile)):
+    print "FATAL: Cannot find cacm relevance file, ", relevancefile
+    exit(-1)
+if (stopfile != "" and not os.path.exists(stopfile)):
+    print "FATAL: Cannot find stopfile, ", stopfile
+    exit(-1)
+if (filter(lambda m: m not in MODELS, models) != []):
+    print "FATAL: models should be one or more of ", MODELS
+    exit(-1)
+if (repeat <= 0):
+    print "FATAL: repeat should be > 0"
+    exit(-1)
+if (snippetqueries < 0):
+    print "FATAL: snippetqueries should be >= 0"
+    exit(-1)
+if (snippetqueries > 0 and "bm25" not in models):
+    print "FATAL: snippets are generated for the bm25 run; add bm25 to models"
+    exit(-1)
+
+if (name == "" and synthetic > 0):
+    name = "synthetic-" + str(synthetic)
+elif (name == ""):
+    name = os.path.basename(os.path.abspath(docstore).rstrip(os.sep))
+
+if (os.path.exists(outputfile)):
+    print "WARNING: Deleting existing outputfile"
+    os.remove(outputfile)
+
+# the workdir is deleted at the end only if it is a temporary one
+temporary = (workdir == "")
+if (temporary):
+    workdir = tempfile.mkdtemp(prefix = "bench.")
+elif (not os.path.exists(workdir)):
+    os.makedirs(workdir)
+workdir = os.path.abspath(workdir)
+
+# the synthetic corpus is generated in the workdir by the synthetic stage
+if (synthetic > 0):
+    syntheticdir  = os.path.join(workdir, "synthetic")
+    docstore      = os.path.join(syntheticdir, "docs")
+    cacmqueryfile = os.path.join(syntheticdir, "cacm.query.txt")
+    relevancefile = os.path.join(syntheticdir, "cacm.rel.txt")
+else:
+    syntheticdir  = ""
+
+config = {"docstore"       : os.path.abspath(docstore),
+          "cacmqueryfile"  : os.path.abspath(cacmqueryfile),
+          "relevancefile"  : os.path.abspath(relevancefile),
+          "synthetic"      : synthetic,
+          "seed"           : seed,
+          "syntheticdir"   : syntheticdir,
+          "stopfile"       : os.path.abspath(stopfile) if stopfile != "" else "",
+          "models"         : models,
+          "repeat"         : repeat,
+          "snippetqueries" : snippetqueries,
+          "workdir"        : workdir,
+          "corpusstore"    : os.path.join(workdir, "corpus"),
+          "indexstore"     : os.path.join(workdir, "index"),
+          "queryfile"      : os.path.join(workdir, "queries.txt")}
+
+configfile = os.path.join(workdir, "bench.config")
+with open(configfile, "w+") as f:
+    json.dump(config, f, indent = 1, sort_keys = True)
+
+# products of an earlier benchmark in the same workdir are rebuilt
+for path in [config["corpusstore"], config["indexstore"]]:
+    if (os.path.exists(path)):
+        shutil.rmtree(path)
+if (os.path.exists(config["queryfile"])):
+    os.remove(config["queryfile"])
+
+start  = time.time()
+stages = {}
+
+try:
+    if (synthetic > 0):
+        stages["synthetic"] = run_stage("synthetic", configfile)
+
+    for stage in ["corpus", "queries", "index", "load"] + \
+                 map(lambda m: "search." + m, models):
+        stages[stage] = run_stage(stage, configfile)
+
+    if (snippetqueries > 0):
+        stages["snippets"] = run_stage("snippets", configfile)
+
+    stages["evaluation"] = run_stage("evaluation", configfile)
+
+finally:
+    if (temporary):
+        shutil.rmtree(workdir)
+
+report = {"version"     : REPORTVERSION,
+          "commit"      : repository_commit(),
+          "date"        : datetime.datetime.now().isoformat(),
+          "seconds"     : time.time() - start,
+          "environment" : environment(),
+          "corpus"      : {"name"      : name,
+                           "documents" : stages["load"]["documents"],
+                           "terms"     : stages["load"]["terms"],
+                           "postings"  : stages["load"]["postings"],
+                           "queries"   : stages["queries"]["queries"]},
+          "config"      : {"synthetic"      : synthetic,
+                           "seed"           : seed,
+                           "models"         : models,
+                           "repeat"         : repeat,
+                           "snippetqueries" : snippetqueries,
+                           "stopfile"       : stopfile != ""},
+          "stages"      : stages}
+
+with open(outputfile, "w+") as f:
+    json.dump(report, f, indent = 1, sort_keys = True)
+
+print "Benchmark report written to ", outputfile
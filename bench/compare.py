@@ -0,0 +1,206 @@
+## This program compares two benchmark reports (refer to bench.py), e.g. of the
+#  parent commit and a change, and flags regressions; measurements of the
+#  change that are worse than the ones of the baseline by more than a threshold
+
+import argparse
+import json
+import os
+from   argparse import RawTextHelpFormatter
+
+## Globals #####################################################################
+
+# Measurements of a stage that are compared; all of them are better when lower
+MEASUREMENTS = ["seconds", "load_seconds", "p50_ms", "p95_ms", "p99_ms",
+                "mean_ms", "peak_rss_kb"]
+
+## Help strings ################################################################
+
+program_help = '''
+
+    compare.py compares the measurements of two benchmark reports of bench.py
+    and flags the ones of the report that are worse than the ones of the
+    baseline by more than a threshold. The program exits with status 1 if there
+    are regressions
+
+    Argument 1: baseline  - Path to the report of the baseline, e.g. of the
+                            parent commit
+
+    Argument 2: report    - Path to the report to compare to the baseline
+
+    Argument 3: threshold - Fraction by which a measurement may be worse than
+                            the baseline before it is a regression. Defaults
+                            to 0.10
+
+    Argument 4: minimum   - Time measurements below this many seconds in both
+                            reports are never regressions; they are noise.
+                            Defaults to 0.005
+
+    EXAMPLES:
+
+        python bench/compare.py --baseline=bench.parent.json --report=bench.json
+        python bench/compare.py --baseline=bench.parent.json --report=bench.json --threshold=0.05
+  '''
+
+baseline_help = '''
+    Path to the report of the baseline
+    '''
+
+report_help = '''
+    Path to the report to compare to the baseline
+    '''
+
+threshold_help = '''
+    Fraction by which a measurement may be worse than the baseline before it is
+    a regression. Defaults to 0.10
+    '''
+
+minimum_help = '''
+    Time measurements below this many seconds in both reports are never
+    regressions. Defaults to 0.005
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--baseline",
+                       metavar  = "b",
+                       required = True,
+                       type     = str,
+                       help     = baseline_help)
+
+argparser.add_argument("--report",
+                       metavar  = "r",
+                       required = True,
+                       type     = str,
+                       help     = report_help)
+
+argparser.add_argument("--threshold",
+                       metavar  = "t",
+                       type     = float,
+                       default  = 0.10,
+                       help     = threshold_help)
+
+argparser.add_argument("--minimum",
+                       metavar  = "m",
+                       type     = float,
+                       default  = 0.005,
+                       help     = minimum_help)
+
+## Comparison ##################################################################
+
+# Given a measurement and its values in the baseline and the report, the
+# threshold and the minimum time
+# Returns True iff the value of the report is a regression
+def is_regression(measurement, base, value, threshold, minimum):
+
+    if (measurement.endswith("_ms")):
+        (base, value) = (base / 1000.0, value / 1000.0)
+
+    if (measurement != "peak_rss_kb" and base < minimum and value < minimum):
+        return False
+
+    return value > base * (1.0 + threshold)
+
+# Given two reports, the threshold and the minimum time
+# Returns a list of (stage, measurement, baseline value, report value,
+# regression) tuples of the measurements of the stages in both reports
+def compare_reports(baseline, report, threshold, minimum):
+
+    rows = []
+
+    for stage in sorted(report["stages"].keys()):
+
+        if (stage not in baseline["stages"]):
+            continue
+
+        for measurement in MEASUREMENTS:
+
+            base  = baseline["stages"][stage].get(measurement)
+            value = report["stages"][stage].get(measurement)
+
+            if (base is None or value is None):
+                continue
+
+            rows.append((stage, measurement, base, value,
+                         is_regression(measurement, base, value, threshold,
+                                       minimum)))
+
+    return rows
+
+# Given two reports
+# Returns a list of warnings about differences between the reports that make
+# them hard to compare
+def comparability_warnings(baseline, report):
+
+    warnings = []
+
+    for key in ["corpus", "config"]:
+        if (baseline[key] != report[key]):
+            warnings.append("the " + key + " of the reports differ")
+
+    if (baseline["environment"] != report["environment"]):
+        warnings.append("the reports were run in different environments")
+
+    # evaluation measures MAP of every model; rankings changed
+    base_map  = baseline["stages"].get("evaluation", {}).get("map", {})
+    value_map = report["stages"].get("evaluation", {}).get("map", {})
+    for model in sorted(set(base_map.keys()) & set(value_map.keys())):
+        if (abs(base_map[model] - value_map[model]) > 1.0e-9):
+            warnings.append("MAP of " + model + " changed, %.4f -> %.4f" %
+                            (base_map[model], value_map[model]))
+
+    return warnings
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+baselinefile = args['baseline']
+reportfile   = args['report']
+threshold    = args['threshold']
+minimum      = args['minimum']
+
+## Input check
+for path in [baselinefile, reportfile]:
+    if (not os.path.exists(path)):
+        print "FATAL: Cannot find report, ", path
+        exit(-1)
+if (threshold < 0.0):
+    print "FATAL: threshold should be >= 0"
+    exit(-1)
+
+with open(baselinefile, "r") as f:
+    baseline = json.load(f)
+with open(reportfile, "r") as f:
+    report = json.load(f)
+
+print "Baseline : ", baselinefile, baseline["commit"]
+print "Report   : ", reportfile, report["commit"]
+
+for warning in comparability_warnings(baseline, report):
+    print "WARNING: ", warning
+print
+
+rows = compare_reports(baseline, report, threshold, minimum)
+
+print "%-18s %-14s %14s %14s %9s" % ("stage", "measurement", "baseline",
+                                     "report", "change")
+for (stage, measurement, base, value, regression) in rows:
+
+    change = "%+8.1f%%" % (100.0 * (value - base) / base) if base > 0 else "        -"
+    print "%-18s %-14s %14.4f %14.4f %9s %s" % \
+          (stage, measurement, base, value, change,
+           "REGRESSION" if regression else "")
+
+regressions = filter(lambda row: row[4], rows)
+
+print
+print "%d regressions of %d measurements, threshold %.0f%%" % \
+      (len(regressions), len(rows), 100.0 * threshold)
+
+if (regressions != []):
+    exit(1)
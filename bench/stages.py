@@ -0,0 +1,298 @@
+## This program runs a single stage of the benchmark suite (refer to bench.py)
+#  in a fresh process and writes the measurements of the stage to a JSON file.
+#  Every stage runs in its own process so that its peak RSS is its own
+#
+# Usage: python stages.py <stage> <configfile> <resultfile>
+#
+# Stages,
+#   synthetic  - generates a synthetic corpus with gen_synthetic.py
+#   corpus     - builds the corpusstore with corpus.py
+#   queries    - processes the cacm query file with query_processing.py
+#   index      - builds the indexstore with indexer.py
+#   load       - reads the index and global statistics
+#   search     - searches every query with the retrieval model of the config and
+#                writes its run to the workdir
+#   snippets   - generates the snippets of the bm25 run (refer to snippet.py)
+#   evaluation - evaluates the runs of all models (refer to eval_engine.py)
+#
+# synthetic, corpus, queries and index run the programs of the repository as
+# they are run by hand; the peak RSS of the stage is the one of the program
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# The modules of the repository are one directory up
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from index             import Index
+from global_statistics import GlobalStatistics, GSFILE
+from query             import queries
+from result_set        import ResultSet
+from bm25              import BM25
+from tfidf             import TFIDF
+from qlm               import QLM
+from bm25_relvence     import BM25_R
+from proximity_model   import ProximityModel
+from docrank_trec      import resultfile_to_docranks
+from snippet           import get_snippets
+from eval_engine       import Qrels, read_run, evaluate_run
+from significance      import quantile
+
+## Globals #####################################################################
+
+# Retrieval models of searcher.search and their classes
+MODELS = {"bm25"      : BM25,
+          "tfidf"     : TFIDF,
+          "qlm"       : QLM,
+          "prf"       : BM25_R,
+          "proximity" : ProximityModel}
+
+# Latency percentiles reported by the search stage
+PERCENTILES = [50, 95, 99]
+
+## Utilities ###################################################################
+
+# Returns the peak resident set size of this process in KB
+def peak_rss_self():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# Returns the peak resident set size of the largest finished child process in
+# KB
+def peak_rss_children():
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+# Given a workdir and a retrieval model
+# Returns the path to the run of the model in the workdir
+def run_filename(workdir, model):
+    return os.path.join(workdir, "run." + model)
+
+# Given a program of the repository and a list of its arguments
+# Run the program; its output is discarded. Returns the wall time in seconds
+def run_program(program, arguments):
+
+    start = time.time()
+
+    with open(os.devnull, "w") as devnull:
+        status = subprocess.call([sys.executable, os.path.join(ROOT, program)] +
+                                 arguments, stdout = devnull)
+
+    seconds = time.time() - start
+
+    if (status != 0):
+        print "FATAL: ", program, " failed with status ", status
+        exit(-1)
+
+    return seconds
+
+## Stages ######################################################################
+
+# Given the config of the benchmark
+# Returns the measurements of generating the synthetic corpus; only its
+# documents, the corpusstore is built of them by the corpus stage
+def synthetic_stage(config):
+
+    seconds = run_program("gen_synthetic.py",
+                          ["--outputdir=" + config["syntheticdir"],
+                           "--documents=" + str(config["synthetic"]),
+                           "--seed="      + str(config["seed"]),
+                           "--layout=docs"])
+
+    return {"seconds"     : seconds,
+            "documents"   : config["synthetic"],
+            "peak_rss_kb" : peak_rss_children()}
+
+# Given the config of the benchmark
+# Returns the measurements of building the corpusstore
+def corpus_stage(config):
+
+    seconds = run_program("corpus.py", ["--docstore="   + config["docstore"],
+                                        "--corpusstore=" + config["corpusstore"]])
+
+    return {"seconds"     : seconds,
+            "documents"   : len(os.listdir(config["docstore"])),
+            "peak_rss_kb" : peak_rss_children()}
+
+# Given the config of the benchmark
+# Returns the measurements of processing the cacm query file
+def queries_stage(config):
+
+    seconds = run_program("query_processing.py",
+                          ["--ipqueryfile=" + config["cacmqueryfile"],
+                           "--opqueryfile=" + config["queryfile"]])
+
+    return {"seconds"     : seconds,
+            "queries"     : len(queries(config["queryfile"])),
+            "peak_rss_kb" : peak_rss_children()}
+
+# Given the config of the benchmark
+# Returns the measurements of building the indexstore
+def index_stage(config):
+
+    seconds = run_program("indexer.py", ["--corpusstore=" + config["corpusstore"],
+                                         "--indexstore="  + config["indexstore"]])
+
+    return {"seconds"     : seconds,
+            "peak_rss_kb" : peak_rss_children()}
+
+# Given the config of the benchmark
+# Returns the measurements of reading the index and the global statistics
+def load_stage(config):
+
+    start        = time.time()
+    invidx       = Index(config["indexstore"])
+    global_stats = GlobalStatistics(os.path.join(config["indexstore"], GSFILE))
+    seconds      = time.time() - start
+
+    return {"seconds"     : seconds,
+            "documents"   : global_stats.get_N(),
+            "terms"       : len(invidx.idxdict),
+            "postings"    : sum(map(len, invidx.idxdict.values())),
+            "peak_rss_kb" : peak_rss_self()}
+
+# Given the config of the benchmark and a retrieval model
+# Returns the measurements of searching every query with the model. Every query
+# is searched config["repeat"] times; the latency of a query is the fastest
+# search. prf expands every query with the results of the query before it
+# (refer to bm25_relvence.py), so its queries are searched one at a time; as
+# if every query is the first of a run
+def search_stage(config, model):
+
+    query_lst = queries(config["queryfile"])
+
+    start = time.time()
+    rm    = MODELS[model](config["indexstore"],
+                          os.path.join(config["indexstore"], GSFILE))
+    load_seconds = time.time() - start
+
+    latencies  = []
+    resultsets = []
+
+    for query in query_lst:
+
+        fastest = None
+        for r in range(0, config["repeat"]):
+
+            start = time.time()
+            if (model == "prf"):
+                resultset = rm.search([query])[0]
+            else:
+                resultset = rm.search_query(rm.invidx, query)
+            seconds = time.time() - start
+
+            if (fastest is None or seconds < fastest):
+                fastest = seconds
+
+        latencies.append(fastest * 1000.0)
+        resultsets.append(resultset)
+
+    # the run of the model for the snippets and evaluation stages
+    with open(run_filename(config["workdir"], model), "w+") as rf:
+        for resultset in resultsets:
+            for resultstring in resultset.trec_result_strings():
+                rf.write(resultstring + "\n")
+
+    latencies.sort()
+
+    measurements = {"load_seconds" : load_seconds,
+                    "seconds"      : sum(latencies) / 1000.0,
+                    "queries"      : len(latencies),
+                    "mean_ms"      : sum(latencies) / float(max(len(latencies), 1)),
+                    "max_ms"       : latencies[-1] if latencies != [] else 0.0,
+                    "peak_rss_kb"  : peak_rss_self()}
+
+    for p in PERCENTILES:
+        measurements["p" + str(p) + "_ms"] = quantile(latencies, p / 100.0) \
+                                             if latencies != [] else 0.0
+
+    return measurements
+
+# Given the config of the benchmark
+# Returns the measurements of generating the snippets of the first
+# config["snippetqueries"] queries of the bm25 run
+def snippets_stage(config):
+
+    query_lst = queries(config["queryfile"])[:config["snippetqueries"]]
+    qids      = set(map(lambda q: q.qid, query_lst))
+
+    docranks  = filter(lambda dr: dr.qid in qids,
+                       resultfile_to_docranks(run_filename(config["workdir"], "bm25")))
+
+    # snippet generation reports its progress
+    stdout     = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start   = time.time()
+        snippets = get_snippets(query_lst, docranks, config["indexstore"],
+                                config["stopfile"])
+        seconds = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    count = sum(map(len, snippets.values()))
+
+    return {"seconds"     : seconds,
+            "queries"     : len(query_lst),
+            "snippets"    : count,
+            "mean_ms"     : 1000.0 * seconds / float(max(count, 1)),
+            "peak_rss_kb" : peak_rss_self()}
+
+# Given the config of the benchmark
+# Returns the measurements of evaluating the runs of all models
+def evaluation_stage(config):
+
+    start = time.time()
+    qrels = Qrels(config["relevancefile"])
+
+    maps = {}
+    for model in config["models"]:
+        (query_metrics, means) = evaluate_run(qrels,
+                                              read_run(run_filename(config["workdir"], model)))
+        maps[model] = means["map"]
+
+    seconds = time.time() - start
+
+    # MAP of every model; a change means the rankings changed too
+    return {"seconds"     : seconds,
+            "runs"        : len(config["models"]),
+            "map"         : maps,
+            "peak_rss_kb" : peak_rss_self()}
+
+## Main ########################################################################
+
+if (len(sys.argv) != 4):
+    print "Usage: python stages.py <stage> <configfile> <resultfile>"
+    exit(-1)
+
+(stage, configfile, resultfile) = sys.argv[1:]
+
+with open(configfile, "r") as f:
+    config = json.load(f)
+
+if (stage == "synthetic"):
+    measurements = synthetic_stage(config)
+elif (stage == "corpus"):
+    measurements = corpus_stage(config)
+elif (stage == "queries"):
+    measurements = queries_stage(config)
+elif (stage == "index"):
+    measurements = index_stage(config)
+elif (stage == "load"):
+    measurements = load_stage(config)
+elif (stage.startswith("search.") and stage[len("search."):] in MODELS):
+    measurements = search_stage(config, stage[len("search."):])
+elif (stage == "snippets"):
+    measurements = snippets_stage(config)
+elif (stage == "evaluation"):
+    measurements = evaluation_stage(config)
+else:
+    print "FATAL: Unknown stage ", stage
+    exit(-1)
+
+with open(resultfile, "w+") as f:
+    json.dump(measurements, f, indent = 1, sort_keys = True)
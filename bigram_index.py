@@ -0,0 +1,115 @@
+## This file builds the bigram side index of a unigram index
+#
+# Phrases of frequent terms (e.g. "of the") are expensive to match with the
+# positions of their terms; the postings of frequent terms are long and every
+# document that has all terms of the phrase has to be checked. The bigram side
+# index (BIGRAMFILE, refer to index.py) holds the postings of selected bigrams,
+# a term made of two adjacent words. The position of a bigram is the position of
+# its first word. Only bigrams that are
+#   i. in at least BIGRAMMINDF documents, or
+#  ii. made of two frequent terms, terms in at least FREQUENTDF of all documents
+# are indexed; the bigrams that phrases are slow to match without. The phrase
+# operator (refer to query_operators.py) uses the side index when an index has
+# one
+#
+# The side index is built from the positions in the unigram index, so it holds
+# the same documents as the unigram index. It is dropped by incremental updates
+# (refer to index_writer.py) and rebuilt by indexer.py --bigrams
+
+from index import Index, Posting
+
+## Globals #####################################################################
+
+# Bigrams in at least this many documents are indexed
+BIGRAMMINDF = 25
+
+# Terms in at least this fraction of all documents are frequent. Bigrams of two
+# frequent terms are indexed
+FREQUENTDF  = 0.05
+
+## Utilities ###################################################################
+
+# Given two terms
+# Returns the bigram of the terms
+def bigram(t1, t2):
+    return t1 + " " + t2
+
+# Given an Index (from index.py)
+# Returns a dictionary of key value pairs of docid and a dictionary of key value
+# pairs of position and term of the document
+def document_terms(invidx):
+
+    doc_terms = {}
+
+    for term in invidx.idxdict:
+        for p in invidx.idxdict[term]:
+            positions = doc_terms.setdefault(p.docid, {})
+            for pos in p.positions:
+                positions[pos] = term
+
+    return doc_terms
+
+# Given a dictionary of key value pairs of position and term of a document
+# Returns a list of (position, bigram) of all bigrams of the document in order
+def document_bigrams(positions):
+
+    bigrams = []
+
+    for pos in sorted(positions.keys()):
+        if (positions.get(pos + 1) is not None):
+            bigrams.append((pos, bigram(positions[pos], positions[pos + 1])))
+
+    return bigrams
+
+## Bigram index ################################################################
+
+# Given an Index of unigrams (from index.py), the name of the bigram index file
+#       to create in the indexstore, the minimum document frequency of an
+#       indexed bigram and the fraction of documents a frequent term is in
+# Create the bigram side index file and return it as an Index
+def build_bigram_index(invidx, bigramfname, mindf = BIGRAMMINDF,
+                       frequentdf = FREQUENTDF):
+
+    doc_bigrams = {}
+    for (docid, positions) in document_terms(invidx).items():
+        doc_bigrams[docid] = document_bigrams(positions)
+
+    # frequent terms
+    mindocs  = frequentdf * len(doc_bigrams)
+    frequent = set(filter(lambda t: len(invidx.idxdict[t]) >= mindocs,
+                          invidx.idxdict.keys()))
+
+    # document frequencies of all bigrams
+    bigram_df = {}
+    for docid in doc_bigrams:
+        for bg in set(map(lambda pb: pb[1], doc_bigrams[docid])):
+            bigram_df[bg] = bigram_df.get(bg, 0) + 1
+
+    def selected(bg):
+        (t1, t2) = bg.split(" ")
+        return (bigram_df[bg] >= mindf or (t1 in frequent and t2 in frequent))
+
+    selection = set(filter(selected, bigram_df.keys()))
+
+    # postings of the selected bigrams; documents in docid order
+    idxdict = {}
+    for docid in sorted(doc_bigrams.keys()):
+
+        doc_positions = {}
+
+        for (pos, bg) in doc_bigrams[docid]:
+            if (bg in selection):
+                doc_positions.setdefault(bg, []).append(pos)
+
+        for bg in doc_positions:
+            positions = doc_positions[bg]
+            idxdict.setdefault(bg, []).append(Posting(docid, len(positions),
+                                                      positions))
+
+    bigramidx = Index(invidx.indexstore, bigramfname)
+    bigramidx.idxdict = idxdict
+    bigramidx.store()
+
+    return bigramidx
+
+################################################################################
@@ -1,9 +1,10 @@
 ##This file implements the BM25 retrieval model
 
-from index             import Index
+from index             import Index, VERIFY_OFF, VERIFY_FULL
 from query             import Query
 from result_set        import Result, ResultSet, DocumentScore
 from global_statistics import GlobalStatistics
+from tracing           import span, count
 
 import math
 import os
@@ -18,6 +19,9 @@ class BM25:
     ## Inverted index
     invidx       = None
 
+    ## Verification level (refer to index.py)
+    verify       = VERIFY_OFF
+
     ## BM25 parameters
     k1 = 1.2
     k2 = 100
@@ -25,11 +29,13 @@ class BM25:
 
     ## Constructor
     # Given an indexstore where the index file is stored by (indexer.py)
-    #       and a global statistics file path
+    #       and a global statistics file path, and
+    #       optionally a verification level (refer to index.py)
     #
     # Initializes the bm25 algorithm
     #
-    def __init__(self, indexstore, gsfile, k1_ = 1.2, k2_ = 100, b_ = 0.75):
+    def __init__(self, indexstore, gsfile, k1_ = 1.2, k2_ = 100, b_ = 0.75,
+                 verify_ = VERIFY_OFF):
 
         # reset
         self.reset()
@@ -40,10 +46,11 @@ class BM25:
             return
 
         # Get index
-        self.invidx = Index(indexstore)
+        self.verify = verify_
+        self.invidx = Index(indexstore, verify = verify_)
 
         # Get global statistics
-        self.global_stats = GlobalStatistics(gsfile)
+        self.global_stats = GlobalStatistics(gsfile, verify_)
 
         # Set BM25 parameters
         self.k1 = k1_
@@ -59,6 +66,9 @@ class BM25:
         ## Inverted index
         self.invidx       = None
 
+        ## Verification level
+        self.verify       = VERIFY_OFF
+
         ## BM25 parameters
         self.k1 = 1.2
         self.k2 = 100
@@ -77,7 +87,8 @@ class BM25:
         # for every query
         for query in queries:
             # search query in index
-            resultset = self.search_query(self.invidx, query)
+            with span("bm25.query", qid = query.qid):
+                resultset = self.search_query(self.invidx, query)
             # store result
             results.append(resultset)
 
@@ -93,46 +104,55 @@ class BM25:
 
         # TODO: For now we know that query terms are split by spaces.
         #       going forward generalize this
-        query_terms = query.querystr.split(" ")
+        with span("bm25.parse"):
+            query_terms = query.querystr.split(" ")
 
-        # filter query terms not appearing in index
-        query_terms = filter(lambda qt: invidx.contains_term(qt), query_terms)
+            # filter query terms not appearing in index
+            query_terms = filter(lambda qt: invidx.contains_term(qt), query_terms)
 
-        # Create a query-termfreqency dictionary. This will remove duplicate
-        query_tf_dict = self.termfrequency(query_terms)
+            # Create a query-termfreqency dictionary. This will remove duplicate
+            query_tf_dict = self.termfrequency(query_terms)
 
         # Get a dictionary of related invlists with key value pairs (term, postings)
         # This is in essence a mini-index
         mini_index    = self.invidx.minindex(query_terms)
 
-        # Get set of related documents
-        docids        = self.invidx.docids_with_terms(set(query_terms))
+        # Get set of related documents; documents must match the phrase and
+        # window operators of the query (refer to query_operators.py)
+        docids        = self.invidx.docids_for_query(set(query_terms),
+                                                     query.operators)
+
+        count("docs_scored", len(docids))
+
+        with span("bm25.score"):
 
-        # List of document scores (DocumentScore from result_set.py)
-        docscores     = []
+            # List of document scores (DocumentScore from result_set.py)
+            docscores     = []
 
-        # Score every document in set
-        for docid in docids:
+            # Score every document in set
+            for docid in docids:
 
-            doc_bm25_score = 0
+                doc_bm25_score = 0
 
-            # Score document for every query term
-            for qt in query_tf_dict:
+                # Score document for every query term
+                for qt in query_tf_dict:
 
-                # query term frequency
-                qtf = query_tf_dict.get(qt)
+                    # query term frequency
+                    qtf = query_tf_dict.get(qt)
 
-                # calculate bm25 score
-                doc_bm25_score = doc_bm25_score + \
-                                 self.bm25_term_score(mini_index, docid, qt, qtf)
+                    # calculate bm25 score
+                    doc_bm25_score = doc_bm25_score + \
+                                     self.bm25_term_score(mini_index, docid, qt, qtf)
 
-            docscores.append(DocumentScore(docid, doc_bm25_score, "BM25"))
+                docscores.append(DocumentScore(docid, doc_bm25_score, "BM25"))
 
         # Sort doc scores based on score from highest to lowest
-        docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
+        with span("bm25.sort"):
+            docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
 
         # return result set
-        return ResultSet(query, docscores)
+        with span("resultset"):
+            return ResultSet(query, docscores)
 
 
     # GIVEN a dictionary of (term, inverted list), mini_index and
@@ -144,9 +164,10 @@ class BM25:
     def bm25_term_score (self, mini_index, docid, qterm, qtf):
 
         # input sanity check
-        assert (docid >= 0)
-        assert (mini_index.get(qterm) is not None)
-        assert (qtf > 0)
+        if (self.verify == VERIFY_FULL):
+            assert (docid >= 0)
+            assert (mini_index.get(qterm) is not None)
+            assert (qtf > 0)
 
         # Get frequency of term in document
         doctf  = self.document_tf (qterm, docid, mini_index)
@@ -167,14 +188,15 @@ class BM25:
         dl      = self.global_stats.document_length(docid) # doc length
         avdl    = self.global_stats.get_avdl()             # avg. doc length
         N       = self.global_stats.get_N()                # total docs in corpus
-        nqt     = len(mini_index.get(qterm))               # #docs with qt (ni)
+        nqt     = self.invidx.document_frequency(qterm)    # #docs with qt (ni)
 
         # Variable sanity check
-        assert (nqt  > 0)
-        assert (dl   > 0)
-        assert (avdl > 0)
-        assert (N    > 0)
-        assert (nqt  > 0)
+        if (self.verify == VERIFY_FULL):
+            assert (nqt  > 0)
+            assert (dl   > 0)
+            assert (avdl > 0)
+            assert (N    > 0)
+            assert (nqt  > 0)
 
         term_bimscore = self.bimscore(N, nqt)
 
@@ -247,8 +269,9 @@ class BM25:
     def document_tf(self, term, docid, mini_index):
 
         # Sanity check
-        assert (mini_index.get(term) is not None)
-        assert (docid >= 0)
+        if (self.verify == VERIFY_FULL):
+            assert (mini_index.get(term) is not None)
+            assert (docid >= 0)
 
         # Get inverted_list / postings of the term
         term_postings = mini_index.get(term)
@@ -261,9 +284,10 @@ class BM25:
 
         # Term does appear in the document
         # Sanity check
-        assert (docposting_idx >= 0 and docposting_idx < len(term_postings))
-        assert (term_postings[docposting_idx].docid >= 0)
-        assert (term_postings[docposting_idx].tf     > 0)
+        if (self.verify == VERIFY_FULL):
+            assert (docposting_idx >= 0 and docposting_idx < len(term_postings))
+            assert (term_postings[docposting_idx].docid >= 0)
+            assert (term_postings[docposting_idx].tf     > 0)
 
         # return frequency
         return term_postings[docposting_idx].tf
@@ -273,7 +297,8 @@ class BM25:
     # if no such posting exists, then return -1
     def posting_idx(self, postings, docid):
 
-        assert (isinstance(docid, int))
+        if (self.verify == VERIFY_FULL):
+            assert (isinstance(docid, int))
 
         # the postings list is sorted. lets binary search
         left  = 0
@@ -1,11 +1,13 @@
 ##This file implements the BM25 retrieval model
-from index             import Index
+from index             import Index, VERIFY_OFF, VERIFY_FULL
 from docid_mapper      import DocIDMapper
 from query             import Query
 from result_set        import Result, ResultSet, DocumentScore
 from global_statistics import GlobalStatistics
 from corpus_rw         import is_corpus_file, CorpusRW
 from text_processing   import word_ngrams
+from forward_index     import ForwardIndex
+from tracing           import span, count
 import collections
 
 
@@ -22,6 +24,15 @@ class BM25_R:
     ## Inverted index
     invidx       = None
 
+    ## Forward index (refer to forward_index.py)
+    fwdidx       = None
+
+    ## Corpus frequencies of all indexed terms; computed on first use
+    corpus_tfs   = None
+
+    ## Verification level (refer to index.py)
+    verify       = VERIFY_OFF
+
     ## BM25 parameters
     k1 = 1.2
     k2 = 100
@@ -30,11 +41,13 @@ class BM25_R:
     indexst =""
     ## Constructor
     # Given an indexstore where the index file is stored by (indexer.py)
-    #       and a global statistics file path
+    #       and a global statistics file path, and
+    #       optionally a verification level (refer to index.py)
     #
     # Initializes the bm25 algorithm
     #
-    def __init__(self, indexstore, gsfile, k1_ = 1.2, k2_ = 100, b_ = 0.75):
+    def __init__(self, indexstore, gsfile, k1_ = 1.2, k2_ = 100, b_ = 0.75,
+                 verify_ = VERIFY_OFF):
 
         # reset
         self.reset()
@@ -45,10 +58,12 @@ class BM25_R:
             return
 
         # Get index
-        self.invidx = Index(indexstore)
+        self.verify = verify_
+        self.invidx = Index(indexstore, verify = verify_)
+        self.fwdidx = ForwardIndex(indexstore)
         self.indexst = indexstore
         # Get global statistics
-        self.global_stats = GlobalStatistics(gsfile)
+        self.global_stats = GlobalStatistics(gsfile, verify_)
 
         # Set BM25 parameters
         self.k1 = k1_
@@ -64,6 +79,15 @@ class BM25_R:
         ## Inverted index
         self.invidx       = None
 
+        ## Forward index
+        self.fwdidx       = None
+
+        ## Corpus frequencies
+        self.corpus_tfs   = None
+
+        ## Verification level
+        self.verify       = VERIFY_OFF
+
         ## BM25 parameters
         self.k1 = 1.2
         self.k2 = 100
@@ -83,11 +107,16 @@ class BM25_R:
         flag = 0
         lst=list()
         for query in queries:
+            # tf components of the scores of the query terms; the second pass
+            # reuses the ones of the first pass (refer to search_query)
+            tf_scores = {}
+
             # search query in index
-            resultset = self.search_query(self.invidx, query, flag, lst)
+            resultset = self.search_query(self.invidx, query, flag, lst, tf_scores)
             lst = self.get_relevencedocs(resultset)
 
-            allterms = collections.Counter(self.rochio(query, self.invidx, lst))
+            with span("prf.expand"):
+                allterms = collections.Counter(self.rochio(query, self.invidx, lst))
 
             length = len (query.querystr.split())
             new_query = query.querystr
@@ -98,7 +127,9 @@ class BM25_R:
 
             flag=1
             q = Query(query.qid,new_query.strip())
-            resultsetrelevance = self.search_query(self.invidx, q,flag, lst)
+            # the expanded query keeps the operators of the query
+            q.operators = query.operators
+            resultsetrelevance = self.search_query(self.invidx, q,flag, lst, tf_scores)
             result = ResultSet(query, resultsetrelevance)
             results.append(result)
 
@@ -106,58 +137,100 @@ class BM25_R:
         return results
 
     ##
-    # GIVEN : a Query (from query.py)
+    # GIVEN : a Query (from query.py) and
+    #         optionally a dictionary of key value pairs of term and the tf
+    #         components of the term's document scores (refer to
+    #         term_tf_scores). Terms not in the dictionary are added to it
     # RETURNS: a ResultSet (from result_set.py) that contains information about
     #          what documents in the index matched the query and their corresponding
     #          document scores with other information
     #
-    def search_query(self, invidx, query, flag, lst):
+    # The tf component of a document score does not depend on the relevance
+    # information or the query term frequency, so the second pass of a query
+    # only computes the ones of the expansion terms. The relevance information
+    # changes the idf component of the original query terms as well, so their
+    # first pass scores cannot be reused as they are
+    #
+    def search_query(self, invidx, query, flag, lst, tf_scores = None):
 
         # TODO: For now we know that query terms are split by spaces.
         #       going forward generalize this
-        query_terms = query.querystr.split(" ")
+        with span("prf.parse"):
+            query_terms = query.querystr.split(" ")
 
-        # filter query terms not appearing in index
-        query_terms = filter(lambda qt: invidx.contains_term(qt), query_terms)
+            # filter query terms not appearing in index
+            query_terms = filter(lambda qt: invidx.contains_term(qt), query_terms)
 
-        # Create a query-termfreqency dictionary. This will remove duplicate
-        query_tf_dict = self.termfrequency(query_terms)
+            # Create a query-termfreqency dictionary. This will remove duplicate
+            query_tf_dict = self.termfrequency(query_terms)
 
         # Get a dictionary of related invlists with key value pairs (term, postings)
         # This is in essence a mini-index
         mini_index    = self.invidx.minindex(query_terms)
 
-        # Get set of related documents
-        docids        = self.invidx.docids_with_terms(set(query_terms))
+        # Get set of related documents; documents must match the phrase and
+        # window operators of the query (refer to query_operators.py)
+        docids        = self.invidx.docids_for_query(set(query_terms),
+                                                     query.operators)
 
 
-        # List of document scores (DocumentScore from result_set.py)
-        docscores     = []
+        count("docs_scored", len(docids))
 
-        # Score every document in set
-        for docid in docids:
+        with span("prf.score"):
 
-            doc_bm25_score = 0
+            # tf components of every query term not scored by an earlier pass
+            if (tf_scores is None):
+                tf_scores = {}
+            for qt in query_tf_dict:
+                if (tf_scores.get(qt) is None):
+                    tf_scores[qt] = self.term_tf_scores(mini_index.get(qt))
 
-            # Score document for every query term
+            # idf and query term frequency components; the same for all documents
+            term_weights = {}
             for qt in query_tf_dict:
+                term_weights[qt] = self.term_weights(mini_index, qt, query_tf_dict.get(qt),
+                                                     flag, lst, tf_scores[qt])
 
-                # query term frequency
-                qtf = query_tf_dict.get(qt)
+            # List of document scores (DocumentScore from result_set.py)
+            docscores     = []
 
-                # calculate bm25 score
-                doc_bm25_score = doc_bm25_score + \
-                                 self.bm25_term_score(mini_index, docid, qt, qtf, flag, lst)
+            # Score every document in set
+            for docid in docids:
 
-            docscores.append(DocumentScore(docid, doc_bm25_score, "PRF"))
+                doc_bm25_score = 0
+
+                # Score document for every query term
+                for qt in query_tf_dict:
+
+                    term_tfscore = tf_scores[qt].get(docid)
+                    if (term_tfscore is None):
+                        # Query term does not appear in document. skip
+                        continue
+
+                    (term_bimscore, term_qfscore) = term_weights[qt]
+
+                    # calculate bm25 score
+                    doc_bm25_score = doc_bm25_score + \
+                                     term_bimscore * term_tfscore * term_qfscore
+
+                docscores.append(DocumentScore(docid, doc_bm25_score, "PRF"))
 
         # Sort doc scores based on score from highest to lowest
-        docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
+        with span("prf.sort"):
+            docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
 
         # return docscores
         return docscores
 
+    # GIVEN a document ID
+    # RETURNS the list of terms of the document in order. The terms are read
+    #         from the forward index; indexstores without a forward index are
+    #         read from the corpus file of the document
     def partialindexer(self, docid):
+
+        if (self.fwdidx.contains_document(docid)):
+            return self.fwdidx.document_terms(docid)
+
         # docid mapper; Maps documentID to a
         # tuple of (cacm_corpus_file_path, cacm_document_path)
         docid_map = DocIDMapper().read(self.indexst)
@@ -183,6 +256,24 @@ class BM25_R:
         return terms
 
 
+    # GIVEN a document ID
+    # RETURNS a tuple of the list of distinct terms of the document in order of
+    #         first occurrence and a dictionary of key value pairs of term and
+    #         the frequency of the term in the document
+    def document_vector(self, docid):
+
+        terms = []
+        tfs   = {}
+
+        for term in self.partialindexer(docid):
+            if term in tfs:
+                tfs[term] = tfs[term] + 1
+            else:
+                tfs[term] = 1
+                terms.append(term)
+
+        return (terms, tfs)
+
     def rochio(self,query,invidx,lst):
         new_query = query
         relevance_index = {}
@@ -203,13 +294,18 @@ class BM25_R:
                 query_vector[term] = 1
 
 
+        # corpus frequencies of all terms, once
+        if self.corpus_tfs is None:
+            self.corpus_tfs = invidx.term_frequencies()
+
+        # a term takes the tf of the last feedback document it is in
         for item in lst:
-            indx = self.partialindexer(item)
-            for term in indx:
-                    relevance_index[term] = invidx.document_posting(term, item).tf
+            (terms, tfs) = self.document_vector(item)
+            for term in terms:
+                    relevance_index[term] = tfs[term]
                     if not query_vector.has_key(term):
                         query_vector[term] = 0
-                    non_relevance_index[term] = invidx.corpus_frequency(term) - invidx.document_posting(term, item).tf
+                    non_relevance_index[term] = self.corpus_tfs[term] - tfs[term]
 
         for term in query_terms:
             if not relevance_index.has_key(term):
@@ -244,58 +340,74 @@ class BM25_R:
         return updated_query
 
 
-    # GIVEN a dictionary of (term, inverted list), mini_index and
-    #       a document id, docid
-    #       a query term, qt
-    #       the frequency of the query term in the query, qtf
-    # RETURNS the bm25 score for the document with respect to the query term
+    # GIVEN the postings of a query term
+    # RETURNS a dictionary of key value pairs of docid and the term frequency
+    #         component of the bm25 score of the document for the query term
+    #         (refer to tfscore), for all documents with the term
     #
-    def bm25_term_score (self, mini_index, docid, qterm, qtf, flag, lst):
+    def term_tf_scores(self, postings):
 
-        # input sanity check
-        assert (docid >= 0)
-        assert (mini_index.get(qterm) is not None)
-        assert (qtf > 0)
-
-        # Get frequency of term in document
-        doctf  = self.document_tf (qterm, docid, mini_index)
-        if (doctf == 0):
-            # Query term does not appear in document. skip
-            return 0
+        avdl = self.global_stats.get_avdl()             # avg. doc length
+
+        if (self.verify == VERIFY_FULL):
+            assert (postings is not None)
+            assert (avdl > 0)
+
+        doc_tfscores = {}
+
+        for p in postings:
+
+            dl = self.global_stats.document_length(p.docid) # doc length
+
+            if (self.verify == VERIFY_FULL):
+                assert (p.docid >= 0)
+                assert (p.tf    > 0)
+                assert (dl      > 0)
 
-        # The BM25 model's query term scoring formula is made of 3 parts
-        #
-        #  1. log of Binary Independence Model score
-        #  2. Term frequency weight score
-        #  3. Query term frequency weight score
-        #
-        # These three scores are multiplied to realize the final score
-        # of the document for this query term
+            doc_tfscores[p.docid] = self.tfscore(p.tf, dl, avdl, self.k1, self.b)
+
+        return doc_tfscores
+
+    # GIVEN a dictionary of (term, inverted list), mini_index,
+    #       a query term, qt,
+    #       the frequency of the query term in the query, qtf,
+    #       the relevance flag and list of relevant docids, and
+    #       the tf components of the query term (refer to term_tf_scores)
+    # RETURNS a tuple of the Binary Independence Model and query term frequency
+    #         components of the bm25 score of any document for the query term
+    #
+    # The BM25 model's query term scoring formula is made of 3 parts
+    #
+    #  1. log of Binary Independence Model score
+    #  2. Term frequency weight score
+    #  3. Query term frequency weight score
+    #
+    # These three scores are multiplied to realize the final score of a document
+    # for the query term. Only 2. depends on the document
+    #
+    def term_weights(self, mini_index, qterm, qtf, flag, lst, doc_tfscores):
+
+        # input sanity check
+        if (self.verify == VERIFY_FULL):
+            assert (mini_index.get(qterm) is not None)
+            assert (qtf > 0)
 
         # Get all variables
-        dl      = self.global_stats.document_length(docid) # doc length
-        avdl    = self.global_stats.get_avdl()             # avg. doc length
         N       = self.global_stats.get_N()                # total docs in corpus
         nqt     = len(mini_index.get(qterm))               # #docs with qt (ni)
 
         # Variable sanity check
-        assert (nqt  > 0)
-        assert (dl   > 0)
-        assert (avdl > 0)
-        assert (N    > 0)
-        assert (nqt  > 0)
+        if (self.verify == VERIFY_FULL):
+            assert (nqt  > 0)
+            assert (N    > 0)
 
-        ri = self.ri(qterm, mini_index, lst)
+        ri = self.ri(qterm, doc_tfscores, lst)
 
         term_bimscore = self.bimscore(N, nqt, flag, ri)
 
-        term_tfscore  = self.tfscore(doctf, dl, avdl, self.k1, self.b)
-
         term_qfscore  = self.qfscore(qtf, self.k2)
 
-        term_score = term_bimscore * term_tfscore * term_qfscore
-
-        return term_score
+        return (term_bimscore, term_qfscore)
 
     # GIVEN: The total number of documents in corpus, N and
     #        The number of documents containing the term of interest
@@ -361,8 +473,9 @@ class BM25_R:
     def document_tf(self, term, docid, mini_index):
 
         # Sanity check
-        assert (mini_index.get(term) is not None)
-        assert (docid >= 0)
+        if (self.verify == VERIFY_FULL):
+            assert (mini_index.get(term) is not None)
+            assert (docid >= 0)
 
         # Get inverted_list / postings of the term
         term_postings = mini_index.get(term)
@@ -375,9 +488,10 @@ class BM25_R:
 
         # Term does appear in the document
         # Sanity check
-        assert (docposting_idx >= 0 and docposting_idx < len(term_postings))
-        assert (term_postings[docposting_idx].docid >= 0)
-        assert (term_postings[docposting_idx].tf     > 0)
+        if (self.verify == VERIFY_FULL):
+            assert (docposting_idx >= 0 and docposting_idx < len(term_postings))
+            assert (term_postings[docposting_idx].docid >= 0)
+            assert (term_postings[docposting_idx].tf     > 0)
 
         # return frequency
         return term_postings[docposting_idx].tf
@@ -387,7 +501,8 @@ class BM25_R:
     # if no such posting exists, then return -1
     def posting_idx(self, postings, docid):
 
-        assert (isinstance(docid, int))
+        if (self.verify == VERIFY_FULL):
+            assert (isinstance(docid, int))
 
         # the postings list is sorted. lets binary search
         left  = 0
@@ -419,9 +534,12 @@ class BM25_R:
         return lst
 
 
-    def ri(self, qterm, minindex, lst):
+    # GIVEN a query term, the tf components of the query term (refer to
+    #       term_tf_scores) and a list of relevant docids
+    # RETURNS the number of relevant documents with the query term
+    def ri(self, qterm, doc_tfscores, lst):
         ri = 0
         for item in lst:
-            if self.document_tf(qterm, item, minindex) > 0:
+            if doc_tfscores.get(item) is not None:
                 ri = ri + 1
         return ri
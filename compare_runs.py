@@ -0,0 +1,306 @@
+## This program compares runs pairwise with paired significance tests on a
+#  metric of every query (refer to significance.py and eval_engine.py) and
+#  prints a comparison matrix of the runs
+
+from eval_engine  import Qrels, read_run, evaluate_run, METRICS
+from significance import compare, PERMUTATIONS, RESAMPLES, ALPHA
+
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+from   argparse import RawTextHelpFormatter
+
+## Help strings ################################################################
+
+program_help = '''
+
+    compare_runs.py compares every pair of runs, files of TREC format result
+    strings, on a metric of every query with a paired t test, a randomization
+    test and a bootstrap confidence interval of the mean difference, and prints
+    a comparison matrix of the runs
+
+    Argument 1: relevancefile - Path to the cacm relevance file
+
+    Argument 2: runfiles      - Comma separated list of runs. Every run may be
+                                a glob pattern, e.g. "results/cacm.result.*"
+
+    Argument 3: metric        - Metric to compare (refer to eval_engine.py).
+                                Defaults to map
+
+    Argument 4: permutations  - Number of permutations of the randomization
+                                test. Defaults to 10000
+
+    Argument 5: resamples     - Number of resamples of the bootstrap. Defaults
+                                to 10000
+
+    Argument 6: seed          - Seed of the random generator. Defaults to 0
+
+    Argument 7: workers       - Number of processes that compare pairs of runs
+                                in parallel. 0 uses every core. Defaults to 1
+
+    Argument 8: outputfile    - Path to a CSV file to write the results of all
+                                tests of all pairs to. This argument is
+                                optional
+
+    EXAMPLES:
+
+        python compare_runs.py --relevancefile=./cacm/cacm.rel.txt --runfiles="results/cacm.result.*" --metric=map --workers=0
+  '''
+
+relevancefile_help = '''
+    Path to the cacm relevance file
+    '''
+
+runfiles_help = '''
+    Comma separated list of runs. Every run may be a glob pattern
+    '''
+
+metric_help = '''
+    Metric to compare. One of
+    ''' + ", ".join(METRICS) + '''. Defaults to map
+    '''
+
+permutations_help = '''
+    Number of permutations of the randomization test. Defaults to 10000
+    '''
+
+resamples_help = '''
+    Number of resamples of the bootstrap. Defaults to 10000
+    '''
+
+seed_help = '''
+    Seed of the random generator. Defaults to 0
+    '''
+
+workers_help = '''
+    Number of processes that compare pairs of runs in parallel. 0 uses every
+    core. Defaults to 1
+    '''
+
+outputfile_help = '''
+    Path to a CSV file to write the results of all tests to. If the outputfile
+    already exists, it is deleted. This argument is optional
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--relevancefile",
+                       metavar  = "rl",
+                       required = True,
+                       type     = str,
+                       help     = relevancefile_help)
+
+argparser.add_argument("--runfiles",
+                       metavar  = "rf",
+                       required = True,
+                       type     = str,
+                       help     = runfiles_help)
+
+argparser.add_argument("--metric",
+                       metavar  = "m",
+                       type     = str,
+                       default  = "map",
+                       help     = metric_help)
+
+argparser.add_argument("--permutations",
+                       metavar  = "p",
+                       type     = int,
+                       default  = PERMUTATIONS,
+                       help     = permutations_help)
+
+argparser.add_argument("--resamples",
+                       metavar  = "r",
+                       type     = int,
+                       default  = RESAMPLES,
+                       help     = resamples_help)
+
+argparser.add_argument("--seed",
+                       metavar  = "s",
+                       type     = int,
+                       default  = 0,
+                       help     = seed_help)
+
+argparser.add_argument("--workers",
+                       metavar  = "w",
+                       type     = int,
+                       default  = 1,
+                       help     = workers_help)
+
+argparser.add_argument("--outputfile",
+                       metavar  = "o",
+                       type     = str,
+                       default  = "",
+                       help     = outputfile_help)
+
+## Parallel comparison #########################################################
+
+# Given a tuple of the per query values of runs A and B, the number of
+# permutations and resamples and a seed
+# Returns the results of all tests of A - B
+def compare_worker(job):
+
+    (a, b, permutations, resamples, seed) = job
+
+    return compare(a, b, permutations, resamples, seed)
+
+##
+# GIVEN: a list of runs,
+#        a dictionary of key value pairs of run and the list of the values of
+#        the metric for every query; the same queries in the same order,
+#        the number of permutations and resamples, a seed and the number of
+#        worker processes
+#
+# RETURNS: a dictionary of key value pairs of (run A, run B) and the results of
+#          the tests of A - B, for every pair of runs with A before B
+#
+def compare_all(runs, run_values, permutations, resamples, seed, workers):
+
+    pairs = []
+    for i in range(0, len(runs)):
+        for j in range(i + 1, len(runs)):
+            pairs.append((runs[i], runs[j]))
+
+    # every pair has its own seed, so results do not depend on the workers
+    jobs = map(lambda k: (run_values[pairs[k][0]], run_values[pairs[k][1]],
+                          permutations, resamples, seed + k),
+               range(0, len(pairs)))
+
+    if (workers > 1 and len(jobs) > 1):
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(compare_worker, jobs, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(compare_worker, jobs)
+
+    return dict(zip(pairs, results))
+
+## Output ######################################################################
+
+# Given a list of runs, the metric means of the runs and the results of
+# compare_all
+# Print the comparison matrix of the runs. The cell of row A and column B is
+# the mean difference A - B and the randomization test p value, marked with a
+# "*" if the difference is significant
+def print_matrix(runs, means, comparisons):
+
+    # runs are numbered in the matrix
+    print "Runs,"
+    for i in range(0, len(runs)):
+        print "  [%d] %-40s %.4f" % (i, runs[i], means[runs[i]])
+    print
+
+    print "%6s" % "" + "".join(map(lambda i: "%22s" % ("[" + str(i) + "]"),
+                                   range(0, len(runs))))
+
+    for i in range(0, len(runs)):
+
+        cells = []
+        for j in range(0, len(runs)):
+
+            if (i == j):
+                cells.append("%22s" % "-")
+                continue
+
+            if (i < j):
+                result = comparisons[(runs[i], runs[j])]
+                diff   = result["diff"]
+            else:
+                result = comparisons[(runs[j], runs[i])]
+                diff   = -result["diff"]
+
+            mark = "*" if result["randomization_p"] < ALPHA else " "
+            cells.append("%22s" % ("%+.4f (p=%.4f)%s" % (diff, result["randomization_p"], mark)))
+
+        print "%6s" % ("[" + str(i) + "]") + "".join(cells)
+
+    print
+    print "* significant at alpha = %.2f, randomization test" % ALPHA
+
+# Given the results of compare_all and the path to a CSV file
+# Write the results of all tests of all pairs to the file
+def write_csv(comparisons, outputfile):
+
+    fields = ["mean_a", "mean_b", "diff", "t", "t_p", "randomization_p",
+              "ci_low", "ci_high"]
+
+    with open(outputfile, "wb") as f:
+
+        writer = csv.writer(f)
+        writer.writerow(["run_a", "run_b"] + fields)
+
+        for pair in sorted(comparisons.keys()):
+            writer.writerow(list(pair) +
+                            map(lambda fl: "%.6f" % comparisons[pair][fl], fields))
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+relevancefile = args['relevancefile']
+runfiles      = args['runfiles']
+metric        = args['metric']
+permutations  = args['permutations']
+resamples     = args['resamples']
+seed          = args['seed']
+workers       = args['workers']
+outputfile    = args['outputfile']
+
+## Input check
+if (not os.path.exists(relevancefile)):
+    print "FATAL: Cannot find cacm relevance file, ", relevancefile
+    exit (-1)
+if (metric not in METRICS):
+    print "FATAL: metric should be one of ", METRICS
+    exit(-1)
+if (permutations <= 0 or resamples <= 0):
+    print "FATAL: permutations and resamples should be > 0"
+    exit(-1)
+if (workers < 0):
+    print "FATAL: workers should be >= 0"
+    exit(-1)
+if (workers == 0):
+    workers = multiprocessing.cpu_count()
+
+# expand glob patterns; runs in the order given
+runs = []
+for pattern in runfiles.split(","):
+    matches = sorted(glob.glob(pattern))
+    if (matches == []):
+        print "FATAL: Cannot find run, ", pattern
+        exit (-1)
+    runs.extend(matches)
+
+if (len(runs) < 2):
+    print "FATAL: At least two runs are needed"
+    exit(-1)
+
+if (outputfile != "" and os.path.exists(outputfile)):
+    print "WARNING: Deleting existing outputfile"
+    os.remove(outputfile)
+
+qrels = Qrels(relevancefile)
+
+# values of the metric for every query of the qrels, of every run
+run_values = {}
+run_means  = {}
+for runfile in runs:
+    (query_metrics, means) = evaluate_run(qrels, read_run(runfile))
+    run_values[runfile] = map(lambda qid: query_metrics[qid][metric], qrels.qids())
+    run_means[runfile]  = means[metric]
+
+comparisons = compare_all(runs, run_values, permutations, resamples, seed, workers)
+
+print_matrix(runs, run_means, comparisons)
+
+if (outputfile != ""):
+    write_csv(comparisons, outputfile)
@@ -4,6 +4,8 @@ from text_processing import process_text
 from cacm_parser     import is_cacm_doc, cacm_docid, cacm_content
 from corpus_rw       import CorpusRW, corpus_filename
 from docid_mapper    import DocIDMapper
+from sentence_store  import document_sentences, store_sentences
+from profiling       import Profiler, PROFILERS, PROFILER_CPROFILE, finish_profile
 
 import os.path
 import shutil
@@ -33,7 +35,18 @@ program_help = '''
     Argument 3: stopfile    - Path to the stoplist file. Every term in the stoplist
                               must be separated by the STOPFILE_DELIMITER (in stopping.py)
 
-    Argument 4: verbose     - Print progress of the program to the stdout. This
+    Argument 4: profile     - Prefix of the profile files to write; pstats,
+                              collapsed stacks for flame graphs and a report
+                              (refer to profiling.py). This argument is optional
+
+    Argument 5: profiler    - Profiler of --profile; "cprofile" (default) or
+                              "sampling", a sampling profiler with a low
+                              overhead
+
+    Argument 6: profilememory - Also profile the top memory allocators of
+                              --profile
+
+    Argument 7: verbose     - Print progress of the program to the stdout. This
                               argument is optional.
 
     EXAMPLES:
@@ -41,6 +54,9 @@ program_help = '''
         # default execution, with casefolding and punctuation handling
         python corpus.py --docstore="./cacm/cacm_corpus" --corpusstore="./corpusstore --stopfile=./cacm/common_words --verbose"
 
+        # profile corpus.py; corpus.prof.pstats, corpus.prof.collapsed, corpus.prof.txt
+        python corpus.py --docstore="./cacm/cacm_corpus" --corpusstore="./corpusstore" --profile=corpus.prof
+
     '''
 
 docstore_help = '''
@@ -55,6 +71,21 @@ stopfile_help = '''
     the STOPFILE_DELIMITER (refer to text_processing.py)
     '''
 
+profile_help = '''
+    Prefix of the profile files to write; pstats, collapsed stacks for flame
+    graphs and a report of the top functions. This argument is optional
+    '''
+
+profiler_help = '''
+    Profiler of --profile; "cprofile" (default) or "sampling", a sampling
+    profiler with a low overhead. This argument is optional
+    '''
+
+profilememory_help = '''
+    Also profile the top memory allocators of --profile. This argument is
+    optional
+    '''
+
 verbose_help = '''
     Print progress of the program to the stdout. This argument is optional.
     '''
@@ -82,6 +113,23 @@ argparser.add_argument("--stopfile",
                        type    = str,
                        help    = stopfile_help)
 
+argparser.add_argument("--profile",
+                       metavar = "pf",
+                       default = "",
+                       type    = str,
+                       help    = profile_help)
+
+argparser.add_argument("--profiler",
+                       metavar = "pr",
+                       default = PROFILER_CPROFILE,
+                       type    = str,
+                       help    = profiler_help)
+
+argparser.add_argument("--profilememory",
+                       dest    = 'profilememory',
+                       action  = 'store_true',
+                       help    = profilememory_help)
+
 argparser.add_argument("--verbose",
                        dest    = 'verbose',
                        action  = 'store_true',
@@ -99,7 +147,8 @@ def print_verbose(txt):
 # GIVEN paths to where cacm documents, to clean up, are stored and
 #       where to store the generated cleaned up corpus from the cacm documents, and
 #       the path to the stopfile (optional)
-# Generate one corpus file for each cacm document document
+# Generate one corpus file for each cacm document document, and the sentence
+# store of the corpus (refer to sentence_store.py)
 def corpus(docstore,
            corpusstore,
            stopfile    = "",
@@ -112,6 +161,11 @@ def corpus(docstore,
     # Sort cacm_docs by file name
     cacm_docs.sort()
 
+    # sentences of every document for snippet generation, and the processed
+    # form of every word seen
+    docid_sentences = {}
+    processed_words = {}
+
     for doc in cacm_docs:
 
         print_verbose("doc -> corpus ( "            + \
@@ -128,6 +182,9 @@ def corpus(docstore,
         # get the content of the cacm document
         content = cacm_content(d_path)
 
+        # split document into sentences
+        docid_sentences[cacm_docid(doc)] = document_sentences(content, processed_words)
+
         # process text (punctuations and casefolding) and by default remove all
         # extraneous spaces
         content = process_text(content, stopfile)
@@ -161,6 +218,9 @@ def corpus(docstore,
     # Write docid map
     DocIDMapper().store(corpusstore, docid_map)
 
+    # Write sentence store
+    store_sentences(corpusstore, docid_sentences)
+
 ## Main ########################################################################
 
 ## Get arguments
@@ -170,6 +230,9 @@ args = vars(argparser.parse_args())
 docstore           = args['docstore']
 corpusstore        = args['corpusstore']
 stopfile           = args['stopfile']
+profile            = args['profile']
+profiler           = args['profiler']
+profilememory      = args['profilememory']
 verbose            = args['verbose']
 
 # Check if docstore is present
@@ -182,6 +245,11 @@ if (stopfile != "" and (not os.path.exists(stopfile))):
     print "FATAL: Cannot find stopfile ", stopfile
     exit(-1)
 
+# Check profiler
+if (profiler not in PROFILERS):
+    print "FATAL: profiler should be one of ", PROFILERS
+    exit(-1)
+
 # Check corpusstore
 if (os.path.exists(corpusstore)):
     print "WARNING: Deleting existing corpusstore"
@@ -189,5 +257,14 @@ if (os.path.exists(corpusstore)):
 # Create corpusstore
 os.makedirs(corpusstore)
 
+## Profile the program (refer to profiling.py)
+program_profile = None
+if (profile != ""):
+    program_profile = Profiler(profile, profiler, profilememory)
+    program_profile.start()
+
 # Get to work now !! :D :D
 corpus(docstore, corpusstore, stopfile)
+
+if (program_profile is not None):
+    finish_profile(program_profile)
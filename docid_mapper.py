@@ -18,15 +18,16 @@ class DocIDMapper:
 
     # given a dictionary of key, value pairs of where the key is the
     #       document ID and the value is a tuple of corpus file path and
-    #       document file path
+    #       document file path, and
+    #       optionally the name of the file to store the mapping to
     # Store the mapping to a file
-    def store(self, mapstore, docid_map):
+    def store(self, mapstore, docid_map, mapfname = DOCIDMAPPER):
 
         # assert we have a mapstore
         assert (os.path.exists(mapstore))
 
         # create docid mapper file in mapstore
-        docidmapf = open(os.path.join(mapstore, DOCIDMAPPER), "w+")
+        docidmapf = open(os.path.join(mapstore, mapfname), "w+")
 
         for docid in docid_map:
             # Write in the format
@@ -106,16 +107,16 @@ class DocIDMapper:
 
     # Given a source mapstore (a folder where a file DOCIDMAPPER exists) and
     # a destination mapstore (a folder where we want to copy the DOCIDMAPPER
-    # file to)
+    # file to), and optionally the name of the destination file
     # Copy DOCIDMAPPER from source folder to destination folder
-    def copy_docidmapper(self, src_mapstore, dst_mapstore):
+    def copy_docidmapper(self, src_mapstore, dst_mapstore, dst_mapfname = DOCIDMAPPER):
 
         assert (os.path.exists(src_mapstore))
         assert (os.path.exists(dst_mapstore))
 
         # docid map source and destination file paths
         mapsfpath = os.path.join(src_mapstore, DOCIDMAPPER)
-        mapdfpath = os.path.join(dst_mapstore, DOCIDMAPPER)
+        mapdfpath = os.path.join(dst_mapstore, dst_mapfname)
 
         assert (os.path.exists(mapsfpath))
         shutil.copy(mapsfpath, mapdfpath)
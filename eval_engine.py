@@ -0,0 +1,230 @@
+## This file provides the evaluation engine; relevance judgements (qrels) and
+#  the metrics of TREC format runs (refer to evaluate_runs.py)
+#
+# Metrics of a query, given the ranking of a run and the R relevant documents
+# of the query,
+#   map     - average precision; the mean over all relevant documents of the
+#             precision at the rank of the document, 0 if not retrieved
+#   mrr     - reciprocal rank of the first relevant document
+#   P@k     - precision at rank k, for every k in PRECISIONKS
+#   Rprec   - precision at rank R
+#   ndcg@k  - normalized discounted cumulative gain at rank k, for every k in
+#             NDCGKS. The gain of a document is its relevance level
+#   bpref   - the mean over all relevant documents of the fraction of judged
+#             non relevant documents not ranked above it; refer to Buckley and
+#             Voorhees, "Retrieval evaluation with incomplete information".
+#             Without judged non relevant documents, bpref is the recall
+#
+# All metrics of a query are computed in a single pass over its ranking, with
+# the relevant documents of the query in a dictionary. The metrics of a run are
+# the means over all queries with relevant documents; queries the run does not
+# rank score 0
+#
+# Relevance files name documents "CACM-0047" while runs name them by docid,
+# "47". Both are the same document (refer to docid_key)
+
+import math
+
+## Globals #####################################################################
+
+# Rank cutoffs of P@k and ndcg@k
+PRECISIONKS = [5, 10, 20, 100]
+NDCGKS      = [10, 20]
+
+# Names of all metrics in output order
+METRICS = ["map", "mrr"] + map(lambda k: "P@" + str(k), PRECISIONKS) + \
+          ["Rprec"] + map(lambda k: "ndcg@" + str(k), NDCGKS) + ["bpref"]
+
+## Utilities ###################################################################
+
+# Given a document name of a relevance file or a run, e.g. "CACM-0047" or "47"
+# Returns the key of the document; the number of the document, or the name if
+# it has no number
+def docid_key(docname):
+
+    number = docname[docname.rfind("-") + 1:]
+
+    if (number.isdigit()):
+        return int(number)
+
+    return docname
+
+# Given a list of relevance levels (gains) and a rank cutoff k
+# Returns the discounted cumulative gain of the gains in order, at rank k
+def dcg(gains, k):
+
+    score = 0.0
+
+    for i in range(0, min(k, len(gains))):
+        score = score + float(gains[i]) / math.log(i + 2, 2)
+
+    return score
+
+## Relevance judgements ########################################################
+
+class Qrels:
+
+    # dictionary of key value pairs of query ID and a dictionary of key value
+    # pairs of relevant document and its relevance level
+    relevant    = {}
+
+    # dictionary of key value pairs of query ID and the set of judged non
+    # relevant documents
+    nonrelevant = {}
+
+    # reset
+    def reset(self):
+        self.relevant    = {}
+        self.nonrelevant = {}
+
+    # Constructor
+    # Given the path to a relevance file. Every line of the file is
+    # "query_id Q0 document relevance"; the relevance is 1 if the line has no
+    # relevance
+    def __init__(self, relevancefile):
+
+        self.reset()
+
+        with open(relevancefile, "r") as f:
+            for line in f:
+
+                parts = line.split()
+                if (parts == []):
+                    continue
+
+                qid   = int(parts[0])
+                docid = docid_key(parts[2])
+                level = int(parts[3]) if len(parts) > 3 else 1
+
+                if (level > 0):
+                    self.relevant.setdefault(qid, {})[docid] = level
+                else:
+                    self.nonrelevant.setdefault(qid, set()).add(docid)
+
+    # Returns the sorted list of IDs of the queries with relevant documents
+    def qids(self):
+        return sorted(self.relevant.keys())
+
+## Runs ########################################################################
+
+# Given the path to a run; a file of TREC format result strings,
+# "query_id Q0 doc_id rank score system_name"
+# Returns a dictionary of key value pairs of query ID and the list of ranked
+# documents of the query, in rank order
+def read_run(runfile):
+
+    ranked = {}
+
+    with open(runfile, "r") as f:
+        for line in f:
+
+            parts = line.split()
+            if (parts == []):
+                continue
+
+            ranked.setdefault(int(parts[0]), []).append((int(parts[3]),
+                                                         docid_key(parts[2])))
+
+    run = {}
+    for qid in ranked:
+        run[qid] = map(lambda rd: rd[1], sorted(ranked[qid]))
+
+    return run
+
+## Metrics #####################################################################
+
+# Given the list of ranked documents of a query,
+#       a dictionary of key value pairs of relevant document and its relevance
+#       level and
+#       a set of judged non relevant documents
+# Returns a dictionary of key value pairs of metric name and its value for the
+# query
+def evaluate_query(ranking, relevant, nonrelevant = set()):
+
+    metrics = dict.fromkeys(METRICS, 0.0)
+
+    R = len(relevant)
+    if (R == 0):
+        return metrics
+
+    # bpref normalization; the number of non relevant documents that count
+    bpref_norm = min(R, len(nonrelevant))
+
+    nrel       = 0     # relevant documents so far
+    nnonrel    = 0     # judged non relevant documents so far
+    sum_prec   = 0.0   # precisions at relevant documents so far
+    bpref      = 0.0
+    gains      = []    # gains of the ranking so far
+    seen       = set()
+
+    for docid in ranking:
+
+        # a document counts at its first rank only
+        if (docid in seen):
+            continue
+        seen.add(docid)
+
+        rank  = len(seen)
+        level = relevant.get(docid, 0)
+
+        gains.append(level)
+
+        if (level > 0):
+            nrel     = nrel + 1
+            sum_prec = sum_prec + float(nrel) / float(rank)
+
+            if (nrel == 1):
+                metrics["mrr"] = 1.0 / float(rank)
+
+            if (bpref_norm > 0):
+                bpref = bpref + 1.0 - float(min(nnonrel, R)) / float(bpref_norm)
+            else:
+                bpref = bpref + 1.0
+
+        elif (docid in nonrelevant):
+            nnonrel = nnonrel + 1
+
+        if (rank in PRECISIONKS):
+            metrics["P@" + str(rank)] = float(nrel) / float(rank)
+        if (rank == R):
+            metrics["Rprec"] = float(nrel) / float(R)
+
+    # cutoffs past the end of the ranking
+    for k in PRECISIONKS:
+        if (k > len(seen)):
+            metrics["P@" + str(k)] = float(nrel) / float(k)
+    if (R > len(seen)):
+        metrics["Rprec"] = float(nrel) / float(R)
+
+    metrics["map"]   = sum_prec / float(R)
+    metrics["bpref"] = bpref / float(R)
+
+    ideal = sorted(relevant.values(), reverse = True)
+    for k in NDCGKS:
+        metrics["ndcg@" + str(k)] = dcg(gains, k) / dcg(ideal, k)
+
+    return metrics
+
+# Given a Qrels and a run (refer to read_run)
+# Returns a tuple of a dictionary of key value pairs of query ID and the
+# metrics of the query, and the mean metrics of the run over all queries of
+# the qrels
+def evaluate_run(qrels, run):
+
+    query_metrics = {}
+
+    for qid in qrels.qids():
+        query_metrics[qid] = evaluate_query(run.get(qid, []),
+                                            qrels.relevant[qid],
+                                            qrels.nonrelevant.get(qid, set()))
+
+    means = dict.fromkeys(METRICS, 0.0)
+
+    if (query_metrics != {}):
+        for metric in METRICS:
+            means[metric] = sum(map(lambda m: m[metric], query_metrics.values())) / \
+                            float(len(query_metrics))
+
+    return (query_metrics, means)
+
+################################################################################
@@ -0,0 +1,163 @@
+## This program evaluates any number of TREC format runs against a relevance
+#  file and writes the metrics of every query of every run to a single output
+#  file (refer to eval_engine.py)
+
+from eval_engine import Qrels, read_run, evaluate_run, METRICS
+
+import argparse
+import csv
+import glob
+import json
+import os
+from   argparse import RawTextHelpFormatter
+
+## Help strings ################################################################
+
+program_help = '''
+
+    evaluate_runs.py evaluates runs, files of TREC format result strings, against
+    a relevance file and writes MAP, MRR, P@k, R-precision, nDCG@k and bpref of
+    every query and the means of every run to a single output file
+
+    Argument 1: relevancefile - Path to the cacm relevance file
+
+    Argument 2: runfiles      - Comma separated list of runs. Every run may be
+                                a glob pattern, e.g. "sweep/*.bm25"
+
+    Argument 3: outputfile    - Path to the output file. A ".json" file is
+                                written as JSON, any other file as CSV. If the
+                                outputfile already exists, it is deleted
+
+    Argument 4: verbose       - Print the mean metrics of every run
+
+    EXAMPLES:
+
+        python evaluate_runs.py --relevancefile=./cacm/cacm.rel.txt --runfiles=cacm.result.bm25,cacm.result.tfidf --outputfile=evaluation.csv --verbose
+        python evaluate_runs.py --relevancefile=./cacm/cacm.rel.txt --runfiles="sweep/*" --outputfile=sweep.json
+  '''
+
+relevancefile_help = '''
+    Path to the cacm relevance file
+    '''
+
+runfiles_help = '''
+    Comma separated list of runs. Every run may be a glob pattern
+    '''
+
+outputfile_help = '''
+    Path to the output file; JSON if it ends with ".json", CSV otherwise
+    '''
+
+verbose_help = '''
+    Print the mean metrics of every run. This argument is optional
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--relevancefile",
+                       metavar  = "rl",
+                       required = True,
+                       type     = str,
+                       help     = relevancefile_help)
+
+argparser.add_argument("--runfiles",
+                       metavar  = "rf",
+                       required = True,
+                       type     = str,
+                       help     = runfiles_help)
+
+argparser.add_argument("--outputfile",
+                       metavar  = "o",
+                       required = True,
+                       type     = str,
+                       help     = outputfile_help)
+
+argparser.add_argument("--verbose",
+                       dest     = 'verbose',
+                       action   = 'store_true',
+                       help     = verbose_help)
+
+## Output ######################################################################
+
+# Given a list of (run, query metrics, mean metrics) tuples and the path to a
+# JSON file
+# Write the metrics of all runs to the file
+def write_json(evaluations, outputfile):
+
+    runs = []
+    for (runfile, query_metrics, means) in evaluations:
+        queries = {}
+        for qid in query_metrics:
+            queries[str(qid)] = query_metrics[qid]
+        runs.append({"run" : runfile, "all" : means, "queries" : queries})
+
+    with open(outputfile, "w+") as f:
+        json.dump({"metrics" : METRICS, "runs" : runs}, f, indent = 1,
+                  sort_keys = True)
+
+# Given a list of (run, query metrics, mean metrics) tuples and the path to a
+# CSV file
+# Write the metrics of all runs to the file; one row per query of every run
+# and a row of query "all" with the means of the run
+def write_csv(evaluations, outputfile):
+
+    with open(outputfile, "wb") as f:
+
+        writer = csv.writer(f)
+        writer.writerow(["run", "query"] + METRICS)
+
+        for (runfile, query_metrics, means) in evaluations:
+            for qid in sorted(query_metrics.keys()):
+                writer.writerow([runfile, qid] +
+                                map(lambda m: "%.4f" % query_metrics[qid][m], METRICS))
+            writer.writerow([runfile, "all"] +
+                            map(lambda m: "%.4f" % means[m], METRICS))
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+relevancefile = args['relevancefile']
+runfiles      = args['runfiles']
+outputfile    = args['outputfile']
+verbose       = args['verbose']
+
+## Input check
+if (not os.path.exists(relevancefile)):
+    print "FATAL: Cannot find cacm relevance file, ", relevancefile
+    exit (-1)
+
+# expand glob patterns; runs in the order given
+runs = []
+for pattern in runfiles.split(","):
+    matches = sorted(glob.glob(pattern))
+    if (matches == []):
+        print "FATAL: Cannot find run, ", pattern
+        exit (-1)
+    runs.extend(matches)
+
+if (os.path.exists(outputfile)):
+    print "WARNING: Deleting existing outputfile"
+    os.remove(outputfile)
+
+qrels = Qrels(relevancefile)
+
+evaluations = []
+for runfile in runs:
+
+    (query_metrics, means) = evaluate_run(qrels, read_run(runfile))
+    evaluations.append((runfile, query_metrics, means))
+
+    if verbose:
+        print runfile
+        print "    " + "  ".join(map(lambda m: "%s %.4f" % (m, means[m]), METRICS))
+
+if (outputfile.endswith(".json")):
+    write_json(evaluations, outputfile)
+else:
+    write_csv(evaluations, outputfile)
@@ -162,10 +162,11 @@ def precision_and_recall_at_k(modeltables):
             pr_file.write("Rank" + " " + "Document_Id" + " " + "Precision" + " " + "Recall" + "\n\n")
 
             A = len(rel_dict[k])            # relevant number of documents in the corpus
+            rel_set = set(rel_dict[k])      # relevant documents, for lookups
 
             for n in top_doc_dict[k]:
                 index = index + 1           # increase rank parameter by 1
-                if n in rel_dict[k]:
+                if n in rel_set:
                     rel_count = rel_count + 1    # increase relevance document count
                     if rel_count == 1:
                         r_rank = float(1/index)  # reciprocal rank
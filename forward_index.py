@@ -0,0 +1,300 @@
+## This file provides the forward index of an index; the terms of every document
+#
+# The inverted index (refer to index.py) maps a term to the documents it is in.
+# The forward index maps a document to its terms, so that relevance feedback,
+# snippet language models and term vector features get the terms of a document
+# in O(document length) without reading corpus files.
+#
+# Every index file has a forward index file next to it with the same name and
+# extension FORWARDEXTN, e.g. index.fwd of index.idx and segment_000003.fwd of
+# segment_000003.idx (refer to segments.py). The forward index is built from the
+# postings of the index file when the index file is created, so both index the
+# same documents. A forward index file is made of,
+#   line 1       - the number of terms, k
+#   next k lines - the terms of the index file in sorted order. The term on
+#                  line i is the term with term ID i
+#   other lines  - one line per document; docid|vector|tokens where vector is
+#                  the space separated term ID and tf pairs of the terms of the
+#                  document and tokens is the space separated term IDs of the
+#                  document in order of position
+#
+# Document lines are only parsed when the document is accessed
+
+from index    import INDEXFILE, SEGMENTRETRIES
+from segments import Segments
+from manifest import Manifest, checksum
+
+import os
+
+## Globals #####################################################################
+
+# Extension of forward index files
+FORWARDEXTN = ".fwd"
+
+## Utilities ###################################################################
+
+# Given the file name of an index file or segment
+# Returns the file name of its forward index file
+def forward_filename(indexfname):
+
+    return os.path.splitext(indexfname)[0] + FORWARDEXTN
+
+## Forward index ###############################################################
+
+class ForwardIndex:
+
+    # indexstore of the index
+    indexstore = ""
+
+    # list of terms; term ID is the position in the list. One list per
+    # forward index file read
+    lexicons   = []
+
+    # dictionary of key value pairs of docid and a tuple of (lexicon, document
+    # line); the line is parsed on access
+    documents  = {}
+
+    # reset
+    def reset(self):
+        self.indexstore = ""
+        self.lexicons   = []
+        self.documents  = {}
+
+    # Constructor
+    # Given an indexstore, or "" for an empty forward index. The forward index
+    # of all live segments (refer to segments.py) of the index is read;
+    # documents deleted from a segment are skipped. If the index has no forward
+    # index, the forward index is empty (refer to exists)
+    def __init__(self, indexstore):
+
+        self.reset()
+
+        self.indexstore = indexstore
+
+        if (indexstore != "" and self.exists()):
+            self.populate()
+
+    ## Predicates ##############################################################
+
+    # true iff every index file of the indexstore has a forward index file.
+    # Indexstores created before forward indexes have none
+    def exists(self):
+
+        fnames = map(forward_filename, self.index_filenames())
+
+        if (fnames == []):
+            return False
+
+        manifest = Manifest(self.indexstore)
+
+        if (manifest.exists()):
+            return all(map(lambda fname: manifest.contains(fname), fnames))
+
+        return all(map(lambda fname: os.path.exists(os.path.join(self.indexstore, fname)),
+                       fnames))
+
+    # Given a docid
+    # true iff the document is in the forward index
+    def contains_document(self, docid):
+        return (self.documents.get(docid) is not None)
+
+    ## Access methods ##########################################################
+
+    # Returns a list of the file names of the live index files of the indexstore
+    def index_filenames(self):
+
+        segments = Segments(self.indexstore)
+
+        if (segments.exists()):
+            return segments.names()
+
+        if (os.path.exists(os.path.join(self.indexstore, INDEXFILE))):
+            return [INDEXFILE]
+
+        return []
+
+    # Given a docid of a document in the forward index
+    # Returns the (docid, vector, tokens) parts of the document line
+    def document_parts(self, docid):
+
+        assert (self.contains_document(docid))
+
+        (lexicon, line) = self.documents[docid]
+        parts = line.split("|")
+
+        assert (len(parts) == 3)
+
+        return (lexicon, parts)
+
+    # Given a docid of a document in the forward index
+    # Returns the term vector of the document; a dictionary of key value pairs
+    # of term and the frequency of the term in the document
+    def term_vector(self, docid):
+
+        (lexicon, parts) = self.document_parts(docid)
+
+        vector = {}
+
+        ids = parts[1].split(" ")
+        for i in range(0, len(ids), 2):
+            vector[lexicon[int(ids[i])]] = int(ids[i + 1])
+
+        return vector
+
+    # Given a docid of a document in the forward index
+    # Returns the list of terms of the document in order of position
+    def document_terms(self, docid):
+
+        (lexicon, parts) = self.document_parts(docid)
+
+        return map(lexicon.__getitem__, map(int, parts[2].split(" ")))
+
+    # Given a docid of a document in the forward index
+    # Returns the number of terms in the document
+    def document_length(self, docid):
+
+        (lexicon, parts) = self.document_parts(docid)
+
+        return parts[2].count(" ") + 1
+
+    # Returns the list of docids in the forward index
+    def docids(self):
+        return self.documents.keys()
+
+    ## Build methods ###########################################################
+
+    # Given an Index (from index.py) whose documents are not in the forward
+    # index
+    # Add the terms of all documents of the index to the forward index
+    def add_index(self, invidx):
+
+        lexicon = sorted(invidx.idxdict.keys())
+
+        self.lexicons.append(lexicon)
+
+        # term IDs and tfs, and term IDs by position, of every document
+        vectors   = {}
+        positions = {}
+
+        for tid in range(0, len(lexicon)):
+            for p in invidx.idxdict[lexicon[tid]]:
+                vectors.setdefault(p.docid, []).append(str(tid) + " " + str(p.tf))
+                doc_positions = positions.setdefault(p.docid, {})
+                for pos in p.positions:
+                    doc_positions[pos] = tid
+
+        for docid in vectors:
+
+            assert (not self.contains_document(docid))
+
+            doc_positions = positions[docid]
+            # every position of the document is indexed
+            assert (sorted(doc_positions.keys()) == range(0, len(doc_positions)))
+
+            tokens = map(lambda pos: str(doc_positions[pos]),
+                         range(0, len(doc_positions)))
+
+            line = str(docid) + "|" + " ".join(vectors[docid]) + "|" + " ".join(tokens)
+            self.documents[docid] = (lexicon, line)
+
+    ## Forward index read/write methods ########################################
+
+    # populate the forward index with the forward index files of all live
+    # index files of the indexstore
+    def populate(self):
+
+        # A segment merge (refer to segment_merge.py) may remove segments of
+        # the indexstore while we are reading them. When that happens start
+        # over with the new segment list
+        for attempt in range(0, SEGMENTRETRIES):
+
+            self.lexicons  = []
+            self.documents = {}
+
+            try:
+                manifest = Manifest(self.indexstore)
+                segments = Segments(self.indexstore)
+
+                for idxfname in self.index_filenames():
+
+                    fname   = forward_filename(idxfname)
+                    deleted = None
+                    if (segments.exists()):
+                        deleted = segments.deletion_bitmap(idxfname)
+
+                    crc = None
+                    if (manifest.contains(fname)):
+                        crc = manifest.checksum(fname)
+
+                    self.read(os.path.join(self.indexstore, fname), deleted, crc)
+                break
+
+            except IOError:
+                # the forward index kept changing; give up with the last error
+                if (attempt == SEGMENTRETRIES - 1):
+                    raise
+
+    # Given the path to a forward index file,
+    #       a DeletionBitmap of documents to skip (optional), and
+    #       the (size, crc32) checksum of the file (optional; refer to
+    #       manifest.py)
+    # Add the documents of the forward index file to the forward index. Raises
+    # an IOError if the file does not exist or does not match the checksum
+    def read(self, fwdfile, deleted = None, crc = None):
+
+        if (not os.path.exists(fwdfile)):
+            raise IOError("forward index removed : " + fwdfile)
+
+        with open(fwdfile, "r") as f:
+            data = f.read()
+
+        if (crc is not None and checksum(data) != crc):
+            raise IOError("checksum mismatch : " + fwdfile)
+
+        lines = data.split("\n")
+
+        nterms  = int(lines[0])
+        lexicon = lines[1 : nterms + 1]
+
+        self.lexicons.append(lexicon)
+
+        for line in lines[nterms + 1:]:
+
+            if (line == ""):
+                continue
+
+            docid = int(line[:line.index("|")])
+
+            # skip deleted documents
+            if (deleted is not None and deleted.is_deleted(docid)):
+                continue
+
+            self.documents[docid] = (lexicon, line)
+
+    # Given the path to a forward index file
+    # Store the forward index to the file
+    def store(self, fwdfile):
+
+        assert (not os.path.exists(fwdfile))
+        assert (len(self.lexicons) == 1)
+
+        lexicon = self.lexicons[0]
+
+        with open(fwdfile, "w+") as f:
+
+            f.write(str(len(lexicon)) + "\n")
+            for term in lexicon:
+                f.write(term + "\n")
+
+            for docid in sorted(self.documents.keys()):
+                f.write(self.documents[docid][1] + "\n")
+
+# Given an Index (from index.py) and the path to a forward index file
+# Build the forward index of the index and store it to the file
+def store_forward_index(invidx, fwdfile):
+
+    fwdidx = ForwardIndex("")
+    fwdidx.add_index(invidx)
+    fwdidx.store(fwdfile)
+
+################################################################################
@@ -5,9 +5,14 @@
 from docrank_trec import DocRankTREC, resultfile_to_docranks
 from query        import queries
 from snippet      import get_snippets
+from snippet_cache import SnippetCache
+from tracing      import span, trace_format
+import tracing
+from profiling    import Profiler, PROFILERS, PROFILER_CPROFILE, finish_profile
 
 import os
 import argparse
+import multiprocessing
 from   argparse import RawTextHelpFormatter
 
 ## Globals #####################################################################
@@ -49,13 +54,45 @@ program_help = '''
     Argument 6: interactive - Prompts the user for options when displaying
                               results
 
-    Argument 7: verbose    - Print to the terminal, the progress of the program.
+    Argument 7: workers    - Number of processes that generate snippets in
+                             parallel. Workers are forked once the snippet
+                             language model is read and share it. 0 uses every
+                             core. Defaults to 1
+
+    Argument 8: snippetcache - Path to a file to read the snippet cache from
+                               and store it to, so that snippets and sentences
+                               of documents are reused by the next run.
+                               (optional)
+
+    Argument 9: tracefile  - Path to a file to write a trace of the stages of
+                             snippet generation to (refer to tracing.py);
+                             Chrome trace format for a ".json" file, JSON lines
+                             otherwise. Snippets are generated by a single
+                             process. (optional)
+
+    Argument 10: profile   - Prefix of the profile files to write; pstats,
+                             collapsed stacks for flame graphs and a report
+                             (refer to profiling.py). This argument is optional
+
+    Argument 11: profiler  - Profiler of --profile; "cprofile" (default) or
+                             "sampling", a sampling profiler with a low
+                             overhead
+
+    Argument 12: profilememory - Also profile the top memory allocators of
+                             --profile
+
+    Argument 13: verbose   - Print to the terminal, the progress of the program.
                              This is optional. Turned off by default
 
     EXAMPLE:
 
         python gen_snippet.py --resultfile=./cacm.result.bm25 --queryfile=queries.txt --indexstore=cacm.index --resultfile=./cacm.result.bm25  --stopfile=cacm/common_words --snippetfile=./snippets.bm25 --verbose
 
+        python gen_snippet.py --resultfile=./cacm.result.bm25 --queryfile=queries.txt --indexstore=cacm.index --stopfile=cacm/common_words --snippetfile=./snippets.bm25 --profile=snippet.prof --profiler=sampling
+
+        # Generate snippets on every core
+        python gen_snippet.py --resultfile=./cacm.result.bm25 --queryfile=queries.txt --indexstore=cacm.index --stopfile=cacm/common_words --snippetfile=./snippets.bm25 --workers=0
+
     '''
 
 resultfile_help = '''
@@ -88,6 +125,37 @@ interactive_help = '''
     Turned off by default
     '''
 
+workers_help = '''
+    Number of processes that generate snippets in parallel. 0 uses every core.
+    Defaults to 1
+    '''
+
+snippetcache_help = '''
+    Path to a file to read the snippet cache from and store it to. The cache is
+    only used for the same indexstore and index generation. optional
+    '''
+
+tracefile_help = '''
+    Path to a file to write a trace of the stages of snippet generation to.
+    Chrome trace format for a ".json" file, JSON lines otherwise. Snippets are
+    generated by a single process. optional
+    '''
+
+profile_help = '''
+    Prefix of the profile files to write; pstats, collapsed stacks for flame
+    graphs and a report of the top functions. This argument is optional
+    '''
+
+profiler_help = '''
+    Profiler of --profile; "cprofile" (default) or "sampling", a sampling
+    profiler with a low overhead. This argument is optional
+    '''
+
+profilememory_help = '''
+    Also profile the top memory allocators of --profile. This argument is
+    optional
+    '''
+
 verbose_help = '''
     Print to the terminal, the progress of the program. This is optional.
     Turned off by default
@@ -134,6 +202,41 @@ argparser.add_argument("--interactive",
                        default = False,
                        help    = interactive_help)
 
+argparser.add_argument("--workers",
+                       metavar  = "w",
+                       type     = int,
+                       default  = 1,
+                       help     = workers_help)
+
+argparser.add_argument("--snippetcache",
+                       metavar  = "sc",
+                       default  = "",
+                       type     = str,
+                       help     = snippetcache_help)
+
+argparser.add_argument("--tracefile",
+                       metavar  = "tf",
+                       default  = "",
+                       type     = str,
+                       help     = tracefile_help)
+
+argparser.add_argument("--profile",
+                       metavar  = "pf",
+                       default  = "",
+                       type     = str,
+                       help     = profile_help)
+
+argparser.add_argument("--profiler",
+                       metavar  = "pr",
+                       default  = PROFILER_CPROFILE,
+                       type     = str,
+                       help     = profiler_help)
+
+argparser.add_argument("--profilememory",
+                       dest     = 'profilememory',
+                       action   = 'store_true',
+                       help     = profilememory_help)
+
 argparser.add_argument("--verbose",
                        dest     = 'verbose',
                        action   = 'store_true',
@@ -248,17 +351,21 @@ def print_snippets_to_file(queryfile, qid_snippets_dict, snippetfile):
 #       resultfile
 #       an indexstore, where the index used process the queries is present,
 #       an optional stopfile
+#       the number of worker processes (optional)
+#       a SnippetCache (optional)
 # Returns a dictionary of (key, value) (queryid, ranked snippet list) pairs
 #
-def get_snippet_dict(resultfile, queryfile, indexstore, stopfile = ""):
+def get_snippet_dict(resultfile, queryfile, indexstore, stopfile = "", workers = 1,
+                     cache = None):
 
     # get list of queries
     query_lst = queries(queryfile)
 
     # transform contents of resultfile into list of DocRankTRECs
-    docranks = resultfile_to_docranks(resultfile)
+    with span("gen_snippet.results"):
+        docranks = resultfile_to_docranks(resultfile)
 
-    return get_snippets(query_lst, docranks, indexstore, stopfile)
+    return get_snippets(query_lst, docranks, indexstore, stopfile, workers, cache)
 
 ## Main ########################################################################
 
@@ -272,6 +379,12 @@ indexstore  = args['indexstore']
 stopfile    = args['stopfile']
 snippetfile = args['snippetfile']
 interactive = args['interactive']
+workers     = args['workers']
+snippetcache = args['snippetcache']
+tracefile   = args['tracefile']
+profile     = args['profile']
+profiler    = args['profiler']
+profilememory = args['profilememory']
 verbose     = args['verbose']
 
 ## Input check
@@ -287,17 +400,70 @@ if (not os.path.exists(indexstore)):
 if (stopfile != "" and (not os.path.exists(stopfile))):
     print "FATAL: Cannot find stopfile, ", stopfile
     exit(-1)
+if (workers < 0):
+    print "FATAL: workers should be >= 0"
+    exit(-1)
+if (workers == 0):
+    workers = multiprocessing.cpu_count()
+if (workers > 1 and tracefile != ""):
+    print "WARNING: traced snippets are generated by a single process; ignoring workers"
+    workers = 1
+if (workers > 1 and profile != ""):
+    print "WARNING: profiled snippets are generated by a single process; ignoring workers"
+    workers = 1
+if (profiler not in PROFILERS):
+    print "FATAL: profiler should be one of ", PROFILERS
+    exit(-1)
 
 ## Snippet output file check
 if (snippetfile != "" and os.path.exists(snippetfile)):
     # Remove existing snippet file
     print "WARNING: Deleting existing snippetfile"
     os.remove(snippetfile)
+if (tracefile != "" and os.path.exists(tracefile)):
+    print "WARNING: Deleting existing tracefile"
+    os.remove(tracefile)
+
+# trace the stages of snippet generation
+if (tracefile != ""):
+    tracing.enable()
+
+## Profile the program (refer to profiling.py)
+program_profile = None
+if (profile != ""):
+    program_profile = Profiler(profile, profiler, profilememory)
+    program_profile.start()
 
 # get to work !
 
 # Get a dictionary of (key, value) of (queryid, ranked list of snippets)
-qid_snippets_dict = get_snippet_dict(resultfile, queryfile, indexstore, stopfile)
+# snippet cache; read from the cache file of a previous run
+cache = SnippetCache(indexstore)
+if (snippetcache != ""):
+    with span("gen_snippet.cache"):
+        cache.read(snippetcache)
+
+with span("gen_snippet.snippets"):
+    qid_snippets_dict = get_snippet_dict(resultfile, queryfile, indexstore,
+                                         stopfile, workers, cache)
+
+if (snippetcache != ""):
+    if (cache.version is None):
+        print "WARNING: indexstore has no manifest; not storing snippet cache"
+    cache.store(snippetcache)
+
+if verbose:
+    print
+    print cache.report()
+
+if (tracefile != ""):
+    tracing.tracer.write(tracefile, trace_format(tracefile))
+    if (verbose):
+        print
+        tracing.tracer.print_summary()
+
+if (program_profile is not None):
+    finish_profile(program_profile)
 
 # display snippets to the terminal
 if interactive:
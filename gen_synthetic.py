@@ -0,0 +1,269 @@
+## This program generates a synthetic corpus in the format of the cacm corpus,
+#  with matching queries and relevance judgements (refer to synthetic.py)
+
+from synthetic import SyntheticCorpus, VOCABULARY, ZIPFEXPONENT, \
+                      LENGTHDISTRIBUTIONS, MEANLENGTH, LENGTHSPREAD, QUERIES
+
+import argparse
+import os
+import shutil
+from   argparse import RawTextHelpFormatter
+
+## Globals #####################################################################
+
+# Print to terminal about what the program is doing
+# this is set by input to the program
+verbose = False
+
+# Layouts of the documents
+LAYOUTS = ["docs", "corpus", "both"]
+
+# Print progress every this many documents
+PROGRESSEVERY = 10000
+
+## Help strings ################################################################
+
+program_help = '''
+
+    gen_synthetic.py generates a synthetic corpus of cacm documents with words of
+    a Zipfian vocabulary and a document length distribution, and queries and
+    relevance judgements of the corpus. The outputdir has,
+
+        docs/           - CACM-XXXX.html documents; a docstore for corpus.py
+        corpus/         - the corpusstore corpus.py would create of docs/
+        cacm.query.txt  - queries in the format of the cacm query file
+        queries.txt     - queries as lines of space separated query ID and query
+        cacm.rel.txt    - relevance judgements in the format of the cacm
+                          relevance file
+
+    Argument 1: outputdir    - Path to the folder to generate the corpus in
+
+    Argument 2: documents    - Number of documents. Defaults to 10000
+
+    Argument 3: vocabulary   - Number of words in the vocabulary. Defaults to
+                               100000
+
+    Argument 4: exponent     - Exponent s of the Zipfian distribution; the word
+                               of rank r has frequency 1 / r^s. Defaults to 1.0
+
+    Argument 5: distribution - Document length distribution; "lognormal",
+                               "uniform" or "constant". Defaults to lognormal
+
+    Argument 6: meanlength   - Mean document length in words. Defaults to 118,
+                               the one of cacm
+
+    Argument 7: spread       - Sigma of the lognormal distribution or relative
+                               half width of the uniform distribution.
+                               Defaults to 0.8
+
+    Argument 8: queries      - Number of queries. Defaults to 64
+
+    Argument 9: seed         - Seed of the random generator. Defaults to 0
+
+    Argument 10: layout      - Layout of the documents; "docs", "corpus" or
+                               "both". Defaults to both
+
+    Argument 11: verbose     - Print progress
+
+    EXAMPLES:
+
+        python gen_synthetic.py --outputdir=synthetic.10k --documents=10000
+        python gen_synthetic.py --outputdir=synthetic.1m --documents=1000000 --vocabulary=1000000 --layout=corpus --verbose
+        python gen_synthetic.py --outputdir=synthetic.short --documents=50000 --distribution=uniform --meanlength=40 --spread=0.5
+  '''
+
+outputdir_help = '''
+    Path to the folder to generate the corpus in. If the folder already
+    exists, it is deleted
+    '''
+
+documents_help = '''
+    Number of documents. Defaults to 10000
+    '''
+
+vocabulary_help = '''
+    Number of words in the vocabulary. Defaults to 100000
+    '''
+
+exponent_help = '''
+    Exponent of the Zipfian distribution of the vocabulary. Defaults to 1.0
+    '''
+
+distribution_help = '''
+    Document length distribution; one of ''' + ", ".join(LENGTHDISTRIBUTIONS) + '''.
+    Defaults to lognormal
+    '''
+
+meanlength_help = '''
+    Mean document length in words. Defaults to 118
+    '''
+
+spread_help = '''
+    Sigma of the lognormal distribution or relative half width, in [0, 1], of
+    the uniform distribution. Defaults to 0.8
+    '''
+
+queries_help = '''
+    Number of queries. Defaults to 64
+    '''
+
+seed_help = '''
+    Seed of the random generator. Defaults to 0
+    '''
+
+layout_help = '''
+    Layout of the documents; "docs" for CACM-XXXX.html files, "corpus" for a
+    corpusstore or "both". Defaults to both
+    '''
+
+verbose_help = '''
+    Print progress. This argument is optional
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--outputdir",
+                       metavar  = "o",
+                       required = True,
+                       type     = str,
+                       help     = outputdir_help)
+
+argparser.add_argument("--documents",
+                       metavar  = "d",
+                       type     = int,
+                       default  = 10000,
+                       help     = documents_help)
+
+argparser.add_argument("--vocabulary",
+                       metavar  = "v",
+                       type     = int,
+                       default  = VOCABULARY,
+                       help     = vocabulary_help)
+
+argparser.add_argument("--exponent",
+                       metavar  = "s",
+                       type     = float,
+                       default  = ZIPFEXPONENT,
+                       help     = exponent_help)
+
+argparser.add_argument("--distribution",
+                       metavar  = "ld",
+                       type     = str,
+                       default  = "lognormal",
+                       help     = distribution_help)
+
+argparser.add_argument("--meanlength",
+                       metavar  = "ml",
+                       type     = float,
+                       default  = MEANLENGTH,
+                       help     = meanlength_help)
+
+argparser.add_argument("--spread",
+                       metavar  = "sp",
+                       type     = float,
+                       default  = LENGTHSPREAD,
+                       help     = spread_help)
+
+argparser.add_argument("--queries",
+                       metavar  = "q",
+                       type     = int,
+                       default  = QUERIES,
+                       help     = queries_help)
+
+argparser.add_argument("--seed",
+                       metavar  = "sd",
+                       type     = int,
+                       default  = 0,
+                       help     = seed_help)
+
+argparser.add_argument("--layout",
+                       metavar  = "l",
+                       type     = str,
+                       default  = "both",
+                       help     = layout_help)
+
+argparser.add_argument("--verbose",
+                       dest     = 'verbose',
+                       action   = 'store_true',
+                       help     = verbose_help)
+
+## Utilities ###################################################################
+
+# Given a docid
+# Print progress every PROGRESSEVERY documents, if verbose is set
+def print_progress(docid):
+    if (verbose and docid % PROGRESSEVERY == 0):
+        print "Generated %d/%d documents" % (docid, documents)
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+outputdir    = args['outputdir']
+documents    = args['documents']
+vocabulary   = args['vocabulary']
+exponent     = args['exponent']
+distribution = args['distribution']
+meanlength   = args['meanlength']
+spread       = args['spread']
+nqueries     = args['queries']
+seed         = args['seed']
+layout       = args['layout']
+verbose      = args['verbose']
+
+## Input check
+if (documents <= 0):
+    print "FATAL: documents should be > 0"
+    exit(-1)
+if (vocabulary <= 1):
+    print "FATAL: vocabulary should be > 1"
+    exit(-1)
+if (exponent <= 0.0):
+    print "FATAL: exponent should be > 0"
+    exit(-1)
+if (distribution not in LENGTHDISTRIBUTIONS):
+    print "FATAL: distribution should be one of ", LENGTHDISTRIBUTIONS
+    exit(-1)
+if (meanlength < 1.0):
+    print "FATAL: meanlength should be >= 1"
+    exit(-1)
+if (spread < 0.0 or (distribution == "uniform" and spread > 1.0)):
+    print "FATAL: spread should be >= 0, and <= 1 for the uniform distribution"
+    exit(-1)
+if (nqueries < 0):
+    print "FATAL: queries should be >= 0"
+    exit(-1)
+if (layout not in LAYOUTS):
+    print "FATAL: layout should be one of ", LAYOUTS
+    exit(-1)
+
+if (os.path.exists(outputdir)):
+    print "WARNING: Deleting existing outputdir"
+    shutil.rmtree(outputdir)
+os.makedirs(outputdir)
+
+outputdir   = os.path.abspath(outputdir)
+docstore    = os.path.join(outputdir, "docs")
+corpusstore = os.path.join(outputdir, "corpus")
+
+corpus = SyntheticCorpus(documents, vocabulary, exponent, distribution,
+                         meanlength, spread, nqueries, seed)
+
+# the docid map of a corpusstore names the documents of docs/ even if they are
+# not written
+corpus.write_documents(docstore, corpusstore if layout != "docs" else "",
+                       layout != "corpus", print_progress)
+
+corpus.write_queries(os.path.join(outputdir, "cacm.query.txt"))
+corpus.write_relevance(os.path.join(outputdir, "cacm.rel.txt"))
+
+with open(os.path.join(outputdir, "queries.txt"), "w+") as qf:
+    for (qid, words) in corpus.queries:
+        qf.write(str(qid) + " " + " ".join(words) + "\n")
+
+print "Success : Synthetic corpus created - ", outputdir
@@ -2,6 +2,7 @@
 #  writing global statistics data
 
 import os
+from   index import VERIFY_OFF, VERIFY_FULL
 
 ## Globals ####################################################################
 
@@ -39,13 +40,17 @@ class GlobalStatistics :
     # document lengths of all the documents indexed
     # This is a dictionary of docid and corresponding doc lengths
     doc_lengths     = None
+    # Verification level (refer to index.py); document lengths are checked
+    # on every fetch only at VERIFY_FULL
+    verify          = VERIFY_OFF
 
-    def __init__(self, gsfile):
+    def __init__(self, gsfile, verify_ = VERIFY_OFF):
 
         # Reset
         self.reset()
 
         self.gsfile = gsfile
+        self.verify = verify_
 
         # read all information from gsfile
         if (os.path.exists(gsfile)):
@@ -58,6 +63,7 @@ class GlobalStatistics :
         self.corpus_size     = 0
         self.avdl            = 0
         self.doc_lengths     = {}
+        self.verify          = VERIFY_OFF
 
     # Given : The number of documents indexed, N
     #         The size of the corpus indexed, corpus_size
@@ -73,10 +79,53 @@ class GlobalStatistics :
         self.avdl        = avdl
         self.doc_lengths = doc_lengths
 
-    # Write all global statistics information to self.gsfile file
-    def write(self):
+    ## Update functions #######################################################
 
-        gsf = open(self.gsfile, "w+")
+    # GIVEN a document ID, docid, and
+    #       the length of the document, dl
+    # Add the document to the statistics. If the document is already a part
+    # of the statistics, its length is replaced
+    def add_document(self, docid, dl):
+
+        assert (docid >= 0)
+        # a document may have no terms, e.g. a one word document indexed with
+        # word bigrams
+        assert (dl >= 0)
+
+        # replacing a document ?
+        self.remove_document(docid)
+
+        self.doc_lengths[docid] = dl
+        self.N                  = self.N + 1
+        self.corpus_size        = self.corpus_size + dl
+
+        self.update_avdl()
+
+    # GIVEN a document ID, docid
+    # Remove the document from the statistics
+    def remove_document(self, docid):
+
+        if (self.doc_lengths.get(docid) is None):
+            # nothing to remove
+            return
+
+        self.N           = self.N - 1
+        self.corpus_size = self.corpus_size - self.doc_lengths[docid]
+        del self.doc_lengths[docid]
+
+        self.update_avdl()
+
+    # Recompute the average document length from N and the corpus size
+    def update_avdl(self):
+
+        self.avdl = 0 if self.N == 0 else \
+                    (float(self.corpus_size) / float(self.N))
+
+    # Write all global statistics information to self.gsfile file, or to
+    # gsfile if given
+    def write(self, gsfile = ""):
+
+        gsf = open(self.gsfile if gsfile == "" else gsfile, "w+")
 
         # write all data to the gs file
 
@@ -104,8 +153,11 @@ class GlobalStatistics :
 
         gsf = open(self.gsfile, "r")
 
-        # reset all existing statistics
+        # reset all existing statistics; but remember where they are stored
+        # and how they are verified
+        (gsfile, verify) = (self.gsfile, self.verify)
         self.reset()
+        (self.gsfile, self.verify) = (gsfile, verify)
 
         # read all information
         for line in gsf.readlines():
@@ -137,15 +189,16 @@ class GlobalStatistics :
     # RETURNS the length of the document of id docid
     def document_length(self, docid):
 
-        # Assert inputs
-        assert (docid >= 0)
+        if (self.verify == VERIFY_FULL):
+            # Assert inputs
+            assert (docid >= 0)
 
-        # Assert that we have the information about length
-        assert (len(self.doc_lengths) != 0)
+            # Assert that we have the information about length
+            assert (len(self.doc_lengths) != 0)
 
-        # Do we have information about the doc?
-        assert (self.doc_lengths.get(docid) is not None)
-        assert (self.doc_lengths.get(docid) > 0)
+            # Do we have information about the doc?
+            assert (self.doc_lengths.get(docid) is not None)
+            assert (self.doc_lengths.get(docid) >= 0)
 
         return self.doc_lengths.get(docid)
 
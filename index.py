@@ -2,14 +2,41 @@
 # index and the inverted index itself
 
 import os
+import random
 from   corpus_rw   import is_corpus_file
 from   cacm_parser import is_cacm_doc
+from   segments    import Segments, SEGMENTSFILE, deletion_filename
+from   manifest    import Manifest, checksum
+from   query_operators import matching_docids
+from   tracing     import span, count, enabled
 
 ## Globals #####################################################################
 
 # Default index file name
 INDEXFILE = "index.idx"
 
+# Bigram side index file name (refer to bigram_index.py)
+BIGRAMFILE = "bigram.idx"
+
+# Number of times to try reading the files of an index that are being replaced
+# by a commit or a segment merge
+SEGMENTRETRIES = 5
+
+# Verification levels of an index and of the retrieval models that read it
+#   VERIFY_OFF     - index files committed with a manifest are checked against
+#                    their checksums (refer to manifest.py). Nothing else
+#   VERIFY_SAMPLED - also sanity check the postings of VERIFYSAMPLE terms when
+#                    the index is read
+#   VERIFY_FULL    - also sanity check all postings when the index is read, and
+#                    assert in the scoring loops of the retrieval models
+VERIFY_OFF     = "off"
+VERIFY_SAMPLED = "sampled"
+VERIFY_FULL    = "full"
+VERIFY_LEVELS  = [VERIFY_OFF, VERIFY_SAMPLED, VERIFY_FULL]
+
+# Number of terms whose postings are sanity checked by VERIFY_SAMPLED
+VERIFYSAMPLE   = 500
+
 ## Term ########################################################################
 
 # a term is a string that is the key in the inverted index dictionary
@@ -69,19 +96,43 @@ class Index:
     # dictionary to hold key value pairs of terms and posting dictionary
     idxdict = {}
 
+    # verification level; one of VERIFY_LEVELS
+    verify  = VERIFY_OFF
+
+    # Collection wide term statistics; a dictionary of key value pairs of term
+    # and (document frequency, corpus frequency). Only set when the index is a
+    # shard of a sharded index (refer to shards.py), where the terms and their
+    # statistics are those of the whole collection
+    termstats = None
+
+    # Bigram side index of the index (refer to bigram_index.py), an Index. None
+    # when the indexstore has no bigram side index
+    bigrams   = None
+
     # constructor
-    def __init__(self, indexstore):
+    # Given an indexstore and optionally the name of an index file in the
+    # indexstore. When the index file is INDEXFILE and the indexstore has more
+    # than one segment (refer to segments.py), all live segments are merged
+    # The index is verified as per the verification level, verify
+    def __init__(self, indexstore, indexfname = INDEXFILE, verify = VERIFY_OFF):
 
         # reset
         self.reset()
 
+        assert (verify in VERIFY_LEVELS)
+
         # Set index variables
         self.indexstore = indexstore
-        self.indexfile  = os.path.join(indexstore, INDEXFILE)
+        self.indexfile  = os.path.join(indexstore, indexfname)
+        self.verify     = verify
 
         # Already existing index ?
-        if (os.path.exists(self.indexfile)):
+        if (indexfname == INDEXFILE and Segments(indexstore).exists()):
+            self.populate_segments()
+        elif (os.path.exists(self.indexfile)):
             self.populate()
+            if (indexfname == INDEXFILE and self.has_bigrams()):
+                self.bigrams = Index(indexstore, BIGRAMFILE, verify)
 
         # Indexfile does not exist. Does the indexstore exist ? if not create one
         if (not os.path.exists(indexstore)):
@@ -94,12 +145,30 @@ class Index:
         self.indexstore = ""
         self.indexfile  = ""
         self.idxdict    = {}
+        self.verify     = VERIFY_OFF
+        self.termstats  = None
+        self.bigrams    = None
 
     ## Predicates ##############################################################
 
+    # Returns true iff the indexstore has a committed bigram side index
+    def has_bigrams(self):
+
+        manifest = Manifest(self.indexstore)
+
+        if (manifest.exists()):
+            return manifest.contains(BIGRAMFILE)
+
+        return os.path.exists(os.path.join(self.indexstore, BIGRAMFILE))
+
     # given a string, that is an index term,
     # true if and only if this index has that term
+    # For a shard, true if and only if the collection has that term
     def contains_term(self, t):
+
+        if (self.termstats is not None):
+            return (self.termstats.get(t) is not None)
+
         return (self.idxdict.get(t) is not None)
 
     ## Term/Posting access/search methods ######################################
@@ -107,6 +176,12 @@ class Index:
     # given a string, that is an index term,
     # returns the list of posting mapped to the term
     def postings(self, t):
+
+        if (self.termstats is not None and self.idxdict.get(t) is None):
+            # a term of the collection that is not in this shard
+            assert (self.termstats.get(t) is not None)
+            return []
+
         assert (self.idxdict.get(t) is not None)
         return self.idxdict[t]
 
@@ -118,7 +193,7 @@ class Index:
         assert (isinstance(docid, int))
         assert (self.contains_term(t))
 
-        postings = self.idxdict[t]
+        postings = self.postings(t)
 
         pidx = self.posting_idx(postings, docid)
 
@@ -212,8 +287,28 @@ class Index:
     # Given an indexed term t, returns the frequency of the term in the corpus
     def corpus_frequency(self, term):
         assert (self.contains_term(term))
+
+        if (self.termstats is not None):
+            return self.termstats[term][1]
+
         return reduce(lambda tf, p: tf + p.tf, self.postings(term), 0)
 
+    # Given an indexed term t, returns the number of documents with the term
+    def document_frequency(self, term):
+        assert (self.contains_term(term))
+
+        if (self.termstats is not None):
+            return self.termstats[term][0]
+
+        return len(self.postings(term))
+
+    # Given a dictionary of key value pairs of term and (document frequency,
+    #       corpus frequency) of the whole collection
+    # Use the statistics instead of the ones of this index. Only terms in the
+    # dictionary are considered to be indexed from now on
+    def load_term_statistics(self, termstats):
+        self.termstats = termstats
+
     # Returns the term frequencies of all the terms in the index in a dictionary
     def term_frequencies(self):
 
@@ -244,29 +339,153 @@ class Index:
 
     ## Sanity check methods ####################################################
 
-    # Sanity check the index
-    def sanity_check(self):
+    # Given a list of terms (optional; defaults to all terms)
+    # Sanity check the postings of the terms
+    def sanity_check(self, terms = None):
 
-        for term in self.idxdict:
+        if (terms is None):
+            terms = self.idxdict.keys()
+
+        for term in terms:
             postings = self.idxdict[term]
 
-            for i in range(0, len(postings) - 1):
+            for i in range(0, len(postings)):
                 assert(postings[i].docid >= 0)
-                assert(postings[i].docid < postings[i+1].docid)
+                assert(i == 0 or postings[i-1].docid < postings[i].docid)
                 assert(postings[i].tf > 0)
                 assert(postings[i].positions == sorted(postings[i].positions))
                 assert(len(postings[i].positions) == postings[i].tf)
 
+    # Sanity check the index as per its verification level
+    def verify_index(self):
+
+        if (self.verify == VERIFY_FULL):
+            self.sanity_check()
+        elif (self.verify == VERIFY_SAMPLED):
+            terms = self.idxdict.keys()
+            self.sanity_check(random.sample(terms, min(VERIFYSAMPLE, len(terms))))
+
     ## Index read/write methods ################################################
 
     # populate the index with the contents of the indexfile
+    # An index file committed with a manifest (refer to manifest.py) is
+    # verified against its checksum
     def populate(self):
 
+        fname = os.path.basename(self.indexfile)
+
+        # A commit may replace the index file while we are reading it. When
+        # that happens start over with the new manifest
+        for attempt in range(0, SEGMENTRETRIES):
+
+            try:
+                manifest = Manifest(self.indexstore)
+
+                if (manifest.contains(fname)):
+                    self.idxdict = self.read_indexfile(self.indexfile, None,
+                                                       manifest.checksum(fname))
+                else:
+                    self.idxdict = self.read_indexfile(self.indexfile)
+                break
+
+            except IOError:
+                # the index file kept changing; give up with the last error
+                if (attempt == SEGMENTRETRIES - 1):
+                    raise
+
+        self.verify_index()
+
+    # populate the index by merging all live segments of the indexstore
+    def populate_segments(self):
+
+        # A segment merge (refer to segment_merge.py) may remove segments of
+        # the indexstore while we are reading them. When that happens start
+        # over with the new segment list
+        for attempt in range(0, SEGMENTRETRIES):
+
+            self.idxdict = {}
+
+            try:
+                # Files of the commit we read must match their checksums.
+                # A mismatch means that a newer commit replaced them
+                manifest = Manifest(self.indexstore)
+                segments = Segments(self.indexstore)
+
+                if (manifest.exists()):
+                    manifest.verify(SEGMENTSFILE)
+
+                for segname in segments.names():
+
+                    segfile = os.path.join(self.indexstore, segname)
+                    if (not os.path.exists(segfile)):
+                        raise IOError("segment removed : " + segfile)
+
+                    deleted = segments.deletion_bitmap(segname)
+                    if (manifest.contains(deletion_filename(segname))):
+                        manifest.verify(deletion_filename(segname))
+
+                    # read segment; skip documents deleted from the segment
+                    if (manifest.contains(segname)):
+                        self.merge(self.read_indexfile(segfile, deleted,
+                                                       manifest.checksum(segname)))
+                    else:
+                        self.merge(self.read_indexfile(segfile, deleted))
+                break
+
+            except IOError:
+                # the segments kept changing; give up with the last error
+                if (attempt == SEGMENTRETRIES - 1):
+                    raise
+
+        self.verify_index()
+
+    # Given a dictionary of key value pairs of term and posting list, that
+    # indexes documents not indexed by this index
+    # Merge the postings into this index
+    def merge(self, idxdict):
+
+        for term in idxdict:
+            if (self.idxdict.get(term) is None):
+                self.idxdict[term] = idxdict[term]
+            else:
+                # Both posting lists are sorted; sort merges them in linear time
+                self.idxdict[term] = sorted(self.idxdict[term] + idxdict[term],
+                                            key = lambda p: p.docid)
+
+    # Given the path to an index file,
+    #       a DeletionBitmap of documents to skip (optional), and
+    #       the (size, crc32) checksum of the file (optional; refer to
+    #       manifest.py)
+    # Returns a dictionary of key value pairs of term and posting list with the
+    #         contents of the index file. Raises an IOError if the file does
+    #         not match the checksum
+    def read_indexfile(self, indexfile, deleted = None, crc = None):
+
         # assert the file exists
-        assert (os.path.exists(self.indexfile))
+        assert (os.path.exists(indexfile))
+
+        with span("index.read", indexfile = os.path.basename(indexfile)):
+            idxdict = self.decode_indexfile(indexfile, deleted, crc)
+
+        if (enabled()):
+            count("postings_decoded", sum(map(len, idxdict.values())))
 
-        with open(self.indexfile, "r") as f:
-            idxf_lines = f.readlines()
+        return idxdict
+
+    # Given the arguments of read_indexfile
+    # Returns the dictionary of read_indexfile; the postings of the index file
+    # decoded to Posting
+    def decode_indexfile(self, indexfile, deleted = None, crc = None):
+
+        idxdict = {}
+
+        with open(indexfile, "r") as f:
+            idxf_data = f.read()
+
+        if (crc is not None and checksum(idxf_data) != crc):
+            raise IOError("checksum mismatch : " + indexfile)
+
+        idxf_lines = idxf_data.splitlines()
 
         for line in idxf_lines:
 
@@ -287,7 +506,7 @@ class Index:
             posting_strings = postinginfo.split(',')
 
             # create an empty entry of the term
-            self.idxdict[term] = []
+            postings = []
 
             # convert each posting string into a Posting
             for posting_string in posting_strings:
@@ -297,6 +516,11 @@ class Index:
 
                 # first part of posting is docid
                 docid = int(posting_parts[0])
+
+                # skip deleted documents
+                if (deleted is not None and deleted.is_deleted(docid)):
+                    continue
+
                 # second part is tf
                 tf    = int(posting_parts[1])
                 # all other parts are term positions
@@ -308,11 +532,13 @@ class Index:
                     positions.append(int(part))
 
                 # lets add this posting
-                postings = self.idxdict[term]
                 postings.append(Posting(docid, tf, positions))
-                self.idxdict[term] = postings
 
-        self.sanity_check()
+            # terms whose documents are all deleted are not indexed
+            if (postings != []):
+                idxdict[term] = postings
+
+        return idxdict
 
     # store index to file
     def store(self):
@@ -419,10 +645,14 @@ class Index:
         # initialize return dict
         midx = {}
 
-        for t in terms:
-            # Term not seen yet
-            if (midx.get(t) is None):
-                midx[t] = self.postings(t)
+        with span("index.minindex"):
+            for t in terms:
+                # Term not seen yet
+                if (midx.get(t) is None):
+                    midx[t] = self.postings(t)
+
+        if (enabled()):
+            count("postings_read", sum(map(len, midx.values())))
 
         return midx
 
@@ -448,12 +678,28 @@ class Index:
 
                 # get docid
                 docid = posting.docid
-                assert (docid >= 0)
+                if (self.verify == VERIFY_FULL):
+                    assert (docid >= 0)
 
                 docids.add(docid)
 
         return docids
 
+    # GIVEN a list of terms and a list of QueryOperator (from
+    #       query_operators.py) of a query
+    # RETURNS a set of documents that contain a term and match every operator
+    #
+    def docids_for_query(self, terms, operators):
+
+        with span("index.docids"):
+
+            if (operators == []):
+                return self.docids_with_terms(terms)
+
+            # the operator terms are query terms; documents that match every
+            # operator contain query terms
+            return matching_docids(self, operators)
+
     def term(self):
         return self.idxdict.keys()
 
@@ -0,0 +1,346 @@
+## This file provides an IndexWriter class that updates an existing indexstore
+#  incrementally. Documents can be added, deleted and updated without
+#  reindexing the whole corpus
+#
+# Added documents are indexed into a new segment (refer to segments.py).
+# Deleted documents are marked in the deletion bitmap of the segment that
+# indexes them. The global statistics and the docid map of the indexstore are
+# kept in sync with the live documents
+#
+# An IndexWriter can be shared with a background segment merger (refer to
+# segment_merge.py). All updates are serialized by the writer's lock
+#
+# Changes are committed atomically with a manifest (refer to manifest.py)
+
+from text_processing   import word_ngrams
+from global_statistics import GlobalStatistics, GSFILE
+from index             import Index, INDEXFILE, BIGRAMFILE
+from segments          import Segments, DeletionBitmap, deletion_filename, \
+                              SEGMENTSFILE
+from manifest          import Manifest
+from corpus_rw         import CorpusRW
+from docid_mapper      import DocIDMapper, DOCIDMAPPER
+from forward_index     import store_forward_index, forward_filename
+
+import os
+import threading
+
+## Utilities ###################################################################
+
+# Given an Index, invidx,
+#       the id of a document, docid,
+#       the path to the corpus file of the document, corpusfpath, and
+#       the number of words consisting a term, n
+# Add all the terms of the document to the index
+# Returns the number of terms in the document
+def index_document(invidx, docid, corpusfpath, n):
+
+    # get corpus file
+    content = CorpusRW().corpus_content(corpusfpath)
+
+    # assert that content of the corpus file has no whitespace other than '\n'
+    assert(all(map(lambda w: w.strip() == w, content.split(" "))))
+
+    # get word ngrams
+    terms = word_ngrams(content, n)
+
+    # assert word ngrams
+    assert(all(map(lambda ng: len(ng.split(" ")) == n, terms)))
+
+    # store terms
+    for posidx in range(0, len(terms)):
+        # term and term position
+        term = terms[posidx]
+        tpos = posidx
+        invidx.update(term, tpos, docid)
+
+    return len(terms)
+
+## IndexWriter #################################################################
+
+class IndexWriter:
+
+    # indexstore to update
+    indexstore   = ""
+
+    # Number of words consisting a term. Must be the same as the number used
+    # to create the indexstore
+    n            = 1
+
+    # Segments of the indexstore
+    segments     = None
+
+    # Manifest of the indexstore
+    manifest     = None
+
+    # Deletion bitmaps of segments that have pending deletions; a dictionary
+    # of (segment file name, DeletionBitmap)
+    deletions    = None
+
+    # Global statistics of the indexstore
+    global_stats = None
+
+    # docid map of the indexstore; Maps documentID to a
+    # tuple of (cacm_corpus_file_path, cacm_document_path)
+    docid_map    = None
+
+    # Segment file names reserved for segments that are being written
+    reserved     = None
+
+    # Lock that serializes updates to the writer's state
+    lock         = None
+
+    # reset
+    def reset(self):
+        self.indexstore   = ""
+        self.n            = 1
+        self.segments     = None
+        self.manifest     = None
+        self.deletions    = {}
+        self.global_stats = None
+        self.docid_map    = {}
+        self.reserved     = []
+        self.lock         = threading.RLock()
+
+    # Constructor
+    # Given the path to an indexstore (it need not exist), and
+    #       the number of words consisting a term
+    def __init__(self, indexstore, n = 1):
+
+        self.reset()
+
+        assert (n > 0)
+
+        self.indexstore = indexstore
+        self.n          = n
+
+        if (not os.path.exists(indexstore)):
+            os.makedirs(indexstore)
+
+        # Get manifest; this rolls forward an interrupted commit
+        self.manifest = Manifest(indexstore, recover = True)
+
+        # Get global statistics
+        self.global_stats = GlobalStatistics(os.path.join(indexstore, GSFILE))
+
+        # Get docid map
+        if (os.path.exists(os.path.join(indexstore, DOCIDMAPPER))):
+            self.docid_map = DocIDMapper().read(indexstore)
+
+        # Get segments
+        self.segments = Segments(indexstore)
+
+        # An indexstore created by indexer.py has a single segment, INDEXFILE,
+        # and no segment list
+        if ((not self.segments.exists()) and \
+            os.path.exists(os.path.join(indexstore, INDEXFILE))):
+            self.segments.add(INDEXFILE, self.global_stats.doc_lengths.keys())
+
+    ## Update methods ##########################################################
+
+    # Given a dictionary of key, value pairs where the key is the
+    #       document ID and the value is a tuple of corpus file path and
+    #       document file path (refer to docid_mapper.py)
+    # Index all the documents into a new segment. Documents that are already
+    # indexed are replaced
+    def add_documents(self, docid_map):
+
+        if (len(docid_map) == 0):
+            # nothing to do
+            return
+
+        with self.lock:
+
+            # new segment
+            segname = self.new_segment_name()
+            segidx  = Index(self.indexstore, segname)
+
+            # The writer is only changed once the segment is stored, so that a
+            # failed batch leaves no statistics of documents no segment indexes
+            try:
+                # dictionary of key value pairs of document ID and length
+                doc_lengths = {}
+
+                for docid in sorted(docid_map.keys()):
+
+                    # Path to the corpus file of this document id
+                    corpusfpath = DocIDMapper().corpusfpath(docid, docid_map)
+
+                    # index document
+                    doc_lengths[docid] = index_document(segidx, docid,
+                                                        corpusfpath, self.n)
+
+                # store segment and its forward index
+                segidx.store()
+                store_forward_index(segidx, os.path.join(self.indexstore,
+                                                         forward_filename(segname)))
+
+                # replacing already indexed documents; delete the old versions
+                self.delete_documents(filter(lambda d: self.is_indexed(d),
+                                             docid_map.keys()))
+
+                # update global statistics and docid map
+                for docid in sorted(doc_lengths.keys()):
+                    self.global_stats.add_document(docid, doc_lengths[docid])
+                    self.docid_map[docid] = docid_map[docid]
+
+                self.segments.add(segname, docid_map.keys())
+
+            finally:
+                self.reserved.remove(segname)
+
+    # Given a list of document IDs
+    # Delete the documents from the index. Document IDs that are not indexed
+    # are ignored
+    def delete_documents(self, docids):
+
+        with self.lock:
+
+            for docid in docids:
+
+                segname = self.segments.segment_of(docid)
+
+                if (segname is None):
+                    # not indexed
+                    continue
+
+                # mark document deleted in its segment
+                if (self.deletions.get(segname) is None):
+                    self.deletions[segname] = self.segments.deletion_bitmap(segname)
+                self.deletions[segname].delete(docid)
+
+                self.segments.remove_docid(segname, docid)
+
+                # update global statistics and docid map
+                self.global_stats.remove_document(docid)
+                del self.docid_map[docid]
+
+    # Given a dictionary of key, value pairs where the key is the
+    #       document ID and the value is a tuple of corpus file path and
+    #       document file path
+    # Reindex the documents. Same as add_documents
+    def update_documents(self, docid_map):
+        self.add_documents(docid_map)
+
+    # Given a list of segment file names, and
+    #       the reserved file name of a segment that indexes the documents of
+    #       all the listed segments, and
+    #       the set of document IDs indexed in the new segment
+    # Replace the listed segments by the new segment and commit. If the new
+    # segment indexes no documents, the listed segments are only removed. Used
+    # by segment merges (refer to segment_merge.py)
+    def replace_segments(self, segnames, segname, merged_docids):
+
+        with self.lock:
+
+            # live documents of the listed segments; documents deleted while
+            # the segments were merged are not live any more
+            docids = set()
+            for name in segnames:
+                docids = docids | self.segments.docids(name)
+                if (self.deletions.get(name) is not None):
+                    del self.deletions[name]
+
+            # every live document must be in the new segment
+            assert (docids <= merged_docids)
+
+            self.reserved.remove(segname)
+
+            if (len(merged_docids) == 0):
+                self.segments.replace(segnames, None, docids)
+            else:
+                self.segments.replace(segnames, segname, docids)
+
+            # the listed segments are deleted once the commit is done
+            for name in segnames:
+                self.manifest.remove(name)
+                self.manifest.remove(deletion_filename(name))
+                self.manifest.remove(forward_filename(name))
+
+            # documents of the new segment that are not live
+            deleted = DeletionBitmap()
+            for docid in (merged_docids - docids):
+                deleted.delete(docid)
+            if (deleted.count() > 0):
+                self.deletions[segname] = deleted
+
+            self.commit()
+
+    # Write all pending changes to the indexstore and commit them atomically
+    def commit(self):
+
+        with self.lock:
+
+            # write deletion bitmaps
+            for segname in self.deletions:
+                delfname = self.manifest.stage(deletion_filename(segname))
+                self.deletions[segname].write(os.path.join(self.indexstore, delfname))
+            self.deletions = {}
+
+            # write segment list, global statistics and the docid map
+            self.segments.write(self.manifest.stage(SEGMENTSFILE))
+            self.global_stats.write(os.path.join(self.indexstore,
+                                                 self.manifest.stage(GSFILE)))
+            DocIDMapper().store(self.indexstore, self.docid_map,
+                                self.manifest.stage(DOCIDMAPPER))
+
+            # the bigram side index is not updated incrementally
+            self.manifest.remove(BIGRAMFILE)
+
+            # segments written since the last commit, with their forward index
+            for segname in self.segments.names():
+                if (not self.manifest.contains(segname)):
+                    self.manifest.add(segname)
+                    fwdfname = forward_filename(segname)
+                    if (os.path.exists(os.path.join(self.indexstore, fwdfname))):
+                        self.manifest.add(fwdfname)
+
+            self.manifest.commit()
+
+    ## Segment methods #########################################################
+
+    # Returns a reserved file name for a new segment
+    def new_segment_name(self):
+
+        with self.lock:
+            segname = self.segments.next_name(self.reserved)
+            self.reserved.append(segname)
+
+        return segname
+
+    # Returns a list of (segment file name, number of live documents, number of
+    #         deleted documents) tuples of all segments. Used by merge policies
+    def segment_statistics(self):
+
+        with self.lock:
+            return map(lambda name: (name,
+                                     len(self.segments.docids(name)),
+                                     self.deletion_bitmap(name).count()),
+                       self.segments.names())
+
+    # Given a segment file name
+    # Returns a copy of the set of live document IDs of the segment
+    def live_docids(self, segname):
+
+        with self.lock:
+            return set(self.segments.docids(segname))
+
+    # Given a segment file name
+    # Returns the deletion bitmap of the segment including pending deletions
+    def deletion_bitmap(self, segname):
+
+        with self.lock:
+            if (self.deletions.get(segname) is not None):
+                return self.deletions[segname]
+            return self.segments.deletion_bitmap(segname)
+
+    ## Predicates ##############################################################
+
+    # Given a document ID
+    # Returns true iff the document is indexed and not deleted
+    def is_indexed(self, docid):
+
+        with self.lock:
+            return self.segments.segment_of(docid) is not None
+
+################################################################################
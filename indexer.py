@@ -1,15 +1,25 @@
 # This program creates an inverted index from the folder containing corpus files
 
-from text_processing   import word_ngrams
 from global_statistics import GlobalStatistics, GSFILE
 from index             import *
+from index_writer      import IndexWriter, index_document
 from corpus_rw         import is_corpus_file, CorpusRW
-from docid_mapper      import DocIDMapper
+from docid_mapper      import DocIDMapper, DOCIDMAPPER
+from segments          import Segments, SEGMENTSFILE, deletion_filename
+from manifest          import Manifest
+from bigram_index      import build_bigram_index
+from forward_index     import store_forward_index, forward_filename
+from shards            import Shards, TermStatistics, SHARDSFILE, TERMSTATFILE, \
+                              shard_dirname, partition, remove_stale_shards, \
+                              is_sharded
+from tracing           import span, count, trace_format
+import tracing
+from profiling         import Profiler, PROFILERS, PROFILER_CPROFILE, \
+                              finish_profile
 
 import argparse
 from   argparse import RawTextHelpFormatter
 import os
-import shutil
 
 ## Globals #####################################################################
 # Print to terminal about what the program is doing
@@ -31,12 +41,67 @@ program_help = '''
 
     Argument 3: ngrams      - Number of ngrams to index. Defaults to 1
 
-    Argument 4: verbose     - Print progress of the program to the stdout.
+    Argument 4: update      - Update an existing indexstore incrementally instead
+                              of recreating it. All documents in the corpusstore
+                              are added to the index as a new segment. Documents
+                              that are already indexed are replaced. This
+                              argument is optional.
+
+    Argument 5: delete      - Comma separated list of document IDs to delete from
+                              an existing indexstore. The corpusstore is not
+                              required when only deleting. This argument is
+                              optional.
+
+    Argument 6: shards      - Number of shards to partition the documents into
+                              by document ID range. Every shard is indexed
+                              into a sub folder of the indexstore. Defaults
+                              to 1, an indexstore that is not sharded. This
+                              argument is optional.
+
+    Argument 7: bigrams     - Also build the bigram side index that speeds up
+                              phrase queries (refer to bigram_index.py). Only
+                              with ngrams 1. This argument is optional.
+
+    Argument 8: tracefile   - Path to a file to write a trace of the stages of
+                              indexing to (refer to tracing.py); Chrome trace
+                              format for a ".json" file, JSON lines otherwise.
+                              This argument is optional.
+
+    Argument 9: profile     - Prefix of the profile files to write; pstats,
+                              collapsed stacks for flame graphs and a report
+                              (refer to profiling.py). This argument is optional
+
+    Argument 10: profiler   - Profiler of --profile; "cprofile" (default) or
+                              "sampling", a sampling profiler with a low
+                              overhead
+
+    Argument 11: profilememory - Also profile the top memory allocators of
+                              --profile
+
+    Argument 12: verbose    - Print progress of the program to the stdout.
                               This argument is optional.
 
     EXAMPLES:
 
         python indexer.py --corpusstore=./cacm.corpus --indexstore=cacm.index --ngrams=1 --verbose
+
+        # add (or replace) the documents in ./new.corpus to cacm.index
+        python indexer.py --corpusstore=./new.corpus --indexstore=cacm.index --update
+
+        # delete documents 12 and 17 from cacm.index
+        python indexer.py --indexstore=cacm.index --delete=12,17
+
+        # index ./cacm.corpus into 4 shards
+        python indexer.py --corpusstore=./cacm.corpus --indexstore=cacm.index --shards=4
+
+        # index ./cacm.corpus with a bigram side index for phrase queries
+        python indexer.py --corpusstore=./cacm.corpus --indexstore=cacm.index --bigrams
+
+        # trace the stages of indexing; open index.trace.json in chrome://tracing
+        python indexer.py --corpusstore=./cacm.corpus --indexstore=cacm.index --tracefile=index.trace.json
+
+        # profile indexing with the sampling profiler, and its memory allocators
+        python indexer.py --corpusstore=./cacm.corpus --indexstore=cacm.index --profile=index.prof --profiler=sampling --profilememory
     '''
 
 corpusstore_help = '''
@@ -52,6 +117,47 @@ ngrams_help = '''
     Number of ngrams to index. defaults to 1
     '''
 
+update_help = '''
+    Update an existing indexstore incrementally instead of recreating it. All
+    documents in the corpusstore are added to the index as a new segment.
+    Documents that are already indexed are replaced. This argument is optional.
+    '''
+
+delete_help = '''
+    Comma separated list of document IDs to delete from an existing indexstore.
+    This argument is optional.
+    '''
+
+shards_help = '''
+    Number of shards to partition the documents into by document ID range.
+    Defaults to 1, an indexstore that is not sharded. This argument is optional.
+    '''
+
+bigrams_help = '''
+    Also build the bigram side index that speeds up phrase queries. Only with
+    ngrams 1. Incremental updates drop the side index. This argument is optional.
+    '''
+
+tracefile_help = '''
+    Path to a file to write a trace of the stages of indexing to. Chrome trace
+    format for a ".json" file, JSON lines otherwise. This argument is optional.
+    '''
+
+profile_help = '''
+    Prefix of the profile files to write; pstats, collapsed stacks for flame
+    graphs and a report of the top functions. This argument is optional
+    '''
+
+profiler_help = '''
+    Profiler of --profile; "cprofile" (default) or "sampling", a sampling
+    profiler with a low overhead. This argument is optional
+    '''
+
+profilememory_help = '''
+    Also profile the top memory allocators of --profile. This argument is
+    optional
+    '''
+
 verbose_help = '''
     Print progress of the program to the stdout. This argument is optional.
     '''
@@ -62,7 +168,7 @@ argparser = argparse.ArgumentParser(description = program_help,
 
 argparser.add_argument("--corpusstore",
                        metavar  = "cs",
-                       required = True,
+                       default  = "",
                        type     = str,
                        help     = corpusstore_help)
 
@@ -78,6 +184,51 @@ argparser.add_argument("--ngrams",
                        type    = int,
                        help    = ngrams_help)
 
+argparser.add_argument("--update",
+                       dest    = 'update',
+                       action  = 'store_true',
+                       help    = update_help)
+
+argparser.add_argument("--delete",
+                       metavar = "d",
+                       default = "",
+                       type    = str,
+                       help    = delete_help)
+
+argparser.add_argument("--shards",
+                       metavar = "k",
+                       default = 1,
+                       type    = int,
+                       help    = shards_help)
+
+argparser.add_argument("--bigrams",
+                       dest    = 'bigrams',
+                       action  = 'store_true',
+                       help    = bigrams_help)
+
+argparser.add_argument("--tracefile",
+                       metavar = "tf",
+                       default = "",
+                       type    = str,
+                       help    = tracefile_help)
+
+argparser.add_argument("--profile",
+                       metavar = "pf",
+                       default = "",
+                       type    = str,
+                       help    = profile_help)
+
+argparser.add_argument("--profiler",
+                       metavar = "pr",
+                       default = PROFILER_CPROFILE,
+                       type    = str,
+                       help    = profiler_help)
+
+argparser.add_argument("--profilememory",
+                       dest    = 'profilememory',
+                       action  = 'store_true',
+                       help    = profilememory_help)
+
 argparser.add_argument("--verbose",
                        dest    = 'verbose',
                        action  = 'store_true',
@@ -92,13 +243,14 @@ def print_verbose(s):
         print (s)
 
 # Store global statistics
-# Given the path to a folder where to store the global stats information and
+# Given the path to a folder where to store the global stats information,
 #       the #terms per document dictionary whose (key, value) pair is
-#       (docid, #terms in doc)
+#       (docid, #terms in doc), and
+#       the name of the file to store the statistics to
 #
 # Store all global statistics information to the global statistics file
 #
-def store_global_stats(indexstore, terms_per_document):
+def store_global_stats(indexstore, terms_per_document, gsfname = GSFILE):
 
     # Total number of docs indexed
     N = len(terms_per_document)
@@ -119,7 +271,7 @@ def store_global_stats(indexstore, terms_per_document):
     # load global stats
     gs.load(N, cs, avdl, terms_per_document)
     # store stats
-    gs.write()
+    gs.write(os.path.join(indexstore, gsfname))
 
     return
 
@@ -128,61 +280,194 @@ def store_global_stats(indexstore, terms_per_document):
 # given a folder where corpus files are stored (created by corpus.py),
 #       a folder where the constructed index should be stored,
 #       the number of words consisting a term,
+#       optionally the docid map of the documents to index; defaults to all
+#       documents of the corpusstore, and
+#       optionally whether to build the bigram side index (refer to
+#       bigram_index.py)
 # then create the output index file
-def indexer(corpusstore, indexstore, n):
+# An index already in the folder is replaced only once the new index is
+# committed (refer to manifest.py). Until then it stays usable
+# Returns the created Index
+def indexer(corpusstore, indexstore, n, docid_map = None, bigrams = False):
+
+    if (not os.path.exists(indexstore)):
+        os.makedirs(indexstore)
+
+    manifest = Manifest(indexstore, recover = True)
+
+    # all files of an existing index are replaced
+    manifest.clear()
+    for segname in Segments(indexstore).names():
+        manifest.remove(segname)
+        manifest.remove(deletion_filename(segname))
+        manifest.remove(forward_filename(segname))
+    manifest.remove(SEGMENTSFILE)
+    manifest.remove(SHARDSFILE)
+    manifest.remove(TERMSTATFILE)
 
     # create an empty index
-    invidx = Index(indexstore)
+    invidx = Index(indexstore, manifest.stage(INDEXFILE))
 
     # global statistics information
     terms_per_document = {}
 
     # docid mapper; Maps documentID to a
     # tuple of (cacm_corpus_file_path, cacm_document_path)
-    docid_map = DocIDMapper().read(corpusstore)
+    all_documents = (docid_map is None)
+    if (all_documents):
+        docid_map = DocIDMapper().read(corpusstore)
 
-    for docid in docid_map:
+    with span("indexer.documents"):
 
-        # Path to the corpus file of this document id
-        corpusfpath = DocIDMapper().corpusfpath(docid, docid_map)
+        for docid in docid_map:
 
-        print_verbose("Adding document" + " (" +  str(docid) + "/" + \
-                     str(len(docid_map)) + ") " + corpusfpath + \
-                      " to index")
+            # Path to the corpus file of this document id
+            corpusfpath = DocIDMapper().corpusfpath(docid, docid_map)
 
-        # get corpus file
-        content = CorpusRW().corpus_content(corpusfpath)
+            print_verbose("Adding document" + " (" +  str(docid) + "/" + \
+                         str(len(docid_map)) + ") " + corpusfpath + \
+                          " to index")
 
-        # assert that content of the corpus file has no whitespace other than '\n'
-        assert(all(map(lambda w: w.strip() == w, content.split(" "))))
+            # index document and store global statistic, terms_per_document
+            terms_per_document[docid] = index_document(invidx, docid, corpusfpath, n)
 
-        # get word ngrams
-        terms = word_ngrams(content, n)
+    count("documents_indexed", len(terms_per_document))
 
-        # assert word ngrams
-        assert(all(map(lambda ng: len(ng.split(" ")) == n, terms)))
+    # store index to a file inside corpusstore
+    with span("indexer.store"):
+        invidx.store()
 
-        # store global statistic, terms_per_document
-        terms_per_document[docid] = len(terms)
+    # forward index; the terms of every document (refer to forward_index.py)
+    with span("indexer.forward"):
+        store_forward_index(invidx, os.path.join(indexstore,
+                                                 manifest.stage(forward_filename(INDEXFILE))))
 
-        # store terms
-        for posidx in range(0, len(terms)):
-            # term and term position
-            term = terms[posidx]
-            tpos = posidx
-            invidx.update(term, tpos, docid)
-
-    # store index to a file inside corpusstore
-    invidx.store()
+    # bigram side index
+    if (bigrams):
+        print_verbose("Building bigram index")
+        with span("indexer.bigrams"):
+            build_bigram_index(invidx, manifest.stage(BIGRAMFILE))
 
     # Copy the document map file from corpusstore to indexstore
-    DocIDMapper().copy_docidmapper(corpusstore, indexstore)
+    if (all_documents):
+        DocIDMapper().copy_docidmapper(corpusstore, indexstore,
+                                       manifest.stage(DOCIDMAPPER))
+    else:
+        DocIDMapper().store(indexstore, docid_map, manifest.stage(DOCIDMAPPER))
 
     # store global statistics
-    store_global_stats(indexstore, terms_per_document)
+    with span("indexer.statistics"):
+        store_global_stats(indexstore, terms_per_document, manifest.stage(GSFILE))
+
+    # commit the new index
+    with span("indexer.commit"):
+        manifest.commit()
+
+    # shards of a sharded index that was replaced
+    remove_stale_shards(indexstore)
 
     print "\nSuccess : Index created - ", indexstore
 
+    return invidx
+
+# given a folder where corpus files are stored (created by corpus.py),
+#       a folder where the constructed index should be stored,
+#       the number of words consisting a term,
+#       the number of shards, k, and
+#       whether to build the bigram side index of every shard
+# then partition the documents by docid range into k shards and index every
+# shard into a sub folder of the indexstore (refer to shards.py)
+def shard_indexer(corpusstore, indexstore, n, k, bigrams = False):
+
+    if (not os.path.exists(indexstore)):
+        os.makedirs(indexstore)
+
+    manifest = Manifest(indexstore, recover = True)
+
+    # all files of an existing index are replaced
+    manifest.clear()
+    for segname in Segments(indexstore).names():
+        manifest.remove(segname)
+        manifest.remove(deletion_filename(segname))
+        manifest.remove(forward_filename(segname))
+    manifest.remove(SEGMENTSFILE)
+    manifest.remove(INDEXFILE)
+    manifest.remove(forward_filename(INDEXFILE))
+
+    docid_map = DocIDMapper().read(corpusstore)
+
+    # the new shard list replaces the one of an existing index
+    shards        = Shards(indexstore)
+    shards.shards = []
+    term_stats    = TermStatistics()
+    N          = 0
+    cs         = 0
+
+    for docids in partition(sorted(docid_map.keys()), k):
+
+        name = shard_dirname(len(shards.names()))
+
+        print_verbose("Indexing documents " + str(docids[0]) + " to " + \
+                      str(docids[-1]) + " into shard " + name)
+
+        shard_docid_map = dict(map(lambda d: (d, docid_map[d]), docids))
+        with span("indexer.shard", shard = name):
+            invidx = indexer(corpusstore, shards.shardstore(name), n,
+                             shard_docid_map, bigrams)
+
+        # collection statistics
+        term_stats.add_index(invidx)
+        gs = GlobalStatistics(os.path.join(shards.shardstore(name), GSFILE))
+        N  = N  + gs.N
+        cs = cs + gs.corpus_size
+
+        shards.add(name, docids[0], docids[-1])
+
+    # shared statistics; document lengths are stored in the shards
+    gs = GlobalStatistics(os.path.join(indexstore, manifest.stage(GSFILE)))
+    gs.load(N, cs, (float(cs) / float(N)), {})
+    gs.write()
+
+    term_stats.write(os.path.join(indexstore, manifest.stage(TERMSTATFILE)))
+    shards.write(manifest.stage(SHARDSFILE))
+    DocIDMapper().copy_docidmapper(corpusstore, indexstore,
+                                   manifest.stage(DOCIDMAPPER))
+
+    # commit the sharded index
+    manifest.commit()
+
+    remove_stale_shards(indexstore, shards.names())
+
+    print "\nSuccess : Sharded index created - ", indexstore
+
+# given a folder where corpus files of new or changed documents are stored
+#       (created by corpus.py) or "" if there are no documents to add,
+#       an existing indexstore,
+#       the number of words consisting a term, and
+#       a list of document IDs to delete from the index
+# then update the index incrementally
+def update_indexer(corpusstore, indexstore, n, delete_docids):
+
+    writer = IndexWriter(indexstore, n)
+
+    # delete documents
+    print_verbose("Deleting documents " + str(delete_docids) + " from index")
+    with span("indexer.delete"):
+        writer.delete_documents(delete_docids)
+
+    # add documents
+    if (corpusstore != ""):
+        docid_map = DocIDMapper().read(corpusstore)
+        print_verbose("Adding " + str(len(docid_map)) + " documents to index")
+        with span("indexer.documents"):
+            writer.add_documents(docid_map)
+        count("documents_indexed", len(docid_map))
+
+    with span("indexer.commit"):
+        writer.commit()
+
+    print "\nSuccess : Index updated - ", indexstore
+
 
 ## Main ########################################################################
 
@@ -193,23 +478,93 @@ args = vars(argparser.parse_args())
 corpusstore = args['corpusstore']
 indexstore  = args['indexstore']
 ngrams      = args['ngrams']
+update      = args['update']
+delete      = args['delete']
+nshards     = args['shards']
+bigrams     = args['bigrams']
+tracefile   = args['tracefile']
+profile     = args['profile']
+profiler    = args['profiler']
+profilememory = args['profilememory']
 verbose     = args['verbose']
 
 ## Input check
-if (not os.path.exists(corpusstore)):
+if (corpusstore == "" and delete == ""):
+    print ("FATAL: corpusstore is required")
+    exit(-1)
+if (corpusstore != "" and not os.path.exists(corpusstore)):
     print ("FATAL: Cannot find file ", corpusstore)
     exit(-1)
 if (ngrams <= 0):
     print ("FATAL: ngrams should be > 0")
     exit(-1)
+if (nshards <= 0):
+    print ("FATAL: shards should be > 0")
+    exit(-1)
+if (bigrams and ngrams != 1):
+    print ("FATAL: bigrams can only be built with ngrams 1")
+    exit(-1)
+if (profiler not in PROFILERS):
+    print ("FATAL: profiler should be one of ", PROFILERS)
+    exit(-1)
 
-## Delete any indexstore previously present
-if (os.path.exists(indexstore)):
-    print ("DELETING EXISTING INDEXSTORE  ", indexstore)
-    shutil.rmtree(indexstore)
-
-# Create index
-indexer(corpusstore, indexstore, ngrams)
+## Document IDs to delete
+delete_docids = []
+if (delete != ""):
+    try:
+        delete_docids = map(lambda d: int(d.strip()), delete.split(","))
+    except ValueError:
+        print ("FATAL: delete should be a comma separated list of document IDs")
+        exit(-1)
+
+## Trace the stages of indexing
+if (tracefile != ""):
+    if (os.path.exists(tracefile)):
+        print ("WARNING: Deleting existing tracefile")
+        os.remove(tracefile)
+    tracing.enable()
+
+## Profile the program (refer to profiling.py)
+program_profile = None
+if (profile != ""):
+    program_profile = Profiler(profile, profiler, profilememory)
+    program_profile.start()
+
+if (update or delete != ""):
+
+    ## Incremental update of an existing indexstore
+    if (not os.path.exists(indexstore)):
+        print ("FATAL: Cannot find indexstore ", indexstore)
+        exit(-1)
+    if (nshards > 1 or is_sharded(indexstore)):
+        print ("FATAL: A sharded indexstore cannot be updated; index it again")
+        exit(-1)
+    if (bigrams):
+        print ("FATAL: An update drops the bigram index; index it again to build it")
+        exit(-1)
+
+    # Update index
+    update_indexer(corpusstore, indexstore, ngrams, delete_docids)
+
+else:
+
+    ## Any indexstore previously present is replaced
+    if (os.path.exists(indexstore)):
+        print ("REPLACING EXISTING INDEXSTORE  ", indexstore)
+
+    # Create index
+    if (nshards > 1):
+        shard_indexer(corpusstore, indexstore, ngrams, nshards, bigrams)
+    else:
+        indexer(corpusstore, indexstore, ngrams, None, bigrams)
+
+if (tracefile != ""):
+    tracing.tracer.write(tracefile, trace_format(tracefile))
+    if (verbose):
+        tracing.tracer.print_summary()
+
+if (program_profile is not None):
+    finish_profile(program_profile)
 
 # print the index
 #Index(indexfile).print_index()
@@ -0,0 +1,323 @@
+## This file provides a Manifest class that commits the files of an indexstore
+#  atomically and verifies them with checksums
+#
+# The manifest file of an indexstore lists every file that belongs to the last
+# commit of the index along with its size and CRC32 checksum. A commit works as
+# follows,
+#   i. Files that replace existing files are written to temporary files
+#      (refer to Manifest.stage). New files that are not referred to by the
+#      last commit (e.g. a new segment) may be written directly
+#  ii. All files are flushed to disk and checksummed
+# iii. A new manifest is written to a temporary file, flushed and renamed to
+#      MANIFEST. The rename is the commit point
+#  iv. Temporary files are renamed to their final names and files that are no
+#      longer referred to are deleted
+# A crash before the commit point leaves the last commit intact. A crash after
+# the commit point is rolled forward when the indexstore is opened again by a
+# writer (refer to Manifest.recover). Readers never modify the indexstore; a
+# file that was not rolled forward fails its checksum
+
+import os
+import zlib
+
+## Globals #####################################################################
+
+# Manifest file name
+MANIFEST    = "MANIFEST"
+
+# Prefix to identify the commit generation in the manifest file. The
+# generation is incremented by every commit
+GENERATIONID = "GENERATION"
+
+# Extension of temporary files that are renamed once committed
+TMPEXTN      = ".tmp"
+
+# Size of blocks read while checksumming a file
+BLOCKSIZE    = 1 << 20
+
+## Utilities ###################################################################
+
+# Given a string
+# Returns a tuple of the size and the CRC32 checksum of the string
+def checksum(data):
+    return (len(data), zlib.crc32(data) & 0xffffffff)
+
+# Given the path to a file
+# Returns a tuple of the size and the CRC32 checksum of the file
+def file_checksum(fpath):
+
+    size = 0
+    crc  = 0
+
+    with open(fpath, "rb") as f:
+        while (True):
+            block = f.read(BLOCKSIZE)
+            if (block == ""):
+                break
+            size = size + len(block)
+            crc  = zlib.crc32(block, crc)
+
+    return (size, crc & 0xffffffff)
+
+# Given the path to a file, flush the file to disk
+def fsync_file(fpath):
+
+    with open(fpath, "rb+") as f:
+        os.fsync(f.fileno())
+
+# Given the path to a folder, flush the folder's entries (i.e. renames) to disk
+def fsync_dir(dirpath):
+
+    fd = os.open(dirpath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+## Manifest ####################################################################
+
+class Manifest:
+
+    # indexstore the manifest describes
+    indexstore = ""
+
+    # commit generation; 0 if nothing has been committed yet
+    generation = 0
+
+    # dictionary of (file name, (size, crc32)) of all committed files
+    entries    = None
+
+    # Pending changes of the next commit
+    #   list of file names staged to temporary files,
+    #   list of file names written directly, and
+    #   list of file names no longer referred to
+    staged     = None
+    added      = None
+    removed    = None
+
+    # reset
+    def reset(self):
+        self.indexstore = ""
+        self.generation = 0
+        self.entries    = {}
+        self.staged     = []
+        self.added      = []
+        self.removed    = []
+
+    # Constructor
+    # Given an indexstore and whether to recover (optional; writers only), read
+    # its manifest if it exists and, if asked to, roll forward a commit that
+    # was interrupted after its commit point
+    def __init__(self, indexstore, recover = False):
+
+        self.reset()
+
+        self.indexstore = indexstore
+
+        if (self.exists()):
+            self.read()
+            if (recover):
+                self.recover()
+
+    ## Predicates ##############################################################
+
+    # true iff the indexstore has a manifest
+    def exists(self):
+        return os.path.exists(os.path.join(self.indexstore, MANIFEST))
+
+    # Given a file name
+    # true iff the file belongs to the last commit
+    def contains(self, fname):
+        return (self.entries.get(fname) is not None)
+
+    ## Verification ############################################################
+
+    # Given a file name that belongs to the last commit
+    # Returns the (size, crc32) checksum of the file recorded in the manifest
+    def checksum(self, fname):
+
+        assert (self.contains(fname))
+
+        return self.entries[fname]
+
+    # Given a file name that belongs to the last commit
+    # Raise an IOError if the file does not match its checksum
+    def verify(self, fname):
+
+        fpath = os.path.join(self.indexstore, fname)
+
+        if (not os.path.exists(fpath) or \
+            file_checksum(fpath) != self.checksum(fname)):
+            raise IOError("checksum mismatch : " + fpath)
+
+    # Raise an IOError if any committed file does not match its checksum
+    def verify_all(self):
+
+        for fname in sorted(self.entries.keys()):
+            self.verify(fname)
+
+    ## Commit methods ##########################################################
+
+    # Given the name of a file that belongs to the next commit
+    # Returns the name of the temporary file to write the file to
+    def stage(self, fname):
+
+        tmpfname = fname + TMPEXTN
+        tmpfpath = os.path.join(self.indexstore, tmpfname)
+
+        # left over by an interrupted commit
+        if (os.path.exists(tmpfpath)):
+            os.remove(tmpfpath)
+
+        if (fname not in self.staged):
+            self.staged.append(fname)
+        if (fname in self.removed):
+            self.removed.remove(fname)
+
+        return tmpfname
+
+    # Given the name of a new file that has been written to the indexstore
+    # Add the file to the next commit
+    def add(self, fname):
+
+        if (fname not in self.added):
+            self.added.append(fname)
+        if (fname in self.removed):
+            self.removed.remove(fname)
+
+    # Given a file name
+    # Remove the file from the next commit. The file is deleted once the
+    # commit is done
+    def remove(self, fname):
+
+        if (fname in self.staged):
+            self.staged.remove(fname)
+        if (fname in self.added):
+            self.added.remove(fname)
+        if (fname not in self.removed):
+            self.removed.append(fname)
+
+    # Remove all committed files from the next commit
+    def clear(self):
+
+        for fname in self.entries.keys():
+            self.remove(fname)
+
+    # Commit all staged, added and removed files
+    def commit(self):
+
+        # flush and checksum the files of the next commit
+        entries = dict(self.entries)
+
+        for fname in self.removed:
+            if (entries.get(fname) is not None):
+                del entries[fname]
+
+        for fname in self.staged:
+            fpath = os.path.join(self.indexstore, fname + TMPEXTN)
+            fsync_file(fpath)
+            entries[fname] = file_checksum(fpath)
+
+        for fname in self.added:
+            fpath = os.path.join(self.indexstore, fname)
+            fsync_file(fpath)
+            entries[fname] = file_checksum(fpath)
+
+        # write the new manifest and rename it; the commit point
+        self.generation = self.generation + 1
+        self.entries    = entries
+        self.write()
+
+        # roll forward
+        for fname in self.staged:
+            self.rename_staged(fname)
+
+        fsync_dir(self.indexstore)
+
+        # delete files that are no longer referred to
+        for fname in self.removed:
+            fpath = os.path.join(self.indexstore, fname)
+            if (not self.contains(fname) and os.path.exists(fpath)):
+                os.remove(fpath)
+
+        self.staged  = []
+        self.added   = []
+        self.removed = []
+
+    # Roll forward committed files that are still in their temporary files
+    # after a commit was interrupted
+    def recover(self):
+
+        for fname in self.entries:
+
+            tmpfpath = os.path.join(self.indexstore, fname + TMPEXTN)
+
+            if (os.path.exists(tmpfpath) and \
+                file_checksum(tmpfpath) == self.entries[fname]):
+                self.rename_staged(fname)
+
+    # Given the name of a staged file
+    # Rename its temporary file to its final name
+    def rename_staged(self, fname):
+
+        tmpfpath = os.path.join(self.indexstore, fname + TMPEXTN)
+
+        try:
+            os.rename(tmpfpath, os.path.join(self.indexstore, fname))
+        except OSError:
+            # another process rolled the file forward already
+            assert (not os.path.exists(tmpfpath))
+
+    ## Read/write methods ######################################################
+
+    # read the manifest file
+    def read(self):
+
+        assert (self.exists())
+
+        self.generation = 0
+        self.entries    = {}
+
+        with open(os.path.join(self.indexstore, MANIFEST), "r") as f:
+            mf_lines = f.readlines()
+
+        for mf_line in mf_lines:
+
+            # Every line is in the format
+            # filename , size , crc32
+            # except the generation line
+            # GENERATION , generation
+            mf_line_parts = map(lambda p: p.strip(), mf_line.split(","))
+
+            if (mf_line_parts[0] == GENERATIONID):
+                assert (len(mf_line_parts) == 2)
+                self.generation = int(mf_line_parts[1])
+            else:
+                assert (len(mf_line_parts) == 3)
+                self.entries[mf_line_parts[0]] = (int(mf_line_parts[1]),
+                                                  int(mf_line_parts[2]))
+
+    # write the manifest file through a temporary file
+    def write(self):
+
+        assert (os.path.exists(self.indexstore))
+
+        mfpath = os.path.join(self.indexstore, MANIFEST)
+
+        with open(mfpath + TMPEXTN, "w+") as f:
+
+            f.write(GENERATIONID + " , " + str(self.generation) + "\n")
+
+            for fname in sorted(self.entries.keys()):
+                f.write(fname                          + " , " + \
+                        str(self.entries[fname][0])    + " , " + \
+                        str(self.entries[fname][1])    + "\n")
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(mfpath + TMPEXTN, mfpath)
+
+        fsync_dir(self.indexstore)
+
+################################################################################
@@ -0,0 +1,266 @@
+## This program merges the segments of an indexstore that has been updated
+#  incrementally (refer to indexer.py --update) using the tiered merge policy in
+#  segment_merge.py. Optionally it reports how merging in the background affects
+#  the latency of BM25 queries
+
+from global_statistics import GSFILE
+from index_writer      import IndexWriter
+from segment_merge     import TieredMergePolicy, SegmentMerger, MergeThread, \
+                              MERGEFACTOR, FLOORDOCS
+from query             import queries
+from bm25              import BM25
+
+import argparse
+import os
+import time
+from   argparse import RawTextHelpFormatter
+
+## Globals #####################################################################
+# Print to terminal about what the program is doing
+# this is set by input to the program
+verbose = False
+
+## Help strings ################################################################
+
+program_help = '''
+
+    merge_segments.py merges the segments of an indexstore that has been updated
+    incrementally by indexer.py --update. Small segments are merged into larger
+    ones and deleted documents are purged. The merges run in a background
+    thread. When a query file is given, BM25 queries are run before, during and
+    after merging and their latencies are reported
+
+    Argument 1: indexstore  - Path to the folder, where the index is created by
+                              indexer.py
+
+    Argument 2: queryfile   - Path to a query file. Queries are used to measure
+                              query latency while merging. This argument is
+                              optional.
+
+    Argument 3: mergefactor - Number of segments of the same size that are
+                              merged together. Defaults to 10
+
+    Argument 4: floordocs   - Segments with fewer documents than this are all
+                              considered to be of the same size. Defaults to 100
+
+    Argument 5: verbose     - Print progress of the program to stdout.
+                              This argument is optional
+
+    EXAMPLES:
+
+        python merge_segments.py --indexstore=./cacm.index --verbose
+
+        # merge every 2 segments of the same size and report query latencies
+        python merge_segments.py --indexstore=./cacm.index --queryfile=queries.txt --mergefactor=2
+    '''
+
+indexstore_help = '''
+    Path to the folder, where the index is created by indexer.py
+    '''
+
+queryfile_help = '''
+    Path to a query file. Queries are used to measure query latency while
+    merging. This argument is optional
+    '''
+
+mergefactor_help = '''
+    Number of segments of the same size that are merged together. Defaults to 10
+    '''
+
+floordocs_help = '''
+    Segments with fewer documents than this are all considered to be of the same
+    size. Defaults to 100
+    '''
+
+verbose_help = '''
+    Print progress of the program to stdout. This argument is optional
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--indexstore",
+                       metavar  = "is",
+                       required = True,
+                       type     = str,
+                       help     = indexstore_help)
+
+argparser.add_argument("--queryfile",
+                       metavar  = "qf",
+                       type     = str,
+                       default  = "",
+                       help     = queryfile_help)
+
+argparser.add_argument("--mergefactor",
+                       metavar  = "mf",
+                       type     = int,
+                       default  = MERGEFACTOR,
+                       help     = mergefactor_help)
+
+argparser.add_argument("--floordocs",
+                       metavar  = "fd",
+                       type     = int,
+                       default  = FLOORDOCS,
+                       help     = floordocs_help)
+
+argparser.add_argument("--verbose",
+                       dest     = 'verbose',
+                       action   = 'store_true',
+                       help     = verbose_help)
+
+## Utilities ###################################################################
+
+# Given a string, print it if verbose is set
+def print_verbose(s):
+    if (verbose):
+        print s
+
+# Given a list of numbers and a percentile p in [0, 100]
+# Returns the p-th percentile of the numbers (nearest rank)
+def percentile(values, p):
+
+    assert (len(values) > 0)
+
+    values = sorted(values)
+    rank   = int(round((p / 100.0) * (len(values) - 1)))
+
+    return values[rank]
+
+# Given a description and a list of query latencies in seconds
+# Print the number of queries and the latency percentiles in milliseconds
+def print_latencies(desc, latencies):
+
+    if (latencies == []):
+        print desc, ": no queries"
+        return
+
+    print desc, ": queries ", len(latencies),                          \
+                ", p50 ", round(percentile(latencies, 50) * 1000, 2), "ms", \
+                ", p95 ", round(percentile(latencies, 95) * 1000, 2), "ms", \
+                ", max ", round(max(latencies) * 1000, 2), "ms"
+
+# Given an indexstore
+# Returns a tuple of a BM25 model that reads the index and the number of
+# seconds it took to read the index
+def open_searcher(indexstore):
+
+    start = time.time()
+    rm    = BM25(indexstore, os.path.join(indexstore, GSFILE))
+
+    return (rm, time.time() - start)
+
+# Given a BM25 model and a Query
+# Returns a tuple of the ResultSet of the query and its latency in seconds
+def timed_query(rm, query):
+
+    start     = time.time()
+    resultset = rm.search_query(rm.invidx, query)
+
+    return (resultset, time.time() - start)
+
+# Given a list of ResultSet
+# Returns a list of (query id, sorted list of (docid, score)) of all result sets.
+# Documents of equal score may be ranked in any order, hence the sort
+def result_signature(resultsets):
+
+    return map(lambda rs: (rs.query.qid,
+                           sorted(map(lambda r: (r.docid, r.score), rs.results))),
+               resultsets)
+
+## Merge #######################################################################
+
+# Given an indexstore, a merge policy and a queryfile (may be "")
+# Merge segments in a background thread while running queries
+def merge_segments(indexstore, policy, queryfile):
+
+    writer = IndexWriter(indexstore)
+    merger = SegmentMerger(writer, policy)
+
+    print "Segments before merging : ", len(writer.segments.names())
+    for segstat in writer.segment_statistics():
+        print_verbose("    " + segstat[0] + " , live " + str(segstat[1]) + \
+                      " , deleted " + str(segstat[2]))
+
+    query_lst = [] if queryfile == "" else queries(queryfile)
+
+    # query latencies before merging
+    (rm, load_before) = open_searcher(indexstore)
+    before    = map(lambda q: timed_query(rm, q), query_lst)
+
+    # merge in the background. Queries keep running against the index read
+    # before merging
+    thread = MergeThread(merger)
+    thread.start()
+
+    during = []
+    while (query_lst != [] and not thread.idle.is_set()):
+        for q in query_lst:
+            during.append(timed_query(rm, q)[1])
+            if (thread.idle.is_set()):
+                break
+
+    if (not thread.wait_idle()):
+        print "FATAL: Merge thread failed"
+        print thread.error
+        exit(-1)
+    thread.stop()
+
+    print "Segments after merging  : ", len(writer.segments.names())
+    for segstat in writer.segment_statistics():
+        print_verbose("    " + segstat[0] + " , live " + str(segstat[1]) + \
+                      " , deleted " + str(segstat[2]))
+
+    print "\nMerge throughput"
+    merger.print_stats()
+
+    if (query_lst == []):
+        return
+
+    # query latencies after merging; read the merged index
+    (rm, load_after) = open_searcher(indexstore)
+    after    = map(lambda q: timed_query(rm, q), query_lst)
+
+    print "\nQuery latency"
+    print "Index read before merging : ", round(load_before, 3), "s"
+    print "Index read after merging  : ", round(load_after, 3), "s"
+    print_latencies("Before merging", map(lambda r: r[1], before))
+    print_latencies("During merging", during)
+    print_latencies("After merging ", map(lambda r: r[1], after))
+
+    # merging must not change any result
+    if (result_signature(map(lambda r: r[0], before)) != \
+        result_signature(map(lambda r: r[0], after))):
+        print "FATAL: Results differ after merging"
+        exit(-1)
+
+    print "Results identical before and after merging"
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+indexstore  = args['indexstore']
+queryfile   = args['queryfile']
+mergefactor = args['mergefactor']
+floordocs   = args['floordocs']
+verbose     = args['verbose']
+
+## Input check
+if (not os.path.exists(indexstore)):
+    print ("FATAL: Cannot find indexstore ", indexstore)
+    exit(-1)
+if (queryfile != "" and not os.path.exists(queryfile)):
+    print ("FATAL: Cannot find file ", queryfile)
+    exit(-1)
+if (mergefactor <= 1):
+    print ("FATAL: mergefactor should be > 1")
+    exit(-1)
+if (floordocs <= 0):
+    print ("FATAL: floordocs should be > 0")
+    exit(-1)
+
+merge_segments(indexstore, TieredMergePolicy(mergefactor, floordocs), queryfile)
@@ -0,0 +1,320 @@
+## This file provides the parameter sweep; BM25 (bm25.py) and QLM (qlm.py)
+#  scores of all queries for a whole grid of model parameters, from an index
+#  read once (refer to sweep.py)
+#
+# Searching the queries once per setting reads the index and looks up the
+# postings, document lengths and statistics of every (query term, document)
+# pair again for every setting. The sweep looks them up once per query,
+#   docids  - the documents that match the query, in the order the retrieval
+#             models score them
+#   dlratio - dl / avdl of every document             (BM25)
+#   terms   - for every query term, in the order the retrieval models score
+#             them, the positions of the documents with the term and the term
+#             frequencies in the documents. BM25 terms have the BIM score and
+#             the query term frequency weight; QLM terms have the collection
+#             probability and tf / dl of every document with the term
+# and a setting is scored with one pass over the arrays per query term. Only
+# the parts of the score that depend on the setting are computed per setting;
+# e.g. K of BM25 once per document. Scores are summed in the same order as the
+# retrieval models, so the rankings of a setting are the rankings of searcher.py
+# with the same parameters.
+#
+# The rankings of every setting go straight to the evaluation engine (refer to
+# eval_engine.py); no runs are written
+
+from index             import Index
+from global_statistics import GlobalStatistics, GSFILE
+from eval_engine       import evaluate_run
+
+import heapq
+import math
+import multiprocessing
+import operator
+import os
+
+## Globals #####################################################################
+
+# Retrieval models that can be swept and the names of their parameters
+SWEEP_MODELS = {"bm25" : ["k1", "b"],
+                "qlm"  : ["lambda"]}
+
+# Number of documents ranked per query (refer to result_set.py)
+MAXRANK       = 100
+
+# Number of settings handed to a worker process at a time (refer to sweep)
+SETTINGSCHUNK = 16
+
+## Utilities ###################################################################
+
+# Given a grid of values of a parameter; either a comma separated list of
+# values, e.g. "0.5,0.75,1.2", or a range "start:stop:step" with stop
+# included, e.g. "0.0:1.0:0.05"
+# Returns the sorted list of values of the grid
+def grid_values(grid):
+
+    if (":" not in grid):
+        return sorted(set(map(float, grid.split(","))))
+
+    parts = map(float, grid.split(":"))
+    assert (len(parts) == 3)
+
+    (start, stop, step) = parts
+    assert (step > 0 and stop >= start)
+
+    # values rounded so that 0.1 steps do not drift; 0.30000000000000004
+    count = int(math.floor((stop - start) / step + 1.0e-9)) + 1
+
+    return map(lambda i: round(start + i * step, 10), range(0, count))
+
+# Given a retrieval model and a dictionary of key value pairs of parameter
+# name and list of values
+# Returns the list of settings of the grid; dictionaries of key value pairs of
+# parameter name and value
+def grid_settings(model, values):
+
+    settings = [{}]
+
+    for param in SWEEP_MODELS[model]:
+        settings = [dict(setting.items() + [(param, value)])
+                    for setting in settings for value in values[param]]
+
+    return settings
+
+## Parameter sweep #############################################################
+
+class ParameterSweep:
+
+    ## Global statistics
+    global_stats = None
+
+    ## Inverted index
+    invidx       = None
+
+    ## BM25 query term frequency parameter; not swept
+    k2           = 100
+
+    # list of query IDs swept
+    qids         = []
+
+    # dictionary of key value pairs of query ID and the list of docids of the
+    # documents that match the query
+    docids       = {}
+
+    # dictionary of key value pairs of query ID and the list of dl / avdl of
+    # the documents of the query
+    dlratios     = {}
+
+    # dictionaries of key value pairs of query ID and the list of terms of the
+    # query; (BIM score, query term frequency weight, positions, tfs) and
+    # (collection probability, positions, tf / dl) tuples
+    bm25_terms   = {}
+    qlm_terms    = {}
+
+    # Reset
+    def reset(self):
+        self.global_stats = None
+        self.invidx       = None
+        self.k2           = 100
+        self.qids         = []
+        self.docids       = {}
+        self.dlratios     = {}
+        self.bm25_terms   = {}
+        self.qlm_terms    = {}
+
+    ## Constructor
+    # Given an indexstore where the index file is stored by (indexer.py),
+    #       a list of Query (from query.py) and
+    #       optionally a set of query IDs to sweep; queries without judgements
+    #       do not count in the evaluation and are not swept, and
+    #       the BM25 parameter k2
+    #
+    def __init__(self, indexstore, query_lst, qids = None, k2_ = 100):
+
+        self.reset()
+
+        assert (os.path.exists(indexstore))
+
+        self.invidx       = Index(indexstore)
+        self.global_stats = GlobalStatistics(os.path.join(indexstore, GSFILE))
+        self.k2           = k2_
+
+        for query in query_lst:
+            if (qids is None or query.qid in qids):
+                self.add_query(query)
+
+    # Given a Query
+    # Look up the documents and term statistics of the query
+    def add_query(self, query):
+
+        # query terms as the retrieval models see them (refer to bm25.py)
+        query_terms = query.querystr.split(" ")
+        query_terms = filter(lambda qt: self.invidx.contains_term(qt), query_terms)
+
+        query_tf_dict = {}
+        for qt in query_terms:
+            query_tf_dict[qt] = query_tf_dict.get(qt, 0) + 1
+
+        # documents in the order the retrieval models score them
+        docids   = list(self.invidx.docids_for_query(set(query_terms),
+                                                     query.operators))
+        position = dict(zip(docids, range(0, len(docids))))
+
+        avdl = float(self.global_stats.get_avdl())
+        N    = float(self.global_stats.get_N())
+        cl   = float(self.global_stats.get_corpussize())
+
+        dls  = map(lambda docid: float(self.global_stats.document_length(docid)),
+                   docids)
+
+        bm25_terms = []
+        qlm_terms  = []
+
+        for qt in query_tf_dict:
+
+            positions = []
+            tfs       = []
+            for posting in self.invidx.postings(qt):
+                if (posting.docid in position):
+                    positions.append(position[posting.docid])
+                    tfs.append(float(posting.tf))
+
+            # BIM score and query term frequency weight (refer to bm25.py)
+            nt  = float(self.invidx.document_frequency(qt))
+            qtf = float(query_tf_dict[qt])
+            bim = math.log((N - nt + 0.5) / (nt + 0.5))
+            qf  = (float(self.k2) + 1.0) * qtf / (float(self.k2) + qtf)
+
+            bm25_terms.append((bim, qf, positions, tfs))
+
+            # collection probability and tf / dl (refer to qlm.py)
+            pc = float(self.invidx.corpus_frequency(qt)) / cl
+
+            qlm_terms.append((pc, positions,
+                              map(lambda i: tfs[i] / dls[positions[i]],
+                                  range(0, len(positions)))))
+
+        self.qids.append(query.qid)
+        self.docids[query.qid]     = docids
+        self.dlratios[query.qid]   = map(lambda dl: dl / avdl, dls)
+        self.bm25_terms[query.qid] = bm25_terms
+        self.qlm_terms[query.qid]  = qlm_terms
+
+    ## Scoring methods #########################################################
+
+    # Given a query ID and the BM25 parameters k1 and b
+    # Returns the list of BM25 scores of the documents of the query
+    def bm25_scores(self, qid, k1, b):
+
+        k1p = float(k1) + 1.0
+
+        # K of every document (refer to bm25.py, tfscore)
+        Ks = map(lambda r: float(k1) * ((1.0 - float(b)) + (float(b) * r)),
+                 self.dlratios[qid])
+
+        scores = [0] * len(Ks)
+
+        for (bim, qf, positions, tfs) in self.bm25_terms[qid]:
+            for j in range(0, len(positions)):
+                i  = positions[j]
+                tf = tfs[j]
+                scores[i] = scores[i] + bim * ((k1p * tf) / (Ks[i] + tf)) * qf
+
+        return scores
+
+    # Given a query ID and the QLM parameter lambda
+    # Returns the list of QLM scores of the documents of the query
+    def qlm_scores(self, qid, l):
+
+        docl   = 1.0 - l
+        scores = [0] * len(self.docids[qid])
+
+        for (pc, positions, ratios) in self.qlm_terms[qid]:
+
+            # documents without the term score the collection probability only
+            lpc    = float(l) * pc
+            logs   = [math.log(lpc)] * len(scores)
+            for j in range(0, len(positions)):
+                logs[positions[j]] = math.log(docl * ratios[j] + lpc)
+
+            scores = map(operator.add, scores, logs)
+
+        return scores
+
+    # Given a retrieval model and a setting (refer to grid_settings)
+    # Returns a run (refer to eval_engine.py); a dictionary of key value pairs
+    # of query ID and the list of the MAXRANK top ranked docids of the query
+    def run(self, model, setting):
+
+        run = {}
+
+        for qid in self.qids:
+
+            if (model == "bm25"):
+                scores = self.bm25_scores(qid, setting["k1"], setting["b"])
+            else:
+                scores = self.qlm_scores(qid, setting["lambda"])
+
+            # highest scores first; ties in the order documents were scored,
+            # as sorted does in the retrieval models
+            top    = heapq.nlargest(MAXRANK, range(0, len(scores)),
+                                    key = scores.__getitem__)
+            docids = self.docids[qid]
+            run[qid] = map(lambda i: docids[i], top)
+
+        return run
+
+## Parallel sweep ##############################################################
+
+# Parameter sweep, qrels and model of the worker processes. They are set before
+# the workers are forked, so every worker shares the arrays of the parent
+# copy-on-write
+worker_sweep = None
+worker_qrels = None
+worker_model = ""
+
+# Given a setting
+# Returns the mean metrics of the setting (refer to eval_engine.py)
+def sweep_worker(setting):
+
+    (query_metrics, means) = evaluate_run(worker_qrels,
+                                          worker_sweep.run(worker_model, setting))
+
+    return means
+
+##
+# GIVEN: a ParameterSweep, a Qrels (from eval_engine.py), a retrieval model of
+#        SWEEP_MODELS, a list of settings (refer to grid_settings) and the
+#        number of worker processes
+#
+# RETURNS: a list of (setting, mean metrics) tuples in the order of the settings
+#
+def sweep(parameter_sweep, qrels, model, settings, workers = 1):
+
+    global worker_sweep
+    global worker_qrels
+    global worker_model
+
+    assert (model in SWEEP_MODELS)
+
+    worker_sweep = parameter_sweep
+    worker_qrels = qrels
+    worker_model = model
+
+    try:
+        if (workers > 1 and len(settings) > 1):
+            pool = multiprocessing.Pool(workers)
+            try:
+                means = pool.map(sweep_worker, settings, chunksize = SETTINGSCHUNK)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            means = map(sweep_worker, settings)
+    finally:
+        worker_sweep = None
+        worker_qrels = None
+        worker_model = ""
+
+    return zip(settings, means)
+
+################################################################################
@@ -0,0 +1,343 @@
+## This file implements the profiling mode of the programs of the repository
+#  (e.g. searcher.py --profile); a deterministic profiler, cProfile, or a
+#  sampling profiler, and optionally the top memory allocators
+#
+# A profile with the prefix p is written to,
+#
+#   p.pstats    - cProfile statistics; read with pstats or snakeviz. cProfile
+#                 only
+#   p.collapsed - collapsed stacks, a stack of ";" separated functions and a
+#                 weight per line; input of flamegraph.pl and speedscope
+#   p.txt       - the functions with the highest time
+#   p.memory    - the top memory allocators, if memory is profiled
+#
+# The sampling profiler samples the stack of the program every SAMPLEINTERVAL
+# seconds of CPU time (signal.setitimer), so its overhead does not depend on
+# the number of function calls. Collapsed stacks of cProfile are derived from
+# its caller/callee times and are weighted by microseconds
+#
+# Memory is profiled with tracemalloc when Python has it (3.4 or later). Older
+# Pythons report the growth of live objects by type and the peak RSS instead
+
+import cProfile
+import gc
+import os
+import pstats
+import resource
+import signal
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+## Globals #####################################################################
+
+# Profilers
+PROFILER_CPROFILE = "cprofile"
+PROFILER_SAMPLING = "sampling"
+PROFILERS         = [PROFILER_CPROFILE, PROFILER_SAMPLING]
+
+# Seconds of CPU time between two samples of the sampling profiler
+SAMPLEINTERVAL = 0.005
+
+# Number of functions in the text report and of allocators in the memory report
+REPORTTOP      = 40
+
+# Number of frames of the stack of an allocation recorded by tracemalloc
+MEMORYFRAMES   = 10
+
+# Collapsed stacks of cProfile with less than this many microseconds are left
+# out; they do not show in a flame graph
+MINSTACKUS     = 1
+
+# Deepest collapsed stack derived from cProfile
+MAXSTACKDEPTH  = 64
+
+## Utilities ###################################################################
+
+# Given the filename, first line number and name of a function
+# Returns the name of the function in a stack; the one of pstats, without the
+# path of the file
+def function_name(filename, lineno, name):
+    return "%s:%d(%s)" % (os.path.basename(filename), lineno, name)
+
+# Given a dictionary of key value pairs of collapsed stack and weight and the
+# path to a file
+# Write the collapsed stacks to the file, heaviest first
+def write_collapsed(stacks, collapsedfile):
+
+    with open(collapsedfile, "w+") as f:
+        for (stack, weight) in sorted(stacks.items(), key = lambda s: s[1],
+                                      reverse = True):
+            f.write(stack + " " + str(weight) + "\n")
+
+# Given the stats dictionary of pstats.Stats (refer to pstats.py); a dictionary
+#       of key value pairs of function and (primitive calls, calls, time,
+#       cumulative time, callers)
+# Returns a dictionary of key value pairs of collapsed stack and microseconds
+#
+# cProfile records the time of every caller/callee pair, not of stacks. The
+# time of a function on a stack is its time times the fraction of its
+# cumulative time that the caller on the stack accounts for
+def cprofile_stacks(stats):
+
+    # callees of every function; (callee, cumulative time of the calls)
+    callees = {}
+    for (func, (cc, nc, tt, ct, callers)) in stats.items():
+        for (caller, edge) in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    stacks = {}
+
+    # Given a function, its stack, the set of functions on the stack and the
+    # fraction of the time of the function spent on the stack
+    # Add the time of the function and its callees on the stack to stacks
+    def walk(func, stack, onstack, fraction):
+
+        (cc, nc, tt, ct, callers) = stats[func]
+
+        us = int(round(1.0e6 * tt * fraction))
+        if (us >= MINSTACKUS):
+            stacks[stack] = stacks.get(stack, 0) + us
+
+        if (len(onstack) >= MAXSTACKDEPTH):
+            return
+
+        for (callee, edge_ct) in callees.get(func, []):
+
+            callee_ct = stats[callee][3]
+
+            # recursion is folded into the outermost call
+            if (callee in onstack or callee_ct <= 0.0):
+                continue
+
+            callee_fraction = fraction * edge_ct / callee_ct
+            if (1.0e6 * callee_fraction * callee_ct < MINSTACKUS):
+                continue
+
+            onstack.add(callee)
+            walk(callee, stack + ";" + function_name(*callee), onstack,
+                 callee_fraction)
+            onstack.remove(callee)
+
+    # functions no profiled function called
+    for func in stats:
+        if (stats[func][4] == {}):
+            walk(func, function_name(*func), set([func]), 1.0)
+
+    return stacks
+
+# Returns a dictionary of key value pairs of type name and number of live
+# objects of the type tracked by the garbage collector
+def live_objects():
+
+    counts = {}
+    for obj in gc.get_objects():
+        name         = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+
+    return counts
+
+## Profiler ####################################################################
+
+# Profiles the code run between start and stop
+class Profiler:
+
+    # Prefix of the profile files
+    prefix   = ""
+
+    # One of PROFILERS
+    profiler = PROFILER_CPROFILE
+
+    # Profile memory allocators too ?
+    memory   = False
+
+    # cProfile.Profile of the cProfile profiler
+    profile  = None
+
+    # Samples of the sampling profiler; a dictionary of key value pairs of
+    # collapsed stack and number of samples
+    samples  = {}
+
+    # Live objects by type when the profiler started, and when it stopped.
+    # Only when memory is profiled without tracemalloc (refer to live_objects)
+    objects_start = None
+    objects_stop  = None
+
+    # tracemalloc snapshot and peak traced memory in bytes when the profiler
+    # stopped
+    snapshot = None
+    peak     = 0
+
+    # Constructor
+    # Given the prefix of the profile files, one of PROFILERS and whether to
+    # profile memory allocators too
+    def __init__(self, prefix_, profiler_ = PROFILER_CPROFILE, memory_ = False):
+
+        self.reset()
+
+        assert (profiler_ in PROFILERS)
+
+        self.prefix   = prefix_
+        self.profiler = profiler_
+        self.memory   = memory_
+
+    # Reset
+    def reset(self):
+        self.prefix        = ""
+        self.profiler      = PROFILER_CPROFILE
+        self.memory        = False
+        self.profile       = None
+        self.samples       = {}
+        self.objects_start = None
+        self.objects_stop  = None
+        self.snapshot      = None
+        self.peak          = 0
+
+    # Start profiling
+    def start(self):
+
+        if (self.memory):
+            if (tracemalloc is not None):
+                tracemalloc.start(MEMORYFRAMES)
+            else:
+                self.objects_start = live_objects()
+
+        if (self.profiler == PROFILER_CPROFILE):
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.samples = {}
+            signal.signal(signal.SIGPROF, self.sample)
+            # system calls interrupted by a sample are restarted
+            signal.siginterrupt(signal.SIGPROF, False)
+            signal.setitimer(signal.ITIMER_PROF, SAMPLEINTERVAL, SAMPLEINTERVAL)
+
+    # Stop profiling
+    def stop(self):
+
+        if (self.profiler == PROFILER_CPROFILE):
+            self.profile.disable()
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+        if (self.memory):
+            if (tracemalloc is not None):
+                self.snapshot = tracemalloc.take_snapshot()
+                self.peak     = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                self.objects_stop = live_objects()
+
+    # Given the signal number and the frame the program was interrupted in
+    # Add the stack of the frame to the samples; the SIGPROF handler of the
+    # sampling profiler
+    def sample(self, signum, frame):
+
+        names = []
+        while (frame is not None):
+            code = frame.f_code
+            names.append(function_name(code.co_filename, code.co_firstlineno,
+                                       code.co_name))
+            frame = frame.f_back
+
+        names.reverse()
+        stack = ";".join(names)
+
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    # Given the path to a file
+    # Write the functions with the highest self time, and the highest time
+    # including their callees, of the samples to the file
+    def write_sample_report(self, reportfile):
+
+        total     = sum(self.samples.values())
+        selftime  = {}
+        inclusive = {}
+
+        for (stack, n) in self.samples.items():
+            names = stack.split(";")
+            selftime[names[-1]] = selftime.get(names[-1], 0) + n
+            # a recursive function counts once per sample
+            for name in set(names):
+                inclusive[name] = inclusive.get(name, 0) + n
+
+        with open(reportfile, "w+") as f:
+
+            f.write("%d samples, one every %.1f ms of CPU time\n\n" %
+                    (total, 1000.0 * SAMPLEINTERVAL))
+
+            for (title, counts) in [("self", selftime), ("inclusive", inclusive)]:
+                f.write("%9s %7s  %s\n" % ("samples", "%", "function (" + title + ")"))
+                top = sorted(counts.items(), key = lambda c: c[1], reverse = True)
+                for (name, n) in top[:REPORTTOP]:
+                    f.write("%9d %6.1f%%  %s\n" % (n, 100.0 * n / max(total, 1), name))
+                f.write("\n")
+
+    # Given the path to a file
+    # Write the top memory allocators to the file
+    def write_memory_report(self, memoryfile):
+
+        with open(memoryfile, "w+") as f:
+
+            f.write("peak RSS %d KB\n" %
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+            if (tracemalloc is not None):
+                f.write("peak traced memory %d KB\n\n" % (self.peak / 1024))
+                for stat in self.snapshot.statistics("lineno")[:REPORTTOP]:
+                    f.write(str(stat) + "\n")
+                return
+
+            # growth of the live objects of every type
+            f.write("tracemalloc is not available; growth of live objects by type\n\n")
+            growth = map(lambda name: (name, self.objects_stop[name] -
+                                             self.objects_start.get(name, 0)),
+                         self.objects_stop.keys())
+            growth = sorted(growth, key = lambda g: g[1], reverse = True)
+            f.write("%12s  %s\n" % ("objects", "type"))
+            for (name, n) in filter(lambda g: g[1] > 0, growth)[:REPORTTOP]:
+                f.write("%+12d  %s\n" % (n, name))
+
+    # Write the profile files
+    # Returns the list of paths to the files written
+    def write(self):
+
+        files = []
+
+        if (self.profiler == PROFILER_CPROFILE):
+
+            self.profile.dump_stats(self.prefix + ".pstats")
+            files.append(self.prefix + ".pstats")
+
+            stats = pstats.Stats(self.profile)
+            write_collapsed(cprofile_stacks(stats.stats), self.prefix + ".collapsed")
+
+            with open(self.prefix + ".txt", "w+") as f:
+                pstats.Stats(self.profile, stream = f).sort_stats("cumulative") \
+                                                       .print_stats(REPORTTOP)
+        else:
+            write_collapsed(self.samples, self.prefix + ".collapsed")
+            self.write_sample_report(self.prefix + ".txt")
+
+        files.append(self.prefix + ".collapsed")
+        files.append(self.prefix + ".txt")
+
+        if (self.memory):
+            self.write_memory_report(self.prefix + ".memory")
+            files.append(self.prefix + ".memory")
+
+        return files
+
+## Profiling functions #########################################################
+
+# Given a Profiler that was started
+# Stop it, write the profile files and print their paths to stdout
+def finish_profile(profiler):
+
+    profiler.stop()
+
+    for profilefile in profiler.write():
+        print "Profile written to ", profilefile
@@ -4,13 +4,20 @@
 # 2. Allow a maximum proximity of three terms, that is, adjacent query terms can
 #    be separated by no more than 3 terms in the matching document. Documents
 #    with terms appearing closer to each other are deemed better matches.
+#
+# Documents are scored with a single pass over the merged, sorted positions of
+# the query terms in the document (refer to merge_proximity_score). The window
+# scan over a dictionary of all positions (refer to scan_proximity_score) gives
+# identical scores and is kept as the reference implementation
 
-from index             import Index
+from index             import Index, VERIFY_OFF, VERIFY_FULL
 from query             import Query
 from result_set        import Result, ResultSet, DocumentScore
 from global_statistics import GlobalStatistics
 from bm25              import BM25
+from tracing           import span, count
 
+import heapq
 import os
 
 ## Globals #####################################################################
@@ -58,6 +65,9 @@ class ProximityModel:
     ## Inverted index
     invidx       = None
 
+    ## Verification level (refer to index.py)
+    verify       = VERIFY_OFF
+
     ## proximity window
     window       = PROXIMITY_WINDOW
 
@@ -65,15 +75,24 @@ class ProximityModel:
     # query terms individually
     base_model  = None
 
+    ## Score documents with the positional merge; the window scan otherwise
+    positional_merge = True
+
     # reset
     def reset(self):
         self.global_stats = None
         self.invidx       = None
+        self.verify       = VERIFY_OFF
         self.window       = PROXIMITY_WINDOW
         self.base_model   = None
+        self.positional_merge = True
 
     # Constructor
-    def __init__(self, indexstore, gsfile, window_ = PROXIMITY_WINDOW):
+    # Given an indexstore, a global statistics file path, a proximity window,
+    # a verification level (refer to index.py) and whether to score documents
+    # with the positional merge
+    def __init__(self, indexstore, gsfile, window_ = PROXIMITY_WINDOW,
+                 verify_ = VERIFY_OFF, positional_merge_ = True):
 
         # reset
         self.reset()
@@ -84,16 +103,18 @@ class ProximityModel:
             return
 
         # Get index
-        self.invidx = Index(indexstore)
+        self.verify = verify_
+        self.invidx = Index(indexstore, verify = verify_)
 
         # Get global statistics
-        self.global_stats = GlobalStatistics(gsfile)
+        self.global_stats = GlobalStatistics(gsfile, verify_)
 
         # Set parameters
         self.window =  window_
+        self.positional_merge = positional_merge_
 
         # Initialize base_model. our base model is BM25
-        self.base_model = BM25(indexstore, gsfile)
+        self.base_model = BM25(indexstore, gsfile, verify_ = verify_)
 
     ##
     # GIVEN : a list of Query (from query.py)
@@ -108,7 +129,8 @@ class ProximityModel:
         # for every query
         for query in queries:
             # search query in index
-            resultset = self.search_query(self.invidx, query)
+            with span("proximity.query", qid = query.qid):
+                resultset = self.search_query(self.invidx, query)
             # store result
             results.append(resultset)
 
@@ -133,78 +155,46 @@ class ProximityModel:
         # appear in the query
         mini_index = self.minindex(query)
 
-        # Get set of related documents
-        docids     = self.invidx.docids_with_terms(set(query_terms))
+        # Get set of related documents; documents must match the phrase and
+        # window operators of the query (refer to query_operators.py)
+        docids     = self.invidx.docids_for_query(set(query_terms),
+                                                  query.operators)
 
-        # Initialize document score list
-        docscores = []
+        # Get the terms that follow every query term in the query
+        query_adjterm_dict = self.adjacent_terms(query_terms)
 
-        for docid in docids:
+        count("docs_scored", len(docids))
 
-            # Get base scores for each query term for this docid. This base score
-            # would tell us the importance of each query term
-            qt_base_score_dict = self.base_scores(query_terms, docid, mini_index)
+        with span("proximity.score"):
 
-            # We have query terms as there are keys in the mini_index
-            # But since we are mainly worried about proximity search, a query
-            # term appearing at position X (e.g. 3) is very different from a
-            # query term that appears at a position Y (e.g. 55) in the same
-            # document. Because a query term appearing at position X need not be
-            # surrounded by the same term like in position Y. query term scores
-            # are very position dependent
+            # Initialize document score list
+            docscores = []
 
-            # Initialize position dependent term score dictionary
-            pos_tscore_dict = self.init_proximity_term_scores(mini_index, docid)
+            for docid in docids:
 
-            # Add base_scores for every term's ProximityTermScore that appears
-            # in pos_tscore_dict
-            for pos in pos_tscore_dict:
-                # get ProximityTermScore for term at this position
-                pts = pos_tscore_dict[pos]
-                # assert initial scores
-                assert (pts.base_score      == 0)
-                assert (pts.proximity_score == 0)
-                # update pts with term base score
-                pts.base_score = qt_base_score_dict[pts.term]
-                # add pts back to pos_tscore_dict
-                pos_tscore_dict[pos] = pts
-
-            # compute proximity scores for terms at all postions in pos_tscore_dict
-            pos_tscore_dict = self.score_for_proximity(pos_tscore_dict, query)
-
-            # add up all the basescores and proximity scores of all terms to be
-            # the score for this document
-            doc_proximity_model_score = 0
-            for pos in pos_tscore_dict:
-                # Get this ProximityTermScore
-                pts = pos_tscore_dict.get(pos)
-                # get total score
-                total_term_score = pts.base_score + pts.proximity_score
-                # update doc_proximity_model_score
-                doc_proximity_model_score = doc_proximity_model_score + total_term_score
-
-            # Debugger
-            #if (query.qid == 65 and docid == 3205):
-            #    print "docscore ", doc_proximity_model_score
-            #    print "query    ", query.querystr
-            #    slist = []
-            #    for pos in pos_tscore_dict:
-            #        # get ProximityTermScore for term at this position
-            #        pts = pos_tscore_dict[pos]
-            #        s =  " * %0.4d %-*s %0.4f %0.4f \n" % (pts.pos, 15, pts.term, pts.base_score, pts.proximity_score)
-            #        slist.append(s)
-            #    slist.sort()
-
-            #    for s in slist:
-            #        print s
-
-            docscores.append(DocumentScore(docid, doc_proximity_model_score, "PROXIMITY"))
+                # Get base scores for each query term for this docid. This base score
+                # would tell us the importance of each query term
+                qt_base_score_dict = self.base_scores(query_terms, docid, mini_index)
+
+                if (self.positional_merge):
+                    doc_proximity_model_score = \
+                        self.merge_proximity_score(mini_index, docid,
+                                                   qt_base_score_dict,
+                                                   query_adjterm_dict)
+                else:
+                    doc_proximity_model_score = \
+                        self.scan_proximity_score(mini_index, docid,
+                                                  qt_base_score_dict, query)
+
+                docscores.append(DocumentScore(docid, doc_proximity_model_score, "PROXIMITY"))
 
         # Sort doc scores based on score from highest to lowest
-        docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
+        with span("proximity.sort"):
+            docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
 
         # return result set
-        return ResultSet(query, docscores)
+        with span("resultset"):
+            return ResultSet(query, docscores)
 
     # Given a Query (query.py)
     # return a dictionary of (key, value) pairs of (terms, invertedlist) of all
@@ -236,7 +226,8 @@ class ProximityModel:
         for query_term in set(query_terms):
 
             # assert that we got this query term's termfrequency
-            assert (qtf_dict.get(query_term) is not None)
+            if (self.verify == VERIFY_FULL):
+                assert (qtf_dict.get(query_term) is not None)
 
             # get base score
             base_score = 0
@@ -250,15 +241,200 @@ class ProximityModel:
 
         return base_score_dict
 
-    # Given a dictionary of (key, value), (position, ProximityTermScore) with
-    #       only base scores computed on every ProximityTermScore value, and
+    # Given a dictionary of (term, invertedlist) of the query terms,
+    #       the id of a document, docid,
+    #       a dictionary of (key, value) pairs of (query_term, base_score) and
     #       a Query (query.py)
-    # Return a dictionary, just like the original but with proximity scores
-    #        computed to the ProximityTermScore value
-    def score_for_proximity(self, pos_tscore_dict, query):
+    # Returns the proximity model score of the document. Every occurrence of a
+    # query term gets a ProximityTermScore and a window of the following
+    # positions is scanned for the adjacent query terms
+    def scan_proximity_score(self, mini_index, docid, qt_base_score_dict, query):
+
+        # We have query terms as there are keys in the mini_index
+        # But since we are mainly worried about proximity search, a query
+        # term appearing at position X (e.g. 3) is very different from a
+        # query term that appears at a position Y (e.g. 55) in the same
+        # document. Because a query term appearing at position X need not be
+        # surrounded by the same term like in position Y. query term scores
+        # are very position dependent
+
+        # Initialize position dependent term score dictionary
+        pos_tscore_dict = self.init_proximity_term_scores(mini_index, docid)
+
+        # Add base_scores for every term's ProximityTermScore that appears
+        # in pos_tscore_dict
+        for pos in pos_tscore_dict:
+            # get ProximityTermScore for term at this position
+            pts = pos_tscore_dict[pos]
+            # assert initial scores
+            if (self.verify == VERIFY_FULL):
+                assert (pts.base_score      == 0)
+                assert (pts.proximity_score == 0)
+            # update pts with term base score
+            pts.base_score = qt_base_score_dict[pts.term]
+            # add pts back to pos_tscore_dict
+            pos_tscore_dict[pos] = pts
 
-        # get all query terms
-        query_terms = query.querystr.split(" ")
+        # compute proximity scores for terms at all postions in pos_tscore_dict
+        pos_tscore_dict = self.score_for_proximity(pos_tscore_dict, query)
+
+        # add up all the basescores and proximity scores of all terms to be
+        # the score for this document
+        doc_proximity_model_score = 0
+        for pos in pos_tscore_dict:
+            # Get this ProximityTermScore
+            pts = pos_tscore_dict.get(pos)
+            # get total score
+            total_term_score = pts.base_score + pts.proximity_score
+            # update doc_proximity_model_score
+            doc_proximity_model_score = doc_proximity_model_score + total_term_score
+
+        # Debugger
+        #if (query.qid == 65 and docid == 3205):
+        #    print "docscore ", doc_proximity_model_score
+        #    print "query    ", query.querystr
+        #    slist = []
+        #    for pos in pos_tscore_dict:
+        #        # get ProximityTermScore for term at this position
+        #        pts = pos_tscore_dict[pos]
+        #        s =  " * %0.4d %-*s %0.4f %0.4f \n" % (pts.pos, 15, pts.term, pts.base_score, pts.proximity_score)
+        #        slist.append(s)
+        #    slist.sort()
+
+        #    for s in slist:
+        #        print s
+
+        return doc_proximity_model_score
+
+    # Given a dictionary of (term, invertedlist) of the query terms,
+    #       the id of a document, docid,
+    #       a dictionary of (key, value) pairs of (query_term, base_score) and
+    #       a dictionary of (key, value) pairs of (query_term, list of adjacent
+    #       query terms) (refer to adjacent_terms)
+    # Returns the proximity model score of the document; identical to
+    # scan_proximity_score
+    #
+    # The sorted position lists of the query terms in the document are merged
+    # with a heap of position cursors, so positions are visited from left to
+    # right once. The first occurrence of an adjacent term at or after a
+    # position is found with a cursor into the adjacent term's position list
+    # that only ever moves right. Scores are kept in dictionaries keyed by
+    # position that are filled in the same order as scan_proximity_score fills
+    # its dictionary, so scores are added up in the same order
+    def merge_proximity_score(self, mini_index, docid, qt_base_score_dict,
+                              query_adjterm_dict):
+
+        # dictionary of (term, positions) of the query terms in the document
+        term_positions = {}
+
+        # dictionaries of (position, base score) and (position, proximity
+        # score) of every occurrence of a query term
+        pos_base_dict      = {}
+        pos_proximity_dict = {}
+
+        for term in mini_index:
+
+            postings = mini_index.get(term)
+            p_idx    = self.posting_idx(postings, docid)
+
+            if (p_idx == -1):
+                # term does not appear in the document
+                continue
+
+            positions = postings[p_idx].positions
+
+            if (self.verify == VERIFY_FULL):
+                assert (postings[p_idx].tf == len(positions))
+
+            term_positions[term] = positions
+
+            base_score = qt_base_score_dict[term]
+            for position in positions:
+                pos_base_dict[position]      = base_score
+                pos_proximity_dict[position] = 0
+
+        # heap of (position, term, index of position) cursors; one per term
+        heap = []
+        for term in term_positions:
+            heap.append((term_positions[term][0], term, 0))
+        heapq.heapify(heap)
+
+        # dictionary of (term, index of the first position of the term that is
+        # not to the left of the current position)
+        cursors = dict.fromkeys(term_positions, 0)
+
+        prev_pos = -1
+
+        while (heap != []):
+
+            (pos, term, idx) = heap[0]
+
+            # move the term's cursor to its next position
+            positions = term_positions[term]
+            if (idx + 1 < len(positions)):
+                heapq.heapreplace(heap, (positions[idx + 1], term, idx + 1))
+            else:
+                heapq.heappop(heap)
+
+            # every position holds a single term
+            if (self.verify == VERIFY_FULL):
+                assert (pos > prev_pos)
+            prev_pos = pos
+
+            base_score          = pos_base_dict[pos]
+            proximity_score     = pos_proximity_dict[pos]
+            pre_proximity_score = proximity_score
+
+            for qtadj in query_adjterm_dict.get(term):
+
+                adj_positions = term_positions.get(qtadj)
+
+                if (adj_positions is None):
+                    # adjterm not in document
+                    continue
+
+                # first occurrence of adjterm at or after pos
+                c = cursors[qtadj]
+                while (c < len(adj_positions) and adj_positions[c] < pos):
+                    c = c + 1
+                cursors[qtadj] = c
+
+                if (c == len(adj_positions) or \
+                    adj_positions[c] >= pos + self.window):
+                    # adjterm not found in window
+                    continue
+
+                adj_pos = adj_positions[c]
+                offset  = adj_pos - pos
+
+                # REWARD; as in score_for_proximity
+                proximity_score = proximity_score                 + \
+                                  (self.window - offset)          * \
+                                  base_score * pos_base_dict[adj_pos]
+
+                pos_proximity_dict[adj_pos] = pos_proximity_dict[adj_pos]      + \
+                                              pre_proximity_score              + \
+                                              (self.window - offset)           * \
+                                              base_score * pos_base_dict[adj_pos]
+
+            if (proximity_score == 0):
+                # PENALIZE
+                proximity_score = proximity_score - (self.window * base_score)
+
+            pos_proximity_dict[pos] = proximity_score
+
+        # add up all the base scores and proximity scores
+        doc_proximity_model_score = 0
+        for pos in pos_proximity_dict:
+            total_term_score = pos_base_dict[pos] + pos_proximity_dict[pos]
+            doc_proximity_model_score = doc_proximity_model_score + total_term_score
+
+        return doc_proximity_model_score
+
+    # Given a list of query terms
+    # Returns a dictionary of (key, value) pairs of (query_term, list of the
+    # terms that follow the query term in the query)
+    def adjacent_terms(self, query_terms):
 
         # compute list of terms to the left of each term in query_terms
         # we say "list of terms", as, if there are duplicates of a term, say X,
@@ -277,6 +453,21 @@ class ProximityModel:
             # add adj term
             query_adjterm_dict[qt] = query_adjterm_dict[qt] + [adj_qt]
 
+        return query_adjterm_dict
+
+    # Given a dictionary of (key, value), (position, ProximityTermScore) with
+    #       only base scores computed on every ProximityTermScore value, and
+    #       a Query (query.py)
+    # Return a dictionary, just like the original but with proximity scores
+    #        computed to the ProximityTermScore value
+    def score_for_proximity(self, pos_tscore_dict, query):
+
+        # get all query terms
+        query_terms = query.querystr.split(" ")
+
+        # get the terms that follow every query term in the query
+        query_adjterm_dict = self.adjacent_terms(query_terms)
+
         # get all positions in pos_tscore_dict
         positions = []
         for pos in pos_tscore_dict:
@@ -311,7 +502,8 @@ class ProximityModel:
                     continue
 
                 # assert that we have a term at pos + offset
-                assert (pos_tscore_dict.get(pos + offset) is not None)
+                if (self.verify == VERIFY_FULL):
+                    assert (pos_tscore_dict.get(pos + offset) is not None)
 
                 # get the adjacent term's ProximityTermScore
                 adj_pts = pos_tscore_dict.get(pos + offset)
@@ -398,7 +590,8 @@ class ProximityModel:
             posting = postings[p_idx]
 
             # assert posting sanity
-            assert (posting.tf == len(posting.positions))
+            if (self.verify == VERIFY_FULL):
+                assert (posting.tf == len(posting.positions))
 
             # get positions that the term appears in
             positions = posting.positions
@@ -406,7 +599,8 @@ class ProximityModel:
             # for each position the term appears in, create an entry in the
             # pos_tscore_dict dictionary
             for position in positions:
-                assert (pos_tscore_dict.get(position) == None)
+                if (self.verify == VERIFY_FULL):
+                    assert (pos_tscore_dict.get(position) == None)
                 # record the term, its position, and 0 base and proximity scores
                 pos_tscore_dict[position] = ProximityTermScore(term, position, 0, 0)
 
@@ -448,7 +642,8 @@ class ProximityModel:
     # if no such posting exists, then return -1
     def posting_idx(self, postings, docid):
 
-        assert (isinstance(docid, int))
+        if (self.verify == VERIFY_FULL):
+            assert (isinstance(docid, int))
 
         # the postings list is sorted. lets binary search
         left  = 0
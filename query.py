@@ -4,6 +4,7 @@
 import os
 from bs4 import BeautifulSoup
 from text_processing import process_text
+from query_operators import parse_query
 
 ## Query #######################################################################
 
@@ -11,22 +12,35 @@ class Query:
 
     # Query ID
     qid   = -1
-    # Query
+    # Query terms separated by spaces
     querystr = ""
+    # Query as written; with phrase and window operators (query_operators.py)
+    text      = ""
+    # List of QueryOperator (from query_operators.py)
+    operators = []
 
     # Constructor
+    # Given a query ID and a query that may have phrase and window operators
     def __init__(self, qid_, querystr_):
 
         # reset
         self.reset()
 
         self.qid      = qid_
-        self.querystr = querystr_
+        self.text     = querystr_
+
+        # Queries without operators are used as they are
+        if ('"' in querystr_ or '#' in querystr_):
+            (self.querystr, self.operators) = parse_query(querystr_)
+        else:
+            self.querystr = querystr_
 
     # Reset
     def reset(self):
-        self.qid      = -1
-        self.querystr = ""
+        self.qid       = -1
+        self.querystr  = ""
+        self.text      = ""
+        self.operators = []
 
 ## Utilities ###################################################################
 
@@ -58,8 +72,12 @@ def queries (queryfile):
         qid      = int(ql_parts[0].strip())
         querystr = ql_parts[1].strip()
 
-        # build query
-        query_lst.append(Query(qid, querystr))
+        # build query; an operator that is not closed cannot be parsed
+        try:
+            query_lst.append(Query(qid, querystr))
+        except ValueError as e:
+            print "FATAL: Cannot parse query " + str(qid) + " ; " + str(e)
+            exit(-1)
 
     # return
     return query_lst
@@ -0,0 +1,415 @@
+## This file provides a query broker that searches a sharded indexstore served
+#  by shard servers (refer to shard_server.py) over TCP
+#
+# The broker reads the statistics shared across shards from the sharded
+# indexstore (refer to shards.py), asks every shard server which shard it
+# serves and groups servers serving the same shard as replicas. Every query is
+# sent to one replica of every shard and the results of all shards are merged
+# as in shard_searcher.py.
+#
+#   Timeouts        - A query waits at most timeout seconds for the results of
+#                     any shard
+#   Partial results - Shards without a replica that answers in time are left
+#                     out of the results of the query and recorded in partial
+#   Hedged requests - A shard that has not answered within hedge_delay seconds
+#                     is sent the same request on another replica. The first
+#                     answer is used. A replica that fails is replaced by the
+#                     next replica right away
+#   Connections     - Connections to shard servers are kept open and reused
+#                     by later queries
+
+from global_statistics import GlobalStatistics, GSFILE
+from shards            import Shards, TermStatistics, TERMSTATFILE
+from shard_searcher    import merge_results, MAXRANK
+from result_set        import ResultSet
+from wire_protocol     import recv_frame, send_frame, decode_hello_reply, \
+                              encode_search, decode_results, decode_error,  \
+                              HELLO, HELLO_REPLY, SEARCH, RESULTS, ERROR
+
+import os
+import select
+import socket
+import time
+
+## Globals #####################################################################
+
+# Seconds a query waits for the results of a shard
+TIMEOUT        = 10.0
+
+# Seconds before a request is also sent to another replica of the shard
+HEDGEDELAY     = 0.5
+
+# Seconds to wait for a connection to a shard server
+CONNECTTIMEOUT = 1.0
+
+# Idle connections kept open per shard server
+MAXIDLE        = 4
+
+## Utilities ###################################################################
+
+# Given a string "host:port"
+# Returns a tuple of (host, port)
+def server_address(hostport):
+
+    parts = hostport.strip().rsplit(":", 1)
+    assert (len(parts) == 2)
+
+    return (parts[0], int(parts[1]))
+
+## Connection pool #############################################################
+
+# Open connections to shard servers
+class ConnectionPool:
+
+    # dictionary of key value pairs of (host, port) and a list of idle sockets
+    idle    = None
+
+    # number of connections opened
+    opened  = 0
+
+    # reset
+    def reset(self):
+        self.idle   = {}
+        self.opened = 0
+
+    # Constructor
+    def __init__(self):
+        self.reset()
+
+    # Given a (host, port)
+    # Returns an idle connection to the server or a new connection. Raises an
+    # IOError if the server cannot be connected to
+    def acquire(self, address):
+
+        idle = self.idle.get(address, [])
+
+        if (idle != []):
+            return idle.pop()
+
+        sock = socket.create_connection(address, CONNECTTIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.opened = self.opened + 1
+
+        return sock
+
+    # Given a (host, port) and a connection to the server with no request in
+    # flight, keep the connection for later requests
+    def release(self, address, sock):
+
+        idle = self.idle.setdefault(address, [])
+
+        if (len(idle) < MAXIDLE):
+            idle.append(sock)
+        else:
+            sock.close()
+
+    # Given a connection that is broken or has a request in flight whose
+    # result is no longer wanted, close it
+    def discard(self, sock):
+
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
+    # Close all idle connections
+    def close(self):
+
+        for address in self.idle:
+            for sock in self.idle[address]:
+                sock.close()
+
+        self.idle = {}
+
+## Query broker ################################################################
+
+class QueryBroker:
+
+    # sharded indexstore
+    indexstore       = ""
+
+    # retrieval model name
+    model            = ""
+
+    # tuple of N, corpus size and avdl of the collection
+    collection_stats = None
+
+    # term statistics of the collection
+    term_stats       = None
+
+    # dictionary of key value pairs of shard name and a list of (host, port)
+    # of the servers serving the shard
+    replicas         = None
+
+    # connections to shard servers
+    pool             = None
+
+    # timeout and hedge delay in seconds
+    timeout          = TIMEOUT
+    hedge_delay      = HEDGEDELAY
+
+    # list of (query ID, list of shard names) of queries whose results lack
+    # the results of some shards
+    partial          = None
+
+    # Statistics
+    #   number of requests sent,
+    #   number of hedged requests sent,
+    #   number of replicas that failed,
+    #   number of shards left out of the results of a query
+    requests         = 0
+    hedged           = 0
+    failovers        = 0
+    unanswered       = 0
+
+    # request ID of the last request
+    reqid            = 0
+
+    # reset
+    def reset(self):
+        self.indexstore       = ""
+        self.model            = ""
+        self.collection_stats = None
+        self.term_stats       = None
+        self.replicas         = {}
+        self.pool             = ConnectionPool()
+        self.timeout          = TIMEOUT
+        self.hedge_delay      = HEDGEDELAY
+        self.partial          = []
+        self.requests         = 0
+        self.hedged           = 0
+        self.failovers        = 0
+        self.unanswered       = 0
+        self.reqid            = 0
+
+    # Constructor
+    # Given a sharded indexstore, a retrieval model name, a list of (host, port)
+    # of shard servers, a timeout and a hedge delay in seconds
+    # Find the shard every server serves
+    def __init__(self, indexstore, model, servers,
+                 timeout = TIMEOUT, hedge_delay = HEDGEDELAY):
+
+        self.reset()
+
+        self.indexstore  = indexstore
+        self.model       = model
+        self.timeout     = timeout
+        self.hedge_delay = hedge_delay
+
+        gs = GlobalStatistics(os.path.join(indexstore, GSFILE))
+        self.collection_stats = (gs.get_N(), gs.get_corpussize(), gs.get_avdl())
+        self.term_stats       = TermStatistics(os.path.join(indexstore, TERMSTATFILE))
+
+        for name in Shards(indexstore).names():
+            self.replicas[name] = []
+
+        for address in servers:
+
+            try:
+                (shardname, model, ndocs) = self.hello(address)
+            except IOError as e:
+                print "WARNING: Shard server ", address, " is not available ", e
+                continue
+
+            if (shardname not in self.replicas):
+                print "WARNING: Shard server ", address, " serves unknown shard ", shardname
+            elif (model != self.model):
+                print "WARNING: Shard server ", address, " searches with ", model
+            else:
+                self.replicas[shardname].append(address)
+
+        for name in sorted(self.replicas.keys()):
+            if (self.replicas[name] == []):
+                print "WARNING: No shard server serves ", name
+
+    # Given a (host, port) of a shard server
+    # Returns a tuple of the shard name, retrieval model name and number of
+    # documents of the server
+    def hello(self, address):
+
+        sock = self.pool.acquire(address)
+
+        try:
+            sock.settimeout(self.timeout)
+            send_frame(sock, HELLO)
+            (msgtype, payload) = recv_frame(sock)
+        except IOError:
+            self.pool.discard(sock)
+            raise
+
+        if (msgtype != HELLO_REPLY):
+            self.pool.discard(sock)
+            raise IOError("unexpected reply " + str(msgtype))
+
+        self.pool.release(address, sock)
+
+        return decode_hello_reply(payload)
+
+    # Given a list of Query (from query.py)
+    # Returns a list of ResultSet where the first resultset in the list
+    #         corresponds to the first query in the input list and so on
+    def search(self, query_lst):
+
+        resultsets = []
+
+        for query in query_lst:
+            docscores = merge_results(self.search_query(query))
+            resultsets.append(ResultSet(query, docscores, MAXRANK))
+
+        return resultsets
+
+    # Given a Query
+    # Returns a list of per shard lists of (score, docid, model) tuples of the
+    # query from every shard that answered in time
+    def search_query(self, query):
+
+        self.reqid = self.reqid + 1
+
+        termstats = self.term_stats.statistics(query.querystr.split(" "))
+        payload   = encode_search(self.reqid, self.collection_stats, termstats,
+                                  [query])
+
+        start    = time.time()
+        deadline = start + self.timeout
+        hedge_at = start + self.hedge_delay
+
+        # replicas not tried yet of every shard
+        untried  = {}
+        for name in self.replicas:
+            untried[name] = list(self.replicas[name])
+            # spread load over the replicas
+            rotate = self.reqid % max(len(untried[name]), 1)
+            untried[name] = untried[name][rotate:] + untried[name][:rotate]
+
+        # dictionary of key value pairs of socket and (shard name, address) of
+        # requests in flight
+        inflight = {}
+
+        # dictionary of key value pairs of shard name and its results
+        answered = {}
+
+        for name in self.replicas:
+            self.send_request(name, untried, inflight, payload)
+
+        hedged = False
+
+        while (len(answered) < len(self.replicas) and inflight != {}):
+
+            now = time.time()
+            if (now >= deadline):
+                break
+
+            if (not hedged and now >= hedge_at):
+                hedged = True
+                for name in self.replicas:
+                    if (name not in answered and untried[name] != []):
+                        self.hedged = self.hedged + 1
+                        self.send_request(name, untried, inflight, payload)
+                continue
+
+            wait = (deadline if hedged else min(deadline, hedge_at)) - now
+            (readable, w, x) = select.select(inflight.keys(), [], [], wait)
+
+            for sock in readable:
+
+                (name, address) = inflight.pop(sock)
+
+                try:
+                    sock.settimeout(max(deadline - time.time(), 0.001))
+                    results = self.recv_results(sock)
+                except IOError:
+                    # the replica failed; try the next one right away
+                    self.pool.discard(sock)
+                    self.failovers = self.failovers + 1
+                    if (name not in answered):
+                        self.send_request(name, untried, inflight, payload)
+                    continue
+
+                self.pool.release(address, sock)
+
+                # the answer of a hedged request that came in second
+                if (name in answered):
+                    continue
+
+                assert (len(results) == 1)
+                answered[name] = results[0]
+
+        # results of requests still in flight are no longer wanted
+        for sock in inflight:
+            self.pool.discard(sock)
+
+        missing = filter(lambda name: name not in answered,
+                         sorted(self.replicas.keys()))
+
+        if (missing != []):
+            self.unanswered = self.unanswered + len(missing)
+            self.partial.append((query.qid, missing))
+
+        return map(lambda name: answered[name], sorted(answered.keys()))
+
+    # Given a shard name, the untried replicas of every shard, the requests in
+    # flight and the payload of a SEARCH
+    # Send the request to the next untried replica of the shard that can be
+    # connected to
+    def send_request(self, name, untried, inflight, payload):
+
+        while (untried[name] != []):
+
+            address = untried[name].pop(0)
+
+            try:
+                sock = self.pool.acquire(address)
+            except IOError:
+                self.failovers = self.failovers + 1
+                continue
+
+            try:
+                sock.settimeout(self.timeout)
+                send_frame(sock, SEARCH, payload)
+            except IOError:
+                # the pooled connection was closed by the server
+                self.pool.discard(sock)
+                self.failovers = self.failovers + 1
+                continue
+
+            self.requests = self.requests + 1
+            inflight[sock] = (name, address)
+            return
+
+    # Given a connection with a request in flight
+    # Returns the results of the request. Raises an IOError if the server
+    # failed
+    def recv_results(self, sock):
+
+        (msgtype, payload) = recv_frame(sock)
+
+        if (msgtype == ERROR):
+            (reqid, msg) = decode_error(payload)
+            raise IOError("shard server error " + msg)
+
+        if (msgtype != RESULTS):
+            raise IOError("unexpected reply " + str(msgtype))
+
+        (reqid, results) = decode_results(payload)
+
+        if (reqid != self.reqid):
+            raise IOError("reply to request " + str(reqid) + \
+                          " instead of " + str(self.reqid))
+
+        return results
+
+    # Print statistics of the broker
+    def print_stats(self):
+
+        print "Requests            : ", self.requests
+        print "Hedged requests     : ", self.hedged
+        print "Failed replicas     : ", self.failovers
+        print "Shards left out     : ", self.unanswered
+        print "Partial results     : ", len(self.partial)
+        print "Connections opened  : ", self.pool.opened
+
+    # Close all connections
+    def close(self):
+        self.pool.close()
+
+################################################################################
@@ -0,0 +1,515 @@
+## This file provides phrase and window operators of queries and matches them
+#  against the positions of terms in an Index (from index.py)
+#
+# Query syntax. Terms outside of operators are plain query terms,
+#   "t1 t2 t3"        - phrase; the terms appear next to each other in order
+#   #odN(t1 t2 t3)    - ordered window; the terms appear in order and every
+#                       term appears at most N positions after the term before
+#                       it. #od1 is a phrase
+#   #uwN(t1 t2 t3)    - unordered window; the terms appear in any order within
+#                       a window of N positions. A term repeated k times
+#                       appears at k positions of the window
+#
+# The terms of operators are scored by retrieval models like plain query terms.
+# Operators are constraints; only documents that match every operator of a
+# query are scored. Matching documents are found before scoring, with cursors
+# that skip through the postings of the operator terms to the documents that
+# have all of them, and with an intersection of the term positions in those
+# documents only
+#
+# Phrases are matched with the bigram side index (refer to bigram_index.py) of
+# an Index when it has one. A phrase is covered with indexed bigrams where it
+# can be, so the long postings of frequent terms like "of the" are replaced by
+# the short postings of their bigram
+
+import bisect
+import itertools
+import random
+import re
+
+## Globals #####################################################################
+
+# Ordered and unordered window operators
+ORDERED   = "od"
+UNORDERED = "uw"
+
+# Operator syntax; #odN( or #uwN(
+OPERATOR_RE = re.compile(r"#(od|uw)(\d+)\(")
+
+## Query operator ##############################################################
+
+class QueryOperator:
+
+    # ORDERED or UNORDERED
+    kind   = ""
+
+    # window size
+    window = 0
+
+    # list of terms
+    terms  = []
+
+    # reset
+    def reset(self):
+        self.kind   = ""
+        self.window = 0
+        self.terms  = []
+
+    # Constructor
+    # Given ORDERED or UNORDERED, a window size and a list of terms
+    def __init__(self, kind_, window_, terms_):
+
+        self.reset()
+
+        assert (kind_ == ORDERED or kind_ == UNORDERED)
+        assert (window_ > 0)
+
+        self.kind   = kind_
+        self.window = window_
+        self.terms  = terms_
+
+    # Given a dictionary of key value pairs of term and the sorted positions of
+    # the term in a document
+    # Returns true iff the document matches the operator
+    def matches(self, term_positions):
+
+        if (self.kind == ORDERED):
+            return ordered_match(map(lambda t: term_positions[t], self.terms),
+                                 self.window)
+
+        # a repeated term must appear as many times in the window
+        terms = sorted(set(self.terms))
+        return unordered_match(map(lambda t: term_positions[t], terms),
+                               self.window,
+                               map(lambda t: self.terms.count(t), terms))
+
+    # Returns the operator in query syntax
+    def operator_string(self):
+        return "#" + self.kind + str(self.window) + "(" + " ".join(self.terms) + ")"
+
+## Parsing #####################################################################
+
+# Given a query string
+# Returns a tuple of the query string with operators replaced by their terms
+# and a list of QueryOperator of the query. Raises a ValueError if an operator
+# is not closed
+def parse_query(querystr):
+
+    terms     = []
+    operators = []
+
+    rest = querystr
+
+    while (rest != ""):
+
+        op    = OPERATOR_RE.search(rest)
+        quote = rest.find('"')
+
+        # no more operators
+        if (op is None and quote == -1):
+            terms.extend(rest.split())
+            break
+
+        if (op is not None and (quote == -1 or op.start() < quote)):
+            # window operator
+            end = rest.find(")", op.end())
+            if (end == -1):
+                raise ValueError("operator is not closed : " + querystr)
+            kind    = op.group(1)
+            window  = int(op.group(2))
+            opterms = rest[op.end():end].split()
+            before  = rest[:op.start()]
+        else:
+            # phrase
+            end = rest.find('"', quote + 1)
+            if (end == -1):
+                raise ValueError("phrase is not closed : " + querystr)
+            kind    = ORDERED
+            window  = 1
+            opterms = rest[quote + 1:end].split()
+            before  = rest[:quote]
+
+        terms.extend(before.split())
+        terms.extend(opterms)
+
+        # an operator of a single term is the term
+        if (len(opterms) > 1):
+            operators.append(QueryOperator(kind, window, opterms))
+
+        rest = rest[end + 1:]
+
+    return (" ".join(terms), operators)
+
+## Position matching ###########################################################
+
+# Given a list of sorted position lists; one per term in order, and a window
+# Returns true iff there are positions p1 < p2 < ... one from every list such
+# that every position is at most window positions after the position before it
+#
+# The positions of every term that end a match of the terms up to it are
+# carried forward. A position of the next term is reachable iff the closest
+# reachable position before it is at most window positions before it
+def ordered_match(position_lists, window):
+
+    reachable = position_lists[0]
+
+    for positions in position_lists[1:]:
+
+        nexts = []
+        for pos in positions:
+            # closest reachable position before pos
+            idx = bisect.bisect_left(reachable, pos)
+            if (idx > 0 and pos - reachable[idx - 1] <= window):
+                nexts.append(pos)
+
+        if (nexts == []):
+            return False
+
+        reachable = nexts
+
+    return True
+
+# Given a list of (position, list) events and the number of positions needed
+# from every list
+# Returns true iff every list can be given the number of positions it needs
+# with no position given to two lists; a bipartite matching of the positions
+# needed by the lists and the positions
+def distinct_positions(events, counts):
+
+    # lists that have every position
+    lists = {}
+    for (pos, i) in events:
+        lists.setdefault(pos, []).append(i)
+
+    # dictionary of key value pairs of position and the slot it is given to;
+    # a slot is a (list, n) pair, the n-th position needed by the list
+    given = {}
+
+    # Given a slot and the set of positions visited
+    # Returns true iff the slot can be given a position, giving positions of
+    # other slots to other positions as needed
+    def augment(slot, visited):
+        for pos in sorted(lists.keys()):
+            if (slot[0] not in lists[pos] or pos in visited):
+                continue
+            visited.add(pos)
+            if (pos not in given or augment(given[pos], visited)):
+                given[pos] = slot
+                return True
+        return False
+
+    for i in range(0, len(counts)):
+        for n in range(0, counts[i]):
+            if (not augment((i, n), set())):
+                return False
+
+    return True
+
+# Given a list of sorted position lists; one per term, a window and optionally
+# the number of positions needed from every list; defaults to one
+# Returns true iff there are distinct positions, the number needed from every
+# list, that are all within a window of window positions
+def unordered_match(position_lists, window, counts = None):
+
+    if (counts is None):
+        counts = [1] * len(position_lists)
+
+    # positions of all lists in order; (position, list)
+    events = sorted(itertools.chain(*map(lambda (i, positions):
+                                             map(lambda p: (p, i), positions),
+                                         enumerate(position_lists))))
+
+    # positions of every list in the window [events[low], events[high]]
+    inwindow = [0] * len(position_lists)
+    missing  = len(position_lists)
+    low      = 0
+
+    for high in range(0, len(events)):
+
+        (pos, i)    = events[high]
+        inwindow[i] = inwindow[i] + 1
+        if (inwindow[i] == counts[i]):
+            missing = missing - 1
+
+        # shrink the window from the left to fewer than window positions
+        while (pos - events[low][0] >= window):
+            j = events[low][1]
+            if (inwindow[j] == counts[j]):
+                missing = missing + 1
+            inwindow[j] = inwindow[j] - 1
+            low = low + 1
+
+        # the lists of a query operator are of distinct terms, so they share no
+        # positions and the check of distinct positions passes at once
+        if (missing == 0 and distinct_positions(events[low:high + 1], counts)):
+            return True
+
+    return False
+
+# Given a list of (sorted positions, offset) tuples; the positions of every
+# unit of a phrase and the offset of the unit in the phrase
+# Returns true iff there is a start position p such that p + offset is a
+# position of every unit
+def phrase_match(unit_positions):
+
+    # the shortest position list drives the match
+    unit_positions = sorted(unit_positions, key = lambda po: len(po[0]))
+    (lead, lead_offset) = unit_positions[0]
+
+    for pos in lead:
+
+        start   = pos - lead_offset
+        matched = True
+
+        for (positions, offset) in unit_positions[1:]:
+            idx = bisect.bisect_left(positions, start + offset)
+            if (idx == len(positions) or positions[idx] != start + offset):
+                matched = False
+                break
+
+        if (matched):
+            return True
+
+    return False
+
+## Phrase units ################################################################
+
+# Given an operator
+# Returns true iff the operator is a phrase
+def is_phrase(op):
+    return (op.kind == ORDERED and op.window == 1)
+
+# Given an Index of bigrams (from bigram_index.py) and the list of terms of a
+# phrase
+# Returns a list of (key, offset) tuples that cover the phrase; a key is an
+# indexed bigram or a term, and the offset is the position of its first word in
+# the phrase. Adjacent terms are covered by their bigram where it is indexed
+def phrase_units(bigrams, terms):
+
+    units = []
+    i     = 0
+
+    while (i < len(terms)):
+
+        if (i + 1 < len(terms) and
+            bigrams.contains_term(terms[i] + " " + terms[i + 1])):
+            units.append((terms[i] + " " + terms[i + 1], i))
+            i = i + 2
+            continue
+
+        # the last term of a phrase overlaps the bigram before it, if indexed
+        if (i == len(terms) - 1 and i > 0 and
+            bigrams.contains_term(terms[i - 1] + " " + terms[i])):
+            units.append((terms[i - 1] + " " + terms[i], i - 1))
+        else:
+            units.append((terms[i], i))
+
+        i = i + 1
+
+    return units
+
+## Posting cursor ##############################################################
+
+# A cursor over a postings list sorted by docid that can skip ahead to a docid
+class PostingCursor:
+
+    # postings list
+    postings = None
+
+    # index of the current posting
+    idx      = 0
+
+    # reset
+    def reset(self):
+        self.postings = []
+        self.idx      = 0
+
+    # Constructor
+    # Given a postings list sorted by docid
+    def __init__(self, postings_):
+        self.reset()
+        self.postings = postings_
+
+    # true iff the cursor is past the last posting
+    def done(self):
+        return (self.idx >= len(self.postings))
+
+    # Returns the current posting
+    def posting(self):
+        return self.postings[self.idx]
+
+    # Returns the docid of the current posting
+    def docid(self):
+        return self.postings[self.idx].docid
+
+    # Given a docid
+    # Move the cursor to the first posting with docid >= the docid. Postings
+    # are skipped with an exponential search followed by a binary search, so
+    # skipping over k postings costs O(log k)
+    def skip_to(self, docid):
+
+        postings = self.postings
+        n        = len(postings)
+
+        if (self.idx >= n or postings[self.idx].docid >= docid):
+            return
+
+        # exponential search for a posting with docid >= docid
+        low  = self.idx
+        step = 1
+        high = low + step
+
+        while (high < n and postings[high].docid < docid):
+            low  = high
+            step = step * 2
+            high = low + step
+
+        high = min(high, n)
+
+        # binary search in (low, high]
+        while (low + 1 < high):
+            mid = (low + high) / 2
+            if (postings[mid].docid < docid):
+                low = mid
+            else:
+                high = mid
+
+        self.idx = high
+
+## Matching ####################################################################
+
+# Given an Index (from index.py) and a list of QueryOperator
+# Returns a set of docids of documents that match every operator
+def matching_docids(invidx, operators):
+
+    assert (operators != [])
+
+    bigrams = getattr(invidx, "bigrams", None)
+
+    # keys of the postings to intersect; terms, and bigrams of phrases
+    terms = set()
+    units = {}
+    for op in operators:
+        if (bigrams is not None and is_phrase(op)):
+            units[op] = phrase_units(bigrams, op.terms)
+            terms.update(map(lambda ko: ko[0], units[op]))
+        else:
+            terms.update(op.terms)
+
+    # documents must have every operator term; bigrams are indexed
+    if (not all(map(lambda t: " " in t or invidx.contains_term(t), terms))):
+        return set()
+
+    cursors = []
+    for term in terms:
+        if (" " in term):
+            postings = bigrams.postings(term)
+        else:
+            postings = invidx.postings(term)
+        cursors.append((term, PostingCursor(postings)))
+
+    # shortest postings list first; it drives the intersection
+    cursors.sort(key = lambda tc: len(tc[1].postings))
+    lead   = cursors[0][1]
+    others = map(lambda tc: tc[1], cursors[1:])
+
+    docids = set()
+
+    while (not lead.done()):
+
+        target = lead.docid()
+
+        # skip every cursor to the target; a cursor past the target gives a
+        # new target
+        found = True
+        for cursor in others:
+            cursor.skip_to(target)
+            if (cursor.done()):
+                return docids
+            if (cursor.docid() != target):
+                found = False
+                lead.skip_to(cursor.docid())
+                break
+
+        if (not found):
+            continue
+
+        # every term is in the document; intersect positions
+        term_positions = {}
+        for (term, cursor) in cursors:
+            term_positions[term] = cursor.posting().positions
+
+        matched = True
+        for op in operators:
+            if (op in units):
+                if (not phrase_match(map(lambda ko: (term_positions[ko[0]], ko[1]),
+                                         units[op]))):
+                    matched = False
+                    break
+            elif (not op.matches(term_positions)):
+                matched = False
+                break
+
+        if (matched):
+            docids.add(target)
+
+        lead.idx = lead.idx + 1
+
+    return docids
+
+## Tests #######################################################################
+
+# Given a list of sorted position lists and a window
+# Returns ordered_match of the lists by trying every combination of positions
+def ordered_match_brute_force(position_lists, window):
+
+    for combination in itertools.product(*position_lists):
+        if (all(map(lambda i: 0 < combination[i] - combination[i - 1] <= window,
+                    range(1, len(combination))))):
+            return True
+
+    return False
+
+# Given a list of sorted position lists, a window and the number of positions
+# needed from every list
+# Returns unordered_match of the lists by trying every combination of positions
+def unordered_match_brute_force(position_lists, window, counts):
+
+    choices = map(lambda (positions, k): itertools.combinations(positions, k),
+                  zip(position_lists, counts))
+
+    for combination in itertools.product(*choices):
+        positions = list(itertools.chain(*combination))
+        if (len(set(positions)) == len(positions) and
+            max(positions) - min(positions) < window):
+            return True
+
+    return False
+
+# tests for ordered_match and unordered_match against the brute force matchers
+def test_position_matching():
+
+    assert (ordered_match([[0], [1, 2], [4]], 2))
+    assert (not ordered_match([[0], [1, 2], [5]], 2))
+    assert (not unordered_match([[5], [5]], 1))
+    assert (not unordered_match([[5]], 1, [2]))
+    assert (unordered_match([[5, 7]], 3, [2]))
+
+    rng = random.Random(0)
+
+    for trial in range(0, 2000):
+
+        nterms = rng.randint(1, 4)
+        window = rng.randint(1, 4)
+        lists  = map(lambda t: sorted(rng.sample(range(0, 12), rng.randint(1, 4))),
+                     range(0, nterms))
+        counts = map(lambda positions: rng.randint(1, len(positions)), lists)
+
+        assert (ordered_match(lists, window) ==
+                ordered_match_brute_force(lists, window))
+        assert (unordered_match(lists, window, counts) ==
+                unordered_match_brute_force(lists, window, counts))
+
+    print "Position matching pass"
+
+################################################################################
@@ -70,8 +70,10 @@ class ResultSet:
         # Set query
         self.query   = query_
 
-        # From documen score list. get a list of ranked Result
-        docscores_ranked = sorted(docscores_, key = lambda x: x.score, reverse=True)
+        # From documen score list. get a list of ranked Result. Documents of
+        # equal score are ranked by docid, so that a sharded index ranks them
+        # as a single index does (refer to shard_searcher.merge_results)
+        docscores_ranked = sorted(docscores_, key = lambda x: (-x.score, x.docid))
 
         for idx in range(0, min(len(docscores_ranked), maxrank)):
 
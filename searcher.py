@@ -10,8 +10,17 @@ from qlm               import QLM
 from tfidf             import TFIDF
 from proximity_model   import ProximityModel
 from bm25_relvence     import BM25_R
+from index             import VERIFY_OFF, VERIFY_LEVELS
+from shards            import is_sharded
+from shard_searcher    import ShardedSearcher, SHARD_MODELS
+from query_broker      import QueryBroker, server_address, TIMEOUT, HEDGEDELAY
+from tracing           import span, trace_format
+import tracing
+from profiling         import Profiler, PROFILERS, PROFILER_CPROFILE, \
+                              finish_profile
 
 import argparse
+import multiprocessing
 import os
 from   argparse import RawTextHelpFormatter
 
@@ -31,6 +40,8 @@ program_help = '''
 
     Argument 1: indexstore - Path to the folder, where the index is created by
                              indexer.py. This is the output folder of indexer.py
+                             A sharded indexstore (indexer.py --shards) is
+                             searched by one process per shard
 
     Argument 2: queryfile  - Path to query file
 
@@ -48,7 +59,46 @@ program_help = '''
     Argument 5: desc       - A description of the run. This carries the same meaning as
                              the last term in Trec Eval strings.
 
-    Argument 6: verbose    - Print progress of the program to stdout.
+    Argument 6: verify     - Verification level of the index and the retrieval
+                             model. "off" (default), "sampled" or "full".
+                             Refer to index.py. This argument is optional
+
+    Argument 7: shardservers - Comma separated host:port list of shard servers
+                             (shard_server.py) serving the shards of a sharded
+                             indexstore. Queries are sent to the servers instead
+                             of searching the shards in process. This argument
+                             is optional
+
+    Argument 8: timeout    - Seconds a query waits for the results of a shard
+                             server. Shards that do not answer in time are left
+                             out of the results. Defaults to 10
+
+    Argument 9: hedgedelay - Seconds before a query is also sent to another
+                             server of the same shard. Defaults to 0.5
+
+    Argument 10: workers   - Number of processes that search queries in
+                             parallel. Workers are forked once the index is
+                             read and share it. 0 uses every core. Defaults
+                             to 1. prf always searches queries in order
+
+    Argument 11: tracefile - Path to a file to write a trace of the stages of
+                             every query to (refer to tracing.py); Chrome trace
+                             format for a ".json" file, JSON lines otherwise.
+                             Queries are searched by a single process. This
+                             argument is optional
+
+    Argument 12: profile   - Prefix of the profile files to write; pstats,
+                             collapsed stacks for flame graphs and a report
+                             (refer to profiling.py). This argument is optional
+
+    Argument 13: profiler  - Profiler of --profile; "cprofile" (default) or
+                             "sampling", a sampling profiler with a low
+                             overhead
+
+    Argument 14: profilememory - Also profile the top memory allocators of
+                             --profile
+
+    Argument 15: verbose   - Print progress of the program to stdout.
                              This argument is optional
 
     EXAMPLES:
@@ -57,6 +107,14 @@ program_help = '''
         python searcher.py --indexstore=./cacm.index --queryfile=queries.txt --model=bm25 --resultfile=results.bm25.txt  --verbose
         # Search using proximity model
         python searcher.py --indexstore=./cacm.index --queryfile=queries.txt --model=proximity --resultfile=results.bm25.txt  --verbose
+        # Search using bm25 on every core
+        python searcher.py --indexstore=./cacm.index --queryfile=queries.txt --model=bm25 --resultfile=results.bm25.txt --workers=0
+        # Search a sharded index served by shard servers (shard_server.py)
+        python searcher.py --indexstore=./cacm.index --queryfile=queries.txt --model=bm25 --shardservers=localhost:9000,localhost:9001
+        # Trace the stages of every bm25 query; open search.trace.json in chrome://tracing
+        python searcher.py --indexstore=./cacm.index --queryfile=queries.txt --model=bm25 --tracefile=search.trace.json --verbose
+        # Profile bm25 search; flamegraph.pl search.prof.collapsed > search.svg
+        python searcher.py --indexstore=./cacm.index --queryfile=queries.txt --model=bm25 --profile=search.prof
   '''
 
 indexstore_help = '''
@@ -84,6 +142,54 @@ desc_help = '''
     Trec Eval strings.
     '''
 
+verify_help = '''
+    Verification level of the index and the retrieval model. "off" (default)
+    checks index checksums only, "sampled" also sanity checks a sample of the
+    postings and "full" sanity checks all postings and asserts while scoring.
+    This argument is optional
+    '''
+
+shardservers_help = '''
+    Comma separated host:port list of shard servers (shard_server.py) serving
+    the shards of a sharded indexstore. Servers of the same shard are replicas.
+    This argument is optional
+    '''
+
+timeout_help = '''
+    Seconds a query waits for the results of a shard server. Defaults to 10
+    '''
+
+hedgedelay_help = '''
+    Seconds before a query is also sent to another server of the same shard.
+    Defaults to 0.5
+    '''
+
+workers_help = '''
+    Number of processes that search queries in parallel. 0 uses every core.
+    Defaults to 1. prf always searches queries in order
+    '''
+
+tracefile_help = '''
+    Path to a file to write a trace of the stages of every query to. Chrome
+    trace format for a ".json" file, JSON lines otherwise. Queries are searched
+    by a single process. This argument is optional
+    '''
+
+profile_help = '''
+    Prefix of the profile files to write; pstats, collapsed stacks for flame
+    graphs and a report of the top functions. This argument is optional
+    '''
+
+profiler_help = '''
+    Profiler of --profile; "cprofile" (default) or "sampling", a sampling
+    profiler with a low overhead. This argument is optional
+    '''
+
+profilememory_help = '''
+    Also profile the top memory allocators of --profile. This argument is
+    optional
+    '''
+
 verbose_help = '''
     Print progress of the program to stdout. This argument is optional
     '''
@@ -123,6 +229,59 @@ argparser.add_argument("--desc",
                        default  = "",
                        help     = desc_help)
 
+argparser.add_argument("--verify",
+                       metavar  = "v",
+                       type     = str,
+                       default  = VERIFY_OFF,
+                       help     = verify_help)
+
+argparser.add_argument("--shardservers",
+                       metavar  = "ss",
+                       type     = str,
+                       default  = "",
+                       help     = shardservers_help)
+
+argparser.add_argument("--timeout",
+                       metavar  = "t",
+                       type     = float,
+                       default  = TIMEOUT,
+                       help     = timeout_help)
+
+argparser.add_argument("--hedgedelay",
+                       metavar  = "hd",
+                       type     = float,
+                       default  = HEDGEDELAY,
+                       help     = hedgedelay_help)
+
+argparser.add_argument("--workers",
+                       metavar  = "w",
+                       type     = int,
+                       default  = 1,
+                       help     = workers_help)
+
+argparser.add_argument("--tracefile",
+                       metavar  = "tf",
+                       type     = str,
+                       default  = "",
+                       help     = tracefile_help)
+
+argparser.add_argument("--profile",
+                       metavar  = "pf",
+                       default  = "",
+                       type     = str,
+                       help     = profile_help)
+
+argparser.add_argument("--profiler",
+                       metavar  = "pr",
+                       default  = PROFILER_CPROFILE,
+                       type     = str,
+                       help     = profiler_help)
+
+argparser.add_argument("--profilememory",
+                       dest     = 'profilememory',
+                       action   = 'store_true',
+                       help     = profilememory_help)
+
 argparser.add_argument("--verbose",
                        dest     = 'verbose',
                        action   = 'store_true',
@@ -163,6 +322,64 @@ def print_to_resultfile(resultsets, resultfile, desc = ""):
                 # write result string
                 rf.write(resultstring + "_" + desc + "\n")
 
+##
+# GIVEN: a sharded index store, a list of Query, a string representing a
+#        retrieval model, a list of (host, port) of shard servers, a timeout and
+#        a hedge delay in seconds
+#
+# RETURNS: a list of ResultSet of the queries searched by the shard servers
+#
+def search_servers(indexstore, query_lst, model, servers,
+                   timeout = TIMEOUT, hedge_delay = HEDGEDELAY):
+
+    broker     = QueryBroker(indexstore, model, servers, timeout, hedge_delay)
+    resultsets = broker.search(query_lst)
+    broker.close()
+
+    for (qid, missing) in broker.partial:
+        print "WARNING: Partial results for query ", qid, ", no results from ", \
+              ", ".join(missing)
+
+    if (verbose):
+        broker.print_stats()
+
+    return resultsets
+
+## Parallel search #############################################################
+
+# Retrieval model searched by worker processes. It is set before the workers are
+# forked, so every worker shares the index read by the parent copy-on-write
+worker_rm = None
+
+# Given a Query
+# Returns the ResultSet of the query searched by the worker's retrieval model
+def search_worker(query):
+    return worker_rm.search_query(worker_rm.invidx, query)
+
+##
+# GIVEN: a retrieval model whose queries are independent of each other (i.e.
+#        not prf), a list of Query and the number of worker processes
+#
+# RETURNS: a list of ResultSet where the first resultset in the list
+#          corresponds to the first query in the input list and so on
+#
+def search_parallel(rm, query_lst, workers):
+
+    global worker_rm
+
+    worker_rm = rm
+    pool      = multiprocessing.Pool(workers)
+
+    try:
+        # one query at a time; query latencies vary a lot
+        resultsets = pool.map(search_worker, query_lst, chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+        worker_rm = None
+
+    return resultsets
+
 ## Search ######################################################################
 
 ##
@@ -171,15 +388,20 @@ def print_to_resultfile(resultsets, resultfile, desc = ""):
 #        a string representing a retrieval model to use,
 #           "bm25" - Use BM25 (bm25.py)
 #           "proximity" - Use proximity model (proximity_model.py)
+#        a verification level (refer to index.py),
+#        a list of (host, port) of shard servers (may be empty), a timeout and
+#        a hedge delay in seconds, and the number of worker processes
 #
 # RETURNS: a list of ResultSet (from result_set.py) where each result set
 #          contains information about documents determined to be relevant for
 #          a query
 #
-def search(indexstore, queryfile, model):
+def search(indexstore, queryfile, model, verify = VERIFY_OFF, servers = [],
+           timeout = TIMEOUT, hedge_delay = HEDGEDELAY, workers = 1):
 
     # queries in queryfile -> list of Query (from query.py)
-    query_lst = queries(queryfile)
+    with span("searcher.queries"):
+        query_lst = queries(queryfile)
 
     # wiki_indexer.py creates a global statistics file inside indexstore. Assert
     # that we have it
@@ -192,31 +414,53 @@ def search(indexstore, queryfile, model):
             model == "prf"      or \
             model == "proximity")
 
+    # sharded indexstore served by shard servers
+    if (servers != []):
+        assert (is_sharded(indexstore) and model in SHARD_MODELS)
+        return search_servers(indexstore, query_lst, model, servers,
+                              timeout, hedge_delay)
+
+    # sharded indexstore; scatter the queries to the shards and gather results
+    if (is_sharded(indexstore)):
+        assert (model in SHARD_MODELS)
+        searcher   = ShardedSearcher(indexstore, model, verify)
+        resultsets = searcher.search(query_lst)
+        searcher.close()
+        return resultsets
+
     # retrieval model
     rm = None
 
-    if (model == "bm25"):
-        # Setup BM25
-        rm = BM25(indexstore, os.path.join(indexstore, GSFILE))
+    with span("searcher.load", model = model):
 
-    elif (model == "tfidf"):
-        # Setup tfidf
-        rm = TFIDF(indexstore, os.path.join(indexstore, GSFILE))
+        if (model == "bm25"):
+            # Setup BM25
+            rm = BM25(indexstore, os.path.join(indexstore, GSFILE), verify_ = verify)
 
-    elif(model == "qlm"):
-        # Setup QLM
-        rm = QLM(indexstore, os.path.join(indexstore, GSFILE))
+        elif (model == "tfidf"):
+            # Setup tfidf
+            rm = TFIDF(indexstore, os.path.join(indexstore, GSFILE), verify_ = verify)
 
-    elif(model == "prf"):
-        # Setup bm25_rel
-        rm = BM25_R(indexstore, os.path.join(indexstore, GSFILE))
+        elif(model == "qlm"):
+            # Setup QLM
+            rm = QLM(indexstore, os.path.join(indexstore, GSFILE), verify_ = verify)
 
-    elif (model == "proximity"):
-        # Set up proximity model
-        rm = ProximityModel(indexstore, os.path.join(indexstore, GSFILE))
+        elif(model == "prf"):
+            # Setup bm25_rel
+            rm = BM25_R(indexstore, os.path.join(indexstore, GSFILE), verify_ = verify)
 
-    # search using retrieval model
-    return rm.search(query_lst)
+        elif (model == "proximity"):
+            # Set up proximity model
+            rm = ProximityModel(indexstore, os.path.join(indexstore, GSFILE),
+                                verify_ = verify)
+
+    # search using retrieval model. prf searches every query with the relevant
+    # documents of the query before it and cannot search queries in parallel
+    if (workers > 1 and model != "prf"):
+        return search_parallel(rm, query_lst, workers)
+
+    with span("searcher.search", model = model):
+        return rm.search(query_lst)
 
 ## Main ########################################################################
 
@@ -229,6 +473,15 @@ queryfile  = args['queryfile']
 model      = args['model']
 resultfile = args['resultfile']
 desc       = args['desc']
+verify     = args['verify']
+shardservers = args['shardservers']
+timeout    = args['timeout']
+hedgedelay = args['hedgedelay']
+workers    = args['workers']
+tracefile  = args['tracefile']
+profile    = args['profile']
+profiler   = args['profiler']
+profilememory = args['profilememory']
 verbose    = args['verbose']
 
 ## Input check
@@ -248,14 +501,75 @@ if (model != "bm25"     and \
     print model
     print "FATAL: Unrecognized retrieval model"
     exit(-1)
+if (model not in SHARD_MODELS and is_sharded(indexstore)):
+    print "FATAL: Retrieval model ", model, " cannot search a sharded indexstore"
+    exit(-1)
+if (shardservers != "" and not is_sharded(indexstore)):
+    print "FATAL: Shard servers can only serve a sharded indexstore"
+    exit(-1)
+if (timeout <= 0 or hedgedelay <= 0):
+    print "FATAL: timeout and hedgedelay should be > 0"
+    exit(-1)
+if (workers < 0):
+    print "FATAL: workers should be >= 0"
+    exit(-1)
+if (workers == 0):
+    workers = multiprocessing.cpu_count()
+if (workers > 1 and model == "prf"):
+    print "WARNING: prf searches queries in order; ignoring workers"
+if (workers > 1 and tracefile != ""):
+    print "WARNING: traced queries are searched by a single process; ignoring workers"
+    workers = 1
+if (tracefile != "" and is_sharded(indexstore)):
+    print "WARNING: shards are searched by other processes; they are not traced"
+if (workers > 1 and is_sharded(indexstore)):
+    print "WARNING: shards are searched in parallel; ignoring workers"
+if (verify not in VERIFY_LEVELS):
+    print "FATAL: verify should be one of ", VERIFY_LEVELS
+    exit(-1)
+if (profiler not in PROFILERS):
+    print "FATAL: profiler should be one of ", PROFILERS
+    exit(-1)
+if (workers > 1 and profile != ""):
+    print "WARNING: profiled queries are searched by a single process; ignoring workers"
+    workers = 1
 # if a resultfile already exists. delete it
 if (resultfile != "" and os.path.exists(resultfile)):
     print "WARNING: Deleting existing resultfile"
     os.remove(resultfile)
 
+# if a tracefile already exists. delete it
+if (tracefile != "" and os.path.exists(tracefile)):
+    print "WARNING: Deleting existing tracefile"
+    os.remove(tracefile)
+
+# trace the stages of the search
+if (tracefile != ""):
+    tracing.enable()
+
+## Profile the program (refer to profiling.py)
+program_profile = None
+if (profile != ""):
+    program_profile = Profiler(profile, profiler, profilememory)
+    program_profile.start()
+
 # Get list of resultset. 1 resultset for 1 query
-resultsets = search(indexstore, queryfile, model)
+servers = []
+if (shardservers != ""):
+    servers = map(server_address, shardservers.split(","))
+
+resultsets = search(indexstore, queryfile, model, verify, servers, timeout,
+                    hedgedelay, workers)
 
 # Print results to resultfile
 if resultfile != "":
-    print_to_resultfile(resultsets, resultfile, desc)
+    with span("searcher.write"):
+        print_to_resultfile(resultsets, resultfile, desc)
+
+if (tracefile != ""):
+    tracing.tracer.write(tracefile, trace_format(tracefile))
+    if (verbose):
+        tracing.tracer.print_summary()
+
+if (program_profile is not None):
+    finish_profile(program_profile)
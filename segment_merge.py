@@ -0,0 +1,317 @@
+## This file provides a tiered segment merge policy and a segment merger that
+#  compacts the segments of a multi segment index (refer to segments.py) in the
+#  background
+#
+# Every segment is placed in a tier by the number of documents it indexes; tier
+# t holds segments of roughly floor_docs * mergefactor^t documents. Once a tier
+# has mergefactor segments, they are merged into one segment of the next tier.
+# Segments with many deleted documents are rewritten on their own to purge the
+# deleted documents. Merged segments are written next to the live segments and
+# swapped in atomically by committing a new segment list (refer to
+# IndexWriter.replace_segments and manifest.py). Searchers that have already read the index
+# keep their snapshot; searchers that read the index while segments are being
+# swapped retry (refer to Index.populate_segments)
+
+from index         import Index
+from forward_index import store_forward_index, forward_filename
+
+import math
+import os
+import threading
+import time
+import traceback
+
+## Globals #####################################################################
+
+# Default number of segments of a tier that are merged together
+MERGEFACTOR    = 10
+
+# Default number of documents of the smallest tier. Segments smaller than this
+# are all in the smallest tier
+FLOORDOCS      = 100
+
+# Default ratio of deleted to indexed documents above which a segment is
+# rewritten to purge its deleted documents
+MAXDELETERATIO = 0.25
+
+# Default number of seconds the merge thread sleeps between merges
+MERGEINTERVAL  = 1.0
+
+# Number of seconds between checks that the merge thread is alive while waiting
+# for it to become idle
+MERGEPOLL      = 1.0
+
+## Tiered merge policy #########################################################
+
+class TieredMergePolicy:
+
+    # number of segments of a tier that are merged together
+    mergefactor     = MERGEFACTOR
+
+    # number of documents of the smallest tier
+    floor_docs      = FLOORDOCS
+
+    # ratio of deleted documents above which a segment is purged
+    max_deleteratio = MAXDELETERATIO
+
+    # reset
+    def reset(self):
+        self.mergefactor     = MERGEFACTOR
+        self.floor_docs      = FLOORDOCS
+        self.max_deleteratio = MAXDELETERATIO
+
+    # Constructor
+    def __init__(self, mergefactor = MERGEFACTOR, floor_docs = FLOORDOCS,
+                 max_deleteratio = MAXDELETERATIO):
+
+        self.reset()
+
+        assert (mergefactor > 1)
+        assert (floor_docs > 0)
+        assert (max_deleteratio > 0 and max_deleteratio <= 1)
+
+        self.mergefactor     = mergefactor
+        self.floor_docs      = floor_docs
+        self.max_deleteratio = max_deleteratio
+
+    # Given the number of documents indexed by a segment
+    # Returns the tier of the segment
+    def tier(self, ndocs):
+
+        if (ndocs <= self.floor_docs):
+            return 0
+
+        return int(math.log(float(ndocs) / self.floor_docs, self.mergefactor)) + 1
+
+    # Given a list of (segment file name, number of live documents, number of
+    #       deleted documents) tuples; oldest segment first
+    # Returns a list of merges, where every merge is a list of segment file
+    #         names to merge into one segment. Segments in a merge are adjacent
+    #         and in the order of the segment list
+    def find_merges(self, segstats):
+
+        merges = []
+        merged = set()
+
+        # purge segments with too many deleted documents
+        for (segname, live, deleted) in segstats:
+            if (deleted > 0 and \
+                float(deleted) / (live + deleted) > self.max_deleteratio):
+                merges.append([segname])
+                merged.add(segname)
+
+        # merge runs of mergefactor adjacent segments of the same tier
+        run      = []
+        run_tier = -1
+        for (segname, live, deleted) in segstats:
+
+            t = self.tier(live)
+
+            if (segname in merged or t != run_tier):
+                run      = []
+                run_tier = t
+
+            if (segname in merged):
+                # never merge a segment twice
+                run_tier = -1
+                continue
+
+            run.append(segname)
+
+            if (len(run) == self.mergefactor):
+                merges.append(run)
+                run      = []
+                run_tier = -1
+
+        return merges
+
+## Segment merger ##############################################################
+
+class SegmentMerger:
+
+    # IndexWriter (from index_writer.py) of the indexstore being merged
+    writer   = None
+
+    # merge policy
+    policy   = None
+
+    # Merge statistics
+    #   number of merges,
+    #   number of segments merged,
+    #   number of live documents written to merged segments,
+    #   number of postings written to merged segments, and
+    #   seconds spent merging
+    merges   = 0
+    segments = 0
+    docs     = 0
+    postings = 0
+    seconds  = 0.0
+
+    # reset
+    def reset(self):
+        self.writer   = None
+        self.policy   = None
+        self.merges   = 0
+        self.segments = 0
+        self.docs     = 0
+        self.postings = 0
+        self.seconds  = 0.0
+
+    # Constructor
+    # Given an IndexWriter and a merge policy
+    def __init__(self, writer, policy = None):
+
+        self.reset()
+
+        self.writer = writer
+        self.policy = TieredMergePolicy() if policy is None else policy
+
+    # Given a list of segment file names
+    # Merge the segments into one segment that indexes their live documents and
+    # replace them in the index
+    def merge(self, segnames):
+
+        assert (len(segnames) > 0)
+
+        start = time.time()
+
+        indexstore = self.writer.indexstore
+
+        # deletion bitmaps of the segments; documents deleted while we merge
+        # are marked deleted in the merged segment when it is swapped in
+        deleted = map(lambda name: self.writer.deletion_bitmap(name), segnames)
+
+        # reserve a name and build the merged segment without holding the
+        # writer's lock, so that updates go on while we merge
+        segname = self.writer.new_segment_name()
+        segidx  = Index(indexstore, segname)
+
+        for i in range(0, len(segnames)):
+            segidx.merge(segidx.read_indexfile(os.path.join(indexstore, segnames[i]),
+                                               deleted[i]))
+
+        merged_docids = segidx.docids_with_terms(segidx.term())
+
+        # segments without live documents are dropped without a replacement
+        if (len(merged_docids) > 0):
+            segidx.store()
+            store_forward_index(segidx, os.path.join(indexstore,
+                                                     forward_filename(segname)))
+
+        # swap in the merged segment; this deletes the merged segments
+        self.writer.replace_segments(segnames, segname, merged_docids)
+
+        # update merge statistics
+        self.merges   = self.merges + 1
+        self.segments = self.segments + len(segnames)
+        self.docs     = self.docs + len(merged_docids)
+        self.postings = self.postings + \
+                        sum(map(lambda t: len(segidx.idxdict[t]), segidx.idxdict))
+        self.seconds  = self.seconds + (time.time() - start)
+
+    # Merge segments as long as the merge policy finds merges
+    # Returns the number of merges done
+    def merge_pending(self):
+
+        nmerges = 0
+
+        while (True):
+
+            merges = self.policy.find_merges(self.writer.segment_statistics())
+
+            if (merges == []):
+                break
+
+            for segnames in merges:
+                self.merge(segnames)
+                nmerges = nmerges + 1
+
+        return nmerges
+
+    # print merge statistics
+    def print_stats(self):
+
+        print "Merges          : ", self.merges
+        print "Segments merged : ", self.segments
+        print "Documents merged: ", self.docs
+        print "Postings merged : ", self.postings
+        print "Seconds merging : ", round(self.seconds, 3)
+
+        if (self.seconds > 0):
+            print "Documents/second: ", round(self.docs / self.seconds, 1)
+            print "Postings/second : ", round(self.postings / self.seconds, 1)
+
+## Merge thread ################################################################
+
+# A daemon thread that periodically runs a SegmentMerger until stopped
+class MergeThread(threading.Thread):
+
+    # Segment merger
+    merger   = None
+
+    # number of seconds to sleep between merges
+    interval = MERGEINTERVAL
+
+    # set to stop the thread
+    stopped  = None
+
+    # set while the merge policy finds no merges, and when a merge failed
+    idle     = None
+
+    # set when a merge failed; the thread exits
+    failed   = None
+
+    # traceback of the exception of the failed merge
+    error    = ""
+
+    # Constructor
+    # Given a SegmentMerger and the number of seconds to sleep between merges
+    def __init__(self, merger, interval = MERGEINTERVAL):
+
+        threading.Thread.__init__(self)
+
+        self.daemon   = True
+        self.merger   = merger
+        self.interval = interval
+        self.stopped  = threading.Event()
+        self.idle     = threading.Event()
+        self.failed   = threading.Event()
+        self.error    = ""
+
+    # thread body
+    def run(self):
+
+        try:
+            while (not self.stopped.is_set()):
+
+                if (self.merger.merge_pending() == 0):
+                    self.idle.set()
+                else:
+                    self.idle.clear()
+
+                self.stopped.wait(self.interval)
+
+        except Exception:
+            # wake up whoever waits for the thread to become idle
+            self.error = traceback.format_exc()
+            self.failed.set()
+            self.idle.set()
+
+    # Wait until the merge policy finds no merges or the thread exits
+    # Returns True iff the thread is idle; False if a merge failed or the thread
+    # died
+    def wait_idle(self):
+
+        while (not self.idle.wait(MERGEPOLL)):
+            if (not self.is_alive()):
+                break
+
+        return self.idle.is_set() and not self.failed.is_set()
+
+    # Stop the thread and wait for the merge in progress to finish
+    def stop(self):
+
+        self.stopped.set()
+        self.join()
+
+################################################################################
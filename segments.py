@@ -0,0 +1,283 @@
+## This file provides classes that facilitate reading and writing the segment
+#  list of a multi segment index and the deletion bitmaps of its segments
+#
+# An index that has been updated incrementally (refer to index_writer.py) is
+# made up of many segments. Every segment is an index file of the same format
+# as INDEXFILE (refer to index.py) that indexes a disjoint set of documents.
+# Documents deleted from a segment are not removed from the segment's index
+# file; instead they are marked in the segment's deletion bitmap
+
+from manifest import Manifest
+
+import os
+
+## Globals #####################################################################
+
+# Segment list file name. The file lists all live segments of an index in the
+# order they were created
+SEGMENTSFILE = "segments"
+
+# Prefix and extension of segment index files created by index_writer.py
+SEGMENTPREFIX = "segment_"
+SEGMENTEXTN   = ".idx"
+
+# Extension of a segment's deletion bitmap file. The deletion bitmap of a
+# segment "X" is stored in the file "X.del"
+DELETIONEXTN  = ".del"
+
+## Utilities ###################################################################
+
+# Given the file name of a segment
+# Returns the file name of the segment's deletion bitmap
+def deletion_filename(segname):
+
+    return segname + DELETIONEXTN
+
+# Given a segment number
+# Returns the file name of the segment
+def segment_filename(segno):
+
+    return SEGMENTPREFIX + ("%06d" % segno) + SEGMENTEXTN
+
+## Deletion bitmap #############################################################
+
+# A bitmap of document IDs. A set bit at position docid indicates that the
+# document has been deleted
+class DeletionBitmap:
+
+    # bitmap; bit i of byte j represents document ID (j * 8) + i
+    bits = None
+
+    # reset
+    def reset(self):
+        self.bits = bytearray()
+
+    # Constructor
+    # Given the path to a deletion bitmap file (optional), read the bitmap
+    def __init__(self, delfile = ""):
+
+        self.reset()
+
+        if (delfile != "" and os.path.exists(delfile)):
+            self.read(delfile)
+
+    # Given a document ID
+    # Mark the document as deleted
+    def delete(self, docid):
+
+        assert (docid >= 0)
+
+        # grow bitmap if required
+        byteidx = docid >> 3
+        if (byteidx >= len(self.bits)):
+            self.bits.extend(bytearray(byteidx - len(self.bits) + 1))
+
+        self.bits[byteidx] |= (1 << (docid & 7))
+
+    # Given a document ID
+    # Returns true iff the document is marked deleted
+    def is_deleted(self, docid):
+
+        byteidx = docid >> 3
+        if (byteidx >= len(self.bits)):
+            return False
+
+        return (self.bits[byteidx] & (1 << (docid & 7))) != 0
+
+    # Returns the list of document IDs marked deleted
+    def docids(self):
+
+        docids = []
+        for byteidx in range(0, len(self.bits)):
+            # skip bytes without any deletions
+            if (self.bits[byteidx] == 0):
+                continue
+            for bit in range(0, 8):
+                if (self.bits[byteidx] & (1 << bit)):
+                    docids.append((byteidx << 3) + bit)
+
+        return docids
+
+    # Returns the number of documents marked deleted
+    def count(self):
+        return sum(map(lambda b: bin(b).count("1"), self.bits))
+
+    # Given the path to a deletion bitmap file, read the bitmap
+    def read(self, delfile):
+
+        assert (os.path.exists(delfile))
+
+        with open(delfile, "rb") as f:
+            self.bits = bytearray(f.read())
+
+    # Given the path to a deletion bitmap file, write the bitmap
+    def write(self, delfile):
+
+        with open(delfile, "wb") as f:
+            f.write(self.bits)
+
+## Segments ####################################################################
+
+# The list of live segments of an index. Every segment is described by its file
+# name and the set of document IDs indexed in the segment
+class Segments:
+
+    # indexstore where the segments are stored
+    indexstore = ""
+
+    # list of (segment file name, set of docids) tuples; oldest segment first
+    segments   = []
+
+    # reset
+    def reset(self):
+        self.indexstore = ""
+        self.segments   = []
+
+    # Constructor
+    # Given an indexstore, read the segment list if it exists
+    def __init__(self, indexstore):
+
+        self.reset()
+
+        self.indexstore = indexstore
+
+        if (self.exists()):
+            self.read()
+
+    ## Predicates ##############################################################
+
+    # true iff the indexstore has a segment list file. If the indexstore has a
+    # manifest (refer to manifest.py), the segment list file must be committed
+    def exists(self):
+
+        manifest = Manifest(self.indexstore)
+
+        if (manifest.exists() and not manifest.contains(SEGMENTSFILE)):
+            return False
+
+        return os.path.exists(os.path.join(self.indexstore, SEGMENTSFILE))
+
+    ## Access methods ##########################################################
+
+    # Returns a list of segment file names; oldest segment first
+    def names(self):
+        return map(lambda s: s[0], self.segments)
+
+    # Given a segment file name
+    # Returns the set of document IDs indexed in the segment
+    def docids(self, segname):
+
+        for s in self.segments:
+            if (s[0] == segname):
+                return s[1]
+
+        assert (False)
+
+    # Given a segment file name
+    # Returns the deletion bitmap of the segment
+    def deletion_bitmap(self, segname):
+        return DeletionBitmap(os.path.join(self.indexstore, deletion_filename(segname)))
+
+    # Given a document ID
+    # Returns the file name of the segment that indexes the document. Returns
+    # None if no segment indexes the document
+    def segment_of(self, docid):
+
+        for s in self.segments:
+            if (docid in s[1]):
+                return s[0]
+
+        return None
+
+    # Given a list of segment file names that are reserved for segments that
+    # are being written (optional)
+    # Returns a segment file name that is not used by any segment
+    def next_name(self, reserved = []):
+
+        # find the largest segment number in use
+        segno = 0
+        for name in self.names() + reserved:
+            if (name.startswith(SEGMENTPREFIX) and name.endswith(SEGMENTEXTN)):
+                segno = max(segno, int(name[len(SEGMENTPREFIX):-len(SEGMENTEXTN)]))
+
+        # make sure we never reuse a file name that is still lying around
+        segno = segno + 1
+        while (os.path.exists(os.path.join(self.indexstore, segment_filename(segno)))):
+            segno = segno + 1
+
+        return segment_filename(segno)
+
+    ## Update methods ##########################################################
+
+    # Given a segment file name and the set of document IDs the segment indexes
+    # Append the segment to the segment list
+    def add(self, segname, docids):
+
+        assert (segname not in self.names())
+
+        self.segments.append((segname, set(docids)))
+
+    # Given a segment file name and a document ID
+    # Remove the document ID from the segment's set of document IDs
+    def remove_docid(self, segname, docid):
+        self.docids(segname).discard(docid)
+
+    # Given a segment file name, remove the segment from the segment list
+    def remove(self, segname):
+
+        self.segments = filter(lambda s: s[0] != segname, self.segments)
+
+    # Given a list of segment file names, and
+    #       the file name and set of document IDs of a segment that indexes
+    #       all live documents of the listed segments
+    # Replace the listed segments by the new segment. The new segment takes
+    # the place of the oldest listed segment. If segname is None, the listed
+    # segments are only removed
+    def replace(self, segnames, segname, docids):
+
+        assert (len(segnames) > 0)
+        assert (segname is None or segname not in self.names())
+
+        pos = self.names().index(segnames[0])
+
+        for name in segnames:
+            self.remove(name)
+
+        if (segname is not None):
+            self.segments.insert(pos, (segname, set(docids)))
+
+    ## Read/write methods ######################################################
+
+    # read the segment list file
+    def read(self):
+
+        assert (self.exists())
+
+        self.segments = []
+
+        with open(os.path.join(self.indexstore, SEGMENTSFILE), "r") as f:
+            seg_lines = f.readlines()
+
+        for seg_line in seg_lines:
+
+            # Every line is in the format
+            # segmentfilename , docid1 docid2 ... docidn
+            seg_line_parts = seg_line.split(",")
+            assert (len(seg_line_parts) == 2)
+
+            segname = seg_line_parts[0].strip()
+            docids  = set(map(int, seg_line_parts[1].split()))
+
+            self.segments.append((segname, docids))
+
+    # Given the name of the file to write to (optional)
+    # write the segment list file
+    def write(self, segfname = SEGMENTSFILE):
+
+        assert (os.path.exists(self.indexstore))
+
+        with open(os.path.join(self.indexstore, segfname), "w+") as f:
+            for s in self.segments:
+                f.write(s[0] + " , " + " ".join(map(str, sorted(s[1]))) + "\n")
+
+################################################################################
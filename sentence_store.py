@@ -0,0 +1,251 @@
+## This file provides the sentence store of a corpus; the sentences of every
+#  document, split and processed for snippet generation (refer to snippet.py)
+#
+# Snippets are made of the sentences of the raw documents. Parsing a raw
+# document, splitting it into sentences and text processing every word of every
+# sentence is done once, when the corpus is created (refer to corpus.py), and
+# stored in the SENTENCEFILE of the corpusstore. The file is memory mapped by
+# readers; only the records of the documents asked for are read.
+#
+# File layout,
+#   header  - SENTENCEMAGIC and the number of documents (4 bytes)
+#   table   - one (docid, offset, length) entry per document sorted by docid;
+#             4, 8 and 4 bytes. Offsets are from the start of the file
+#   records - the record of every document. A record has one line per sentence
+#             of the document; the sentence with all whitespace normalized to
+#             single spaces, followed by the processed form of every word of
+#             the sentence (refer to text_processing.process_text), all tab
+#             separated
+#
+# All integers are big endian
+
+from text_processing import process_text, clean_extraneous_whitespace
+
+import mmap
+import os
+import re
+import shutil
+import struct
+
+## Globals #####################################################################
+
+# Sentence store file name
+SENTENCEFILE  = "sentences.snt"
+
+# First bytes of a sentence store file
+SENTENCEMAGIC = "SNT1"
+
+# Header and table entry
+HEADER = struct.Struct(">4sI")
+ENTRY  = struct.Struct(">IQI")
+
+# Extension of the file records are written to until the table is known
+RECORDSEXTN   = ".records"
+
+## Utilities ###################################################################
+
+# Given the contents of a raw document
+# Returns a list of sentences in the document
+def split_sentences(dcontents):
+
+    # split doc into multiple paragraphs
+    paragraphs = re.split("\n\n", dcontents)
+
+    # sentences
+    ret_sentences = []
+
+    # for each paragraph
+    for paragraph in paragraphs:
+        # split paragraph into sentences
+        # hypothesize that a whitespace after a period the marks end of a sentence
+        ret_sentences = ret_sentences + re.split('\.\s', paragraph)
+
+    # return sentences
+    return ret_sentences
+
+# Given the contents of a raw document and
+#       optionally a dictionary of key value pairs of word and its processed
+#       form, that is used as a cache across documents
+# Returns a list of (sentence, processed words) tuples of the sentences of the
+# document. Sentences are whitespace normalized
+def document_sentences(dcontents, processed = None):
+
+    if (processed is None):
+        processed = {}
+
+    sentences = map(lambda s: clean_extraneous_whitespace(s),
+                    split_sentences(dcontents))
+
+    doc_sentences = []
+
+    for sentence in sentences:
+
+        words = sentence.split(" ")
+        for word in words:
+            if (processed.get(word) is None):
+                processed[word] = process_text(word)
+
+        doc_sentences.append((sentence, map(lambda w: processed[w], words)))
+
+    return doc_sentences
+
+## Sentence store ##############################################################
+
+class SentenceStore:
+
+    # path to the sentence store file
+    sentencefile = ""
+
+    # memory map of the file; None if the file does not exist
+    mm           = None
+
+    # dictionary of key value pairs of docid and (offset, length) of its record
+    table        = {}
+
+    # reset
+    def reset(self):
+        self.sentencefile = ""
+        self.mm           = None
+        self.table        = {}
+
+    # Constructor
+    # Given a corpusstore. The sentence store of the corpusstore is read if it
+    # has one
+    def __init__(self, corpusstore):
+
+        self.reset()
+
+        self.sentencefile = os.path.join(corpusstore, SENTENCEFILE)
+
+        if (self.exists()):
+            self.open()
+
+    # true iff the corpusstore has a sentence store
+    def exists(self):
+        return os.path.exists(self.sentencefile)
+
+    # Given a docid
+    # true iff the sentences of the document are in the store
+    def contains_document(self, docid):
+        return (self.table.get(docid) is not None)
+
+    # Memory map the sentence store file and read its table
+    def open(self):
+
+        with open(self.sentencefile, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+        (magic, ndocs) = HEADER.unpack_from(self.mm, 0)
+        assert (magic == SENTENCEMAGIC)
+
+        for i in range(0, ndocs):
+            (docid, offset, length) = ENTRY.unpack_from(self.mm, HEADER.size + i * ENTRY.size)
+            self.table[docid] = (offset, length)
+
+    # Close the memory map
+    def close(self):
+
+        if (self.mm is not None):
+            self.mm.close()
+
+        self.mm    = None
+        self.table = {}
+
+    # Given a docid of a document in the store
+    # Returns a list of (sentence, processed words) tuples of the sentences of
+    # the document; refer to document_sentences
+    def sentences(self, docid):
+
+        assert (self.contains_document(docid))
+
+        (offset, length) = self.table[docid]
+
+        doc_sentences = []
+
+        for line in self.mm[offset : offset + length].split("\n"):
+            parts = line.split("\t")
+            doc_sentences.append((parts[0], parts[1:]))
+
+        return doc_sentences
+
+## Sentence store writer #######################################################
+
+# Writes the sentence store file of a corpusstore one document at a time, so the
+# sentences of a corpus need not be in memory at once. Records are written to a
+# side file; the header and table are written when the writer is closed
+class SentenceStoreWriter:
+
+    # path to the sentence store file
+    sentencefile = ""
+
+    # side file of the records
+    records      = None
+
+    # list of (docid, length) of the records written, in docid order
+    entries      = []
+
+    # reset
+    def reset(self):
+        self.sentencefile = ""
+        self.records      = None
+        self.entries      = []
+
+    # Constructor
+    # Given a corpusstore
+    def __init__(self, corpusstore):
+
+        self.reset()
+
+        assert (os.path.exists(corpusstore))
+
+        self.sentencefile = os.path.join(corpusstore, SENTENCEFILE)
+        self.records      = open(self.sentencefile + RECORDSEXTN, "wb")
+
+    # Given a docid greater than the docids added so far and a list of
+    #       (sentence, processed words) tuples of the document
+    # Add the record of the document
+    def add(self, docid, doc_sentences):
+
+        assert (self.entries == [] or docid > self.entries[-1][0])
+
+        lines  = map(lambda sw: sw[0] + "\t" + "\t".join(sw[1]), doc_sentences)
+        record = "\n".join(lines)
+
+        self.records.write(record)
+        self.entries.append((docid, len(record)))
+
+    # Write the sentence store file
+    def close(self):
+
+        self.records.close()
+
+        with open(self.sentencefile, "wb") as f:
+
+            f.write(HEADER.pack(SENTENCEMAGIC, len(self.entries)))
+
+            offset = HEADER.size + len(self.entries) * ENTRY.size
+            for (docid, length) in self.entries:
+                f.write(ENTRY.pack(docid, offset, length))
+                offset = offset + length
+
+            with open(self.sentencefile + RECORDSEXTN, "rb") as records:
+                shutil.copyfileobj(records, f)
+
+        os.remove(self.sentencefile + RECORDSEXTN)
+
+        self.records = None
+        self.entries = []
+
+# Given a corpusstore and a dictionary of key value pairs of docid and a list
+#       of (sentence, processed words) tuples of the document
+# Write the sentence store file of the corpusstore
+def store_sentences(corpusstore, docid_sentences):
+
+    writer = SentenceStoreWriter(corpusstore)
+
+    for docid in sorted(docid_sentences.keys()):
+        writer.add(docid, docid_sentences[docid])
+
+    writer.close()
+
+################################################################################
@@ -0,0 +1,220 @@
+## This file provides a scatter-gather searcher for sharded indexstores (refer
+#  to shards.py)
+#
+# Every shard is searched by a worker process that keeps the shard's retrieval
+# model in memory. Queries are sent to all workers along with the collection
+# wide statistics of the query terms. Every worker returns the top results of
+# every query in its shard, and the per shard results are merged into one
+# ranked list per query
+
+from global_statistics import GlobalStatistics, GSFILE
+from shards            import Shards, TermStatistics, TERMSTATFILE
+from result_set        import ResultSet, DocumentScore
+from index             import VERIFY_OFF
+from bm25              import BM25
+from qlm               import QLM
+from tfidf             import TFIDF
+from proximity_model   import ProximityModel
+
+import heapq
+import multiprocessing
+import os
+
+## Globals #####################################################################
+
+# Number of results kept per query. Same as the default of ResultSet
+MAXRANK = 100
+
+# Retrieval models that can search a sharded indexstore. Pseudo relevance
+# feedback (bm25_relvence.py) reads the documents of its first pass results
+# and is not supported
+SHARD_MODELS = ["bm25", "tfidf", "qlm", "proximity"]
+
+## Shard search ################################################################
+
+# Given the path to a shard's indexstore, a retrieval model name (one of
+#       SHARD_MODELS) and a verification level
+# Returns the retrieval model that searches the shard
+def shard_model(shardstore, model, verify = VERIFY_OFF):
+
+    assert (model in SHARD_MODELS)
+
+    gsfile = os.path.join(shardstore, GSFILE)
+
+    if (model == "bm25"):
+        return BM25(shardstore, gsfile, verify_ = verify)
+    elif (model == "tfidf"):
+        return TFIDF(shardstore, gsfile, verify_ = verify)
+    elif (model == "qlm"):
+        return QLM(shardstore, gsfile, verify_ = verify)
+    else:
+        return ProximityModel(shardstore, gsfile, verify_ = verify)
+
+# Given a retrieval model of a shard,
+#       a tuple of N, corpus size and avdl of the collection,
+#       a dictionary of key value pairs of term and (df, cf) of the collection
+#       with at least all query terms, and
+#       a list of Query (from query.py)
+# Returns a list of lists of (score, docid, model) tuples of the top MAXRANK
+#         documents of the shard for every query; highest score first
+def search_shard(rm, collection_stats, termstats, query_lst):
+
+    (N, corpus_size, avdl) = collection_stats
+
+    # score as if the collection were a single index; the proximity model
+    # scores with a base model that has an index of its own
+    models = [rm]
+    if (getattr(rm, "base_model", None) is not None):
+        models.append(rm.base_model)
+
+    for m in models:
+        m.global_stats.load(N, corpus_size, avdl, m.global_stats.doc_lengths)
+        m.invidx.load_term_statistics(termstats)
+
+    results = []
+
+    for query in query_lst:
+        resultset = rm.search_query(rm.invidx, query)
+        results.append(map(lambda r: (r.score, r.docid, r.model),
+                           resultset.results[:MAXRANK]))
+
+    return results
+
+# Given a list of per shard lists of (score, docid, model) tuples of a query;
+#       highest score first
+# Returns a list of DocumentScore (from result_set.py) of the top MAXRANK
+#         documents of all shards
+def merge_results(shard_results):
+
+    # heapq.merge needs ascending lists; order by descending score, then docid
+    # as ResultSet ranks the results of a single index
+    ascending = map(lambda rs: map(lambda r: (-r[0], r[1], r[2]), rs),
+                    shard_results)
+
+    docscores = []
+    for (negscore, docid, model) in heapq.merge(*ascending):
+        if (len(docscores) == MAXRANK):
+            break
+        docscores.append(DocumentScore(docid, -negscore, model))
+
+    return docscores
+
+## Shard worker ################################################################
+
+# Given a connection to the searcher, the path to a shard's indexstore, a
+#       retrieval model name and a verification level
+# Search the shard for every batch of queries received on the connection until
+# None is received
+def shard_worker(conn, shardstore, model, verify):
+
+    rm = shard_model(shardstore, model, verify)
+
+    # ready
+    conn.send(True)
+
+    while (True):
+
+        msg = conn.recv()
+
+        if (msg is None):
+            break
+
+        (collection_stats, termstats, query_lst) = msg
+        conn.send(search_shard(rm, collection_stats, termstats, query_lst))
+
+    conn.close()
+
+## Sharded searcher ############################################################
+
+class ShardedSearcher:
+
+    # sharded indexstore
+    indexstore       = ""
+
+    # shards of the indexstore
+    shards           = None
+
+    # tuple of N, corpus size and avdl of the collection
+    collection_stats = None
+
+    # term statistics of the collection
+    term_stats       = None
+
+    # list of (process, connection) of the shard workers
+    workers          = None
+
+    # reset
+    def reset(self):
+        self.indexstore       = ""
+        self.shards           = None
+        self.collection_stats = None
+        self.term_stats       = None
+        self.workers          = []
+
+    # Constructor
+    # Given a sharded indexstore, a retrieval model name (one of SHARD_MODELS)
+    # and a verification level
+    # Start a worker process for every shard
+    def __init__(self, indexstore, model, verify = VERIFY_OFF):
+
+        self.reset()
+
+        assert (model in SHARD_MODELS)
+
+        self.indexstore = indexstore
+        self.shards     = Shards(indexstore)
+
+        gs = GlobalStatistics(os.path.join(indexstore, GSFILE))
+        self.collection_stats = (gs.get_N(), gs.get_corpussize(), gs.get_avdl())
+        self.term_stats       = TermStatistics(os.path.join(indexstore, TERMSTATFILE))
+
+        # workers read their shards in parallel
+        for name in self.shards.names():
+            (conn, worker_conn) = multiprocessing.Pipe()
+            process = multiprocessing.Process(target = shard_worker,
+                                              args   = (worker_conn,
+                                                        self.shards.shardstore(name),
+                                                        model, verify))
+            process.daemon = True
+            process.start()
+            self.workers.append((process, conn))
+
+        for (process, conn) in self.workers:
+            assert (conn.recv())
+
+    # Given a list of Query (from query.py)
+    # Returns a list of ResultSet where the first resultset in the list
+    #         corresponds to the first query in the input list and so on
+    def search(self, query_lst):
+
+        # collection statistics of all query terms
+        terms = set()
+        for query in query_lst:
+            terms.update(query.querystr.split(" "))
+        termstats = self.term_stats.statistics(terms)
+
+        # scatter
+        for (process, conn) in self.workers:
+            conn.send((self.collection_stats, termstats, query_lst))
+
+        # gather
+        shard_results = map(lambda w: w[1].recv(), self.workers)
+
+        resultsets = []
+        for qidx in range(0, len(query_lst)):
+            docscores = merge_results(map(lambda rs: rs[qidx], shard_results))
+            resultsets.append(ResultSet(query_lst[qidx], docscores, MAXRANK))
+
+        return resultsets
+
+    # Stop all workers
+    def close(self):
+
+        for (process, conn) in self.workers:
+            conn.send(None)
+            conn.close()
+            process.join()
+
+        self.workers = []
+
+################################################################################
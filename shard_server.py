@@ -0,0 +1,253 @@
+## This program serves searches of one shard of a sharded indexstore (refer to
+#  indexer.py --shards) over TCP. The query broker (query_broker.py) sends
+#  queries to shard servers and merges their results. Shard servers speak the
+#  protocol in wire_protocol.py
+
+from global_statistics import GlobalStatistics, GSFILE
+from index             import VERIFY_OFF, VERIFY_LEVELS
+from shard_searcher    import shard_model, search_shard, SHARD_MODELS
+from wire_protocol     import recv_frame, send_frame, encode_hello_reply, \
+                              decode_search, encode_results, encode_error,  \
+                              HELLO, HELLO_REPLY, SEARCH, RESULTS, ERROR
+
+import argparse
+import os
+import SocketServer
+import sys
+import threading
+from   argparse import RawTextHelpFormatter
+
+## Globals #####################################################################
+# Print to terminal about what the program is doing
+# this is set by input to the program
+verbose = False
+
+## Help strings ################################################################
+
+program_help = '''
+
+    shard_server.py serves searches of one shard of a sharded indexstore over
+    TCP until it is killed. The shard is read once at startup. Any number of
+    servers (replicas) may serve the same shard; the query broker sends every
+    query to one replica of every shard
+
+    Argument 1: indexstore - Path to the folder of the shard, a shard_NNN
+                             folder inside a sharded indexstore
+
+    Argument 2: model      - Retrieval model to use, one of
+                             "bm25", "tfidf", "qlm" or "proximity"
+
+    Argument 3: port       - TCP port to listen on
+
+    Argument 4: host       - Host name or address to listen on. Defaults to
+                             localhost
+
+    Argument 5: verify     - Verification level of the index and the retrieval
+                             model. "off" (default), "sampled" or "full".
+                             Refer to index.py. This argument is optional
+
+    Argument 6: verbose    - Print progress of the program to stdout.
+                             This argument is optional
+
+    EXAMPLES:
+
+        # serve 2 shards with 2 replicas each
+        python shard_server.py --indexstore=./cacm.index/shard_000 --model=bm25 --port=9000 &
+        python shard_server.py --indexstore=./cacm.index/shard_000 --model=bm25 --port=9001 &
+        python shard_server.py --indexstore=./cacm.index/shard_001 --model=bm25 --port=9002 &
+        python shard_server.py --indexstore=./cacm.index/shard_001 --model=bm25 --port=9003 &
+    '''
+
+indexstore_help = '''
+    Path to the folder of the shard, a shard_NNN folder inside a sharded
+    indexstore
+    '''
+
+model_help = '''
+    Retrieval model to use, one of "bm25", "tfidf", "qlm" or "proximity"
+    '''
+
+port_help = '''
+    TCP port to listen on
+    '''
+
+host_help = '''
+    Host name or address to listen on. Defaults to localhost
+    '''
+
+verify_help = '''
+    Verification level of the index and the retrieval model. "off" (default),
+    "sampled" or "full". This argument is optional
+    '''
+
+verbose_help = '''
+    Print progress of the program to stdout. This argument is optional
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--indexstore",
+                       metavar  = "is",
+                       required = True,
+                       type     = str,
+                       help     = indexstore_help)
+
+argparser.add_argument("--model",
+                       metavar  = "m",
+                       required = True,
+                       type     = str,
+                       help     = model_help)
+
+argparser.add_argument("--port",
+                       metavar  = "p",
+                       required = True,
+                       type     = int,
+                       help     = port_help)
+
+argparser.add_argument("--host",
+                       metavar  = "h",
+                       type     = str,
+                       default  = "localhost",
+                       help     = host_help)
+
+argparser.add_argument("--verify",
+                       metavar  = "v",
+                       type     = str,
+                       default  = VERIFY_OFF,
+                       help     = verify_help)
+
+argparser.add_argument("--verbose",
+                       dest     = 'verbose',
+                       action   = 'store_true',
+                       help     = verbose_help)
+
+## Utilities ###################################################################
+
+# Given a string, print it if verbose is set
+def print_verbose(s):
+    if (verbose):
+        print s
+
+## Server ######################################################################
+
+# Serves the requests of one broker connection until the connection is closed
+class ShardRequestHandler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+
+        server = self.server
+
+        print_verbose("Connected " + str(self.client_address))
+
+        while (True):
+
+            try:
+                (msgtype, payload) = recv_frame(self.request)
+            except IOError:
+                break
+
+            try:
+                if (msgtype == HELLO):
+                    send_frame(self.request, HELLO_REPLY,
+                               encode_hello_reply(server.shardname,
+                                                  server.model,
+                                                  server.ndocs))
+                elif (msgtype == SEARCH):
+                    self.search(payload)
+                else:
+                    send_frame(self.request, ERROR,
+                               encode_error(0, "unexpected message " + str(msgtype)))
+            except IOError:
+                # the broker gave up on the request and closed the connection
+                break
+
+        print_verbose("Disconnected " + str(self.client_address))
+
+    # Given the payload of a SEARCH, search the shard and send the results
+    def search(self, payload):
+
+        server = self.server
+        reqid  = 0
+
+        try:
+            (reqid, collection_stats, termstats, query_lst) = decode_search(payload)
+
+            # the model keeps the statistics of the last request; search one
+            # request at a time
+            with server.lock:
+                results = search_shard(server.rm, collection_stats, termstats,
+                                       query_lst)
+
+        except Exception as e:
+            send_frame(self.request, ERROR, encode_error(reqid, repr(e)))
+            return
+
+        send_frame(self.request, RESULTS, encode_results(reqid, results))
+
+# Serves every broker connection in a thread of its own
+class ShardServer(SocketServer.ThreadingTCPServer):
+
+    allow_reuse_address = True
+    daemon_threads      = True
+
+    # name of the shard served, i.e. its folder name
+    shardname = ""
+
+    # retrieval model name and the retrieval model of the shard
+    model     = ""
+    rm        = None
+
+    # number of documents in the shard
+    ndocs     = 0
+
+    # lock held while searching
+    lock      = None
+
+    # Constructor
+    # Given a (host, port) to listen on, the path to a shard's indexstore, a
+    # retrieval model name and a verification level
+    def __init__(self, address, shardstore, model, verify = VERIFY_OFF):
+
+        self.shardname = os.path.basename(os.path.normpath(shardstore))
+        self.model     = model
+        self.rm        = shard_model(shardstore, model, verify)
+        self.ndocs     = GlobalStatistics(os.path.join(shardstore, GSFILE)).N
+        self.lock      = threading.Lock()
+
+        SocketServer.ThreadingTCPServer.__init__(self, address,
+                                                 ShardRequestHandler)
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+indexstore = args['indexstore']
+model      = args['model']
+port       = args['port']
+host       = args['host']
+verify     = args['verify']
+verbose    = args['verbose']
+
+## Input check
+if (not os.path.exists(os.path.join(indexstore, GSFILE))):
+    print "FATAL: Cannot find a shard in ", indexstore
+    exit(-1)
+if (model not in SHARD_MODELS):
+    print "FATAL: model should be one of ", SHARD_MODELS
+    exit(-1)
+if (verify not in VERIFY_LEVELS):
+    print "FATAL: verify should be one of ", VERIFY_LEVELS
+    exit(-1)
+
+server = ShardServer((host, port), indexstore, model, verify)
+
+print "Serving ", server.shardname, " (", server.ndocs, " documents, ", model, \
+      ") on ", host + ":" + str(port)
+sys.stdout.flush()
+
+server.serve_forever()
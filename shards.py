@@ -0,0 +1,228 @@
+## This file provides classes that facilitate reading and writing the layout of
+#  a sharded indexstore
+#
+# A sharded indexstore (refer to indexer.py --shards) partitions the documents
+# by document ID range into shards. Every shard is an ordinary indexstore in a
+# sub folder of the sharded indexstore with its own postings, docid map and
+# global statistics of the documents in the shard. The sharded indexstore holds
+# the statistics shared across shards,
+#   i. SHARDSFILE   - the shard list and the document ID range of every shard
+#  ii. GSFILE       - N, the corpus size and avdl of the whole collection
+# iii. TERMSTATFILE - the document and corpus frequency of every term of the
+#                     whole collection
+#  iv. DOCIDMAPPER  - the docid map of the whole collection
+# Retrieval models searching a shard use the shared statistics so that they
+# score documents exactly as if the collection were a single index
+
+from manifest import Manifest
+
+import os
+import shutil
+
+## Globals #####################################################################
+
+# Shard list file name
+SHARDSFILE   = "shards"
+
+# Prefix of shard folder names
+SHARDPREFIX  = "shard_"
+
+# Term statistics file name
+TERMSTATFILE = "term.stat"
+
+## Utilities ###################################################################
+
+# Given a shard number
+# Returns the folder name of the shard
+def shard_dirname(shardno):
+
+    return SHARDPREFIX + ("%03d" % shardno)
+
+# Given an indexstore
+# Returns true iff the indexstore is sharded
+def is_sharded(indexstore):
+
+    manifest = Manifest(indexstore)
+
+    if (manifest.exists()):
+        return manifest.contains(SHARDSFILE)
+
+    return os.path.exists(os.path.join(indexstore, SHARDSFILE))
+
+# Given a sorted list of document IDs and the number of shards, k
+# Returns a list of k lists of consecutive document IDs of nearly equal sizes
+def partition(docids, k):
+
+    assert (k > 0)
+    assert (docids == sorted(docids))
+
+    parts = []
+    start = 0
+
+    for shardno in range(0, k):
+        # spread the remainder over the first shards
+        end = start + (len(docids) / k) + (1 if shardno < len(docids) % k else 0)
+        parts.append(docids[start:end])
+        start = end
+
+    return filter(lambda p: p != [], parts)
+
+# Given an indexstore and a list of shard folder names to keep
+# Delete all other shard folders of the indexstore
+def remove_stale_shards(indexstore, keep = []):
+
+    for name in os.listdir(indexstore):
+        if (name.startswith(SHARDPREFIX) and name not in keep and \
+            os.path.isdir(os.path.join(indexstore, name))):
+            shutil.rmtree(os.path.join(indexstore, name))
+
+## Shards ######################################################################
+
+# The list of shards of a sharded indexstore. Every shard is described by its
+# folder name and the smallest and largest document IDs in the shard
+class Shards:
+
+    # sharded indexstore
+    indexstore = ""
+
+    # list of (shard folder name, smallest docid, largest docid) tuples
+    shards     = []
+
+    # reset
+    def reset(self):
+        self.indexstore = ""
+        self.shards     = []
+
+    # Constructor
+    # Given a sharded indexstore, read the shard list if it exists
+    def __init__(self, indexstore):
+
+        self.reset()
+
+        self.indexstore = indexstore
+
+        if (os.path.exists(os.path.join(indexstore, SHARDSFILE))):
+            self.read()
+
+    # Returns a list of shard folder names
+    def names(self):
+        return map(lambda s: s[0], self.shards)
+
+    # Given a shard folder name
+    # Returns the path to the shard's indexstore
+    def shardstore(self, name):
+        return os.path.join(self.indexstore, name)
+
+    # Given a document ID
+    # Returns the folder name of the shard the document ID belongs to or None
+    def shard_of(self, docid):
+
+        for s in self.shards:
+            if (docid >= s[1] and docid <= s[2]):
+                return s[0]
+
+        return None
+
+    # Given a shard folder name and the smallest and largest document IDs of
+    # the shard, append the shard to the shard list
+    def add(self, name, mindocid, maxdocid):
+
+        assert (name not in self.names())
+        assert (mindocid <= maxdocid)
+
+        self.shards.append((name, mindocid, maxdocid))
+
+    # read the shard list file
+    def read(self):
+
+        self.shards = []
+
+        with open(os.path.join(self.indexstore, SHARDSFILE), "r") as f:
+            for line in f.readlines():
+                # Every line is in the format
+                # shardname , mindocid , maxdocid
+                parts = map(lambda p: p.strip(), line.split(","))
+                assert (len(parts) == 3)
+                self.shards.append((parts[0], int(parts[1]), int(parts[2])))
+
+    # Given the name of the file to write to (optional)
+    # write the shard list file
+    def write(self, shardsfname = SHARDSFILE):
+
+        with open(os.path.join(self.indexstore, shardsfname), "w+") as f:
+            for s in self.shards:
+                f.write(s[0] + " , " + str(s[1]) + " , " + str(s[2]) + "\n")
+
+## Term statistics #############################################################
+
+# Document and corpus frequencies of the terms of a collection
+class TermStatistics:
+
+    # dictionary of key value pairs of term and (df, cf)
+    termstats = None
+
+    # reset
+    def reset(self):
+        self.termstats = {}
+
+    # Constructor
+    # Given the path to a term statistics file (optional), read it
+    def __init__(self, tsfile = ""):
+
+        self.reset()
+
+        if (tsfile != "" and os.path.exists(tsfile)):
+            self.read(tsfile)
+
+    # Given an Index (from index.py)
+    # Add the statistics of all terms of the index. The documents of the index
+    # must not have been added before
+    def add_index(self, invidx):
+
+        for term in invidx.idxdict:
+
+            postings = invidx.idxdict[term]
+
+            df = len(postings)
+            cf = reduce(lambda cf, p: cf + p.tf, postings, 0)
+
+            (cdf, ccf) = self.termstats.get(term, (0, 0))
+            self.termstats[term] = (cdf + df, ccf + cf)
+
+    # Given a list of terms
+    # Returns a dictionary of key value pairs of term and (df, cf) of all terms
+    # of the collection in the list
+    def statistics(self, terms):
+
+        stats = {}
+
+        for term in terms:
+            if (self.termstats.get(term) is not None):
+                stats[term] = self.termstats[term]
+
+        return stats
+
+    # Given the path to a term statistics file, read it
+    def read(self, tsfile):
+
+        self.termstats = {}
+
+        with open(tsfile, "r") as f:
+            for line in f:
+                # Every line is in the format
+                # term , df , cf
+                # Terms never have whitespace, but may have commas
+                parts = line.rsplit(",", 2)
+                assert (len(parts) == 3)
+                self.termstats[parts[0].strip()] = (int(parts[1]), int(parts[2]))
+
+    # Given the path to a term statistics file, write the statistics sorted
+    # by term
+    def write(self, tsfile):
+
+        with open(tsfile, "w+") as f:
+            for term in sorted(self.termstats.keys()):
+                (df, cf) = self.termstats[term]
+                f.write(term + " , " + str(df) + " , " + str(cf) + "\n")
+
+################################################################################
@@ -0,0 +1,225 @@
+## This file provides paired significance tests of two runs, given the values
+#  of a metric for every query of both runs (refer to eval_engine.py)
+#
+# Tests, on the per query differences d of the metric of run A and run B,
+#   t test           - paired Student's t test of mean(d) != 0; two sided
+#   randomization    - the sign of every difference is flipped at random, as if
+#                      the runs were swapped on the query; the p value is the
+#                      fraction of permutations with an |mean| at least as
+#                      large as |mean(d)|; two sided
+#   bootstrap        - queries are resampled with replacement; the confidence
+#                      interval of mean(d) is the percentile interval of the
+#                      means of the resamples
+# Permutations and resamples draw from a random generator seeded by the caller,
+# so a comparison is repeatable
+
+import math
+import random
+
+## Globals #####################################################################
+
+# Default number of permutations of the randomization test and resamples of
+# the bootstrap
+PERMUTATIONS = 10000
+RESAMPLES    = 10000
+
+# Confidence of the bootstrap interval
+CONFIDENCE   = 0.95
+
+# Significance level
+ALPHA        = 0.05
+
+# Largest number of iterations and precision of the incomplete beta function
+BETAITERS    = 200
+BETAEPS      = 3.0e-12
+
+## Utilities ###################################################################
+
+# Given a list of numbers
+# Returns the mean of the numbers
+def mean(values):
+    return sum(values) / float(len(values))
+
+# Given two lists of numbers of the same length
+# Returns the list of differences of the numbers
+def differences(a, b):
+
+    assert (len(a) == len(b))
+
+    return map(lambda ab: ab[0] - ab[1], zip(a, b))
+
+# Given a, b and x in [0, 1]
+# Returns the continued fraction of the regularized incomplete beta function
+# (refer to Numerical Recipes, betacf)
+def beta_fraction(a, b, x):
+
+    qab = a + b
+    qap = a + 1.0
+    qam = a - 1.0
+
+    c = 1.0
+    d = 1.0 - qab * x / qap
+    if (abs(d) < 1.0e-300):
+        d = 1.0e-300
+    d = 1.0 / d
+    h = d
+
+    for m in range(1, BETAITERS + 1):
+
+        m2 = 2 * m
+
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d  = 1.0 + aa * d
+        if (abs(d) < 1.0e-300):
+            d = 1.0e-300
+        c  = 1.0 + aa / c
+        if (abs(c) < 1.0e-300):
+            c = 1.0e-300
+        d  = 1.0 / d
+        h  = h * d * c
+
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d  = 1.0 + aa * d
+        if (abs(d) < 1.0e-300):
+            d = 1.0e-300
+        c  = 1.0 + aa / c
+        if (abs(c) < 1.0e-300):
+            c = 1.0e-300
+        d  = 1.0 / d
+        de = d * c
+        h  = h * de
+
+        if (abs(de - 1.0) < BETAEPS):
+            break
+
+    return h
+
+# Given a, b and x in [0, 1]
+# Returns the regularized incomplete beta function I_x(a, b)
+def incomplete_beta(a, b, x):
+
+    assert (x >= 0.0 and x <= 1.0)
+
+    if (x == 0.0 or x == 1.0):
+        return x
+
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+                     a * math.log(x) + b * math.log(1.0 - x))
+
+    if (x < (a + 1.0) / (a + b + 2.0)):
+        return front * beta_fraction(a, b, x) / a
+
+    return 1.0 - front * beta_fraction(b, a, 1.0 - x) / b
+
+# Given a sorted list of numbers and a fraction q in [0, 1]
+# Returns the q quantile of the numbers; linear between neighbours
+def quantile(values, q):
+
+    pos  = q * (len(values) - 1)
+    low  = int(math.floor(pos))
+    high = min(low + 1, len(values) - 1)
+
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+## Tests #######################################################################
+
+# Given a list of per query differences
+# Returns a tuple of the t statistic and the two sided p value of the paired t
+# test
+def t_test(diffs):
+
+    n = len(diffs)
+    if (n < 2):
+        return (0.0, 1.0)
+
+    m   = mean(diffs)
+    var = sum(map(lambda d: (d - m) * (d - m), diffs)) / float(n - 1)
+
+    # identical runs, or a constant difference
+    if (var == 0.0):
+        return (0.0, 1.0 if m == 0.0 else 0.0)
+
+    t  = m / math.sqrt(var / float(n))
+    df = float(n - 1)
+
+    return (t, incomplete_beta(df / 2.0, 0.5, df / (df + t * t)))
+
+# Given a list of per query differences, the number of permutations and a
+#       random generator
+# Returns the two sided p value of the randomization test
+def randomization_test(diffs, permutations, rng):
+
+    n = len(diffs)
+    if (n == 0):
+        return 1.0
+
+    total    = sum(diffs)
+    observed = abs(total)
+
+    # sum with the signs of the differences on set bits flipped is
+    # total - 2 * (sum of the flipped differences)
+    count = 0
+    for p in range(0, permutations):
+
+        bits    = rng.getrandbits(n)
+        flipped = 0.0
+        i       = 0
+        while (bits):
+            if (bits & 1):
+                flipped = flipped + diffs[i]
+            bits = bits >> 1
+            i    = i + 1
+
+        # tolerance for rounding of sums of the same numbers in another order
+        if (abs(total - 2.0 * flipped) >= observed - 1.0e-12):
+            count = count + 1
+
+    return float(count + 1) / float(permutations + 1)
+
+# Given a list of per query differences, the number of resamples, a random
+#       generator and the confidence of the interval
+# Returns a tuple of the low and high end of the bootstrap confidence interval
+# of the mean difference
+def bootstrap_interval(diffs, resamples, rng, confidence = CONFIDENCE):
+
+    n = len(diffs)
+    if (n == 0):
+        return (0.0, 0.0)
+
+    means = []
+    for r in range(0, resamples):
+        resample = 0.0
+        for i in range(0, n):
+            resample = resample + diffs[int(rng.random() * n)]
+        means.append(resample / float(n))
+
+    means.sort()
+
+    return (quantile(means, (1.0 - confidence) / 2.0),
+            quantile(means, 1.0 - (1.0 - confidence) / 2.0))
+
+## Comparison ##################################################################
+
+# Given two lists of the values of a metric for the same queries; runs A and B,
+#       the number of permutations and resamples and
+#       a seed of the random generator
+# Returns a dictionary of the results of all tests of A - B
+def compare(a, b, permutations = PERMUTATIONS, resamples = RESAMPLES, seed = 0):
+
+    diffs = differences(a, b)
+    rng   = random.Random(seed)
+
+    (t, t_p)    = t_test(diffs)
+    perm_p      = randomization_test(diffs, permutations, rng)
+    (low, high) = bootstrap_interval(diffs, resamples, rng)
+
+    return {"mean_a"          : mean(a) if a != [] else 0.0,
+            "mean_b"          : mean(b) if b != [] else 0.0,
+            "diff"            : mean(diffs) if diffs != [] else 0.0,
+            "t"               : t,
+            "t_p"             : t_p,
+            "randomization_p" : perm_p,
+            "ci_low"          : low,
+            "ci_high"         : high}
+
+################################################################################
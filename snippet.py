@@ -5,11 +5,14 @@ from docrank_trec    import DocRankTREC
 from query           import Query
 from cacm_parser     import is_cacm_doc, cacm_content
 from docid_mapper    import DocIDMapper
-from text_processing import process_text, clean_extraneous_whitespace
+from text_processing import process_text, is_number
 from snippet_lm      import SnippetLM
+from sentence_store  import SentenceStore, document_sentences
+from snippet_cache   import SnippetCache
+from tracing         import span, count
 
+import multiprocessing
 import os
-import re
 import sys
 
 ## Globals #####################################################################
@@ -17,6 +20,10 @@ import sys
 # Number of words in snippet
 NSNIPPETWORDS = 50
 
+# Number of documents handed to a worker process at a time in parallel snippet
+# generation (refer to snippets_parallel)
+DOCCHUNK      = 8
+
 ## Snippet class ###############################################################
 
 class Snippet:
@@ -35,6 +42,13 @@ class Snippet:
     # Snippet language model utilites
     snippet_lm      = None
 
+    # Sentence stores (refer to sentence_store.py); a dictionary of key value
+    # pairs of corpusstore and SentenceStore. Shared by the Snippets of a run
+    sentence_stores = None
+
+    # Snippet cache (refer to snippet_cache.py). Shared by the Snippets of a run
+    cache           = None
+
     # reset
     def reset(self):
         # initialize class variables
@@ -43,9 +57,12 @@ class Snippet:
         self.indexstore      = None
         self.stopfile        = None
         self.snippet_lm      = None
+        self.sentence_stores = None
+        self.cache           = None
 
     # Constructor
-    def __init__(self, ranked_docs_, query_, indexstore_, stopfile_, snippet_lm_):
+    def __init__(self, ranked_docs_, query_, indexstore_, stopfile_, snippet_lm_,
+                 sentence_stores_ = None, cache_ = None):
 
         #reset
         self.reset()
@@ -62,6 +79,9 @@ class Snippet:
         self.stopfile    = stopfile_
         self.snippet_lm  = snippet_lm_
 
+        self.sentence_stores = {} if sentence_stores_ is None else sentence_stores_
+        self.cache           = SnippetCache(indexstore_) if cache_ is None else cache_
+
         # assert that all rankings are about the supplied query
         assert (all(map(lambda drt: drt.qid == self.query.qid, self.ranked_docs)))
 
@@ -75,6 +95,24 @@ class Snippet:
         # get list of docids for which we have to generate a snippet
         docids = map(lambda rd: rd.docid, self.ranked_docs)
 
+        with span("snippet.significant_words"):
+            (query_words, sig_words) = self.significant_words()
+
+        # get docid map; maps docid to corpusfile and the document file
+        docid_map = DocIDMapper().read(self.indexstore)
+
+        # for each document
+        with span("snippet.documents"):
+            for docid in docids:
+                doc_snippets[docid] = self.document_snippet(docid, docid_map,
+                                                            query_words, sig_words)
+
+        return doc_snippets
+
+    # Returns a tuple of the processed query words and the significant words
+    # of the query, considering the ranked documents
+    def significant_words(self):
+
         # get processed and stopped query string
         querystr = process_text(self.query.querystr, self.stopfile)
 
@@ -92,130 +130,163 @@ class Snippet:
         #print sig_words
         #print "-----------------------------------------------------------"
 
-        # get docid map; maps docid to corpusfile and the document file
-        docid_map = DocIDMapper().read(self.indexstore)
+        return (query_words, sig_words)
 
-        # for each document
-        for docid in docids:
+    # Given a docid of a ranked document, the docid map of the indexstore
+    #       (refer to docid_mapper.py), and the query words and significant
+    #       words of the query (refer to significant_words)
+    # Returns the snippet string of the document
+    #
+    # Every sentence is a list of raw words and the list of the processed form
+    # of every word (refer to sentence_store.py). Segments, their scores and
+    # highlights are computed from the two lists; words are not text processed
+    # again
+    def document_snippet(self, docid, docid_map, query_words, sig_words):
+
+        # the snippet may have been generated for another query
+        snippet_str = self.cache.snippet(docid, sig_words, query_words)
+        if (snippet_str is not None):
+            count("snippets_cached")
+            return snippet_str
 
-            # document of id docid
-            docfpath = DocIDMapper().docfpath(docid, docid_map)
+        count("snippets_generated")
 
-            # get doc sentences
-            doc_sentences = self.sentences(docfpath)
+        # document of id docid
+        docfpath = DocIDMapper().docfpath(docid, docid_map)
 
-            # we want our sentences to be separated by just spaces
-            doc_sentences = map(lambda s: clean_extraneous_whitespace(s), doc_sentences)
+        # get doc sentences and their processed words, and the bitmaps of the
+        # sentences with every processed word
+        doc_entry = self.cache.document(docid)
 
-            # get significant segments of sentences
-            doc_segments  = map(lambda s: self.sig_segment(s, sig_words), doc_sentences)
+        if (doc_entry is None):
 
-            # text process document segments
-            pdoc_segments = map(lambda s: process_text(s), doc_segments)
+            with span("snippet.sentences"):
 
-            # score segments
-            doc_segment_scores = map(lambda seg: self.segment_score(seg, sig_words), pdoc_segments)
+                # sentence store of the document's corpusstore
+                corpusfpath = DocIDMapper().corpusfpath(docid, docid_map)
+                store       = self.sentence_store(os.path.dirname(corpusfpath))
 
-            # we got all information, lets generate the snippet
-            snippet_str = self.snippet(os.path.basename(docfpath), doc_segments, doc_segment_scores)
+                if (store.contains_document(docid)):
+                    doc_sentences = store.sentences(docid)
+                else:
+                    # split and process the sentences of the document
+                    doc_sentences = document_sentences(cacm_content(docfpath))
 
-            # highlight query terms in snippet
-            snippet_str = self.highlight(query_words, snippet_str)
+                doc_entry = self.cache.add_document(docid, doc_sentences)
 
-            # store snippet
-            doc_snippets[docid] = snippet_str
+        (doc_sentences, bitmaps) = doc_entry
 
-        return doc_snippets
+        sig_set = set(sig_words)
 
-    # Given a path to an indexed document
-    # Return a list of sentences in the document.
-    def sentences(self, docfpath):
+        # sentences with significant words
+        sig_bitmap = reduce(lambda b, w: b | bitmaps.get(w, 0), sig_set, 0)
 
-        # get contents of the document
-        dcontents = cacm_content(docfpath)
+        # get significant segments of sentences; (words, processed words)
+        doc_segments = []
+        for i in range(0, len(doc_sentences)):
 
-        # split doc into multiple paragraphs
-        paragraphs = re.split("\n\n", dcontents)
+            # no significant words in the sentence ?
+            if (not (sig_bitmap >> i) & 1):
+                doc_segments.append(([], []))
+                continue
 
-        # sentences
-        ret_sentences = []
+            (sentence, pwords) = doc_sentences[i]
+            words = sentence.split(" ")
+            assert (len(pwords) == len(words))
+            (start_seg, end_seg) = self.sig_segment(pwords, sig_set)
+            doc_segments.append((words[start_seg : end_seg], pwords[start_seg : end_seg]))
 
-        # for each paragraph
-        for paragraph in paragraphs:
-            # split paragraph into sentences
-            # hypothesize that a whitespace after a period the marks end of a sentence
-            ret_sentences = ret_sentences + re.split('\.\s', paragraph)
+        # score segments
+        doc_segment_scores = map(lambda seg: self.segment_score(seg[0], seg[1], sig_set),
+                                 doc_segments)
+
+        # we got all information, lets generate the snippet with query terms
+        # highlighted
+        snippet_str = self.snippet(os.path.basename(docfpath), doc_segments,
+                                   doc_segment_scores, set(query_words))
+
+        self.cache.add_snippet(docid, sig_words, query_words, snippet_str)
+
+        return snippet_str
 
-        # return sentences
-        return ret_sentences
+    # Given a corpusstore
+    # Return the SentenceStore of the corpusstore. The store is empty if the
+    # corpusstore has none
+    def sentence_store(self, corpusstore):
 
-    # Given a raw document sentence, and a list of significant words
-    # Return the largest segment of the sentence bounded by significant words
-    def sig_segment(self, sentence, sig_words):
+        if (self.sentence_stores.get(corpusstore) is None):
+            self.sentence_stores[corpusstore] = SentenceStore(corpusstore)
 
-        # break sentence into words
-        words = sentence.split(" ")
+        return self.sentence_stores[corpusstore]
+
+    # Given the processed form of every word of a raw document sentence and a
+    #       set of significant words
+    # Return the (start, end) word indices of the largest segment of the
+    # sentence bounded by significant words; (0, 0) if there are none
+    def sig_segment(self, pwords, sig_words):
 
         # start and end segment index marker
         start_seg = -1
         end_seg   = -1
 
         # find index of the first appearance of a significant word
-        for idx in range(0, len(words)):
-            # text process this word to compare with query
-            pword = process_text(words[idx])
-
+        for idx in range(0, len(pwords)):
             # is it a significant word ?
-            if (pword in sig_words):
+            if (pwords[idx] in sig_words):
                 start_seg = idx
                 break
 
-        # find index of the last appearance of a significant word
-        for idx in range(len(words) - 1, -1, -1):
-            # text process this word to compare with query
-            pword = process_text(words[idx])
+        # no significant words in the sentence ?
+        if (start_seg == -1):
+            return (0, 0)
 
-            if (pword in sig_words):
+        # find index of the last appearance of a significant word
+        for idx in range(len(pwords) - 1, start_seg - 1, -1):
+            if (pwords[idx] in sig_words):
                 end_seg = idx
                 break
 
         assert (start_seg <= end_seg)
 
-        # no significant words in the sentence ?
-        if (start_seg == -1 and end_seg == -1):
-            return ""
-
         # always include a couple of words on either sides of the segment
         # for context
         start_seg = 0 if start_seg - 3 < 0 else start_seg - 3
-        return " ".join(words[start_seg : end_seg + 4])
+        return (start_seg, min(end_seg + 4, len(pwords)))
 
-    # Given a sentence segment bounded by query terms, and a list of significant
-    # words
+    # Given the raw words of a sentence segment bounded by query terms, the
+    # processed form of every word and a set of significant words
     # Returns the score for the document according to Luhns paper
     #         "The Automatic Creation of Literature Abstracts"
-    def segment_score(self, segment, sig_words):
+    def segment_score(self, seg_words, seg_pwords, sig_words):
 
         # empty segment ?
-        if (segment == ""):
+        if (seg_words == []):
             return 0
 
-        # split segment into words
-        seg_words = segment.split(" ")
+        # The words of the processed segment are the words of the processed
+        # words of the segment, except for a word starting with a period and a
+        # number; a period after a space is kept (refer to
+        # text_processing.handle_period)
+        if (any(map(lambda w: w[:1] == "." and is_number(w[1:2] or " "), seg_words[1:]))):
+            pseg_words = process_text(" ".join(seg_words)).split(" ")
+        else:
+            pseg_words = " ".join(filter(lambda pw: pw != "", seg_pwords)).split(" ")
 
         # count how many words are significant in segment
-        sig_word_count = len(filter(lambda w: w in sig_words, seg_words))
+        sig_word_count = len(filter(lambda w: w in sig_words, pseg_words))
 
         # total number of words in the segment
-        seg_words_count = len(seg_words)
+        seg_words_count = len(pseg_words)
 
         # return score
         return float(float(sig_word_count * sig_word_count) / float(seg_words_count))
 
-    # Given a list of raw document segments, and
-    #       a list of corresponding scores of each document segment
-    # Returns a snippet of the document
-    def snippet(self, docname, segments, scores):
+    # Given the document name,
+    #       a list of (raw words, processed words) document segments,
+    #       a list of corresponding scores of each document segment and
+    #       a set of query words
+    # Returns a snippet of the document with the query words highlighted
+    def snippet(self, docname, segments, scores, query_words):
 
         # assert all lists have same lenght
         assert (len(segments)  == len(scores))
@@ -254,7 +325,7 @@ class Snippet:
                 snippet_tuples.append(score_tuple)
                 # Update running count of words in snippet; add segment length
                 # to words_in_snippet
-                words_in_segment = len(score_tuple[DOCSEG].split(" "))
+                words_in_segment = len(score_tuple[DOCSEG][0])
                 words_in_snippet = words_in_snippet + words_in_segment
 
         # Cool! got snippet tuples. we want to display snippet sentences in the
@@ -262,13 +333,26 @@ class Snippet:
         # sort tuples by sentence idx
         snippet_tuples.sort(key=lambda t: t[SEGIDX])
 
-        # construct snippet string
-        snippet_str = ""
+        # no segments; just the docname
+        if (snippet_tuples == []):
+            return self.highlight(query_words, docname + "\n\n")
+
+        # highlight query words in segments
+        segment_strs = []
         for snippet_tuple in snippet_tuples:
-            snippet_str = snippet_str + snippet_tuple[DOCSEG] + " ... "
+            (words, pwords) = snippet_tuple[DOCSEG]
+            segment_strs.append(" ".join(map(lambda i: words[i].upper() if pwords[i] in query_words else words[i],
+                                              range(0, len(words)))))
 
-        # cherry on top. add docname
-        snippet_str = docname + "\n" + snippet_str.strip() + "\n"
+        # the docname and the first word of the snippet are one word of the
+        # snippet string
+        first = snippet_tuples[0][DOCSEG][0][0]
+        segment_strs[0] = segment_strs[0][len(first):]
+
+        # construct snippet string
+        snippet_str = self.highlight(query_words, docname + "\n" + first) + \
+                      segment_strs[0] + "".join(map(lambda s: " ... " + s, segment_strs[1:])) + \
+                      " ...\n"
 
         # return snippet string
         return snippet_str
@@ -293,6 +377,93 @@ class Snippet:
         # join and return
         return (" ").join(words)
 
+## Parallel snippet generation ################################################
+
+# Snippets of all queries and the docid map of the indexstore used by worker
+# processes. They are set before the workers are forked, so every worker shares
+# the SnippetLM, sentence stores and docid map of the parent copy-on-write
+worker_snippets  = None
+worker_docid_map = None
+
+# Given the position of a Snippet in worker_snippets
+# Returns the query words and significant words of its query
+def significant_words_worker(sidx):
+    return worker_snippets[sidx].significant_words()
+
+# Given a tuple of the position of a Snippet in worker_snippets, the docid of a
+#       document ranked for its query and the query words and significant words
+#       of the query
+# Returns the snippet string of the document
+def snippet_worker(job):
+
+    (sidx, docid, query_words, sig_words) = job
+
+    return worker_snippets[sidx].document_snippet(docid, worker_docid_map,
+                                                  query_words, sig_words)
+
+##
+# GIVEN: a list of Snippet; one per query,
+#        the docid map of the indexstore (refer to docid_mapper.py) and
+#        the number of worker processes
+#
+# RETURNS: a list of lists of snippet strings; one list per Snippet in the
+#          input list, with the snippets of its documents in rank order
+#
+def snippets_parallel(snippets, docid_map, workers):
+
+    global worker_snippets
+    global worker_docid_map
+
+    worker_snippets  = snippets
+    worker_docid_map = docid_map
+    pool             = multiprocessing.Pool(workers)
+
+    try:
+        # significant words of every query; one query at a time, queries rank
+        # different numbers of documents
+        sig_words_lst = pool.map(significant_words_worker,
+                                 range(0, len(snippets)), chunksize = 1)
+
+        # snippets of every query; None for snippets not in the cache
+        snippet_lsts = []
+
+        # one job per (query, document) not in the cache
+        jobs = []
+        for sidx in range(0, len(snippets)):
+            (query_words, sig_words) = sig_words_lst[sidx]
+            cache = snippets[sidx].cache
+            snippet_lst = []
+            for docrank in snippets[sidx].ranked_docs:
+                snippet_lst.append(cache.snippet(docrank.docid, sig_words, query_words))
+                if (snippet_lst[-1] is None):
+                    jobs.append((sidx, docrank.docid, query_words, sig_words))
+            snippet_lsts.append(snippet_lst)
+
+        # pool.map returns snippets in the order of the jobs
+        doc_snippets = pool.map(snippet_worker, jobs, chunksize = DOCCHUNK)
+    finally:
+        pool.close()
+        pool.join()
+        worker_snippets  = None
+        worker_docid_map = None
+
+    # fill in the generated snippets and add them to the cache of the parent
+    j = 0
+    for sidx in range(0, len(snippets)):
+        (query_words, sig_words) = sig_words_lst[sidx]
+        cache = snippets[sidx].cache
+        for i in range(0, len(snippet_lsts[sidx])):
+            if (snippet_lsts[sidx][i] is None):
+                (jsidx, docid) = jobs[j][:2]
+                assert (jsidx == sidx)
+                snippet_lsts[sidx][i] = doc_snippets[j]
+                cache.add_snippet(docid, sig_words, query_words, doc_snippets[j])
+                j = j + 1
+
+    assert (j == len(jobs))
+
+    return snippet_lsts
+
 ## Snippet generation functions ################################################
 
 ##
@@ -301,9 +472,12 @@ class Snippet:
 #        queries in the, query_lst,
 #        the path to where the index used in the search is stored
 #        the path to a stopfile (optional) and
+#        the number of worker processes (optional) and
+#        a SnippetCache (in snippet_cache.py) of the indexstore (optional)
 # Returns a dictionary of (key, value) (queryid, ranked snippet list) pairs
 #
-def get_snippets(query_lst, docranks, indexstore, stopfile = ""):
+def get_snippets(query_lst, docranks, indexstore, stopfile = "", workers = 1,
+                 cache = None):
 
     # input check
     assert (os.path.exists(indexstore))
@@ -316,6 +490,17 @@ def get_snippets(query_lst, docranks, indexstore, stopfile = ""):
     # We are using a language model to generate snippets
     snippet_lm = SnippetLM(indexstore, stopfile)
 
+    # sentence stores of the corpusstores of the ranked documents
+    sentence_stores = {}
+
+    # cache of the snippets of the run
+    if (cache is None):
+        cache = SnippetCache(indexstore)
+
+    if (workers > 1):
+        return get_snippets_parallel(query_lst, docranks, indexstore, stopfile,
+                                     snippet_lm, sentence_stores, cache, workers)
+
     # For every query, print snippets
     for q in query_lst:
 
@@ -327,7 +512,9 @@ def get_snippets(query_lst, docranks, indexstore, stopfile = ""):
         sys.stdout.flush()
 
         # Get a dictionary of key-value (docid, snippet string)
-        doc_snippets = Snippet(q_docranks, q, indexstore, stopfile, snippet_lm).snippets()
+        with span("snippet.query", qid = q.qid):
+            doc_snippets = Snippet(q_docranks, q, indexstore, stopfile, snippet_lm,
+                                   sentence_stores, cache).snippets()
 
         # ordered snippet list
         snippet_lst = []
@@ -347,6 +534,39 @@ def get_snippets(query_lst, docranks, indexstore, stopfile = ""):
 
     return qid_snippets_dict
 
+# Given the arguments of get_snippets, a SnippetLM of the indexstore, an empty
+#       dictionary of sentence stores (refer to Snippet), a SnippetCache and
+#       the number of worker processes
+# Returns the snippets of get_snippets generated by the worker processes
+def get_snippets_parallel(query_lst, docranks, indexstore, stopfile, snippet_lm,
+                          sentence_stores, cache, workers):
+
+    print "Generating snippets with %d workers" % workers
+    sys.stdout.flush()
+
+    snippets = []
+    for q in query_lst:
+        q_docranks = filter(lambda drt: drt.qid == q.qid, docranks)
+        snippets.append(Snippet(q_docranks, q, indexstore, stopfile, snippet_lm,
+                                sentence_stores, cache))
+
+    docid_map = DocIDMapper().read(indexstore)
+
+    # open the sentence stores of all ranked documents before the workers are
+    # forked, so the workers share them
+    for docrank in docranks:
+        corpusstore = os.path.dirname(DocIDMapper().corpusfpath(docrank.docid, docid_map))
+        if (sentence_stores.get(corpusstore) is None):
+            sentence_stores[corpusstore] = SentenceStore(corpusstore)
+
+    snippet_lsts = snippets_parallel(snippets, docid_map, workers)
+
+    qid_snippets_dict = {}
+    for i in range(0, len(query_lst)):
+        qid_snippets_dict[query_lst[i].qid] = snippet_lsts[i]
+
+    return qid_snippets_dict
+
 ##
 # GIVEN: a list of Query (in query.py), query_lst, and
 #        a list of docrank objects, describing the ranking the ranking for all
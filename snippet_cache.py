@@ -0,0 +1,254 @@
+## This file provides the snippet cache; products of snippet generation (refer
+#  to snippet.py) reused across queries and runs of gen_snippet.py
+#
+# Queries often rank the same documents. For every document the cache holds,
+#   sentences - the (sentence, processed words) tuples of the sentences of the
+#               document (refer to sentence_store.py)
+#   bitmaps   - a dictionary of key value pairs of every processed word of the
+#               document and a bitmap of the sentences with the word; bit i is
+#               set iff sentence i has the word. Sentences without significant
+#               words have no segment and are skipped
+# and for every (document, significant words, query words) the snippet string.
+#
+# Entries are keyed by the index version too; the generation and checksum of
+# the manifest of the indexstore (refer to manifest.py). A commit changes the
+# version, so entries of documents of an older index are never used. Indexstores
+# without a manifest have no version; their entries are not stored to disk.
+#
+# The number of documents and snippets in the cache is bounded; the least
+# recently used entries are evicted. The cache may be stored to a file and read
+# by the next run
+
+from manifest import Manifest, MANIFEST, TMPEXTN, file_checksum
+
+import collections
+import cPickle
+import os
+
+## Globals #####################################################################
+
+# Maximum number of documents and snippets in the cache
+MAXDOCUMENTS = 4096
+MAXSNIPPETS  = 16384
+
+## Utilities ###################################################################
+
+# Given an indexstore
+# Returns the version of the index; a tuple of the generation and checksum of
+# its manifest, or None if the indexstore has no manifest
+def index_version(indexstore):
+
+    manifest = Manifest(indexstore)
+
+    if (not manifest.exists()):
+        return None
+
+    return (manifest.generation,
+            file_checksum(os.path.join(indexstore, MANIFEST)))
+
+# Given a list of (sentence, processed words) tuples of a document
+# Returns a dictionary of key value pairs of every processed word of the
+# document and the bitmap of the sentences with the word
+def sentence_bitmaps(doc_sentences):
+
+    bitmaps = {}
+
+    for i in range(0, len(doc_sentences)):
+        for pword in set(doc_sentences[i][1]):
+            bitmaps[pword] = bitmaps.get(pword, 0) | (1 << i)
+
+    return bitmaps
+
+## LRU cache ###################################################################
+
+# A dictionary of bounded size that evicts the least recently used entry
+class LRUCache:
+
+    # maximum number of entries
+    capacity = 0
+
+    # ordered dictionary of entries; least recently used first
+    entries  = None
+
+    # number of lookups that found / did not find an entry
+    hits     = 0
+    misses   = 0
+
+    # reset
+    def reset(self):
+        self.capacity = 0
+        self.entries  = collections.OrderedDict()
+        self.hits     = 0
+        self.misses   = 0
+
+    # Constructor
+    # Given the maximum number of entries
+    def __init__(self, capacity_):
+
+        self.reset()
+
+        assert (capacity_ > 0)
+        self.capacity = capacity_
+
+    # Given a key
+    # Returns the value of the key, or None if the key is not in the cache
+    def get(self, key):
+
+        value = self.entries.pop(key, None)
+
+        if (value is None):
+            self.misses = self.misses + 1
+            return None
+
+        # most recently used
+        self.entries[key] = value
+        self.hits = self.hits + 1
+
+        return value
+
+    # Given a key and a value that is not None
+    # Add the key to the cache
+    def put(self, key, value):
+
+        assert (value is not None)
+
+        self.entries.pop(key, None)
+        self.entries[key] = value
+
+        while (len(self.entries) > self.capacity):
+            self.entries.popitem(last = False)
+
+    # Returns the fraction of lookups that found an entry
+    def hit_rate(self):
+
+        if (self.hits + self.misses == 0):
+            return 0.0
+
+        return float(self.hits) / float(self.hits + self.misses)
+
+## Snippet cache ###############################################################
+
+class SnippetCache:
+
+    # indexstore whose snippets are cached
+    indexstore = ""
+
+    # version of the index (refer to index_version)
+    version    = None
+
+    # LRUCache of key value pairs of (version, docid) and a tuple of the
+    # sentences and bitmaps of the document
+    documents  = None
+
+    # LRUCache of key value pairs of (version, docid, significant words, query
+    # words) and the snippet string of the document
+    snippets   = None
+
+    # reset
+    def reset(self):
+        self.indexstore = ""
+        self.version    = None
+        self.documents  = LRUCache(MAXDOCUMENTS)
+        self.snippets   = LRUCache(MAXSNIPPETS)
+
+    # Constructor
+    # Given an indexstore and optionally the maximum number of documents and
+    # snippets in the cache
+    def __init__(self, indexstore_, maxdocuments = MAXDOCUMENTS,
+                 maxsnippets = MAXSNIPPETS):
+
+        self.reset()
+
+        assert (os.path.exists(indexstore_))
+
+        self.indexstore = indexstore_
+        self.version    = index_version(indexstore_)
+        self.documents  = LRUCache(maxdocuments)
+        self.snippets   = LRUCache(maxsnippets)
+
+    ## Access methods ##########################################################
+
+    # Given a docid
+    # Returns a tuple of the sentences and bitmaps of the document, or None if
+    # the document is not in the cache
+    def document(self, docid):
+        return self.documents.get((self.version, docid))
+
+    # Given a docid and a list of (sentence, processed words) tuples of the
+    # document
+    # Add the document to the cache and return its (sentences, bitmaps)
+    def add_document(self, docid, doc_sentences):
+
+        entry = (doc_sentences, sentence_bitmaps(doc_sentences))
+        self.documents.put((self.version, docid), entry)
+
+        return entry
+
+    # Given a docid, a list of significant words and a list of query words
+    # Returns the snippet string of the document, or None if it is not in the
+    # cache
+    def snippet(self, docid, sig_words, query_words):
+        return self.snippets.get(self.snippet_key(docid, sig_words, query_words))
+
+    # Given a docid, a list of significant words, a list of query words and
+    # the snippet string of the document
+    # Add the snippet to the cache
+    def add_snippet(self, docid, sig_words, query_words, snippet_str):
+        self.snippets.put(self.snippet_key(docid, sig_words, query_words),
+                          snippet_str)
+
+    # Given a docid, a list of significant words and a list of query words
+    # Returns the key of the snippet of the document
+    def snippet_key(self, docid, sig_words, query_words):
+        return (self.version, docid, frozenset(sig_words), frozenset(query_words))
+
+    # Returns a string reporting the hit rates of the cache
+    def report(self):
+        return "Snippet cache hit rates : documents %.1f%% (%d/%d), snippets %.1f%% (%d/%d)" % \
+               (100.0 * self.documents.hit_rate(), self.documents.hits,
+                self.documents.hits + self.documents.misses,
+                100.0 * self.snippets.hit_rate(), self.snippets.hits,
+                self.snippets.hits + self.snippets.misses)
+
+    ## Cache read/write methods ################################################
+
+    # Given the path to a cache file
+    # Add the entries of the file of the same indexstore and index version to
+    # the cache. Nothing is read if the file does not exist
+    def read(self, cachefile):
+
+        if (self.version is None or not os.path.exists(cachefile)):
+            return
+
+        with open(cachefile, "rb") as f:
+            data = cPickle.load(f)
+
+        if (data["indexstore"] != os.path.abspath(self.indexstore) or
+            data["version"] != self.version):
+            return
+
+        # least recently used first
+        for (key, value) in data["documents"]:
+            self.documents.put(key, value)
+        for (key, value) in data["snippets"]:
+            self.snippets.put(key, value)
+
+    # Given the path to a cache file
+    # Store the cache to the file through a temporary file. Nothing is stored
+    # if the indexstore has no index version
+    def store(self, cachefile):
+
+        if (self.version is None):
+            return
+
+        data = {"indexstore" : os.path.abspath(self.indexstore),
+                "version"    : self.version,
+                "documents"  : self.documents.entries.items(),
+                "snippets"   : self.snippets.entries.items()}
+
+        with open(cachefile + TMPEXTN, "wb") as f:
+            cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(cachefile + TMPEXTN, cachefile)
+
+################################################################################
@@ -10,6 +10,7 @@ from index             import Index
 from global_statistics import GlobalStatistics, GSFILE
 from stopping          import Stopping
 from text_processing   import is_numeric
+from forward_index     import ForwardIndex
 
 import os
 import math
@@ -38,19 +39,41 @@ class SnippetLM:
     # inverted index
     invidx       = None
 
+    # forward index
+    fwdidx       = None
+
     # global statistics
     global_stats = None
 
     # document ID mapper
     docid_map    = None
 
+    # dictionary of key value pairs of term and its frequency in the corpus;
+    # read once, when first needed
+    cf_table     = None
+
+    # dictionaries of key value pairs of docid and a dictionary of key value
+    # pairs of every indexed term of the document and P(term|D), and log of
+    # P(term|D). Computed once per document
+    doc_probs    = None
+    doc_logprobs = None
+
+    # dictionary of key value pairs of (query terms, top RQ docids) and the
+    # significant words of the query
+    sig_words_cache = None
+
     # reset
     def reset(self):
         self.indexstore   = None
         self.stopfile     = None
         self.invidx       = None
+        self.fwdidx       = None
         self.global_stats = None
         self.docid_map    = None
+        self.cf_table     = None
+        self.doc_probs    = {}
+        self.doc_logprobs = {}
+        self.sig_words_cache = {}
 
     # constructor
     def __init__(self, indexstore_, stopfile_ = ""):
@@ -70,48 +93,133 @@ class SnippetLM:
         # create index
         self.invidx     = Index(self.indexstore)
 
+        # create forward index
+        self.fwdidx     = ForwardIndex(self.indexstore)
+
         # create global statistics
         self.global_stats = GlobalStatistics(os.path.join(self.indexstore, GSFILE))
 
         # create a docid mapper
         self.docid_map = DocIDMapper().read(self.indexstore)
 
-    ##
-    # Given a string, word, that must have been indexed and
-    #       the document id, docid, of the document of interest, and
-    # Return the probability of the word appearing in the document
-    def p_word_given_document(self, word, docid):
+    ## Relevance model probabilities ###########################################
+    #
+    # We need the following to compute the probability of a word given a
+    # document,
+    # 1. frequency of the word in the document
+    # 2. total number of words in the document
+    # 3. frequency of the word in the corpus (background model)
+    # 4. total number of words in the corpus (background model)
+    #
+    # The probabilities of all the words of a document are computed at once,
+    # from the term vector of the document (refer to forward_index.py) and the
+    # corpus frequency table. A word that is not in a document has the
+    # background probability in the document
 
-        assert (self.invidx.contains_term(word))
+    # Returns a dictionary of key value pairs of every indexed term and its
+    # frequency in the corpus
+    def corpus_frequencies(self):
 
-        # get the document's posting for the word
-        word_docid_posting = self.invidx.document_posting(word, docid)
+        if (self.cf_table is None):
+            self.cf_table = self.invidx.term_frequencies()
 
-        # we need the following,
-        # 1. frequency of the word in the document
-        # 2. total number of words in the document
-        # 3. frequency of the word in the corpus (background model)
-        # 4. total number of words in the corpus (background model)
+        return self.cf_table
 
-        # 1. frequency of the word in the document
-        f_w_d  = 0 if word_docid_posting is None else word_docid_posting.tf
+    # Given a docid
+    # Returns a dictionary of key value pairs of term and the frequency of the
+    # term in the document
+    def document_tfs(self, docid):
 
-        # 2. total number of words in the document
-        dl = self.global_stats.document_length(docid)
+        # term vector of the document from the forward index, if the index has
+        # one
+        if (self.fwdidx.contains_document(docid)):
+            return self.fwdidx.term_vector(docid)
 
-        # 3. frequency of the word in the corpus
-        f_w_c = self.invidx.corpus_frequency(word)
+        # count the words of the corpusfile
+        cfpath = DocIDMapper().corpusfpath(docid, self.docid_map)
+
+        tfs = {}
+        for w in CorpusRW().corpus_content(cfpath).split(" "):
+            tfs[w] = tfs.get(w, 0) + 1
+
+        return tfs
+
+    # Given a docid
+    # Returns a dictionary of key value pairs of every indexed term of the
+    # document and the probability of the term appearing in the document
+    def document_probabilities(self, docid):
+
+        if (self.doc_probs.get(docid) is None):
+
+            cf_table = self.corpus_frequencies()
+
+            # 2. total number of words in the document
+            dl = self.global_stats.document_length(docid)
+            # 4. total number of words in the corpus
+            cl = self.global_stats.get_N()
+
+            # sanity check
+            assert (dl > 0)
+            assert (cl > 0)
+
+            probs = {}
+
+            # 1. frequency of the word in the document
+            for (word, f_w_d) in self.document_tfs(docid).items():
+
+                # 3. frequency of the word in the corpus
+                f_w_c = cf_table.get(word)
+                if (f_w_c is None):
+                    continue
+
+                probs[word] = (float(1.0 - LAMBDA) * (float(f_w_d) / float(dl))) + \
+                                    (float(LAMBDA) * (float(f_w_c) / float(cl)))
 
+            self.doc_probs[docid] = probs
+
+        return self.doc_probs[docid]
+
+    # Given a docid
+    # Returns a dictionary of key value pairs of every indexed term of the
+    # document and the log of the probability of the term appearing in the
+    # document
+    def document_logprobabilities(self, docid):
+
+        if (self.doc_logprobs.get(docid) is None):
+            logprobs = {}
+            for (word, p) in self.document_probabilities(docid).items():
+                logprobs[word] = math.log(p)
+            self.doc_logprobs[docid] = logprobs
+
+        return self.doc_logprobs[docid]
+
+    # Given a string, word, that must have been indexed
+    # Return the probability of the word appearing in a document that does not
+    # have the word
+    def background_probability(self, word):
+
+        # 3. frequency of the word in the corpus
+        f_w_c = self.corpus_frequencies().get(word)
         # 4. total number of words in the corpus
         cl = self.global_stats.get_N()
 
         # sanity check
-        assert (dl    > 0)
+        assert (f_w_c is not None) # the index must contain the word
+        assert (f_w_c > 0)
         assert (cl    > 0)
-        assert (f_w_c > 0) # cos we know that the index contains the term
 
-        p = (float(1.0 - LAMBDA) * (float(f_w_d) / float(dl))) + \
-                  (float(LAMBDA) * (float(f_w_c) / float(cl)))
+        return (float(LAMBDA) * (float(f_w_c) / float(cl)))
+
+    ##
+    # Given a string, word, that must have been indexed and
+    #       the document id, docid, of the document of interest, and
+    # Return the probability of the word appearing in the document
+    def p_word_given_document(self, word, docid):
+
+        p = self.document_probabilities(docid).get(word)
+
+        if (p is None):
+            return self.background_probability(word)
 
         return p
 
@@ -142,17 +250,17 @@ class SnippetLM:
         # filter query terms that appear in the inverted index
         query_terms = filter(lambda qt: self.invidx.contains_term(qt), query_terms)
 
+        # docids of the top RQ documents
+        docids = map(lambda rd: rd.docid, ranked_docs[:RQ])
+
         # We know what all relevant documents are. and we know all the query terms
         # We can straight away calculate the
         #   n
         #  SUM log(P(qi|D)),  for all the top RQ documents
         #  i=1
         #
-        p_q_d_dict = {}
-        for i in range(0, min(RQ, len(ranked_docs))):
-
-            # get docid
-            docid = ranked_docs[i].docid
+        p_q_d_lst = []
+        for docid in docids:
 
             # Compute all P(qi|D)
             p_qi_d = map(lambda q: self.p_word_given_document(q, docid), query_terms)
@@ -160,7 +268,10 @@ class SnippetLM:
             p_q_d = reduce(lambda x, y: x + math.log(y), p_qi_d)
 
             # record score
-            p_q_d_dict[docid] = p_q_d
+            p_q_d_lst.append(float(p_q_d))
+
+        # log(P(W|D)) of the words of every top RQ document
+        doc_logprobs = map(self.document_logprobabilities, docids)
 
         # Compute log(P(W|D)) and add it to second part of the sum in the formula.
         # Computed above for all words
@@ -168,16 +279,20 @@ class SnippetLM:
 
             w_score = 0
 
-            # for all top RQ documents
-            for i in range(0, min(RQ, len(ranked_docs))):
+            # log(P(W|D)) of the documents without the word
+            bg_logprob = None
 
-                # get document id of the ith document
-                docid = ranked_docs[i].docid
+            # for all top RQ documents
+            for i in range(0, len(docids)):
 
                 # Get prob. of the word given document (left term in formula)
-                p_w_d = math.log(self.p_word_given_document(w, docid))
+                p_w_d = doc_logprobs[i].get(w)
+                if (p_w_d is None):
+                    if (bg_logprob is None):
+                        bg_logprob = math.log(self.background_probability(w))
+                    p_w_d = bg_logprob
 
-                w_score = w_score + float(p_w_d) + float(p_q_d_dict[docid])
+                w_score = w_score + p_w_d + p_q_d_lst[i]
 
             # record score
             word_score_tuple.append((w, w_score))
@@ -220,6 +335,11 @@ class SnippetLM:
             # get document ID of the ith ranked document
             docid = ranked_docs[i].docid
 
+            # words of the document from the forward index, if the index has one
+            if (self.fwdidx.contains_document(docid)):
+                words = words + self.fwdidx.document_terms(docid)
+                continue
+
             # get path to the ith ranked document/corpusfile
             cfpath = DocIDMapper().corpusfpath(docid, self.docid_map)
 
@@ -250,6 +370,12 @@ class SnippetLM:
             # nothing to do
             return query_terms
 
+        # the significant words depend on the query terms and the top RQ
+        # documents only; queries of a run often share them
+        key = (tuple(query_terms), tuple(map(lambda rd: rd.docid, ranked_docs[:RQ])))
+        if (self.sig_words_cache.get(key) is not None):
+            return list(self.sig_words_cache[key])
+
         # we have everything to do!!
 
         # get set of words in relavant documents
@@ -294,4 +420,6 @@ class SnippetLM:
             if (w not in sig_words):
                 sig_words.append(w)
 
+        self.sig_words_cache[key] = list(sig_words)
+
         return sig_words
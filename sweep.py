@@ -0,0 +1,303 @@
+## This program sweeps a grid of BM25 or QLM parameters; it reads the index once,
+#  evaluates the rankings of every setting (refer to parameter_sweep.py and
+#  eval_engine.py) and reports the best settings
+
+from parameter_sweep import ParameterSweep, SWEEP_MODELS, grid_values, \
+                            grid_settings, sweep
+from eval_engine     import Qrels, METRICS
+from query           import queries
+from global_statistics import GSFILE
+from shards          import is_sharded
+
+import argparse
+import csv
+import multiprocessing
+import os
+from   argparse import RawTextHelpFormatter
+
+## Help strings ################################################################
+
+program_help = '''
+
+    sweep.py evaluates a retrieval model for every setting of a grid of its
+    parameters and prints the best settings. The index is read and the postings
+    of the queries are looked up once for all settings, and the rankings of
+    every setting are evaluated without writing runs
+
+    Argument 1: indexstore    - Path to the indexstore (not sharded)
+
+    Argument 2: queryfile     - Path to a file of lines of space separated
+                                query ID and query
+
+    Argument 3: relevancefile - Path to the cacm relevance file
+
+    Argument 4: model         - Retrieval model to sweep,
+                                "bm25" sweeps k1 and b
+                                "qlm"  sweeps lambda
+
+    Argument 5: k1, b, lambda - Grids of the parameters; a comma separated list
+                                of values or a range "start:stop:step" with
+                                stop included
+
+    Argument 6: metric        - Metric the settings are ranked by (refer to
+                                eval_engine.py). Defaults to map
+
+    Argument 7: top           - Number of best settings to print. Defaults to
+                                10
+
+    Argument 8: workers       - Number of processes that evaluate settings in
+                                parallel. 0 uses every core. Defaults to 1
+
+    Argument 9: outputfile    - Path to a CSV file to write the mean metrics of
+                                all settings to. This argument is optional
+
+    EXAMPLES:
+
+        python sweep.py --indexstore=./cacm.index --queryfile=./queries.txt --relevancefile=./cacm/cacm.rel.txt --model=bm25 --k1=0.1:4.0:0.1 --b=0.0:1.0:0.04 --workers=0
+        python sweep.py --indexstore=./cacm.index --queryfile=./queries.txt --relevancefile=./cacm/cacm.rel.txt --model=qlm --lambda=0.05:0.95:0.05 --metric=ndcg@10
+  '''
+
+indexstore_help = '''
+    Path to the indexstore
+    '''
+
+queryfile_help = '''
+    Path to a file of lines of space separated query ID and query
+    '''
+
+relevancefile_help = '''
+    Path to the cacm relevance file
+    '''
+
+model_help = '''
+    Retrieval model to sweep; "bm25" or "qlm"
+    '''
+
+k1_help = '''
+    Grid of the BM25 parameter k1. Defaults to 0.1:3.0:0.1
+    '''
+
+b_help = '''
+    Grid of the BM25 parameter b. Defaults to 0.0:1.0:0.05
+    '''
+
+k2_help = '''
+    BM25 parameter k2; not swept. Defaults to 100
+    '''
+
+lambda_help = '''
+    Grid of the QLM parameter lambda; values in (0, 1]. Defaults to
+    0.05:1.0:0.05
+    '''
+
+metric_help = '''
+    Metric the settings are ranked by. One of
+    ''' + ", ".join(METRICS) + '''. Defaults to map
+    '''
+
+top_help = '''
+    Number of best settings to print. Defaults to 10
+    '''
+
+workers_help = '''
+    Number of processes that evaluate settings in parallel. 0 uses every core.
+    Defaults to 1
+    '''
+
+outputfile_help = '''
+    Path to a CSV file to write the mean metrics of all settings to. If the
+    outputfile already exists, it is deleted. This argument is optional
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--indexstore",
+                       metavar  = "i",
+                       required = True,
+                       type     = str,
+                       help     = indexstore_help)
+
+argparser.add_argument("--queryfile",
+                       metavar  = "q",
+                       required = True,
+                       type     = str,
+                       help     = queryfile_help)
+
+argparser.add_argument("--relevancefile",
+                       metavar  = "rl",
+                       required = True,
+                       type     = str,
+                       help     = relevancefile_help)
+
+argparser.add_argument("--model",
+                       metavar  = "m",
+                       required = True,
+                       type     = str,
+                       help     = model_help)
+
+argparser.add_argument("--k1",
+                       metavar  = "k1",
+                       type     = str,
+                       default  = "0.1:3.0:0.1",
+                       help     = k1_help)
+
+argparser.add_argument("--b",
+                       metavar  = "b",
+                       type     = str,
+                       default  = "0.0:1.0:0.05",
+                       help     = b_help)
+
+argparser.add_argument("--k2",
+                       metavar  = "k2",
+                       type     = float,
+                       default  = 100,
+                       help     = k2_help)
+
+argparser.add_argument("--lambda",
+                       metavar  = "l",
+                       type     = str,
+                       default  = "0.05:1.0:0.05",
+                       help     = lambda_help)
+
+argparser.add_argument("--metric",
+                       metavar  = "mt",
+                       type     = str,
+                       default  = "map",
+                       help     = metric_help)
+
+argparser.add_argument("--top",
+                       metavar  = "t",
+                       type     = int,
+                       default  = 10,
+                       help     = top_help)
+
+argparser.add_argument("--workers",
+                       metavar  = "w",
+                       type     = int,
+                       default  = 1,
+                       help     = workers_help)
+
+argparser.add_argument("--outputfile",
+                       metavar  = "o",
+                       type     = str,
+                       default  = "",
+                       help     = outputfile_help)
+
+## Output ######################################################################
+
+# Given a retrieval model, a list of (setting, mean metrics) tuples, the metric
+# the settings are ranked by and the number of settings to print
+# Print the best settings with all their mean metrics
+def print_best(model, results, metric, top):
+
+    params = SWEEP_MODELS[model]
+
+    # best first; the first setting of the grid among equal ones
+    ranked = sorted(results, key = lambda sm: sm[1][metric], reverse = True)
+
+    print "Best settings of", model, "by", metric, "of", len(results), "settings,"
+    print "  ".join(map(lambda p: "%8s" % p, params)) + "  " + \
+          "  ".join(map(lambda m: "%8s" % m, METRICS))
+
+    for (setting, means) in ranked[:top]:
+        print "  ".join(map(lambda p: "%8.4f" % setting[p], params)) + "  " + \
+              "  ".join(map(lambda m: "%8.4f" % means[m], METRICS))
+
+# Given a retrieval model, a list of (setting, mean metrics) tuples and the
+# path to a CSV file
+# Write the mean metrics of all settings to the file; one row per setting
+def write_csv(model, results, outputfile):
+
+    params = SWEEP_MODELS[model]
+
+    with open(outputfile, "wb") as f:
+
+        writer = csv.writer(f)
+        writer.writerow(params + METRICS)
+
+        for (setting, means) in results:
+            writer.writerow(map(lambda p: "%g" % setting[p], params) +
+                            map(lambda m: "%.4f" % means[m], METRICS))
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+indexstore    = args['indexstore']
+queryfile     = args['queryfile']
+relevancefile = args['relevancefile']
+model         = args['model']
+k2            = args['k2']
+metric        = args['metric']
+top           = args['top']
+workers       = args['workers']
+outputfile    = args['outputfile']
+
+## Input check
+if (not os.path.exists(os.path.join(indexstore, GSFILE))):
+    print "FATAL: Cannot find indexstore, ", indexstore
+    exit (-1)
+if (is_sharded(indexstore)):
+    print "FATAL: Sharded indexstores cannot be swept, ", indexstore
+    exit (-1)
+if (not os.path.exists(queryfile)):
+    print "FATAL: Cannot find queryfile, ", queryfile
+    exit (-1)
+if (not os.path.exists(relevancefile)):
+    print "FATAL: Cannot find cacm relevance file, ", relevancefile
+    exit (-1)
+if (model not in SWEEP_MODELS):
+    print "FATAL: model should be one of ", SWEEP_MODELS.keys()
+    exit(-1)
+if (metric not in METRICS):
+    print "FATAL: metric should be one of ", METRICS
+    exit(-1)
+if (top <= 0):
+    print "FATAL: top should be > 0"
+    exit(-1)
+if (workers < 0):
+    print "FATAL: workers should be >= 0"
+    exit(-1)
+if (workers == 0):
+    workers = multiprocessing.cpu_count()
+
+# grids of the parameters of the model
+values = {}
+for param in SWEEP_MODELS[model]:
+    try:
+        values[param] = grid_values(args[param])
+    except (ValueError, AssertionError):
+        print "FATAL: Cannot read grid of", param, ",", args[param]
+        exit(-1)
+
+if (model == "bm25" and (min(values["k1"]) < 0.0 or min(values["b"]) < 0.0 or
+                         max(values["b"]) > 1.0)):
+    print "FATAL: k1 should be >= 0 and b in [0, 1]"
+    exit(-1)
+if (model == "qlm" and (min(values["lambda"]) <= 0.0 or
+                        max(values["lambda"]) > 1.0)):
+    print "FATAL: lambda should be in (0, 1]"
+    exit(-1)
+
+if (outputfile != "" and os.path.exists(outputfile)):
+    print "WARNING: Deleting existing outputfile"
+    os.remove(outputfile)
+
+qrels    = Qrels(relevancefile)
+settings = grid_settings(model, values)
+
+# only queries with judgements count in the evaluation
+parameter_sweep = ParameterSweep(indexstore, queries(queryfile),
+                                 set(qrels.qids()), k2)
+
+results = sweep(parameter_sweep, qrels, model, settings, workers)
+
+print_best(model, results, metric, top)
+
+if (outputfile != ""):
+    write_csv(model, results, outputfile)
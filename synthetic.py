@@ -0,0 +1,371 @@
+## This file provides the synthetic corpus generator; corpora of any size in the
+#  format of the cacm corpus, with queries and relevance judgements, for scaling
+#  tests and benchmarks (refer to gen_synthetic.py and bench/bench.py)
+#
+# A synthetic document has the layout of a cacm document; a title, an abstract
+# of sentences, the "CACM <month>, <year>" line, authors and citation lines.
+# Words are drawn from a vocabulary of pronounceable made up words with Zipfian
+# frequencies; the word of rank r is drawn with probability proportional to
+# 1 / r^s. Document lengths, in words of the processed document, follow a
+# lognormal, uniform or constant distribution of a given mean.
+#
+# Queries are a few words of the middle ranks of the vocabulary. Every query has
+# a handful of relevant documents; about half of the query words are planted in
+# the abstract of every relevant document, so that retrieval models can find
+# most of them.
+#
+# Documents are generated one at a time from a single seeded random generator,
+# and written as they are generated; the same parameters and seed generate the
+# same corpus. Documents can be written as
+#   docstore    - CACM-XXXX.html files, as in cacm/cacm_docs (refer to corpus.py)
+#   corpusstore - the corpusstore corpus.py creates of the docstore; corpus
+#                 files, docid map and sentence store, without parsing and text
+#                 processing every document
+
+from cacm_parser    import CACM_FILE_PREFIX, CACM_FILE_SUFFIX
+from corpus_rw      import CorpusRW, corpus_filename
+from docid_mapper   import DOCIDMAPPER
+from sentence_store import SentenceStoreWriter, document_sentences
+
+import bisect
+import math
+import os
+import random
+
+## Globals #####################################################################
+
+# Default size of the vocabulary and exponent of its Zipfian distribution
+VOCABULARY   = 100000
+ZIPFEXPONENT = 1.0
+
+# Document length distributions. The default mean is the one of cacm; the
+# spread is the sigma of the lognormal distribution and the relative half
+# width of the uniform distribution
+LENGTHDISTRIBUTIONS = ["lognormal", "uniform", "constant"]
+MEANLENGTH          = 118
+LENGTHSPREAD        = 0.8
+
+# Default number of queries, words per query and relevant documents per query
+QUERIES      = 64
+QUERYWORDS   = (3, 6)
+RELEVANT     = (5, 30)
+
+# Ranks of the vocabulary query words are drawn from
+QUERYRANKS   = (20, 2000)
+
+# Probability that a query word is planted in a relevant document and the times
+# it is planted
+PLANTPROB    = 0.5
+PLANTS       = (1, 2)
+
+# Words per title and sentence, authors and citations per document
+TITLEWORDS    = (3, 10)
+SENTENCEWORDS = (6, 24)
+AUTHORS       = (1, 3)
+CITATIONS     = (0, 8)
+
+# Made up words are sequences of these syllables
+CONSONANTS = "bcdfghjklmnprstvwz"
+VOWELS     = "aeiou"
+SYLLABLES  = [c + v for c in CONSONANTS for v in VOWELS]
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+YEARS  = (1958, 1982)
+
+## Utilities ###################################################################
+
+# Given the rank of a word in the vocabulary, from 0
+# Returns the made up word of the rank. Frequent words are short
+def vocabulary_word(rank):
+
+    syllables = []
+
+    rank = rank + 1
+    while (rank > 0):
+        syllables.append(SYLLABLES[rank % len(SYLLABLES)])
+        rank = rank / len(SYLLABLES)
+
+    return "".join(syllables)
+
+# Given a docid and the number of documents of the corpus
+# Returns the cacm document file name of the docid; "CACM-XXXX.html" with
+# enough digits that the names of the corpus sort in docid order
+def document_filename(docid, documents):
+
+    digits = max(4, len(str(documents)))
+
+    return CACM_FILE_PREFIX + "-" + str(docid).zfill(digits) + CACM_FILE_SUFFIX
+
+## Zipf sampler ################################################################
+
+# Draws the words of a vocabulary with Zipfian frequencies
+class ZipfSampler:
+
+    # list of words of the vocabulary by rank
+    words = []
+
+    # cumulative weights of the ranks
+    cdf   = []
+
+    # reset
+    def reset(self):
+        self.words = []
+        self.cdf   = []
+
+    # Constructor
+    # Given the size of the vocabulary and the exponent of the distribution
+    def __init__(self, vocabulary_, exponent_):
+
+        self.reset()
+
+        assert (vocabulary_ > 0)
+
+        self.words = map(vocabulary_word, range(0, vocabulary_))
+
+        total = 0.0
+        for r in range(1, vocabulary_ + 1):
+            total = total + 1.0 / math.pow(r, exponent_)
+            self.cdf.append(total)
+
+    # Given a random generator and a number of words
+    # Returns a list of words drawn from the vocabulary
+    def sample(self, rng, count):
+
+        words = self.words
+        cdf   = self.cdf
+        total = cdf[-1]
+        last  = len(cdf) - 1
+
+        return [words[min(bisect.bisect_right(cdf, rng.random() * total), last)]
+                for i in range(0, count)]
+
+## Synthetic corpus ############################################################
+
+class SyntheticCorpus:
+
+    # number of documents
+    documents    = 0
+
+    # ZipfSampler of the vocabulary
+    sampler      = None
+
+    # document length distribution, mean and spread
+    distribution = "lognormal"
+    meanlength   = MEANLENGTH
+    spread       = LENGTHSPREAD
+
+    # random generator
+    rng          = None
+
+    # list of (qid, list of query words) of the queries
+    queries      = []
+
+    # dictionary of key value pairs of qid and the sorted list of docids of the
+    # relevant documents of the query
+    relevant     = {}
+
+    # dictionary of key value pairs of docid and the list of qids the document
+    # is relevant for
+    planted      = {}
+
+    # reset
+    def reset(self):
+        self.documents    = 0
+        self.sampler      = None
+        self.distribution = "lognormal"
+        self.meanlength   = MEANLENGTH
+        self.spread       = LENGTHSPREAD
+        self.rng          = None
+        self.queries      = []
+        self.relevant     = {}
+        self.planted      = {}
+
+    # Constructor
+    # Given the number of documents and optionally the size and Zipf exponent
+    # of the vocabulary, the document length distribution, its mean and spread,
+    # the number of queries and the seed of the random generator
+    def __init__(self, documents_, vocabulary = VOCABULARY,
+                 exponent = ZIPFEXPONENT, distribution_ = "lognormal",
+                 meanlength_ = MEANLENGTH, spread_ = LENGTHSPREAD,
+                 queries = QUERIES, seed = 0):
+
+        self.reset()
+
+        assert (documents_ > 0)
+        assert (distribution_ in LENGTHDISTRIBUTIONS)
+        assert (meanlength_ >= 1)
+
+        self.documents    = documents_
+        self.sampler      = ZipfSampler(vocabulary, exponent)
+        self.distribution = distribution_
+        self.meanlength   = meanlength_
+        self.spread       = spread_
+        self.rng          = random.Random(seed)
+
+        self.generate_queries(queries)
+
+    ## Generation methods ######################################################
+
+    # Given the number of queries
+    # Generate the queries and choose their relevant documents
+    def generate_queries(self, count):
+
+        vocabulary = len(self.sampler.words)
+        low        = min(QUERYRANKS[0], vocabulary - 1)
+        high       = min(QUERYRANKS[1], vocabulary)
+
+        for qid in range(1, count + 1):
+
+            nwords = self.rng.randint(QUERYWORDS[0], QUERYWORDS[1])
+            words  = map(lambda i: self.sampler.words[self.rng.randrange(low, high)],
+                         range(0, nwords))
+
+            nrelevant = min(self.rng.randint(RELEVANT[0], RELEVANT[1]),
+                            self.documents)
+            docids    = sorted(self.rng.sample(xrange(1, self.documents + 1),
+                                               nrelevant))
+
+            self.queries.append((qid, words))
+            self.relevant[qid] = docids
+            for docid in docids:
+                self.planted.setdefault(docid, []).append(qid)
+
+    # Returns the length of the next document in words, as drawn from the
+    # length distribution
+    def document_length(self):
+
+        if (self.distribution == "lognormal"):
+            mu = math.log(self.meanlength) - self.spread * self.spread / 2.0
+            return max(1, int(round(self.rng.lognormvariate(mu, self.spread))))
+
+        if (self.distribution == "uniform"):
+            low  = self.meanlength * (1.0 - self.spread)
+            high = self.meanlength * (1.0 + self.spread)
+            return max(1, int(round(self.rng.uniform(low, high))))
+
+        return int(self.meanlength)
+
+    # Given a docid
+    # Returns a tuple of the contents of the document; the text of its <pre>
+    # tag, and the list of words of the processed document (refer to
+    # text_processing.process_text)
+    def document(self, docid):
+
+        rng    = self.rng
+        length = self.document_length()
+
+        # parts of the document
+        ntitle     = min(rng.randint(TITLEWORDS[0], TITLEWORDS[1]), length)
+        nauthors   = rng.randint(AUTHORS[0], AUTHORS[1])
+        ncitations = rng.randint(CITATIONS[0], CITATIONS[1])
+        nabstract  = max(0, length - ntitle - 3 - 2 * nauthors - 3 * ncitations)
+
+        title    = self.sampler.sample(rng, ntitle)
+        abstract = self.sampler.sample(rng, nabstract)
+
+        # words of the queries the document is relevant for
+        for qid in self.planted.get(docid, []):
+            for word in self.queries[qid - 1][1]:
+                if (rng.random() >= PLANTPROB):
+                    continue
+                for p in range(0, rng.randint(PLANTS[0], PLANTS[1])):
+                    abstract.insert(rng.randint(0, len(abstract)), word)
+
+        month   = MONTHS[rng.randrange(0, len(MONTHS))]
+        year    = str(rng.randint(YEARS[0], YEARS[1]))
+        authors = map(lambda i: (self.sampler.sample(rng, 1)[0],
+                                 chr(ord("A") + rng.randrange(0, 26))),
+                      range(0, nauthors))
+        cited   = map(lambda i: str(rng.randint(1, self.documents)),
+                      range(0, ncitations))
+
+        # abstract sentences
+        sentences = []
+        i = 0
+        while (i < len(abstract)):
+            n = rng.randint(SENTENCEWORDS[0], SENTENCEWORDS[1])
+            sentence = abstract[i : i + n]
+            sentences.append(" ".join([sentence[0].capitalize()] + sentence[1:]) + ".")
+            i = i + n
+
+        text = "\n\n\n" + " ".join(title).capitalize() + "\n\n" + \
+               "\n".join(sentences) + "\n\n" + \
+               "CACM " + month + ", " + year + "\n\n" + \
+               "".join(map(lambda a: a[0].capitalize() + ", " + a[1] + ".\n",
+                           authors)) + "\n" + \
+               "".join(map(lambda c: c + "\t5\t" + str(docid) + "\n", cited))
+
+        words = title + abstract + ["cacm", month.lower(), year] + \
+                reduce(lambda w, a: w + [a[0], a[1].lower()], authors, []) + \
+                reduce(lambda w, c: w + [c, "5", str(docid)], cited, [])
+
+        return (text, words)
+
+    ## Write methods ###########################################################
+
+    # Given the path to a docstore, the path to a corpusstore or "" to not
+    # write one, whether to write the documents to the docstore; the docid map
+    # of the corpusstore names the documents of the docstore either way, and
+    # optionally a function called with every docid written
+    # Generate all documents and write them to the docstore and corpusstore
+    def write_documents(self, docstore, corpusstore, docs = True,
+                        progress = None):
+
+        if (docs and not os.path.exists(docstore)):
+            os.makedirs(docstore)
+        if (corpusstore != "" and not os.path.exists(corpusstore)):
+            os.makedirs(corpusstore)
+
+        if (corpusstore != ""):
+            docidmapf = open(os.path.join(corpusstore, DOCIDMAPPER), "w+")
+            sentences = SentenceStoreWriter(corpusstore)
+            processed = {}
+
+        for docid in range(1, self.documents + 1):
+
+            (text, words) = self.document(docid)
+            docfname      = document_filename(docid, self.documents)
+
+            if (docs):
+                with open(os.path.join(docstore, docfname), "w+") as f:
+                    f.write("<html>\n<pre>" + text + "</pre>\n</html>\n")
+
+            if (corpusstore != ""):
+                CorpusRW().store_corpus(" ".join(words), corpus_filename(docfname),
+                                        corpusstore)
+
+                # docid map and sentence store as corpus.py writes them
+                docidmapf.write(str(docid) + " , " +
+                                os.path.join(corpusstore, corpus_filename(docfname)) +
+                                " , " + os.path.join(docstore, docfname) + "\n")
+                sentences.add(docid, document_sentences(text, processed))
+
+            if (progress is not None):
+                progress(docid)
+
+        if (corpusstore != ""):
+            docidmapf.close()
+            sentences.close()
+
+    # Given the path to a query file
+    # Write the queries in the format of the cacm query file
+    def write_queries(self, queryfile):
+
+        with open(queryfile, "w+") as f:
+            for (qid, words) in self.queries:
+                f.write("<DOC>\n<DOCNO> " + str(qid) + " </DOCNO>\n\n\n " +
+                        " ".join(words) + "\n\n \n</DOC>\n")
+
+    # Given the path to a relevance file
+    # Write the relevance judgements in the format of the cacm relevance file
+    def write_relevance(self, relevancefile):
+
+        with open(relevancefile, "w+") as f:
+            for (qid, words) in self.queries:
+                for docid in self.relevant[qid]:
+                    f.write(str(qid) + " Q0 " +
+                            document_filename(docid, self.documents)[:-len(CACM_FILE_SUFFIX)] +
+                            " 1\n")
+
+################################################################################
@@ -1,9 +1,10 @@
 # This file implements the tf.idf retreival model
 
-from index             import Index
+from index             import Index, VERIFY_OFF, VERIFY_FULL
 from query             import Query
 from result_set        import Result, ResultSet, DocumentScore
 from global_statistics import GlobalStatistics
+from tracing           import span, count
 
 import math
 import os
@@ -19,16 +20,20 @@ class TFIDF:
     ## Inverted index
     invidx       = None
 
+    ## Verification level (refer to index.py)
+    verify       = VERIFY_OFF
+
     # tf.idf parameters
     # lambda ?
 
     ## Constructor
     # Given an indexstore where the index file is stored by (indexer.py)
-    #       and a global statistics file path
+    #       and a global statistics file path, and
+    #       optionally a verification level (refer to index.py)
     #
     # Initializes the tf.idf model
     #
-    def __init__(self, indexstore, gsfile):
+    def __init__(self, indexstore, gsfile, verify_ = VERIFY_OFF):
 
         # reset
         self.reset()
@@ -39,10 +44,11 @@ class TFIDF:
             return
 
         # Get index
-        self.invidx = Index(indexstore)
+        self.verify = verify_
+        self.invidx = Index(indexstore, verify = verify_)
 
         # Get global statistics
-        self.global_stats = GlobalStatistics(gsfile)
+        self.global_stats = GlobalStatistics(gsfile, verify_)
 
         # Initialize parameters
         # lambda
@@ -56,6 +62,9 @@ class TFIDF:
         ## Inverted index
         self.invidx       = None
 
+        ## Verification level
+        self.verify       = VERIFY_OFF
+
         ## Initialize parameters
         # lambda = ?
 
@@ -72,7 +81,8 @@ class TFIDF:
         # for every query
         for query in queries:
             # search query in index
-            resultset = self.search_query(self.invidx, query)
+            with span("tfidf.query", qid = query.qid):
+                resultset = self.search_query(self.invidx, query)
             # store result
             results.append(resultset)
 
@@ -88,43 +98,52 @@ class TFIDF:
 
         # TODO: For now we know that query terms are split by spaces.
         #       going forward generalize this
-        query_terms = query.querystr.split(" ")
+        with span("tfidf.parse"):
+            query_terms = query.querystr.split(" ")
 
-        # filter query terms not appearing in index
-        query_terms = filter(lambda qt: invidx.contains_term(qt), query_terms)
+            # filter query terms not appearing in index
+            query_terms = filter(lambda qt: invidx.contains_term(qt), query_terms)
 
-        # Create a query-termfreqency dictionary. This will remove duplicate
-        query_tf_dict = self.termfrequency(query_terms)
+            # Create a query-termfreqency dictionary. This will remove duplicate
+            query_tf_dict = self.termfrequency(query_terms)
 
         # Get a dictionary of related invlists with key value pairs (term, postings)
         # This is in essence a mini-index
         mini_index    = self.invidx.minindex(query_terms)
 
-        # Get set of related documents
-        docids        = self.invidx.docids_with_terms(set(query_terms))
+        # Get set of related documents; documents must match the phrase and
+        # window operators of the query (refer to query_operators.py)
+        docids        = self.invidx.docids_for_query(set(query_terms),
+                                                     query.operators)
+
+        count("docs_scored", len(docids))
+
+        with span("tfidf.score"):
 
-        # List of document scores (DocumentScore from result_set.py)
-        docscores     = []
+            # List of document scores (DocumentScore from result_set.py)
+            docscores     = []
 
-        # Score every document in set
-        for docid in docids:
+            # Score every document in set
+            for docid in docids:
 
-            doc_tfidf_score = 0
+                doc_tfidf_score = 0
 
-            # Score document for every query term
-            for qt in query_tf_dict:
+                # Score document for every query term
+                for qt in query_tf_dict:
 
-                # calculate tf-idf score
-                doc_tfidf_score = doc_tfidf_score + \
-                                 self.tfidf_term_score(mini_index, docid, qt)
+                    # calculate tf-idf score
+                    doc_tfidf_score = doc_tfidf_score + \
+                                     self.tfidf_term_score(mini_index, docid, qt)
 
-            docscores.append(DocumentScore(docid, doc_tfidf_score, "TFIDF"))
+                docscores.append(DocumentScore(docid, doc_tfidf_score, "TFIDF"))
 
         # Sort doc scores based on score from highest to lowest
-        docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
+        with span("tfidf.sort"):
+            docscores = sorted(docscores, key = lambda x: x.score, reverse=True)
 
         # return result set
-        return ResultSet(query, docscores)
+        with span("resultset"):
+            return ResultSet(query, docscores)
 
     # GIVEN a dictionary of (term, inverted list), mini_index and
     #       a document id, docid
@@ -134,8 +153,9 @@ class TFIDF:
     def tfidf_term_score (self, mini_index, docid, qterm):
 
         # input sanity check
-        assert (docid >= 0)
-        assert (mini_index.get(qterm) is not None)
+        if (self.verify == VERIFY_FULL):
+            assert (docid >= 0)
+            assert (mini_index.get(qterm) is not None)
 
         # Get frequency of term in document
         doctf  = self.document_tf (qterm, docid, mini_index)
@@ -144,10 +164,11 @@ class TFIDF:
             return 0
 
         # Get document frequency variables
-        nqt     = float(len(mini_index.get(qterm)))               
+        nqt     = float(self.invidx.document_frequency(qterm))               
 
         # Variable sanity check
-        assert (nqt  > 0)
+        if (self.verify == VERIFY_FULL):
+            assert (nqt  > 0)
 
         term_score = float(doctf * (1/nqt))
 
@@ -179,8 +200,9 @@ class TFIDF:
     def document_tf(self, term, docid, mini_index):
 
         # Sanity check
-        assert (mini_index.get(term) is not None)
-        assert (docid >= 0)
+        if (self.verify == VERIFY_FULL):
+            assert (mini_index.get(term) is not None)
+            assert (docid >= 0)
 
         # Get inverted_list / postings of the term
         term_postings = mini_index.get(term)
@@ -193,9 +215,10 @@ class TFIDF:
 
         # Term does appear in the document
         # Sanity check
-        assert (docposting_idx >= 0 and docposting_idx < len(term_postings))
-        assert (term_postings[docposting_idx].docid >= 0)
-        assert (term_postings[docposting_idx].tf     > 0)
+        if (self.verify == VERIFY_FULL):
+            assert (docposting_idx >= 0 and docposting_idx < len(term_postings))
+            assert (term_postings[docposting_idx].docid >= 0)
+            assert (term_postings[docposting_idx].tf     > 0)
 
         # return frequency
         return float(term_postings[docposting_idx].tf)
@@ -205,7 +228,8 @@ class TFIDF:
     # if no such posting exists, then return -1
     def posting_idx(self, postings, docid):
 
-        assert (isinstance(docid, int))
+        if (self.verify == VERIFY_FULL):
+            assert (isinstance(docid, int))
 
         # the postings list is sorted. lets binary search
         left  = 0
@@ -0,0 +1,271 @@
+## This file implements lightweight tracing of the stages of indexing, search
+#  and snippet generation; timed spans and aggregate counters
+#
+# A span times a stage of a program,
+#
+#     with span("bm25.score", qid = query.qid):
+#         ...
+#
+# and a counter adds up a quantity over all stages,
+#
+#     count("docs_scored", len(docids))
+#
+# Tracing is off unless a program enables it (e.g. searcher.py --tracefile).
+# When it is off, span returns a shared span that does nothing and count
+# returns at once, so instrumented code costs a function call per stage. Spans
+# belong around stages, not around the work of every posting or document
+#
+# A trace is written as JSON lines, a span or counter per line, or in the Chrome
+# trace event format, which chrome://tracing and Perfetto display as a timeline
+
+import json
+import os
+import time
+
+## Globals #####################################################################
+
+# Trace file formats
+TRACE_JSONL  = "jsonl"
+TRACE_CHROME = "chrome"
+TRACEFORMATS = [TRACE_JSONL, TRACE_CHROME]
+
+# The Tracer of the process; None when tracing is off
+tracer = None
+
+## Spans #######################################################################
+
+# A span that does nothing; returned by span when tracing is off
+class NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULLSPAN = NullSpan()
+
+# A timed stage of a program; recorded by its tracer when the stage ends
+class Span:
+
+    # Tracer that records the span
+    tracer = None
+    # Name of the stage
+    name   = ""
+    # Dictionary of key value pairs that describe the span, e.g. the query ID
+    args   = None
+    # Start time in seconds since the epoch
+    start  = 0.0
+
+    # Constructor
+    def __init__(self, tracer_, name_, args_):
+
+        self.reset()
+
+        self.tracer = tracer_
+        self.name   = name_
+        self.args   = args_
+
+    # Reset
+    def reset(self):
+        self.tracer = None
+        self.name   = ""
+        self.args   = None
+        self.start  = 0.0
+
+    def __enter__(self):
+        self.tracer.depth = self.tracer.depth + 1
+        self.start        = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds           = time.time() - self.start
+        self.tracer.depth = self.tracer.depth - 1
+        self.tracer.record(self.name, self.start, seconds, self.args)
+        return False
+
+## Tracer ######################################################################
+
+# Records the spans and counters of a process
+class Tracer:
+
+    # List of (name, start, seconds, depth, args) tuples of the ended spans
+    spans    = []
+
+    # Dictionary of key value pairs of counter name and value
+    counters = {}
+
+    # Number of spans that are open
+    depth    = 0
+
+    # Time the tracer started in seconds since the epoch
+    start    = 0.0
+
+    # Process ID
+    pid      = 0
+
+    # Constructor
+    def __init__(self):
+        self.reset()
+
+    # Reset
+    def reset(self):
+        self.spans    = []
+        self.counters = {}
+        self.depth    = 0
+        self.start    = time.time()
+        self.pid      = os.getpid()
+
+    # Given the name, start time, duration in seconds and arguments of a span
+    # that ended
+    # Record the span
+    def record(self, name, start, seconds, args):
+        self.spans.append((name, start, seconds, self.depth, args))
+
+    # Given the name of a counter and an amount
+    # Add the amount to the counter
+    def count(self, name, n):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # Returns a list of (name, calls, total seconds) of every span name; by
+    # total seconds, from highest to lowest
+    def summary(self):
+
+        totals = {}
+        for (name, start, seconds, depth, args) in self.spans:
+            (calls, total) = totals.get(name, (0, 0.0))
+            totals[name]   = (calls + 1, total + seconds)
+
+        return sorted(map(lambda nt: (nt[0], nt[1][0], nt[1][1]), totals.items()),
+                      key = lambda s: s[2], reverse = True)
+
+    # Print the summary of the spans and the counters to stdout
+    def print_summary(self):
+
+        print "%-28s %9s %12s %12s" % ("span", "calls", "total ms", "mean ms")
+        for (name, calls, total) in self.summary():
+            print "%-28s %9d %12.3f %12.3f" % (name, calls, 1000.0 * total,
+                                               1000.0 * total / calls)
+
+        for name in sorted(self.counters.keys()):
+            print "%-28s %9d" % (name, self.counters[name])
+
+    # Given the path to a file
+    # Write the spans and counters as JSON lines; a span per line in the order
+    # the spans ended, then a counter per line. Times are in seconds since the
+    # tracer started
+    def write_jsonl(self, tracefile):
+
+        with open(tracefile, "w+") as f:
+
+            for (name, start, seconds, depth, args) in self.spans:
+                f.write(json.dumps({"span"    : name,
+                                    "start"   : start - self.start,
+                                    "seconds" : seconds,
+                                    "depth"   : depth,
+                                    "pid"     : self.pid,
+                                    "args"    : args if args is not None else {}},
+                                   sort_keys = True) + "\n")
+
+            for name in sorted(self.counters.keys()):
+                f.write(json.dumps({"counter" : name,
+                                    "value"   : self.counters[name],
+                                    "pid"     : self.pid},
+                                   sort_keys = True) + "\n")
+
+    # Given the path to a file
+    # Write the spans as complete events and the counters as counter events of
+    # the Chrome trace event format. Times are in microseconds since the
+    # tracer started
+    def write_chrome(self, tracefile):
+
+        events = []
+        end    = 0.0
+
+        for (name, start, seconds, depth, args) in self.spans:
+            events.append({"name" : name,
+                           "ph"   : "X",
+                           "ts"   : 1.0e6 * (start - self.start),
+                           "dur"  : 1.0e6 * seconds,
+                           "pid"  : self.pid,
+                           "tid"  : self.pid,
+                           "args" : args if args is not None else {}})
+            end = max(end, start + seconds - self.start)
+
+        # counters are totals; shown at the end of the trace
+        for name in sorted(self.counters.keys()):
+            events.append({"name" : name,
+                           "ph"   : "C",
+                           "ts"   : 1.0e6 * end,
+                           "pid"  : self.pid,
+                           "args" : {name : self.counters[name]}})
+
+        # complete events must be sorted by start time
+        events.sort(key = lambda e: e["ts"])
+
+        with open(tracefile, "w+") as f:
+            json.dump({"traceEvents"     : events,
+                       "displayTimeUnit" : "ms"}, f)
+
+    # Given the path to a file and one of TRACEFORMATS
+    # Write the trace to the file
+    def write(self, tracefile, traceformat = TRACE_JSONL):
+
+        assert (traceformat in TRACEFORMATS)
+
+        if (traceformat == TRACE_CHROME):
+            self.write_chrome(tracefile)
+        else:
+            self.write_jsonl(tracefile)
+
+## Tracing functions ###########################################################
+
+# Turn tracing on; spans and counters from now on are recorded by a new Tracer
+# Returns the Tracer
+def enable():
+
+    global tracer
+
+    tracer = Tracer()
+
+    return tracer
+
+# Turn tracing off
+def disable():
+
+    global tracer
+
+    tracer = None
+
+# Returns True iff tracing is on
+def enabled():
+    return tracer is not None
+
+# Given the name of a stage and optionally key value arguments that describe it
+# Returns a span to time the stage with; a span that does nothing when tracing
+# is off
+def span(name, **args):
+
+    if (tracer is None):
+        return NULLSPAN
+
+    return Span(tracer, name, args if args != {} else None)
+
+# Given the name of a counter and an amount
+# Add the amount to the counter, if tracing is on
+def count(name, n = 1):
+
+    if (tracer is None):
+        return
+
+    tracer.count(name, n)
+
+# Given a path to a trace file
+# Returns the format of the trace file; Chrome trace format for a ".json" file
+# and JSON lines otherwise
+def trace_format(tracefile):
+
+    if (tracefile.endswith(".json")):
+        return TRACE_CHROME
+
+    return TRACE_JSONL
@@ -0,0 +1,251 @@
+## This program fully verifies an indexstore created by indexer.py. It is meant
+#  to be run by CI and after building or updating an index; the search path
+#  does not verify the index by default (refer to the verification levels in
+#  index.py)
+
+from global_statistics import GlobalStatistics, GSFILE
+from index             import Index, VERIFY_FULL
+from manifest          import Manifest
+from docid_mapper      import DocIDMapper, DOCIDMAPPER
+from shards            import Shards, TermStatistics, TERMSTATFILE, is_sharded
+
+import argparse
+import os
+from   argparse import RawTextHelpFormatter
+
+## Globals #####################################################################
+# Print to terminal about what the program is doing
+# this is set by input to the program
+verbose = False
+
+## Help strings ################################################################
+
+program_help = '''
+
+    verify_index.py verifies an indexstore created by indexer.py. It checks
+    that,
+        i. all files committed with the manifest match their checksums
+       ii. all postings are sorted, have positive term frequencies and sorted
+           positions
+      iii. the global statistics agree with the index and the docid map
+
+    Every shard of a sharded indexstore (refer to indexer.py --shards) is
+    verified as an indexstore of its own. The statistics shared across shards
+    must add up to the statistics of the shards
+
+    The program exits with a non zero status if the indexstore is not valid
+
+    Argument 1: indexstore - Path to the folder, where the index is created by
+                             indexer.py
+
+    Argument 2: verbose    - Print progress of the program to stdout.
+                             This argument is optional
+
+    EXAMPLES:
+
+        python verify_index.py --indexstore=./cacm.index --verbose
+    '''
+
+indexstore_help = '''
+    Path to the folder, where the index is created by indexer.py
+    '''
+
+verbose_help = '''
+    Print progress of the program to stdout. This argument is optional
+    '''
+
+## Setup argument parser #######################################################
+
+argparser = argparse.ArgumentParser(description = program_help,
+                                    formatter_class = RawTextHelpFormatter)
+
+argparser.add_argument("--indexstore",
+                       metavar  = "is",
+                       required = True,
+                       type     = str,
+                       help     = indexstore_help)
+
+argparser.add_argument("--verbose",
+                       dest     = 'verbose',
+                       action   = 'store_true',
+                       help     = verbose_help)
+
+## Utilities ###################################################################
+
+# Given a string, print it if verbose is set
+def print_verbose(s):
+    if (verbose):
+        print s
+
+# Given a message
+# Print the message and exit with a failure status
+def fail(msg):
+    print "FATAL: " + msg
+    exit(-1)
+
+## Verification ################################################################
+
+# Given an indexstore
+# Verify the checksums of all committed files
+def verify_checksums(indexstore):
+
+    manifest = Manifest(indexstore)
+
+    if (not manifest.exists()):
+        print "WARNING: No manifest; checksums not verified"
+        return
+
+    print_verbose("Verifying checksums of " + str(len(manifest.entries)) + \
+                  " files, generation " + str(manifest.generation))
+
+    try:
+        manifest.verify_all()
+    except IOError as e:
+        fail(str(e))
+
+# Given an indexstore
+# Returns the index of the indexstore read with full verification
+def verify_postings(indexstore):
+
+    print_verbose("Verifying postings")
+
+    try:
+        invidx = Index(indexstore, verify = VERIFY_FULL)
+    except (IOError, AssertionError) as e:
+        fail("index is not valid " + str(e))
+
+    return invidx
+
+# Given an indexstore and its index
+# Verify that the global statistics and the docid map agree with the index
+def verify_statistics(indexstore, invidx):
+
+    print_verbose("Verifying global statistics")
+
+    gs = GlobalStatistics(os.path.join(indexstore, GSFILE))
+
+    if (gs.N != len(gs.doc_lengths)):
+        fail("N is " + str(gs.N) + " but " + str(len(gs.doc_lengths)) + \
+             " document lengths are recorded")
+
+    if (gs.corpus_size != sum(gs.doc_lengths.values())):
+        fail("corpus size does not match the document lengths")
+
+    if (gs.N > 0 and abs(gs.avdl - float(gs.corpus_size) / gs.N) > 1e-6):
+        fail("avdl does not match the corpus size and N")
+
+    # every document has as many terms in the index as its length
+    doc_terms = {}
+    for term in invidx.idxdict:
+        for p in invidx.idxdict[term]:
+            doc_terms[p.docid] = doc_terms.get(p.docid, 0) + p.tf
+
+    # documents without terms have no postings
+    if (not set(doc_terms.keys()) <= set(gs.doc_lengths.keys())):
+        fail("indexed documents do not match the documents in global statistics")
+
+    for docid in gs.doc_lengths:
+        if (doc_terms.get(docid, 0) != gs.doc_lengths[docid]):
+            fail("document " + str(docid) + " has " + str(doc_terms.get(docid, 0)) + \
+                 " indexed terms but length " + str(gs.doc_lengths[docid]))
+
+    print_verbose("Verifying docid map")
+
+    if (not os.path.exists(os.path.join(indexstore, DOCIDMAPPER))):
+        fail("cannot find the docid map")
+
+    docid_map = DocIDMapper().read(indexstore)
+
+    if (set(docid_map.keys()) != set(gs.doc_lengths.keys())):
+        fail("docid map does not match the documents in global statistics")
+
+# Given a sharded indexstore
+# Verify every shard, and that the statistics shared across shards are the
+# sums of the statistics of the shards. The shared global statistics have no
+# document lengths; they are stored in the shards
+def verify_shards(indexstore):
+
+    shards = Shards(indexstore)
+
+    if (shards.names() == []):
+        fail("sharded indexstore has no shards")
+
+    term_stats = TermStatistics()
+    N          = 0
+    cs         = 0
+    docids     = set()
+
+    for name in shards.names():
+
+        shardstore = shards.shardstore(name)
+
+        print_verbose("Verifying shard " + name)
+
+        if (not os.path.exists(shardstore)):
+            fail("cannot find shard " + shardstore)
+
+        verify_checksums(shardstore)
+        invidx = verify_postings(shardstore)
+        verify_statistics(shardstore, invidx)
+
+        # documents of the shard must be in its document ID range
+        (mindocid, maxdocid) = filter(lambda s: s[0] == name, shards.shards)[0][1:]
+        gs = GlobalStatistics(os.path.join(shardstore, GSFILE))
+        if (any(map(lambda d: d < mindocid or d > maxdocid, gs.doc_lengths))):
+            fail("shard " + name + " has documents out of its document ID range")
+
+        term_stats.add_index(invidx)
+        N      = N  + gs.N
+        cs     = cs + gs.corpus_size
+        docids = docids | set(gs.doc_lengths.keys())
+
+    print_verbose("Verifying shared statistics")
+
+    gs = GlobalStatistics(os.path.join(indexstore, GSFILE))
+
+    if (gs.N != N):
+        fail("N is " + str(gs.N) + " but the shards index " + str(N) + \
+             " documents")
+
+    if (gs.corpus_size != cs):
+        fail("corpus size does not match the corpus sizes of the shards")
+
+    if (gs.N > 0 and abs(gs.avdl - float(gs.corpus_size) / gs.N) > 1e-6):
+        fail("avdl does not match the corpus size and N")
+
+    if (not os.path.exists(os.path.join(indexstore, TERMSTATFILE))):
+        fail("cannot find the term statistics")
+
+    if (TermStatistics(os.path.join(indexstore, TERMSTATFILE)).termstats != \
+        term_stats.termstats):
+        fail("term statistics do not match the postings of the shards")
+
+    if (not os.path.exists(os.path.join(indexstore, DOCIDMAPPER))):
+        fail("cannot find the docid map")
+
+    if (set(DocIDMapper().read(indexstore).keys()) != docids):
+        fail("docid map does not match the documents of the shards")
+
+## Main ########################################################################
+
+## Get arguments
+args = vars(argparser.parse_args())
+
+## Inputs
+indexstore = args['indexstore']
+verbose    = args['verbose']
+
+## Input check
+if (not os.path.exists(indexstore)):
+    print "FATAL: Cannot find indexstore, ", indexstore
+    exit (-1)
+
+verify_checksums(indexstore)
+
+if (is_sharded(indexstore)):
+    verify_shards(indexstore)
+else:
+    invidx = verify_postings(indexstore)
+    verify_statistics(indexstore, invidx)
+
+print "\nSuccess : Index verified - ", indexstore
@@ -0,0 +1,325 @@
+## This file defines the binary protocol spoken between the query broker
+#  (query_broker.py) and shard servers (shard_server.py) over TCP
+#
+# Every message is sent as a frame. A frame is a fixed size header followed by
+# a payload,
+#   header  - protocol version (1 byte), message type (1 byte) and payload
+#             length (4 bytes), all big endian
+#   payload - message specific fields packed back to back. Integers and doubles
+#             are big endian, strings are a 2 byte length followed by the bytes
+#             of the string
+#
+# Messages,
+#   HELLO         - broker asks a server which shard it serves. Empty payload
+#   HELLO_REPLY   - shard name, retrieval model name and number of documents
+#   SEARCH        - request ID, N, corpus size and avdl of the collection, the
+#                   (term, df, cf) of all query terms and a list of
+#                   (query ID, query as written, with its operators)
+#   RESULTS       - request ID and, for every query in the same order, the
+#                   model name and a list of (docid, score) highest score first
+#   ERROR         - request ID and an error message
+#
+# Scores are sent as doubles, so results of a remote shard are identical to
+# results of the same shard searched in process
+
+from query import Query
+
+import struct
+
+## Globals #####################################################################
+
+# Protocol version; a server rejects frames of other versions
+VERSION     = 1
+
+# Message types
+HELLO       = 1
+HELLO_REPLY = 2
+SEARCH      = 3
+RESULTS     = 4
+ERROR       = 5
+
+# Frame header; version, message type, payload length
+HEADER      = struct.Struct(">BBI")
+
+# Largest payload accepted
+MAXPAYLOAD  = 1 << 26
+
+## Packing #####################################################################
+
+# Builds a payload field by field
+class Packer:
+
+    # list of packed fields
+    parts = None
+
+    # reset
+    def reset(self):
+        self.parts = []
+
+    # Constructor
+    def __init__(self):
+        self.reset()
+
+    # Given a non negative integer < 2^16, pack it
+    def ushort(self, n):
+        self.parts.append(struct.pack(">H", n))
+
+    # Given a non negative integer < 2^32, pack it
+    def uint(self, n):
+        self.parts.append(struct.pack(">I", n))
+
+    # Given a signed integer that fits in 32 bits, pack it
+    def int(self, n):
+        self.parts.append(struct.pack(">i", n))
+
+    # Given a non negative integer < 2^64, pack it
+    def ulong(self, n):
+        self.parts.append(struct.pack(">Q", n))
+
+    # Given a float, pack it
+    def double(self, d):
+        self.parts.append(struct.pack(">d", d))
+
+    # Given a string shorter than 2^16 bytes, pack it
+    def string(self, s):
+        self.ushort(len(s))
+        self.parts.append(s)
+
+    # Returns the payload
+    def payload(self):
+        return "".join(self.parts)
+
+# Reads a payload field by field. Raises an IOError if the payload is too short
+class Unpacker:
+
+    # payload
+    payload = ""
+
+    # offset of the next field in the payload
+    offset  = 0
+
+    # reset
+    def reset(self):
+        self.payload = ""
+        self.offset  = 0
+
+    # Constructor
+    # Given a payload
+    def __init__(self, payload):
+        self.reset()
+        self.payload = payload
+
+    # Given a struct format
+    # Returns the unpacked field
+    def field(self, fmt):
+
+        size = struct.calcsize(fmt)
+
+        if (self.offset + size > len(self.payload)):
+            raise IOError("truncated payload")
+
+        value = struct.unpack_from(fmt, self.payload, self.offset)[0]
+        self.offset = self.offset + size
+
+        return value
+
+    def ushort(self):
+        return self.field(">H")
+
+    def uint(self):
+        return self.field(">I")
+
+    def int(self):
+        return self.field(">i")
+
+    def ulong(self):
+        return self.field(">Q")
+
+    def double(self):
+        return self.field(">d")
+
+    def string(self):
+
+        n = self.ushort()
+
+        if (self.offset + n > len(self.payload)):
+            raise IOError("truncated payload")
+
+        s = self.payload[self.offset : self.offset + n]
+        self.offset = self.offset + n
+
+        return s
+
+    # true iff all fields have been read
+    def done(self):
+        return (self.offset == len(self.payload))
+
+## Frames ######################################################################
+
+# Given a socket and a number of bytes
+# Returns the bytes read from the socket. Raises an IOError if the connection
+# is closed before all bytes are read
+def recv_exactly(sock, n):
+
+    parts = []
+
+    while (n > 0):
+        part = sock.recv(min(n, 1 << 16))
+        if (part == ""):
+            raise IOError("connection closed")
+        parts.append(part)
+        n = n - len(part)
+
+    return "".join(parts)
+
+# Given a socket, a message type and a payload, send the frame
+def send_frame(sock, msgtype, payload = ""):
+
+    sock.sendall(HEADER.pack(VERSION, msgtype, len(payload)) + payload)
+
+# Given a socket
+# Returns a tuple of the message type and payload of the next frame. Raises an
+# IOError if the connection is closed or the frame is not valid
+def recv_frame(sock):
+
+    (version, msgtype, length) = HEADER.unpack(recv_exactly(sock, HEADER.size))
+
+    if (version != VERSION):
+        raise IOError("unsupported protocol version " + str(version))
+    if (length > MAXPAYLOAD):
+        raise IOError("frame too large " + str(length))
+
+    return (msgtype, recv_exactly(sock, length))
+
+## Messages ####################################################################
+
+# Given a shard name, a retrieval model name and the number of documents
+# Returns the payload of a HELLO_REPLY
+def encode_hello_reply(shardname, model, ndocs):
+
+    p = Packer()
+    p.string(shardname)
+    p.string(model)
+    p.uint(ndocs)
+
+    return p.payload()
+
+# Given the payload of a HELLO_REPLY
+# Returns a tuple of shard name, retrieval model name and number of documents
+def decode_hello_reply(payload):
+
+    u = Unpacker(payload)
+
+    return (u.string(), u.string(), u.uint())
+
+# Given a request ID,
+#       a tuple of N, corpus size and avdl of the collection,
+#       a dictionary of key value pairs of term and (df, cf) and
+#       a list of Query (from query.py)
+# Returns the payload of a SEARCH
+def encode_search(reqid, collection_stats, termstats, query_lst):
+
+    (N, corpus_size, avdl) = collection_stats
+
+    p = Packer()
+    p.uint(reqid)
+    p.uint(N)
+    p.ulong(corpus_size)
+    p.double(avdl)
+
+    p.uint(len(termstats))
+    for term in termstats:
+        p.string(term)
+        p.uint(termstats[term][0])
+        p.ulong(termstats[term][1])
+
+    p.ushort(len(query_lst))
+    for query in query_lst:
+        p.int(query.qid)
+        p.string(query.text)
+
+    return p.payload()
+
+# Given the payload of a SEARCH
+# Returns a tuple of request ID, (N, corpus size, avdl), term statistics and a
+# list of Query
+def decode_search(payload):
+
+    u = Unpacker(payload)
+
+    reqid            = u.uint()
+    collection_stats = (u.uint(), u.ulong(), u.double())
+
+    termstats = {}
+    for i in range(0, u.uint()):
+        term = u.string()
+        termstats[term] = (u.uint(), u.ulong())
+
+    query_lst = []
+    for i in range(0, u.ushort()):
+        qid = u.int()
+        query_lst.append(Query(qid, u.string()))
+
+    return (reqid, collection_stats, termstats, query_lst)
+
+# Given a request ID and a list of lists of (score, docid, model) tuples for
+#       every query; highest score first (refer to shard_searcher.search_shard)
+# Returns the payload of a RESULTS
+def encode_results(reqid, results):
+
+    p = Packer()
+    p.uint(reqid)
+    p.ushort(len(results))
+
+    for query_results in results:
+
+        model = query_results[0][2] if query_results != [] else ""
+        assert (all(map(lambda r: r[2] == model, query_results)))
+
+        p.string(model)
+        p.ushort(len(query_results))
+        for (score, docid, model) in query_results:
+            p.uint(docid)
+            p.double(score)
+
+    return p.payload()
+
+# Given the payload of a RESULTS
+# Returns a tuple of request ID and a list of lists of (score, docid, model)
+# tuples for every query
+def decode_results(payload):
+
+    u = Unpacker(payload)
+
+    reqid   = u.uint()
+    results = []
+
+    for i in range(0, u.ushort()):
+        model = u.string()
+        query_results = []
+        for j in range(0, u.ushort()):
+            docid = u.uint()
+            query_results.append((u.double(), docid, model))
+        results.append(query_results)
+
+    return (reqid, results)
+
+# Given a request ID and an error message
+# Returns the payload of an ERROR
+def encode_error(reqid, msg):
+
+    p = Packer()
+    p.uint(reqid)
+    p.string(msg[:1024])
+
+    return p.payload()
+
+# Given the payload of an ERROR
+# Returns a tuple of request ID and error message
+def decode_error(payload):
+
+    u = Unpacker(payload)
+
+    return (u.uint(), u.string())
+
+################################################################################